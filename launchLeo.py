@@ -5,4 +5,7 @@ A minimal script to launch leo.
 """
 
 import leo.core.runLeo
-leo.core.runLeo.run()
+
+if __name__ == '__main__':
+    # The guard is needed for worker processes: see at.readInWorkers.
+    leo.core.runLeo.run()
@@ -13,6 +13,7 @@ import leo.core.leoGlobals as g
 
 import os
 import optparse
+import pickle
 import string
 import sys
 import traceback
@@ -100,6 +101,7 @@ class LeoApp:
         self.leoID = None               # The id part of gnx's.
         self.lossage = []               # List of last 100 keystrokes.
         self.spellDict = None           # The singleton PyEnchant spell dict.
+        self.textRevision = 0           # Incremented when any headline or body changes.
         self.numberOfUntitledWindows=0  # Number of opened untitled windows.
         self.windowList = []            # Global list of all frames.
         self.realMenuNameDict = {}      # Translations of menu names.
@@ -113,6 +115,7 @@ class LeoApp:
         self.nodeIndices = None         # The singleton nodeIndices instance.
         self.pluginsController = None   # The singleton PluginsManager instance.
         self.sessionManager = None      # The singleton SessionManager instance.
+        self.startupProfile = None      # The StartupProfile instance for --startup-profile.
 
         # Global status vars...
 
@@ -1703,7 +1706,7 @@ class LoadManager:
     def getPreviousSettings (self,fn):
         '''
         Return the settings in effect for fn. Typically, this involves
-        pre-reading fn.
+        pre-reading the @settings tree of fn.
         '''
         lm = self
         settingsName  = 'settings dict for %s' % g.shortFileName(fn)
@@ -1720,9 +1723,12 @@ class LoadManager:
             finally:
                 g.app.preReadFlag = False
             # Merge the settings from c into *copies* of the global dicts.
+            sp = g.app.startupProfile
+            if sp: sp.begin('settings','parse %s' % fn)
             d1,d2 = lm.computeLocalSettings(c,
                 lm.globalSettingsDict,lm.globalShortcutsDict,localFlag=True)
                     # d1 and d2 are copies.
+            if sp: sp.end('settings','parse %s' % fn)
             d1.setName(settingsName)
             d2.setName(shortcutsName)
         else:
@@ -1845,6 +1851,9 @@ class LoadManager:
         '''
         Open a settings file with a null gui.  Return the commander.
 
+        The commander's outline contains only the file's @settings tree,
+        unless the tree contains clones defined outside it.
+
         The caller must init the c.config object.
         '''
         trace = (False or g.trace_startup) and not g.unitTesting
@@ -1864,6 +1873,8 @@ class LoadManager:
                 s = g.toEncodedString(s,'ascii')
             g.blue(s)
 
+        sp = g.app.startupProfile
+        if sp: sp.begin('settings','read %s' % fn)
         theFile = lm.openLeoOrZipFile(fn)
         if theFile:
             message('reading settings in %s' % (fn))
@@ -1874,12 +1885,20 @@ class LoadManager:
         frame = c.frame
         frame.log.enable(False)
         g.app.lockLog()
-        ok = c.fileCommands.openLeoFile(theFile,fn,
-            readAtFileNodesFlag=False,silent=True)
+        if theFile and c.fileCommands.readSettingsTree(theFile,fn):
                 # closes theFile.
+            ok = preRead = True
+        else:
+            # Read the entire outline.
+            theFile = lm.openLeoOrZipFile(fn)
+            ok = c.fileCommands.openLeoFile(theFile,fn,
+                readAtFileNodesFlag=False,silent=True)
+                    # closes theFile.
+            preRead = False
         g.app.unlockLog()
         c.openDirectory = frame.openDirectory = g.os_path_dirname(fn)
         g.app.gui = oldGui
+        if sp: sp.end('settings','read %s' % fn,preRead=preRead)
         return ok and c or None
     #@+node:ekr.20120213081706.10382: *4* lm.readGlobalSettingsFiles
     def readGlobalSettingsFiles (self):
@@ -1891,13 +1910,23 @@ class LoadManager:
         # Open the standard settings files with a nullGui.
         # Important: their commanders do not exist outside this method!
         paths = [lm.computeLeoSettingsPath(),lm.computeMyLeoSettingsPath()]
+        key = lm.computeSettingsCacheKey(paths)
+        sp = g.app.startupProfile
+        if sp: sp.begin('settings','settings cache')
+        ok = lm.readSettingsCache(key)
+        if sp: sp.end('settings','settings cache',hit=ok)
+        if ok:
+            if trace: g.es_debug('using cached settings')
+            return
         old_commanders = g.app.commanders()
         commanders = [lm.openSettingsFile(path) for path in paths]
         commanders = [z for z in commanders if z]
         settings_d,shortcuts_d = lm.createDefaultSettingsDicts()
         for c in commanders:
+            if sp: sp.begin('settings','parse %s' % c.fileName())
             settings_d,shortcuts_d = lm.computeLocalSettings(
                 c,settings_d,shortcuts_d,localFlag=False)
+            if sp: sp.end('settings','parse %s' % c.fileName())
         # Adjust the name.
         shortcuts_d.setName('lm.globalShortcutsDict')
         if trace:
@@ -1908,11 +1937,180 @@ class LoadManager:
             lm.traceShortcutsDict(shortcuts_d,verbose)
         lm.globalSettingsDict = settings_d
         lm.globalShortcutsDict = shortcuts_d
+        lm.writeSettingsCache(key,commanders)
         # Clear the cache entries for the commanders.
         # This allows this method to be called outside the startup logic.
         for c in commanders:
             if c not in old_commanders:
                 g.app.forgetOpenFile(c.fileName())
+    #@+node:ekr.20141230130001.1: *4* lm.Settings cache
+    #@+at The settings cache holds the global settings and shortcuts dicts
+    # computed by lm.readGlobalSettingsFiles, and the parts of g.app.config
+    # that the settings parser sets. It is a single pickle file in
+    # ~/.leo/db. --no-cache disables it.
+    # 
+    # The cache key contains the path, modification time and md5 hash of
+    # each settings file, and everything else the parser depends on. If
+    # the key does not match, readGlobalSettingsFiles parses the files
+    # and writes a new cache.
+    #@@c
+
+    settingsCacheAttributes = (
+        'buttonsFileName','context_menus',
+        'enabledPluginsFileName','enabledPluginsString',
+        'menusFileName','menusList','modeCommandsDict',
+    )
+        # The ivars of g.app.config set by the settings parser.
+    settingsCacheVersion = 1
+        # Change this whenever the format of the cache changes.
+    #@+node:ekr.20141230130001.2: *5* lm.computeSettingsCacheKey
+    def computeSettingsCacheKey (self,paths):
+        '''
+        Return the key of the cached global settings computed from the
+        settings files given by paths, or None if there is no cache.
+        '''
+        import hashlib
+        import leo.core.leoVersion as leoVersion
+        lm = self
+        if not g.enableDB or not g.app.homeLeoDir:
+            return None
+        key = [
+            lm.settingsCacheVersion,
+            leoVersion.version,leoVersion.build,leoVersion.git_info.get('commit'),
+            tuple(sys.version_info[:2]),sys.platform,lm.computeMachineName(),
+        ]
+        for path in paths:
+            if path:
+                try:
+                    f = open(path,'rb')
+                    try:
+                        s = f.read()
+                    finally:
+                        f.close()
+                    mtime = os.path.getmtime(path)
+                except (IOError,OSError):
+                    return None
+                key.append((path,mtime,hashlib.md5(s).hexdigest()))
+            else:
+                key.append(None)
+        return tuple(key)
+    #@+node:ekr.20141230130001.3: *5* lm.computeSettingsCachePath
+    def computeSettingsCachePath (self):
+        '''Return the path to the settings cache.'''
+        return g.os_path_finalize_join(g.app.homeLeoDir,'db','global_settings.pickle')
+    #@+node:ekr.20141230130001.4: *5* lm.readSettingsCache & helper
+    def readSettingsCache (self,key):
+        '''
+        Init lm.globalSettingsDict, lm.globalShortcutsDict and g.app.config
+        from the settings cache. Return False if the cache does not exist or
+        if its key does not match key.
+        '''
+        trace = False and not g.unitTesting
+        lm = self
+        if not key:
+            return False
+        fn = lm.computeSettingsCachePath()
+        if not g.os_path_exists(fn):
+            return False
+        try:
+            f = open(fn,'rb')
+            try:
+                data = pickle.load(f)
+            finally:
+                f.close()
+            if data[0] != key:
+                if trace: g.trace('key changed')
+                return False
+            settings_d,shortcuts_d,state,trees = data[1:]
+        except Exception:
+            if trace: g.es_exception()
+            return False
+        lm.restoreSettingsTrees(trees)
+        for name in state:
+            setattr(g.app.config,name,state.get(name))
+        lm.globalSettingsDict = settings_d
+        lm.globalShortcutsDict = shortcuts_d
+        return True
+    #@+node:ekr.20141230130001.5: *6* lm.restoreSettingsTrees
+    def restoreSettingsTrees (self,trees):
+        '''
+        Recreate the @buttons and @commands trees saved by
+        lm.writeSettingsCache, and add their nodes to
+        g.app.config.atCommonButtonsList and atCommonCommandsList.
+        '''
+        import leo.core.leoConfig as leoConfig
+        import leo.core.leoNodes as leoNodes
+        commanders = {}
+        for fn,kind,aList in trees:
+            c = commanders.get(fn)
+            if not c:
+                # Create a commander with a null gui, as in lm.openSettingsFile.
+                oldGui = g.app.gui
+                g.app.gui = g.app.nullGui
+                try:
+                    c = commanders[fn] = g.app.newCommander(fn)
+                    c.frame.log.enable(False)
+                finally:
+                    g.app.gui = oldGui
+            h,b,gnx,children = aList
+            junk,v = c.cacher.fastAddLastChild(c.hiddenRootNode,gnx)
+            c.cacher.createOutlineFromCacheList(v,aList,fileName=fn)
+            p = leoNodes.Position(v,childIndex=len(c.hiddenRootNode.children)-1)
+            parser = leoConfig.SettingsTreeParser(c,localFlag=False)
+            if kind == '@buttons':
+                parser.doButtons(p,kind,None,None)
+            else:
+                parser.doCommands(p,kind,None,None)
+    #@+node:ekr.20141230130001.6: *5* lm.writeSettingsCache
+    def writeSettingsCache (self,key,commanders):
+        '''
+        Write the settings cache after lm.readGlobalSettingsFiles has read
+        the outlines of the given commanders.
+        '''
+        trace = False and not g.unitTesting
+        lm = self
+        if not key:
+            return
+        config = g.app.config
+        # Positions can't be pickled: save the trees containing them.
+        trees = []
+        for aList,kind in (
+            (config.atCommonButtonsList,'@buttons'),
+            (config.atCommonCommandsList,'@commands'),
+        ):
+            seen = set()
+            for p,script in aList:
+                c = p.v.context
+                if c not in commanders:
+                    continue # Created by an earlier call.
+                for p2 in p.self_and_parents():
+                    if g.match_word(p2.h,0,kind):
+                        if p2.v not in seen:
+                            seen.add(p2.v)
+                            trees.append((c.mFileName,kind,c.cacher.makeCacheList(p2)),)
+                        break
+        state = dict([(name,getattr(config,name))
+            for name in lm.settingsCacheAttributes if hasattr(config,name)])
+        data = (key,lm.globalSettingsDict,lm.globalShortcutsDict,state,trees)
+        fn = lm.computeSettingsCachePath()
+        tempName = fn + '.tmp'
+        try:
+            theDir = g.os_path_dirname(fn)
+            if not g.os_path_exists(theDir):
+                os.makedirs(theDir)
+            f = open(tempName,'wb')
+            try:
+                pickle.dump(data,f,pickle.HIGHEST_PROTOCOL)
+            finally:
+                f.close()
+            if g.os_path_exists(fn):
+                os.remove(fn)
+            os.rename(tempName,fn)
+        except Exception:
+            # Not all settings can be pickled. Parse them at every startup.
+            if trace: g.es_exception()
+            if g.os_path_exists(tempName):
+                os.remove(tempName)
     #@+node:ekr.20120214165710.10838: *4* lm.traceSettingsDict
     def traceSettingsDict (self,d,verbose=False):
 
@@ -1951,16 +2149,36 @@ class LoadManager:
             return
         if not g.app.gui:
             return
+        sp = g.app.startupProfile
         # Phase 2: load plugins: the gui has already been set.
+        if sp: sp.begin('phases','load plugins')
         g.doHook("start1")
+        if sp: sp.end('phases','load plugins')
         if g.app.killed: return
         # Phase 3: after loading plugins. Create one or more frames.
+        if sp: sp.begin('phases','open files')
         ok = lm.doPostPluginsInit()
+        if sp: sp.end('phases','open files')
         if ok:
+            if sp: lm.finishStartupProfile()
             g.es('') # Clears horizontal scrolling in the log pane.
             g.app.gui.runMainLoop()
             # For scripts, the gui is a nullGui.
             # and the gui.setScript has already been called.
+    #@+node:ekr.20141230140001.16: *4* LM.finishStartupProfile
+    def finishStartupProfile(self):
+        '''
+        Finish g.app.startupProfile, write it to the --startup-profile file
+        and show a summary in the log.
+        '''
+        sp = g.app.startupProfile
+        try:
+            sp.finish()
+        except Exception:
+            g.es_exception()
+            g.error('can not write startup profile: %s' % sp.fileName)
+        for s in sp.summary():
+            g.es_print(s)
     #@+node:ekr.20120219154958.10477: *4* LM.doPrePluginsInit & helpers
     def doPrePluginsInit(self,fileName,pymacs):
 
@@ -1973,7 +2191,7 @@ class LoadManager:
 
         # Scan the options as early as possible.
         lm.options = options = lm.scanOptions(fileName,pymacs)
-            # also sets lm.files.
+            # also sets lm.files and g.app.startupProfile.
 
         if options.get('version'):
             g.app.computeSignon()
@@ -1981,17 +2199,22 @@ class LoadManager:
 
         script = options.get('script')
         verbose = script is None
+        sp = g.app.startupProfile
 
         # Init the app.
+        if sp: sp.begin('phases','init app')
         lm.initApp(verbose)
         lm.reportDirectories(verbose)
+        if sp: sp.end('phases','init app')
 
         # Read settings *after* setting g.app.config and *before* opening plugins.
         # This means if-gui has effect only in per-file settings.
+        if sp: sp.begin('phases','read global settings')
         lm.readGlobalSettingsFiles()
             # reads only standard settings files, using a null gui.
             # uses lm.files[0] to compute the local directory
             # that might contain myLeoSettings.leo.
+        if sp: sp.end('phases','read global settings')
 
         # Read the recent files file.
         localConfigFile = lm.files[0] if lm.files else None
@@ -2000,7 +2223,9 @@ class LoadManager:
         g.app.setGlobalDb()
 
         # Create the gui after reading options and settings.
+        if sp: sp.begin('phases','create gui')
         lm.createGui(pymacs)
+        if sp: sp.end('phases','create gui')
 
         # We can't print the signon until we know the gui.
         g.app.computeSignon() # Set app.signon/signon2 for commanders.
@@ -2144,6 +2369,8 @@ class LoadManager:
             help = 'save session tabs on exit')
         add('--silent', action="store_true", dest="silent",
             help = 'disable all log messages')
+        add('--startup-profile', dest='startup_profile',
+            help = 'write startup timings to a json file')
         add('--trace-plugins', action="store_true", dest='trace_plugins',
             help = 'trace imports of plugins')
         add('-v', '--version', action="store_true", dest="version",
@@ -2233,6 +2460,11 @@ class LoadManager:
         # --silent
         g.app.silentMode = options.silent
         # print('scanOptions: silentMode',g.app.silentMode)
+        # --startup-profile=fn
+        if options.startup_profile and not g.app.startupProfile:
+            # runLeo.py did not create the profile, so it omits Leo's imports.
+            import leo.core.leoStartupProfile as leoStartupProfile
+            g.app.startupProfile = leoStartupProfile.StartupProfile(options.startup_profile)
         # --trace-plugins
         g.app.trace_plugins = options.trace_plugins
         # --version: print the version and exit.
@@ -2290,9 +2522,12 @@ class LoadManager:
         # Create the main frame.  Show it and all queued messages.
         c = c1 = None
         if lm.files:
+            sp = g.app.startupProfile
             for fn in lm.files:
+                if sp: sp.begin('phases',fn)
                 c = lm.loadLocalFile(fn,gui=g.app.gui,old_c=None)
                     # Returns None if the file is open in another instance of Leo.
+                if sp: sp.end('phases',fn)
                 if not c1: c1 = c 
         if g.app.restore_session:
             m = g.app.sessionManager
@@ -2530,6 +2765,8 @@ class LoadManager:
         1. If fn is an existing .leo file (possibly zipped), read it twice:
         the first time with a NullGui to discover settings,
         the second time with the requested gui to create the outline.
+        The first read creates only the @settings tree and stops as soon
+        as it has seen all of the tree.
 
         2. If fn is an external file:
         get settings from the leoSettings.leo and myLeoSetting.leo, then
@@ -2551,7 +2788,7 @@ class LoadManager:
                 if trace: g.trace('Already open: %s' % (fn))
                 return c
         # Step 1: get the previous settings.
-        # For .leo files (and zipped .leo files) this pre-reads the file in a null gui.
+        # For .leo files (and zipped .leo files) this pre-reads the @settings tree in a null gui.
         # Otherwise, get settings from leoSettings.leo, myLeoSettings.leo, or default settings.
         previousSettings = lm.getPreviousSettings(fn)
         # Step 2: open the outline in the requested gui.
@@ -2690,7 +2927,7 @@ class LoadManager:
         if not g.os_path_exists(fn):
             p = c.rootPosition()
             # Create an empty @edit node unless fn is an .leo file.
-            p.h = g.shortFileName(fn) if fn.endswith('.leo') else '@edit %s' % fn
+            p.h = g.shortFileName(fn) if fn.endswith(('.leo','.leob')) else '@edit %s' % fn
             c.selectPosition(p)
         elif c.looksLikeDerivedFile(fn):
             # 2011/10/10: Create an @file node.
@@ -2711,7 +2948,7 @@ class LoadManager:
                 c.selectPosition(p)
         # Fix critical bug 1184855: data loss with command line 'leo somefile.ext'
         # 2013/09/25: Fix smallish bug 1226816 Command line "leo xxx.leo" creates file xxx.leo.leo.
-        c.mFileName = fn if fn.endswith('.leo') else '%s.leo' % (fn)
+        c.mFileName = fn if fn.endswith(('.leo','.leob')) else '%s.leo' % (fn)
         c.frame.title = c.computeWindowTitle(c.mFileName)
         c.frame.setTitle(c.frame.title)
         # chapterController.finishCreate must be called after the first real redraw
@@ -2725,7 +2962,7 @@ class LoadManager:
     #@+node:ekr.20120223062418.10419: *6* LM.isLeoFile & LM.isZippedFile
     def isLeoFile(self,fn):
 
-        return fn and (zipfile.is_zipfile(fn) or fn.endswith('.leo'))
+        return fn and (zipfile.is_zipfile(fn) or fn.endswith(('.leo','.leob')))
 
     def isZippedFile(self,fn):
 
@@ -14,6 +14,7 @@ allow_cloned_sibs = True
 import leo.core.leoGlobals as g
 import leo.core.leoNodes as leoNodes
 import glob
+import hashlib
 import importlib
 import os
 import sys
@@ -121,6 +122,14 @@ class AtFile:
         # Dicts for writers plugins
         self.atAutoWritersDict = {}
         self.writersDispatchDict = {}
+        # Set by at.prefetchExternalFiles, used by at.read.
+        self.prefetchedDict = {}
+        # Set by at.writeAll, used by at.writeAllHelper.
+        self.unchangedTrees = set()
+        # Used by at.treeDigest.
+        self.treeDigestDict = {}
+            # Keys are vnodes; values are tuples:
+            # (v.textRevision,v.fileIndex,childDigests,digest).
         # User options.
         self.checkPythonCodeOnWrite = c.config.getBool(
             'check-python-code-on-write',default=True)
@@ -634,6 +643,12 @@ class AtFile:
             at.inputFile.close()
             root.clearDirty()
             return True
+        if (at.prefetchedDict and not fromString and not atShadow and
+            at.readPrefetchedTree(root,fileName,fileKey)
+        ):
+            if trace: g.trace('prefetched',fileName)
+            at.inputFile.close()
+            return True
         if not g.unitTesting:
             g.es("reading:",root.h)
         if isFileLike:
@@ -823,55 +838,60 @@ class AtFile:
             # we aren't doing the initial read.
             c.endEditing() 
         anyRead = False
-        p = root.copy()
-        scanned_tnodes = set()
         c.init_error_dialogs()
-        after = p.nodeAfterTree() if partialFlag else c.nullPosition()
-        while p and p != after:
-            gnx = p.gnx
-            #skip clones
-            if gnx in scanned_tnodes:
-                p.moveToNodeAfterTree()
-                continue
-            scanned_tnodes.add(gnx)
-            if not p.h.startswith('@'):
-                p.moveToThreadNext()
-            elif p.isAtIgnoreNode():
-                if p.isAnyAtFileNode() :
-                    c.ignored_at_file_nodes.append(p.h)
-                p.moveToNodeAfterTree()
-            elif p.isAtThinFileNode():
-                anyRead = True
-                at.read(p,force=force)
-                p.moveToNodeAfterTree()
-            elif p.isAtAutoNode():
-                fileName = p.atAutoNodeName()
-                at.readOneAtAutoNode (fileName,p)
-                p.moveToNodeAfterTree()
-            elif p.isAtEditNode():
-                fileName = p.atEditNodeName()
-                at.readOneAtEditNode (fileName,p)
-                p.moveToNodeAfterTree()
-            elif p.isAtShadowFileNode():
-                fileName = p.atShadowFileNodeName()
-                at.readOneAtShadowNode (fileName,p)
-                p.moveToNodeAfterTree()
-            elif p.isAtFileNode():
-                anyRead = True
-                wasOrphan = p.isOrphan()
-                ok = at.read(p,force=force)
-                if wasOrphan and not partialFlag and not ok:
-                    # Remind the user to fix the problem.
-                    # However, the dirty bit gets cleared.
-                    # p.setDirty() # 2011/06/17: won't be preserved anyway.
-                        # Expensive, but it can't be helped.
-                    p.setOrphan() # 2010/10/22: the dirty bit gets cleared.
-                    # c.setChanged(True) # 2011/06/17
-                p.moveToNodeAfterTree()
+        at.prefetchExternalFiles(root,partialFlag)
+            # Read @file and @thin trees in parallel if enabled.
+        c.cacher.beginBatch()
+            # Commit all new cache entries at once.
+        try:
+            # Walk the vnodes, skipping clones, and create positions only for @ nodes.
+            pruned,stack = set(),[]
+                # pruned: vnodes whose subtrees the walk must skip.
+            if partialFlag:
+                walker = root.walk(unique=True,prune=pruned,stack=stack)
             else:
-                if p.isAtAsisFileNode() or p.isAtNoSentFileNode():
+                walker = c.walk(unique=True,prune=pruned,stack=stack)
+            for v,level,childIndex in walker:
+                if not v.h.startswith('@'):
+                    continue
+                p = leoNodes.Position(v,childIndex,stack[:])
+                if p.isAtIgnoreNode():
+                    if p.isAnyAtFileNode() :
+                        c.ignored_at_file_nodes.append(p.h)
+                    pruned.add(v)
+                elif p.isAtThinFileNode():
+                    anyRead = True
+                    at.read(p,force=force)
+                    pruned.add(v)
+                elif p.isAtAutoNode():
+                    fileName = p.atAutoNodeName()
+                    at.readOneAtAutoNode (fileName,p)
+                    pruned.add(v)
+                elif p.isAtEditNode():
+                    fileName = p.atEditNodeName()
+                    at.readOneAtEditNode (fileName,p)
+                    pruned.add(v)
+                elif p.isAtShadowFileNode():
+                    fileName = p.atShadowFileNodeName()
+                    at.readOneAtShadowNode (fileName,p)
+                    pruned.add(v)
+                elif p.isAtFileNode():
+                    anyRead = True
+                    wasOrphan = p.isOrphan()
+                    ok = at.read(p,force=force)
+                    if wasOrphan and not partialFlag and not ok:
+                        # Remind the user to fix the problem.
+                        # However, the dirty bit gets cleared.
+                        # p.setDirty() # 2011/06/17: won't be preserved anyway.
+                            # Expensive, but it can't be helped.
+                        p.setOrphan() # 2010/10/22: the dirty bit gets cleared.
+                        # c.setChanged(True) # 2011/06/17
+                    pruned.add(v)
+                elif p.isAtAsisFileNode() or p.isAtNoSentFileNode():
                     at.rememberReadPath(at.fullPath(p),p)
-                p.moveToThreadNext()
+        finally:
+            c.cacher.endBatch()
+            at.prefetchedDict = {}
         # 2010/10/22: Preserve the orphan bits: the dirty bits will be cleared!
         #for v in c.all_unique_nodes():
         #    v.clearOrphan()
@@ -879,6 +899,164 @@ class AtFile:
             g.es("no @<file> nodes in the selected tree")
         if use_tracer: tt.stop()
         c.raise_error_dialogs()  # 2011/12/17
+    #@+node:ekr.20141216071502.1: *4* at.prefetchExternalFiles & helpers
+    def prefetchExternalFiles (self,root,partialFlag):
+        '''
+        Read all @file and @thin trees that at.readAll will read in a pool of
+        worker processes. The workers return the trees as cache lists. at.read
+        grafts them into the outline in the usual order, so clones and gnx
+        conflicts are handled exactly as when reading from the cache.
+
+        @int parallel-read-workers sets the number of workers.
+        Values less than 2 disable parallel reading. Files are also read
+        serially if g.spawnContext can not start workers safely: on
+        Python 2, or if the main script does not guard its code with
+        if __name__ == '__main__'.
+        '''
+        trace = False and not g.unitTesting
+        at = self ; c = at.c
+        at.prefetchedDict = {}
+        n = c.config.getInt('parallel-read-workers') or 0
+        if n < 2:
+            return
+        ctx = g.spawnContext()
+        if not ctx:
+            g.es_print('ignoring @int parallel-read-workers: can not start worker processes')
+            return
+        tasks = at.findPrefetchTasks(root,partialFlag)
+        if len(tasks) < 2:
+            return
+        if trace: t1 = time.time()
+        at.prefetchedDict = at.readInWorkers(tasks,n,ctx)
+        if trace: g.trace('%s of %s files in %2.2f sec' % (
+            len(at.prefetchedDict),len(tasks),time.time()-t1))
+    #@+node:ekr.20141216071502.2: *5* at.findPrefetchTasks
+    def findPrefetchTasks (self,root,partialFlag):
+        '''
+        Return a list of tasks for readInWorker, one for every @file or @thin
+        node that at.readAll will read and that is not in the cache.
+        '''
+        at = self ; c = at.c
+        tasks = []
+        # Visit nodes exactly as at.readAll does.
+        pruned,stack = set(),[]
+        if partialFlag:
+            walker = root.walk(unique=True,prune=pruned,stack=stack)
+        else:
+            walker = c.walk(unique=True,prune=pruned,stack=stack)
+        for v,level,childIndex in walker:
+            if not v.h.startswith('@'):
+                continue
+            p = leoNodes.Position(v,childIndex,stack[:])
+            if p.isAtIgnoreNode():
+                pruned.add(v)
+            elif p.isAtThinFileNode() or p.isAtFileNode():
+                fn = at.fullPath(p)
+                if (not p.isOrphan() and g.os_path_isfile(fn) and
+                    not at.isCachedFile(p,fn)
+                ):
+                    # The worker knows nothing of p's ancestors.
+                    at.scanAllDirectives(p,reading=True)
+                    tasks.append((fn,at.encoding,at.language,at.tab_width))
+                pruned.add(v)
+            elif p.isAnyAtFileNode() and not (
+                p.isAtAsisFileNode() or p.isAtNoSentFileNode()
+            ):
+                pruned.add(v)
+        return tasks
+    #@+node:ekr.20141216071502.3: *5* at.isCachedFile
+    def isCachedFile (self,p,fn):
+        '''Return True if Cacher.readFile will find fn in the cache.'''
+        c = self.c
+        if not g.enableDB:
+            return False
+        s,e = g.readFileIntoString(fn,raw=True,silent=True)
+        return s is not None and c.cacher.fileKey(p.h,s) in c.cacher.db
+    #@+node:ekr.20141216071502.4: *5* at.readInWorkers
+    def readInWorkers (self,tasks,n,ctx=None):
+        '''
+        Run readInWorker for all tasks in a pool of n processes, started by
+        ctx, a context returned by g.spawnContext. Return a dict: keys are
+        file names, values are (digest,aList). Return {} if no workers can
+        be started safely.
+        '''
+        ctx = ctx or g.spawnContext()
+        d = {}
+        if not ctx:
+            return d
+        try:
+            pool = ctx.Pool(processes=min(n,len(tasks)),
+                initializer=initReadWorker,initargs=(g.app.leoID,))
+            try:
+                results = pool.map(readInWorker,tasks,chunksize=1)
+            finally:
+                pool.terminate()
+        except Exception:
+            g.es_print('can not read files in parallel')
+            g.es_exception()
+            return d
+        for fn,digest,errors,aList in results:
+            if aList and not errors:
+                d[fn] = digest,aList
+        return d
+    #@+node:ekr.20141216071502.5: *5* at.readPrefetchedTree
+    def readPrefetchedTree (self,root,fileName,fileKey):
+        '''
+        Replace root's tree by the tree that a worker process read from
+        fileName. Return False if there is no such tree or if the file has
+        changed since the worker read it.
+        '''
+        at = self ; c = at.c
+        data = at.prefetchedDict.pop(fileName,None)
+        if not data:
+            return False
+        digest,aList = data
+        s,e = g.readFileIntoString(fileName,raw=True,silent=True)
+        if s is None or hashlib.md5(s).hexdigest() != digest:
+            return False
+        if not g.unitTesting:
+            g.es("reading:",root.h)
+        # Exactly as in Cacher.readFile.
+        while root.hasChildren():
+            root.firstChild().doDelete()
+        h,b,gnx,children = aList
+        c.cacher.createOutlineFromCacheList(root.v,
+            [root.h,b,gnx,children],fileName=fileName)
+        root.clearOrphan()
+        root.clearDirty()
+        if fileKey:
+            c.cacher.writeFile(root,fileKey)
+        return True
+    #@+node:ekr.20141216071502.6: *5* at.readToCacheList
+    def readToCacheList (self,fileName,encoding,language,tab_width):
+        '''
+        Read fileName into the root of this outline. Return a tuple
+        (fileName,digest,errors,aList), where aList is the tree's cache list.
+
+        Called only by readInWorker: this replaces the entire outline.
+        '''
+        at = self ; c = at.c
+        c.fileCommands.gnxDict = {}
+        root = c.rootPosition()
+        while root.hasChildren():
+            root.firstChild().doDelete()
+        root.clearOrphan()
+        root.h = '@file %s' % fileName
+        # Stand-ins for the directives in effect in the real outline.
+        root.b = '@encoding %s\n@language %s\n@tabwidth %s\n' % (
+            encoding,language,tab_width)
+        s,e = g.readFileIntoString(fileName,raw=True,silent=True)
+        if s is None:
+            return fileName,None,1,None
+        digest = hashlib.md5(s).hexdigest()
+        # Leave new nodes without gnxs, so the main process allocates them.
+        # Gnxs allocated here could clash with those of the main process.
+        ni = g.app.nodeIndices
+        ni.begin_holding(c)
+        ok = at.read(root,force=True)
+        aList = c.cacher.makeCacheList(root) if ok else None
+        ni.end_holding(c,c.fileCommands)
+        return fileName,digest,0 if ok else at.errors or 1,aList
     #@+node:ekr.20080801071227.7: *4* at.readAtShadowNodes
     def readAtShadowNodes (self,p):
 
@@ -2698,6 +2876,7 @@ class AtFile:
 
         # Delete all of root's tree.
         self.root.v.children = []
+        self.c.gnxIndex.childrenChanged(self.root.v)
         self.root.setDirty()
             # 2010/10/22: the dirty bit gets cleared later, though.
         self.root.setOrphan()
@@ -2823,6 +3002,7 @@ class AtFile:
 
         if at.importing:
             v._bodyString = new # Allowed use of _bodyString.
+            v.bumpTextRevision()
         elif middle: 
             pass # Middle sentinels never alter text.
         else:
@@ -2841,6 +3021,7 @@ class AtFile:
                 at.reportCorrection(old,new,v)
                 v._bodyString = new # Allowed use of _bodyString.
                     # Just setting v.tempBodyString won't work here.
+                v.bumpTextRevision()
                 v.setDirty()
                     # Mark the node dirty. Ancestors will be marked dirty later.
                 c.setChanged(True)
@@ -3210,24 +3391,34 @@ class AtFile:
         at.canCancelFlag = True
         at.cancelFlag = False
         at.yesToAll = False
+        at.unchangedTrees = set()
+            # Vnodes of @<file> trees not written because their fingerprints match.
         if writeAtFileNodesFlag:
             # The Write @<file> Nodes command.
             # Write all nodes in the selected tree.
             root = c.p
             p = c.p
-            after = p.nodeAfterTree()
         else:
             # Write dirty nodes in the entire outline.
             root = c.rootPosition()
             p = c.rootPosition()
-            after = c.nullPosition()
         at.clearAllOrphanBits(p)
-        while p and p != after:
+        # Walk the vnodes and create positions only for @<file> nodes.
+        pruned,stack = set(),[]
+            # pruned: vnodes whose subtrees the walk must skip.
+        if writeAtFileNodesFlag:
+            walker = root.walk(prune=pruned,stack=stack)
+        else:
+            walker = c.walk(prune=pruned,stack=stack)
+        for v,level,childIndex in walker:
+            if not v.h.startswith('@') and not v.isAtIgnoreNode():
+                continue
+            p = leoNodes.Position(v,childIndex,stack[:])
             if p.isAtIgnoreNode() and not p.isAtAsisFileNode():
                 if p.isAnyAtFileNode() :
                     c.ignored_at_file_nodes.append(p.h)
                 # Note: @ignore not honored in @asis nodes.
-                p.moveToNodeAfterTree() # 2011/10/08: Honor @ignore!
+                pruned.add(v) # 2011/10/08: Honor @ignore!
             elif p.isAnyAtFileNode():
                 try:
                     self.writeAllHelper(p,root,force,toString,writeAtFileNodesFlag,writtenFiles)
@@ -3240,9 +3431,7 @@ class AtFile:
                     g.es('https://groups.google.com/forum/#!forum/leo-editor',color='blue')
                     g.es('Warning: changes to this file will be lost',color='red')
                     g.es('unless you can save the file successfully.',color='red')
-                p.moveToNodeAfterTree()
-            else:
-                p.moveToThreadNext()
+                pruned.add(v)
         # Make *sure* these flags are cleared for other commands.
         at.canCancelFlag = False
         at.cancelFlag = False
@@ -3250,6 +3439,9 @@ class AtFile:
         #@+<< say the command is finished >>
         #@+node:ekr.20041005105605.150: *5* << say the command is finished >>
         if not g.unitTesting:
+            n = len(at.unchangedTrees)
+            if n > 0:
+                g.es('skipped %s unchanged @<file> tree%s' % (n,g.choose(n==1,'','s')))
             if writeAtFileNodesFlag or writeDirtyAtFileNodesFlag:
                 if len(writtenFiles) > 0:
                     g.es("finished")
@@ -3270,13 +3462,13 @@ class AtFile:
         '''Clear orphan bits for all nodes *except* orphan @file nodes.'''
 
         # 2011/06/15: Important bug fix: retain orphan bits for @file nodes.
-        for p2 in p.self_and_subtree():
-            if p2.isOrphan():
-                if p2.isAnyAtFileNode():
-                    # g.trace('*** retaining orphan bit',p2.h)
+        for v,level,childIndex in p.walk():
+            if v.isOrphan():
+                if v.isAnyAtFileNode():
+                    # g.trace('*** retaining orphan bit',v.h)
                     pass
                 else:
-                    p2.clearOrphan()
+                    v.clearOrphan()
     #@+node:ekr.20041005105605.149: *5* at.writeAllHelper
     def writeAllHelper (self,p,root,
         force,toString,writeAtFileNodesFlag,writtenFiles
@@ -3317,8 +3509,16 @@ class AtFile:
             writeAtFileNodesFlag or
             p.v in writtenFiles
         ):
+            if toString or pathChanged or writeAtFileNodesFlag:
+                fingerprint = None
+            else:
+                fingerprint = at.treeFingerprint(p)
+            if fingerprint and at.isUnchangedTree(p,fingerprint):
+                if trace: g.trace('unchanged',p.h)
+                at.unchangedTrees.add(p.v)
+                writtenFiles.append(p.v)
             # Tricky: @ignore not recognised in @asis nodes.
-            if p.isAtAsisFileNode():
+            elif p.isAtAsisFileNode():
                 at.asisWrite(p,toString=toString)
                 writtenFiles.append(p.v)
             elif p.isAtIgnoreNode():
@@ -3343,6 +3543,10 @@ class AtFile:
                 # Write old @file nodes using @thin format.
                 at.write(p,kind='@file',thinFile=True,toString=toString)
                 writtenFiles.append(p.v)
+            if (fingerprint and not at.errors and not p.isOrphan() and
+                p.v not in at.unchangedTrees
+            ):
+                at.rememberFingerprint(p,fingerprint)
             if p.v in writtenFiles:
                 # Clear the dirty bits in all descendant nodes.
                 # However, persistence data may still have to be written.
@@ -3350,6 +3554,97 @@ class AtFile:
                 if trace: g.trace('clearing',p.h)
                 for p2 in p.self_and_subtree():
                     p2.v.clearDirty()
+    #@+node:ekr.20141217081503.1: *5* at.treeFingerprint & helpers
+    def treeFingerprint (self,p):
+        '''
+        Return a digest of everything that determines the external file
+        written from p: p's path, the directives in p's ancestors, and the
+        headlines, bodies, gnxs and structure of p's tree.
+
+        at.treeDigest caches the digests of subtrees, so only nodes that
+        have changed since the last save are rehashed.
+
+        Return None if p's file is not a sentinel-based @<file> node or if
+        caching is disabled.
+        '''
+        at = self ; c = at.c
+        if not g.enableDB or not c.mFileName:
+            return None
+        if not (p.isAtThinFileNode() or p.isAtFileNode() or p.isAtNoSentFileNode()):
+            return None
+        m = hashlib.md5()
+        def update(s):
+            m.update(g.toEncodedString(s,'utf-8',reportErrors=False))
+        update(at.fullPath(p))
+        for setting in ('output_newline','underindent-escape-string'):
+            update('%s\0' % c.config.getString(setting))
+        update('%s\0' % c.config.getBool('force_newlines_in_at_nosent_bodies'))
+        for p2 in p.parents():
+            d = g.get_directives_dict(p2)
+            update(repr(sorted(d.items())))
+        update(at.treeDigest(p.v))
+        return m.hexdigest()
+    #@+node:ekr.20150102090001.6: *6* at.treeDigest
+    def treeDigest (self,v):
+        '''
+        Return a digest of v's gnx, headline and body and of the digests of
+        v's children. Reuse the cached digest of any node whose text
+        revision, gnx and child digests are unchanged.
+        '''
+        at = self
+        d = at.treeDigestDict
+        digests = {} # Keys are vnodes; values are digests computed by this call.
+        todo = [(v,False)]
+        while todo:
+            v2,childrenDone = todo.pop()
+            if v2 in digests:
+                continue # A clone.
+            if not childrenDone:
+                todo.append((v2,True))
+                todo.extend([(z,False) for z in v2.children])
+                continue
+            childDigests = [digests[z] for z in v2.children]
+            data = d.get(v2)
+            if (data and data[0] == v2.textRevision and
+                data[1] == v2.fileIndex and data[2] == childDigests
+            ):
+                digests[v2] = data[3]
+                continue
+            m = hashlib.md5()
+            for s in [v2.fileIndex,v2.h,v2.b] + childDigests:
+                m.update(g.toEncodedString('%s\0' % s,'utf-8',reportErrors=False))
+            digest = digests[v2] = m.hexdigest()
+            d[v2] = v2.textRevision,v2.fileIndex,childDigests,digest
+        return digests[v]
+    #@+node:ekr.20141217081503.2: *6* at.fileStat
+    def fileStat (self,fn):
+        '''Return (size,mtime) for fn, or None if fn does not exist.'''
+        try:
+            st = os.stat(fn)
+            return st.st_size,st.st_mtime
+        except OSError:
+            return None
+    #@+node:ekr.20141217081503.3: *6* at.isUnchangedTree
+    def isUnchangedTree (self,p,fingerprint):
+        '''
+        Return True if p's tree is unchanged since Leo last wrote p's file
+        and the file itself has not changed since then.
+        '''
+        at = self ; c = at.c
+        fn = at.fullPath(p)
+        data = c.cacher.getCachedFingerprint(fn)
+        if not data:
+            return False
+        old_fingerprint,stat = data
+        return old_fingerprint == fingerprint and stat == at.fileStat(fn)
+    #@+node:ekr.20141217081503.4: *6* at.rememberFingerprint
+    def rememberFingerprint (self,p,fingerprint):
+        '''Remember the fingerprint of p's tree and the stat of p's file.'''
+        at = self ; c = at.c
+        fn = at.fullPath(p)
+        stat = at.fileStat(fn)
+        if stat:
+            c.cacher.setCachedFingerprint(fn,(fingerprint,stat))
     #@+node:ekr.20140727075002.18108: *5* at.saveOutlineIfPossible
     def saveOutlineIfPossible(self):
         '''Save the outline if only persistence data nodes are dirty.'''
@@ -5824,5 +6119,31 @@ class AtFile:
             g.error("read only:",fn)
     #@-others
 atFile = AtFile # compatibility
+#@+<< worker functions for parallel reads >>
+#@+node:ekr.20141216071502.7: ** << worker functions for parallel reads >>
+# These functions run in the processes created by at.readInWorkers.
+
+worker_c = None
+    # The commander into which readInWorker reads files.
+
+def initReadWorker(leoID):
+    '''Init Leo without a gui, plugins or settings.'''
+    global worker_c
+    import leo.core.leoBridge as leoBridge
+    sys.leoID = leoID
+    bridge = leoBridge.controller(gui='nullGui',
+        loadPlugins=False,readSettings=False,silent=True,verbose=False)
+    g.enableDB = False
+    worker_c = bridge.createFrame('')
+
+def readInWorker(task):
+    '''Read one external file. Return (fileName,digest,errors,aList).'''
+    fileName,encoding,language,tab_width = task
+    try:
+        return worker_c.atFileCommands.readToCacheList(
+            fileName,encoding,language,tab_width)
+    except Exception:
+        return fileName,None,1,None
+#@-<< worker functions for parallel reads >>
 
 #@-leo
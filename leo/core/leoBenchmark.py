@@ -0,0 +1,672 @@
+#@+leo-ver=5-thin
+#@+node:ekr.20141218090101.15: * @file leoBenchmark.py
+'''
+Benchmarks for Leo's core, run outside of Leo with the leoBridge module.
+
+Usage::
+
+    python leo/core/leoBenchmark.py imports [--limit=seconds]
+    python leo/core/leoBenchmark.py read-leo [--path=x.leo] [--nodes=n]
+    python leo/core/leoBenchmark.py open-leo [--path=x.leo] [--nodes=n]
+    python leo/core/leoBenchmark.py memory [--nodes=n]
+    python leo/core/leoBenchmark.py traverse [--nodes=n]
+    python leo/core/leoBenchmark.py search [--nodes=n]
+    python leo/core/leoBenchmark.py startup
+    python leo/core/leoBenchmark.py tokenize [--nodes=n]
+    python leo/core/leoBenchmark.py undo [--nodes=n]
+    python leo/core/leoBenchmark.py words [--nodes=n]
+
+imports: start Leo with the null gui and without plugins, opening a small
+generated outline, and report the import times recorded by the
+--startup-profile option. Fail with exit status 1 if startup imports any
+of the modules in lazyModules, or if the imports take longer than
+--limit seconds, 0.25 by default. Each startup runs in a separate
+process: the benchmark reports the fastest of three runs.
+
+read-leo: compare the peak memory and wall time of fc.readSaxFile with
+those of the former reader, fc.readSaxFileInTwoPasses. Each reader runs
+in a separate process. Without --path, the benchmark reads a generated
+outline containing --nodes nodes.
+
+open-leo: time the two phases of opening a .leo file: the pre-read of
+its @settings tree and the read of the entire outline. Without --path,
+the benchmark opens a generated outline containing --nodes nodes and an
+@settings tree.
+
+memory: report the bytes used by each VNode and Position of a generated
+outline containing --nodes nodes, 1,000,000 by default. The outline is
+built in a separate process. Run this benchmark before and after
+changing the VNode or Position classes.
+
+startup: time the startup of the bridge and of Leo with the null gui,
+up to and including reading leoSettings.leo and myLeoSettings.leo,
+with and without the settings cache. Each startup runs in a separate
+process.
+
+tokenize: time leoTokenizer.tokenize on a generated sample of --nodes
+lines, 200 by default, for each mode in leo/modes. The sample contains
+the mode's keywords and common delimiters. Report tokens/sec and
+chars/sec for all modes, with and without the compilation of the rules,
+and the slowest modes.
+
+traverse: time the outline iterators on generated outlines containing
+10,000, 100,000 and 1,000,000 nodes, or --nodes nodes. Each outline is
+built in a separate process.
+
+search: time c.find_b with and without the search index on a generated
+outline containing --nodes nodes, 100,000 by default.
+
+undo: time the undo bead of a command that changes one node of a tree
+containing --nodes nodes, 100,000 by default.
+
+words: time the completions of a prefix with and without c.wordIndex on
+a generated outline containing --nodes nodes, 100,000 by default.
+'''
+#@+<< imports >>
+#@+node:ekr.20141218090101.16: ** << imports >> (leoBenchmark.py)
+import optparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+try:
+    import resource # Not available on Windows.
+except ImportError:
+    resource = None
+try:
+    import tracemalloc # Python 3.4 and above.
+except ImportError:
+    tracemalloc = None
+# Make sure the current directory is on sys.path.
+cwd = os.getcwd()
+if cwd not in sys.path:
+    sys.path.append(cwd)
+import leo.core.leoBridge as leoBridge
+#@-<< imports >>
+# Do not define g here. Use the g returned by the bridge.
+
+lazyModules = (
+    'PyQt4','PyQt5','cProfile','docutils','doctest','leo.core.leoQt',
+    'leo.plugins.free_layout','leo.plugins.mod_http','timeit',
+)
+    # Modules that Leo imports only when needed, not during startup.
+
+#@+others
+#@+node:ekr.20141218090101.17: ** main & helpers (leoBenchmark.py)
+def main ():
+    '''Run the benchmark given on the command line.'''
+    options,args = scanOptions()
+    d = {
+        'imports':  benchmarkImports,
+        'memory':   benchmarkMemory,
+        'open-leo': benchmarkOpenLeo,
+        'read-leo': benchmarkReadLeo,
+        'search':   benchmarkSearch,
+        'startup':  benchmarkStartup,
+        'tokenize': benchmarkTokenize,
+        'traverse': benchmarkTraverse,
+        'undo':     benchmarkUndo,
+        'words':    benchmarkWords,
+    }
+    f = args and d.get(args[0])
+    if f:
+        f(options)
+    else:
+        print('usage: leoBenchmark.py %s [options]' % '|'.join(sorted(d)))
+#@+node:ekr.20141218090101.18: *3* openBridge
+def openBridge ():
+    '''Open the bridge and return (g,c), c being a new commander.'''
+    bridge = leoBridge.controller(
+        gui='nullGui',
+        loadPlugins=False,
+        readSettings=False,
+        silent=True,
+        verbose=False,
+    )
+    g = bridge.globals()
+    g.app.silentMode = True
+    c = bridge.openLeoFile('')
+    return g,c
+#@+node:ekr.20141218090101.19: *3* peakMemory
+def peakMemory ():
+    '''Return the peak resident set size of this process in KB, or None.'''
+    if not resource:
+        return None
+    n = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        n = n // 1024 # ru_maxrss is in bytes on MacOS.
+    return n
+#@+node:ekr.20141218090101.20: *3* runChild
+def runChild (args):
+    '''Run this file with the given args in a new process. Return its last line.'''
+    command = [sys.executable,os.path.abspath(__file__)] + args
+    s = subprocess.check_output(command,cwd=cwd)
+    lines = s.decode('utf-8').splitlines()
+    return lines and lines[-1] or ''
+#@+node:ekr.20141218090101.21: *3* scanOptions
+def scanOptions():
+    '''Handle all options and remove them from sys.argv.'''
+    parser = optparse.OptionParser()
+    parser.add_option('--child',    dest='child',action='store_true')
+    parser.add_option('--limit',    dest='limit',type='float')
+    parser.add_option('--no-cache', dest='noCache',action='store_true')
+    parser.add_option('--nodes',    dest='nodes',type='int')
+    parser.add_option('--path',     dest='path')
+    parser.add_option('--reader',   dest='reader')
+    options, args = parser.parse_args()
+    sys.argv = [sys.argv[0]]
+    return options,args
+#@+node:ekr.20141218090101.22: ** benchmarkReadLeo & helpers
+def benchmarkReadLeo (options):
+    '''Compare the .leo file readers.'''
+    if options.reader:
+        # In a child process.
+        readLeoFile(options.path,options.reader)
+        return
+    fn = options.path
+    if fn:
+        tempName = None
+    else:
+        fd,tempName = tempfile.mkstemp(suffix='.leo')
+        os.close(fd)
+        fn = tempName
+        writeOutline(fn,options.nodes or 100000)
+    try:
+        print('%s: %s bytes' % (fn,os.path.getsize(fn)))
+        print('%-24s %10s %12s %12s' % ('reader','nodes','time','peak memory'))
+        for reader in ('readSaxFileInTwoPasses','readSaxFile'):
+            line = runChild(['read-leo','--path',fn,'--reader',reader])
+            nodes,t,base,peak = line.split()
+            if base == 'None':
+                memory = 'n/a'
+            else:
+                memory = '+%sKB' % (int(peak) - int(base))
+            print('%-24s %10s %11.2fs %12s' % (reader,nodes,float(t),memory))
+    finally:
+        if tempName:
+            os.remove(tempName)
+#@+node:ekr.20141230120001.20: ** benchmarkOpenLeo
+def benchmarkOpenLeo (options):
+    '''Time the settings pre-read and the full read of a .leo file.'''
+    g,c = openBridge()
+    lm = g.app.loadManager
+    fn = options.path and os.path.abspath(options.path)
+    if fn:
+        tempName = None
+    else:
+        fd,tempName = tempfile.mkstemp(suffix='.leo')
+        os.close(fd)
+        fn = tempName
+        writeOutline(fn,options.nodes or 100000,settings=True)
+    try:
+        times = []
+        t1 = time.time()
+        lm.getPreviousSettings(fn)
+        times.append(time.time()-t1)
+        t1 = time.time()
+        c2 = g.openWithFileName(fn)
+        times.append(time.time()-t1)
+        times.append(times[1]-times[0])
+        n = len(list(c2.all_unique_nodes()))
+        print('%s: %s bytes, %s nodes' % (fn,os.path.getsize(fn),n))
+        for name,t in zip(('pre-read settings','open','open less pre-read'),times):
+            print('%-32s %9.3fs' % (name,t))
+    finally:
+        if tempName:
+            os.remove(tempName)
+#@+node:ekr.20141230140001.18: ** benchmarkImports & helper
+def benchmarkImports (options):
+    '''
+    Report the import times of Leo's startup. Exit with status 1 if
+    startup imports lazily-imported modules or takes too long to import.
+    '''
+    limit = 0.25 if options.limit is None else options.limit
+    fd,outline = tempfile.mkstemp(suffix='.leo')
+    os.close(fd)
+    fd,fn = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        writeOutline(outline,10)
+        profiles = []
+        for i in range(4):
+            d = profileStartup(outline,fn)
+            d['importTime'] = sum([z['self'] for z in d['imports']])
+            if i > 0:
+                # The first run updates the caches.
+                profiles.append(d)
+    finally:
+        os.remove(outline)
+        os.remove(fn)
+    d = min(profiles,key=lambda d: d['importTime'])
+    print('%-40s %9.3fs' % ('startup',d['total']['wall']))
+    print('%-40s %9.3fs' % ('imports (%s modules)' % len(d['imports']),d['importTime']))
+    print('slowest imports: self, cumulative')
+    for entry in sorted(d['imports'],key=lambda z: -z['self'])[:10]:
+        print('%-40s %9.3fs %9.3fs' % (entry['name'],entry['self'],entry['cumulative']))
+    errors = []
+    lazy = sorted(set([z['name'] for z in d['imports']
+        for name in lazyModules
+            if z['name'] == name or z['name'].startswith(name + '.')]))
+    if lazy:
+        errors.append('startup imported lazy modules: %s' % ', '.join(lazy))
+    if d['importTime'] > limit:
+        errors.append('imports took %5.3fs, more than the limit of %5.3fs' % (
+            d['importTime'],limit))
+    for s in errors:
+        print('FAIL: %s' % s)
+    if errors:
+        sys.exit(1)
+#@+node:ekr.20141230140001.19: *3* profileStartup
+def profileStartup (outline,fn):
+    '''
+    Open outline with the null gui and without plugins in a new process,
+    writing a startup profile to fn. Return the profile.
+    '''
+    import json
+    command = [sys.executable,'-c','import leo.core.runLeo as r; r.run()',
+        '--gui=null','--no-plugins','--silent','--startup-profile=%s' % fn,outline]
+    subprocess.check_output(command,cwd=cwd,stderr=subprocess.STDOUT)
+    f = open(fn)
+    try:
+        return json.load(f)
+    finally:
+        f.close()
+#@+node:ekr.20141222100001.1: ** benchmarkMemory & helpers
+def benchmarkMemory (options):
+    '''Report the memory used by each VNode and Position.'''
+    n = options.nodes or 1000000
+    if options.child:
+        measureMemory(n)
+        return
+    line = runChild(['memory','--child','--nodes',str(n)])
+    method,vnodeBytes,positionBytes,t = line.split()
+    print('%s nodes, measured with %s' % (n,method))
+    print('%-24s %10s' % ('bytes per VNode',vnodeBytes))
+    print('%-24s %10s' % ('bytes per Position',positionBytes))
+    print('%-24s %9.2fs' % ('time to build outline',float(t)))
+#@+node:ekr.20141222100001.2: *3* buildOutline
+def buildOutline (c,n,depth=1,body=None):
+    '''
+    Add n nodes to c's outline, using the same shape as writeOutline,
+    but linking the nodes the way fc.readSaxFile does.
+
+    depth > 1 nests each group of children that many levels deep.
+    body: None or a function returning the body text of node i.
+    '''
+    import leo.core.leoNodes as leoNodes
+    gnx = 'bench.20141222000000.%s'
+    root = c.hiddenRootNode
+    root.children = []
+    i = 0
+    while i < n:
+        parent = leoNodes.VNode(context=c,gnx=gnx % i)
+        parent.setHeadString('node %s' % i)
+        if body: parent.setBodyString(body(i))
+        parent.parents.append(root)
+        root.children.append(parent)
+        i += 1
+        for j in range(depth):
+            group = parent
+            for k in range(min(9,n-i)):
+                v = leoNodes.VNode(context=c,gnx=gnx % i)
+                v.setHeadString('node %s' % i)
+                if body: v.setBodyString(body(i))
+                v.parents.append(group)
+                group.children.append(v)
+                i += 1
+                parent = v
+    c.gnxIndex.invalidate()
+#@+node:ekr.20141222100001.3: *3* measureMemory
+def measureMemory (n):
+    '''
+    Build an outline containing n nodes and print the memory used by
+    each VNode and by each Position.
+    '''
+    g,c = openBridge()
+    method = 'tracemalloc' if tracemalloc else 'ru_maxrss'
+    # Measure vnodes.
+    t1 = time.time()
+    before = memoryInUse()
+    buildOutline(c,n)
+    vnodeBytes = (memoryInUse() - before) / n
+    t2 = time.time()
+    # Measure copies of positions, as made by iterators.
+    before = memoryInUse()
+    aList = [p.copy() for p in c.all_positions()]
+    positionBytes = (memoryInUse() - before) / len(aList)
+    print('%s %d %d %s' % (method,vnodeBytes,positionBytes,t2-t1))
+#@+node:ekr.20141222100001.4: *3* memoryInUse
+def memoryInUse ():
+    '''
+    Return the bytes allocated by Python, as measured by tracemalloc,
+    or the peak resident set size of this process.
+    '''
+    if tracemalloc:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        return tracemalloc.get_traced_memory()[0]
+    else:
+        return 1024 * (peakMemory() or 0)
+#@+node:ekr.20141225080001.25: ** benchmarkSearch
+def benchmarkSearch (options):
+    '''Time c.find_b with and without the search index.'''
+    import gc
+    import pickle
+    import leo.core.leoSearchIndex as leoSearchIndex
+    n = options.nodes or 100000
+    g,c = openBridge()
+    body = lambda i: (
+        'def spam_%s(self,a,b):\n'
+        '    """A typical body."""\n'
+        '    return eggs_%s(a) < b & self.c.p.h\n' % (i,(i * 7) % n))
+    buildOutline(c,n,depth=3,body=body)
+    si = c.searchIndex
+    t1 = time.time()
+    si.update()
+    t2 = time.time()
+    si.candidates('pam') # Build the trigram index.
+    t3 = time.time()
+    data = dict([(word,leoSearchIndex.toBytes(a)) for word,a in si.postings.items()])
+    size = len(pickle.dumps(data,2))
+    print('%s nodes, %s words' % (n,len(si.postings)))
+    print('%-32s %9.2fs' % ('build index',t2-t1))
+    print('%-32s %9.2fs' % ('build trigram index',t3-t2))
+    print('%-32s %8sKB' % ('cached postings',size // 1024))
+    print('%-32s %10s %10s %10s' % ('c.find_b','hits','no index','index'))
+    for pattern in ('spam_%s' % (n // 2),'eggs_1234','pam_99','typical body',r'eggs_\d+7\(','self'):
+        times,hits = [],0
+        for enabled in (False,True):
+            si.enabled = enabled
+            gc.collect()
+            t1 = time.time()
+            hits = len(c.find_b(pattern))
+            times.append(time.time()-t1)
+        print('%-32s %10s %9.3fs %9.3fs' % (pattern,hits,times[0],times[1]))
+#@+node:ekr.20141230130001.7: ** benchmarkStartup & helper
+def benchmarkStartup (options):
+    '''Time startup with and without the settings cache.'''
+    if options.reader:
+        # In a child process.
+        startLeo(options.reader,options.noCache)
+        return
+    print('%-10s %-10s %10s' % ('gui','settings','time'))
+    for kind in ('bridge','null-gui'):
+        runChild(['startup','--reader',kind])
+            # Make sure the cache is up to date.
+        for noCache in (True,False):
+            args = ['startup','--reader',kind]
+            if noCache:
+                args.append('--no-cache')
+            t = float(runChild(args))
+            print('%-10s %-10s %9.3fs' % (kind,'parsed' if noCache else 'cached',t))
+#@+node:ekr.20141230130001.8: *3* startLeo
+def startLeo (kind,noCache):
+    '''
+    Start Leo with the bridge or the null gui, reading the global settings
+    files. Print the time taken.
+    '''
+    t1 = time.time()
+    if kind == 'bridge':
+        if noCache:
+            import leo.core.leoGlobals as leoGlobals
+            leoGlobals.enableDB = False
+        leoBridge.controller(
+            gui='nullGui',
+            loadPlugins=False,
+            readSettings=True,
+            silent=True,
+            verbose=False,
+        )
+    else:
+        import leo.core.runLeo # Creates g.app.
+        import leo.core.leoApp as leoApp
+        import leo.core.leoGlobals as g
+        sys.argv = ['leo','--gui=null']
+        if noCache:
+            sys.argv.append('--no-cache')
+        g.app.loadManager = lm = leoApp.LoadManager()
+        lm.doPrePluginsInit(fileName=None,pymacs=None)
+            # Reads the global settings files and creates the gui.
+    print(time.time()-t1)
+#@+node:ekr.20141231120001.64: ** benchmarkTokenize & helper
+def benchmarkTokenize (options):
+    '''Time leoTokenizer.Tokenizer on generated samples for all modes.'''
+    import glob
+    import leo.core.leoTokenizer as leoTokenizer
+    n = options.nodes or 200
+    g,c = openBridge()
+    tokenizer = leoTokenizer.Tokenizer()
+    pattern = g.os_path_finalize_join(g.app.loadDir,'..','modes','*.py')
+    languages = sorted([g.shortFileName(z)[:-3] for z in glob.glob(pattern)])
+    languages = [z for z in languages if z != '__init__']
+    results = [] # (language,chars,tokens,cold time,warm time)
+    for language in languages:
+        text = tokenizeSample(tokenizer,language,n)
+        if text is None:
+            continue
+        t1 = time.time()
+        tokenizer.tokenize(language,text)
+        t2 = time.time()
+        runs,states = tokenizer.tokenize(language,text)
+        t3 = time.time()
+        results.append((language,len(text),len(runs),t2-t1,t3-t2))
+    chars = sum([z[1] for z in results])
+    tokens = sum([z[2] for z in results])
+    print('%s modes, %s lines per mode, %s chars, %s tokens' % (
+        len(results),n,chars,tokens))
+    for name,k in (('with compilation',3),('without compilation',4)):
+        t = sum([z[k] for z in results]) or 1e-9
+        print('%-20s %9.4fs %10.0f tokens/sec %11.0f chars/sec' % (
+            name,t,tokens/t,chars/t))
+    print('slowest modes:')
+    for language,nChars,nTokens,cold,warm in sorted(results,key=lambda z: -z[4])[:5]:
+        print('%-20s %9.4fs %10.0f chars/sec' % (language,warm,nChars/(warm or 1e-9)))
+#@+node:ekr.20141231120001.65: *3* tokenizeSample
+def tokenizeSample (tokenizer,language,n):
+    '''
+    Return n lines of text containing the keywords of the language's
+    mode and common delimiters, or None if the mode can not be loaded.
+    '''
+    if not tokenizer.init_mode(language):
+        return None
+    # Leo directives such as @doc would color the rest of the sample.
+    keywords = sorted([z for z in tokenizer.keywordsDict if not z.startswith('@')])
+    keywords = keywords or ['word']
+    delims = (
+        '"string" \'c\' 123 0x1f (a+b)*c; # comment',
+        '// comment /* comment */ <tag attr="value"> $x @y',
+        '-- comment {block} [index] ; comment % comment',
+        'http://leoeditor.com <<section name>> @others',
+    )
+    lines = []
+    for i in range(n):
+        words = [keywords[(i * 7 + k) % len(keywords)] for k in range(6)]
+        lines.append(' '.join(words) + ' ' + delims[i % len(delims)])
+    return '\n'.join(lines)
+#@+node:ekr.20141224090001.4: ** benchmarkTraverse & helpers
+def benchmarkTraverse (options):
+    '''Time the outline iterators.'''
+    if options.child:
+        timeTraversals(options.nodes)
+        return
+    names = traversals()
+    sizes = [options.nodes] if options.nodes else [10000,100000,1000000]
+    print('%-32s %s' % ('seconds per traversal (nodes)',
+        ' '.join(['%10s' % n for n in sizes])))
+    results = []
+    for n in sizes:
+        line = runChild(['traverse','--child','--nodes',str(n)])
+        results.append([float(z) for z in line.split()])
+    for i,name in enumerate(names):
+        print('%-32s %s' % (name,' '.join(['%10.4f' % z[i] for z in results])))
+#@+node:ekr.20141224090001.5: *3* timeTraversals
+def timeTraversals (n):
+    '''
+    Build an outline containing n nodes, with some nested and cloned
+    nodes, and print the time taken by each traversal.
+    '''
+    g,c = openBridge()
+    buildOutline(c,n,depth=3)
+    # Clone every 100th top-level node as the last child of the next one.
+    root = c.hiddenRootNode
+    for i in range(100,len(root.children),100):
+        v = root.children[i-1]
+        v._addLink(len(root.children[i].children),root.children[i])
+    result = []
+    for name,f in traversals(c):
+        t1 = time.time()
+        f()
+        result.append(time.time()-t1)
+    print(' '.join(['%s' % z for z in result]))
+#@+node:ekr.20141224090001.6: *3* traversals
+def traversals (c=None):
+    '''
+    Return a list of (name,f) tuples, or just the names if c is None.
+    Calling f traverses c's outline.
+    '''
+    def consume (it):
+        for z in it:
+            pass
+    def copies (it):
+        for p in it:
+            p.copy()
+    table = [
+        ('c.all_positions',             lambda: consume(c.all_positions())),
+        ('c.all_positions + p.copy',    lambda: copies(c.all_positions())),
+        ('c.walk',                      lambda: consume(c.walk())),
+        ('c.walk_positions',            lambda: consume(c.walk_positions())),
+        ('c.all_unique_positions',      lambda: consume(c.all_unique_positions())),
+        ('c.walk(unique=True)',         lambda: consume(c.walk(unique=True))),
+        ('c.all_unique_nodes',          lambda: consume(c.all_unique_nodes())),
+    ]
+    return [z[0] for z in table] if c is None else table
+#@+node:ekr.20141218090101.23: *3* readLeoFile
+def readLeoFile (fn,reader):
+    '''
+    Read fn with the given reader method of c.fileCommands.
+    Print the number of nodes read, the time taken, and the peak
+    memory before and after the read.
+    '''
+    g,c = openBridge()
+    fc = c.fileCommands
+    fc.initReadIvars()
+    base = peakMemory()
+    t1 = time.time()
+    theFile = open(fn,'rb')
+    try:
+        v = getattr(fc,reader)(theFile,fn,
+            silent=True,inClipboard=True,reassignIndices=False)
+    finally:
+        theFile.close()
+    t2 = time.time()
+    peak = peakMemory()
+    assert v,'%s failed' % reader
+    print('%s %s %s %s' % (len(fc.gnxDict),t2-t1,base,peak))
+#@+node:ekr.20141218090101.24: *3* writeOutline
+def writeOutline (fn,n,settings=False):
+    '''
+    Write a .leo file containing n nodes, some of them cloned,
+    preceded by a small @settings tree if settings is True.
+    '''
+    body = 'def spam(a,b):\n    """A typical body."""\n    return a < b & c > d\n' * 8
+    gnx = 'bench.20141218000000.%s'
+    f = open(fn,'w')
+    f.write('<?xml version="1.0" encoding="utf-8"?>\n')
+    f.write('<leo_file xmlns:leo="http://www.leo-editor.org/2011/leo" >\n')
+    f.write('<leo_header file_format="2"/>\n')
+    f.write('<vnodes>\n')
+    if settings:
+        f.write('<v t="bench.20141217000000.1"><vh>@settings</vh>\n')
+        f.write('<v t="bench.20141217000000.2"><vh>@int bench-setting = 1</vh></v>\n')
+        f.write('</v>\n')
+    # Top-level nodes with ten children each. Every tenth group ends with a clone.
+    i = 0
+    while i < n:
+        f.write('<v t="%s"><vh>node %s</vh>\n' % (gnx % i,i))
+        parent = i
+        i += 1
+        for j in range(min(9,n-i)):
+            f.write('<v t="%s"><vh>node %s</vh></v>\n' % (gnx % i,i))
+            i += 1
+        if parent % 100 == 0 and parent > 0:
+            f.write('<v t="%s"><vh>node %s</vh></v>\n' % (gnx % 1,1))
+        f.write('</v>\n')
+    f.write('</vnodes>\n<tnodes>\n')
+    if settings:
+        for i in (1,2):
+            f.write('<t tx="bench.20141217000000.%s"></t>\n' % i)
+    escaped = body.replace('&','&amp;').replace('<','&lt;').replace('>','&gt;')
+    for i in range(n):
+        f.write('<t tx="%s">%s</t>\n' % (gnx % i,escaped))
+    f.write('</tnodes>\n</leo_file>\n')
+    f.close()
+#@+node:ekr.20141229090001.7: ** benchmarkUndo
+def benchmarkUndo (options):
+    '''Time u.beforeChangeTree, u.afterChangeTree, undo and redo.'''
+    n = options.nodes or 100000
+    g,c = openBridge()
+    buildOutline(c,n,depth=3)
+    # Move all nodes into the tree of the first top-level node.
+    root = c.hiddenRootNode
+    top = root.children[0]
+    for v in root.children[1:]:
+        v.parents = [top]
+        top.children.append(v)
+    root.children[1:] = []
+    c.gnxIndex.invalidate()
+    p = c.rootPosition()
+    c.selectPosition(p)
+    u = c.undoer
+    times = []
+    t1 = time.time()
+    bunch = u.beforeChangeTree(p)
+    times.append(time.time()-t1)
+    p.firstChild().b = 'changed'
+    t1 = time.time()
+    u.afterChangeTree(p,'benchmark',bunch)
+    times.append(time.time()-t1)
+    for helper in (u.undoTree,u.redoTree):
+        t1 = time.time()
+        u.setIvarsFromBunch(bunch)
+        helper()
+        times.append(time.time()-t1)
+    print('%s nodes, %s changed' % (n,len(bunch.oldTree)))
+    for name,t in zip(('beforeChangeTree','afterChangeTree','undo','redo'),times):
+        print('%-32s %9.3fs' % (name,t))
+#@+node:ekr.20141230100001.15: ** benchmarkWords
+def benchmarkWords (options):
+    '''Time c.wordIndex.completions and a scan of all bodies.'''
+    import leo.core.leoWordIndex as leoWordIndex
+    n = options.nodes or 100000
+    g,c = openBridge()
+    body = lambda i: (
+        'def spam_%s(self,a,b):\n'
+        '    return eggs_%s(a) < b\n' % (i,(i * 7) % n))
+    buildOutline(c,n,depth=3,body=body)
+    wi = c.wordIndex
+    times = []
+    t1 = time.time()
+    aList = leoWordIndex.word_pattern.findall(
+        ''.join([v._bodyString for v,level,childIndex in c.walk(unique=True)]))
+    aList = sorted(set([z for z in aList if z.startswith('spam_1')]))
+    times.append(time.time()-t1)
+    t1 = time.time()
+    wi.update()
+    times.append(time.time()-t1)
+    t1 = time.time()
+    aList2 = wi.completions('spam_1')
+    times.append(time.time()-t1)
+    assert aList == aList2
+    c.rootPosition().b = 'changed_word'
+    t1 = time.time()
+    wi.completions('spam_1')
+    times.append(time.time()-t1)
+    print('%s nodes, %s words, %s completions' % (n,len(wi.words),len(aList)))
+    for name,t in zip(('scan all bodies','build index','completions','completions after a change'),times):
+        print('%-32s %9.4fs' % (name,t))
+#@-others
+
+if __name__ == '__main__':
+    main()
+#@-leo
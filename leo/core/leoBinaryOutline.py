@@ -0,0 +1,488 @@
+#@+leo-ver=5-thin
+#@+node:ekr.20141219100001.1: * @file leoBinaryOutline.py
+'''
+Classes that read and write .leob files, a compact binary equivalent of
+.leo files.
+
+A .leob file holds exactly the information in the corresponding .leo
+file, so leoToLeob and leobToLeo convert between the two formats without
+loss. Unlike .leo files, .leob files can be read without parsing xml and
+the body of any node can be read without reading the rest of the file.
+'''
+#@+<< .leob file format >>
+#@+node:ekr.20141219100001.2: ** << .leob file format >>
+#@@nocolor-node
+#@+at
+# All integers are unsigned and little-endian. All strings are utf-8.
+# 
+# A .leob file starts with a header:
+# 
+#     magic:      the 4 bytes 'LEOB'
+#     version:    u32
+#     count:      u32, the number of sections
+#     sections:   count entries of (tag: 4 bytes, offset: u64, length: u64)
+# 
+# The sections are:
+# 
+# STRS: The string table: gnxs, headlines, element and attribute names
+#       and attribute values, each stored once.
+#       u32 n, then n+1 u32 offsets into the following string data.
+#       String i is data[offsets[i]:offsets[i+1]].
+# 
+# ELEM: The elements of the .leo file, in document order, as a stream of
+#       one-byte opcodes followed by their arguments. All arguments are
+#       varints: 7 bits per byte, low bits first, high bit set in all
+#       but the last byte.
+#       START   tag: string index, n, then n attributes.
+#               Each attribute is (2 * name + kind, value), name being a
+#               string index. If kind is STRING, value is a string index.
+#               If kind is HEX, value is a length followed by that many
+#               bytes: the unhexlified value of an attribute such as a
+#               pickled uA.
+#       END
+#       TEXT    string index: the text of a <vh> element.
+#       BODY    index into TNOD: the text of a <t> element.
+#       PI      target: string index, data: string index.
+# 
+# BODY: The body texts of all <t> elements.
+# 
+# TNOD: One 16-byte record (tx: u32 string index, offset: u64, length: u32)
+#       for each <t> element, in document order. offset and length locate
+#       the body text in BODY.
+# 
+# TIDX: u32 n, then n u32 indices into TNOD sorted by gnx. This allows
+#       LeobFile.getBody to find a body with a binary search.
+#@-<< .leob file format >>
+#@+<< imports >>
+#@+node:ekr.20141219100001.3: ** << imports >> (leoBinaryOutline)
+import leo.core.leoGlobals as g
+import binascii
+import io
+import re
+import string
+import struct
+import xml.sax
+import xml.sax.handler
+import xml.sax.saxutils
+import xml.sax.xmlreader
+#@-<< imports >>
+
+magic = b'LEOB'
+version = 1
+START,END,TEXT,BODY,PI = 1,2,3,4,5
+STRING,HEX = 0,1
+hex_pattern = re.compile(r'^(?:[0-9a-f]{2})+$')
+    # Only lower-case hex strings survive a round trip through binascii.
+badchars_pattern = re.compile(u'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+    # The control characters that leoToLeob replaces with blanks.
+
+#@+others
+#@+node:ekr.20141219100001.4: ** Top-level functions (leoBinaryOutline)
+def varint(n):
+    '''Return n, an unsigned int, encoded as a varint.'''
+    aList = []
+    while n >= 0x80:
+        aList.append((n & 0x7f) | 0x80)
+        n >>= 7
+    aList.append(n)
+    return bytes(bytearray(aList))
+
+def cleanAttribute(s):
+    '''
+    Return s, an attribute value, as a sax parser reports it after a
+    round trip through a .leo file.
+    '''
+    s = cleanText(s)
+    for ch in '\n\t':
+        if ch in s:
+            s = s.replace(ch,' ')
+    return s
+
+def cleanText(s):
+    '''
+    Return s, the text of an element, as a sax parser reports it after a
+    round trip through a .leo file: without control characters and with
+    all line endings converted to newlines.
+    '''
+    if badchars_pattern.search(s):
+        s = badchars_pattern.sub(' ',s)
+    if '\r' in s:
+        s = s.replace('\r\n','\n').replace('\r','\n')
+    return s
+
+def isLeobData(s):
+    '''Return True if s, a string or bytes, starts a .leob file.'''
+    return g.toEncodedString(s[:len(magic)],'utf-8') == magic
+
+def leoToLeob(s):
+    '''Convert s, the contents of a .leo file, to the contents of a .leob file.'''
+    # Like fc.cleanSaxInputString, replace control characters with blanks.
+    s = g.toEncodedString(s,'utf-8')
+    badchars = bytes(bytearray([ch for ch in range(32) if ch not in (9,10,13)]))
+    if g.isPython3:
+        table = bytes.maketrans(badchars,b' ' * len(badchars))
+    else:
+        table = string.maketrans(badchars,' ' * len(badchars))
+    s = s.translate(table)
+    encoder = LeobEncoder()
+    xml.sax.parseString(s,encoder)
+    return encoder.getData()
+
+def leobToLeo(data):
+    '''Convert data, the contents of a .leob file, to the contents of a .leo file.'''
+    return LeobFile(io.BytesIO(data)).toXML()
+#@+node:ekr.20141219100001.5: ** class LeobEncoder (ContentHandler)
+class LeobEncoder (xml.sax.handler.ContentHandler):
+
+    '''
+    A sax content handler that converts a .leo file to a .leob file.
+
+    fc.putLeobFile calls the start, endElement and characters methods
+    directly, without creating any xml.
+    '''
+
+    #@+others
+    #@+node:ekr.20141219100001.6: *3*  leob.__init__
+    def __init__ (self):
+        '''Ctor for LeobEncoder class.'''
+        xml.sax.handler.ContentHandler.__init__(self)
+        self.bodies = []
+            # The bodies of all <t> elements, encoded.
+        self.bodySize = 0
+        self.content = None
+            # A list while within <t> and <vh> elements.
+        self.elements = []
+            # The pieces of the ELEM section.
+        self.strings = []
+            # Encoded strings in order of their indices.
+        self.stringDict = {}
+            # Keys are unicode strings, values are string indices.
+        self.tnodes = []
+            # (tx,offset,length) for each <t> element.
+    #@+node:ekr.20141219100001.7: *3* leob.characters
+    def characters (self,content):
+
+        if self.content is not None:
+            self.content.append(content)
+    #@+node:ekr.20141219100001.8: *3* leob.endElement
+    def endElement (self,name):
+
+        if name == 't':
+            b = g.toEncodedString(''.join(self.content),'utf-8')
+            self.elements.append(struct.pack('<B',BODY) + varint(len(self.tnodes)))
+            self.tnodes.append((self.tx,self.bodySize,len(b)),)
+            self.bodies.append(b)
+            self.bodySize += len(b)
+            self.content = None
+        elif name == 'vh':
+            h = ''.join(self.content)
+            self.elements.append(struct.pack('<B',TEXT) + varint(self.stringIndex(h)))
+            self.content = None
+        self.elements.append(struct.pack('<B',END))
+    #@+node:ekr.20141219100001.9: *3* leob.getData
+    def getData (self):
+        '''Return the contents of the .leob file.'''
+        strings = self.strings
+        offsets,n = [],0
+        for s in strings:
+            offsets.append(n)
+            n += len(s)
+        offsets.append(n)
+        stringData = b''.join([
+            struct.pack('<I',len(strings)),
+            struct.pack('<%sI' % len(offsets),*offsets)]+strings)
+        tnodeData = b''.join([struct.pack('<IQI',*z) for z in self.tnodes])
+        order = sorted(range(len(self.tnodes)),
+            key=lambda i: strings[self.tnodes[i][0]])
+        indexData = struct.pack('<I%sI' % len(order),len(order),*order)
+        sections = (
+            (b'STRS',stringData),
+            (b'ELEM',b''.join(self.elements)),
+            (b'BODY',b''.join(self.bodies)),
+            (b'TNOD',tnodeData),
+            (b'TIDX',indexData),
+        )
+        result,offset = [],12 + 20 * len(sections)
+        result.append(magic + struct.pack('<II',version,len(sections)))
+        for tag,data in sections:
+            result.append(tag + struct.pack('<QQ',offset,len(data)))
+            offset += len(data)
+        result.extend([data for tag,data in sections])
+        return b''.join(result)
+    #@+node:ekr.20141219100001.10: *3* leob.processingInstruction
+    def processingInstruction (self,target,data):
+
+        self.elements.append(struct.pack('<B',PI) +
+            varint(self.stringIndex(target)) + varint(self.stringIndex(data)))
+    #@+node:ekr.20141219100001.11: *3* leob.startElement
+    def startElement (self,name,attrs):
+
+        self.start(name,[(z,attrs.getValue(z)) for z in attrs.getNames()])
+    #@+node:ekr.20150102090001.7: *3* leob.start
+    def start (self,name,attrs):
+        '''
+        Start an element. attrs is a list of (name,value) tuples in document
+        order. Values must be as a sax parser would report them.
+        '''
+        aList = [
+            struct.pack('<B',START),
+            varint(self.stringIndex(name)),
+            varint(len(attrs)),
+        ]
+        for attr,val in attrs:
+            n = 2 * self.stringIndex(attr)
+            if attr not in ('t','tx') and hex_pattern.match(val):
+                # Store pickled uA's and other hex data as raw bytes.
+                data = binascii.unhexlify(g.toEncodedString(val,'ascii'))
+                aList.extend([varint(n + HEX),varint(len(data)),data])
+            else:
+                aList.extend([varint(n + STRING),varint(self.stringIndex(val))])
+        self.elements.append(b''.join(aList))
+        if name == 't':
+            self.tx = self.stringIndex(dict(attrs).get('tx'))
+            self.content = []
+        elif name == 'vh':
+            self.content = []
+    #@+node:ekr.20141219100001.12: *3* leob.stringIndex
+    def stringIndex (self,s):
+        '''Return the index of s in the string table, adding s if necessary.'''
+        n = self.stringDict.get(s)
+        if n is None:
+            n = self.stringDict[s] = len(self.strings)
+            self.strings.append(g.toEncodedString(s,'utf-8'))
+        return n
+    #@-others
+#@+node:ekr.20141219100001.13: ** class LeobFile
+class LeobFile:
+
+    '''A class that reads an open .leob file.'''
+
+    #@+others
+    #@+node:ekr.20141219100001.14: *3*  leob.__init__
+    def __init__ (self,theFile):
+        '''Ctor for LeobFile class. theFile is a .leob file open in binary mode.'''
+        self.theFile = theFile
+        self.sections = {}
+            # Keys are section tags, values are (offset,length).
+        self.strings = None
+            # A list of all strings, created by readStrings.
+        self.readHeader()
+    #@+node:ekr.20141219100001.15: *3* leob.Reading
+    #@+node:ekr.20141219100001.16: *4* leob.read
+    def read (self,offset,n):
+        '''Return n bytes at the given file offset.'''
+        f = self.theFile
+        f.seek(offset)
+        s = f.read(n)
+        if len(s) != n:
+            raise ValueError('truncated .leob file')
+        return s
+    #@+node:ekr.20141219100001.17: *4* leob.readHeader
+    def readHeader (self):
+        '''Read the header and the table of sections.'''
+        s = self.read(0,12)
+        if s[:4] != magic:
+            raise ValueError('not a .leob file')
+        n,count = struct.unpack('<II',s[4:])
+        if n != version:
+            raise ValueError('unknown .leob version: %s' % n)
+        s = self.read(12,20 * count)
+        for i in range(count):
+            j = 20 * i
+            offset,length = struct.unpack('<QQ',s[j+4:j+20])
+            self.sections[s[j:j+4]] = (offset,length)
+    #@+node:ekr.20141219100001.18: *4* leob.readSection
+    def readSection (self,tag):
+        '''Return the contents of the section with the given tag.'''
+        offset,length = self.sections[tag]
+        return self.read(offset,length)
+    #@+node:ekr.20141219100001.19: *4* leob.readString
+    def readString (self,i):
+        '''Read string i without reading the entire string table.'''
+        if self.strings is not None:
+            return self.strings[i]
+        offset,length = self.sections[b'STRS']
+        n = struct.unpack('<I',self.read(offset,4))[0]
+        start,end = struct.unpack('<II',self.read(offset+4+4*i,8))
+        data = offset + 4 + 4*(n+1)
+        return g.toUnicode(self.read(data+start,end-start),'utf-8')
+    #@+node:ekr.20141219100001.20: *4* leob.readStrings
+    def readStrings (self):
+        '''Read the entire string table.'''
+        s = self.readSection(b'STRS')
+        n = struct.unpack('<I',s[:4])[0]
+        offsets = struct.unpack('<%sI' % (n+1),s[4:8+4*n])
+        data = 8 + 4*n
+        self.strings = [
+            g.toUnicode(s[data+offsets[i]:data+offsets[i+1]],'utf-8')
+                for i in range(n)]
+    #@+node:ekr.20141219100001.21: *3* leob.getBody
+    def getBody (self,gnx):
+        '''
+        Return the body of the node with the given gnx, or None.
+
+        This reads only the parts of the file needed to find the body.
+        '''
+        index = self.sections[b'TIDX'][0]
+        tnodes = self.sections[b'TNOD'][0]
+        n = struct.unpack('<I',self.read(index,4))[0]
+        lo,hi = 0,n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            i = struct.unpack('<I',self.read(index+4+4*mid,4))[0]
+            tx,start,size = struct.unpack('<IQI',self.read(tnodes+16*i,16))
+            tx = self.readString(tx)
+            if tx == gnx:
+                body_offset = self.sections[b'BODY'][0]
+                return g.toUnicode(self.read(body_offset+start,size),'utf-8')
+            elif tx < gnx:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+    #@+node:ekr.20141219100001.22: *3* leob.replay
+    def replay (self,handler):
+        '''
+        Call the methods of handler, a sax content handler, just as a sax
+        parser would when parsing the corresponding .leo file.
+        '''
+        self.readStrings()
+        strings = self.strings
+        elements = self.readSection(b'ELEM')
+        codes = bytearray(elements)
+        bodies = self.readSection(b'BODY')
+        tnodes = self.readSection(b'TNOD')
+        AttributesImpl = xml.sax.xmlreader.AttributesImpl
+        def get():
+            '''Return the varint at codes[i] and advance i.'''
+            n = shift = 0
+            while True:
+                b = codes[i[0]]
+                i[0] += 1
+                n |= (b & 0x7f) << shift
+                if b < 0x80:
+                    return n
+                shift += 7
+        stack = []
+        i,n = [0],len(codes)
+            # i is a list so that get can update it.
+        handler.startDocument()
+        while i[0] < n:
+            op = codes[i[0]]
+            i[0] += 1
+            if op == START:
+                name = strings[get()]
+                d = {}
+                for j in range(get()):
+                    attr = get()
+                    if attr & 1 == HEX:
+                        size = get()
+                        k = i[0]
+                        val = g.ue(binascii.hexlify(elements[k:k+size]),'ascii')
+                        i[0] += size
+                    else:
+                        val = strings[get()]
+                    d[strings[attr >> 1]] = val
+                stack.append(name)
+                handler.startElement(name,AttributesImpl(d))
+            elif op == END:
+                handler.endElement(stack.pop())
+            elif op == TEXT:
+                handler.characters(strings[get()])
+            elif op == BODY:
+                j = 16 * get()
+                tx,start,size = struct.unpack('<IQI',tnodes[j:j+16])
+                if size:
+                    handler.characters(g.toUnicode(bodies[start:start+size],'utf-8'))
+            elif op == PI:
+                target = strings[get()]
+                handler.processingInstruction(target,strings[get()])
+            else:
+                raise ValueError('bad .leob opcode: %s' % op)
+        handler.endDocument()
+    #@+node:ekr.20141219100001.23: *3* leob.toXML
+    def toXML (self):
+        '''Return the contents of the corresponding .leo file, as bytes.'''
+        writer = LeobXMLWriter()
+        self.replay(writer)
+        return writer.getData()
+    #@-others
+#@+node:ekr.20141219100001.24: ** class LeobXMLWriter (ContentHandler)
+class LeobXMLWriter (xml.sax.handler.ContentHandler):
+
+    '''A sax content handler that writes a .leo file in Leo's usual layout.'''
+
+    #@+others
+    #@+node:ekr.20141219100001.25: *3*  leob.__init__
+    def __init__ (self):
+        '''Ctor for LeobXMLWriter class.'''
+        xml.sax.handler.ContentHandler.__init__(self)
+        self.afterHeadline = False
+            # True: the last output was a </vh> tag.
+        self.inElement = False
+            # True: the last output was a start tag without its closing '>'.
+        self.result = []
+    #@+node:ekr.20141219100001.26: *3* leob.characters
+    def characters (self,content):
+
+        self.closeStartTag()
+        self.result.append(xml.sax.saxutils.escape(content))
+    #@+node:ekr.20141219100001.27: *3* leob.closeStartTag
+    def closeStartTag (self):
+        '''Finish a pending start tag.'''
+        if self.inElement:
+            self.result.append('>')
+            self.inElement = False
+    #@+node:ekr.20141219100001.28: *3* leob.endDocument & startDocument
+    def startDocument (self):
+
+        self.result.append('%s"utf-8"%s\n' % (
+            g.app.prolog_prefix_string,g.app.prolog_postfix_string))
+        self.result.append('<!-- Created by Leo: http://leoeditor.com/leo_toc.html -->\n')
+
+    def endDocument (self):
+
+        pass
+    #@+node:ekr.20141219100001.29: *3* leob.endElement
+    def endElement (self,name):
+
+        if self.inElement:
+            self.result.append('/>')
+            self.inElement = False
+        else:
+            self.result.append('</%s>' % name)
+        # Put <v> elements on separate lines.
+        self.afterHeadline = name == 'vh'
+        if not self.afterHeadline:
+            self.result.append('\n')
+    #@+node:ekr.20141219100001.30: *3* leob.getData
+    def getData (self):
+        '''Return the .leo file as bytes.'''
+        return g.toEncodedString(''.join(self.result),'utf-8')
+    #@+node:ekr.20141219100001.31: *3* leob.processingInstruction
+    def processingInstruction (self,target,data):
+
+        self.closeStartTag()
+        self.result.append('<?%s %s?>\n' % (target,data))
+    #@+node:ekr.20141219100001.32: *3* leob.startElement
+    def startElement (self,name,attrs):
+
+        if self.inElement:
+            self.result.append('>')
+            if name != 'vh':
+                self.result.append('\n')
+        elif self.afterHeadline:
+            self.result.append('\n')
+        self.afterHeadline = False
+        self.result.append('<%s' % name)
+        entities = {'"':'&quot;','\n':'&#10;','\r':'&#13;','\t':'&#9;'}
+        for attr in attrs.getNames():
+            val = xml.sax.saxutils.escape(attrs.getValue(attr),entities)
+            self.result.append(' %s="%s"' % (attr,val))
+        self.inElement = True
+    #@-others
+#@-others
+#@@language python
+#@@tabwidth -4
+#@@pagewidth 70
+#@-leo
@@ -20,9 +20,14 @@ import fnmatch
 import hashlib
 import os
 import stat
-# import time
+import time
 import zlib
 
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
 # try:
     # import marshal
 # except ImportError:
@@ -58,10 +63,45 @@ class Cacher:
         # set by initFileDB and initGlobalDB...
         self.db = {}
             # 2011/07/30
-            # When caching is enabled will be a PickleShareDB instance.
+            # When caching is enabled will be a PickleShareDB
+            # or SqlitePickleShareDB instance.
         self.dbdirname = None # A string.
         self.inited = False
 
+    #@+node:ekr.20141215061501.1: *4* getBackend (Cacher)
+    def getBackend (self):
+        '''
+        Return the name of the db class to use: 'sqlite' or 'pickleshare'.
+        The @string cache-backend setting selects the backend.
+        '''
+        c = self.c
+        config = c.config if c else g.app.config
+        kind = config and config.getString('cache-backend')
+        kind = (kind or 'sqlite').lower()
+        if kind == 'sqlite' and not sqlite3:
+            kind = 'pickleshare'
+        return kind
+    #@+node:ekr.20141215061501.2: *4* getMaxCacheSize (Cacher)
+    def getMaxCacheSize (self):
+        '''Return the maximum size of an sqlite db in bytes, or 0.'''
+        c = self.c
+        config = c.config if c else g.app.config
+        n = config and config.getInt('cache-max-megabytes')
+        return max(0,n or 0) * 1024 * 1024
+    #@+node:ekr.20141215061501.3: *4* openDB (Cacher)
+    def openDB (self,dbdirname):
+        '''
+        Return a db for dbdirname, using the backend given by getBackend.
+        The sqlite db holds all entries in the single file dbdirname.sqlite.
+        The first time it is opened, it imports the entries of the
+        PickleShareDB directory dbdirname, if it exists.
+        '''
+        if self.getBackend() == 'sqlite':
+            return SqlitePickleShareDB(dbdirname + '.sqlite',
+                legacyRoot=dbdirname,
+                maxSize=self.getMaxCacheSize())
+        else:
+            return PickleShareDB(dbdirname)
     #@+node:ekr.20100208082353.5918: *4* initFileDB
     def initFileDB (self,fn):
 
@@ -83,7 +123,7 @@ class Cacher:
             self.dbdirname = dbdirname = join(g.app.homeLeoDir,'db',
                 '%s_%s' % (bname,hashlib.md5(fn).hexdigest()))
 
-            self.db = PickleShareDB(dbdirname)
+            self.db = self.openDB(dbdirname)
             # Fixes bug 670108.
             self.c.db = self.db
             self.inited = True
@@ -98,7 +138,7 @@ class Cacher:
         # We always create the global db, even if caching is disabled.
         try:
             dbdirname = g.app.homeLeoDir + "/db/global"
-            self.db = db = PickleShareDB(dbdirname)
+            self.db = db = self.openDB(dbdirname)
             if trace: g.trace(db,dbdirname)
             self.inited = True
             return db
@@ -109,6 +149,16 @@ class Cacher:
 
         if changeName or not self.inited:
             self.initFileDB(fn)
+    #@+node:ekr.20141215061501.4: *3* begin/endBatch (Cacher)
+    def beginBatch (self):
+        '''Defer committing db changes until the matching endBatch.'''
+        if hasattr(self.db,'beginBatch'):
+            self.db.beginBatch()
+
+    def endBatch (self):
+        '''Commit all db changes made since the matching beginBatch.'''
+        if hasattr(self.db,'endBatch'):
+            self.db.endBatch()
     #@+node:ekr.20100209160132.5759: *3* clear/AllCache(s) (Cacher)
     def clearCache (self):
         if self.db:
@@ -174,6 +224,8 @@ class Cacher:
             v = parent_v
             v._headString = h    
             v._bodyString = b
+            v.bumpTextRevision()
+            v.context.gnxIndex.headlineChanged(v)
 
         for z in children:
             h,b,gnx,grandChildren = z
@@ -257,6 +309,19 @@ class Cacher:
         child_v.h,child_v.b = h,b
         child_v.setDirty()
         c.changed = True # Tell getLeoFile to propegate dirty nodes.
+    #@+node:ekr.20141217081503.5: *4* getCachedFingerprint
+    def getCachedFingerprint (self,fn):
+        '''
+        Return the data set by setCachedFingerprint for the external file fn,
+        or None.
+        '''
+        key = self.fileKey(fn,'fingerprint')
+        return self.db.get('fingerprint_%s' % key)
+    #@+node:ekr.20141225080001.22: *4* getCachedSearchIndex
+    def getCachedSearchIndex (self):
+        '''Return the data set by setCachedSearchIndex, or None.'''
+        key = self.fileKey(self.c.mFileName,'search-index')
+        return self.db.get('search_index_%s' % key)
     #@+node:ekr.20100208082353.5923: *4* getCachedGlobalFileRatios
     def getCachedGlobalFileRatios (self):
 
@@ -358,6 +423,19 @@ class Cacher:
         return [
             p.h,p.b,p.gnx,
             [self.makeCacheList(p2) for p2 in p.children()]]
+    #@+node:ekr.20141217081503.6: *4* setCachedFingerprint
+    def setCachedFingerprint (self,fn,data):
+        '''
+        Remember data, a tuple (fingerprint,stat), for the external file fn.
+        See at.treeFingerprint.
+        '''
+        key = self.fileKey(fn,'fingerprint')
+        self.db['fingerprint_%s' % key] = data
+    #@+node:ekr.20141225080001.23: *4* setCachedSearchIndex
+    def setCachedSearchIndex (self,data):
+        '''Remember data, the search index of the outline. See si.writeCache.'''
+        key = self.fileKey(self.c.mFileName,'search-index')
+        self.db['search_index_%s' % key] = data
     #@+node:ekr.20100208082353.5929: *4* setCachedGlobalsElement
     def setCachedGlobalsElement(self,fn):
 
@@ -372,17 +450,21 @@ class Cacher:
 
         if trace: g.trace(c.mFileName,key,g.callers(5))
 
-        self.db['body_outline_ratio_%s' % key] = str(c.frame.ratio)
-        self.db['body_secondary_ratio_%s' % key] = str(c.frame.secondary_ratio)
-        if trace: g.trace('ratios: %1.2f %1.2f' % (
-            c.frame.ratio,c.frame.secondary_ratio))
-
-        width,height,left,top = c.frame.get_window_info()
-
-        self.db['window_position_%s' % key] = (
-            str(top),str(left),str(height),str(width))
-        if trace:
-            g.trace('top',top,'left',left,'height',height,'width',width)
+        self.beginBatch()
+        try:
+            self.db['body_outline_ratio_%s' % key] = str(c.frame.ratio)
+            self.db['body_secondary_ratio_%s' % key] = str(c.frame.secondary_ratio)
+            if trace: g.trace('ratios: %1.2f %1.2f' % (
+                c.frame.ratio,c.frame.secondary_ratio))
+
+            width,height,left,top = c.frame.get_window_info()
+
+            self.db['window_position_%s' % key] = (
+                str(top),str(left),str(height),str(width))
+            if trace:
+                g.trace('top',top,'left',left,'height',height,'width',width)
+        finally:
+            self.endBatch()
     #@+node:ekr.20100208082353.5928: *4* setCachedStringPosition
     def setCachedStringPosition(self,str_pos):
 
@@ -412,7 +494,7 @@ class Cacher:
         elif not fileKey:
             g.trace(g.callers(5))
             g.internalError('empty fileKey')
-        elif self.db.get(fileKey):
+        elif fileKey in self.db:
             if trace: g.trace('already cached',fileKey)
         else:
             if trace: g.trace('caching ',p.h,fileKey)
@@ -801,5 +883,282 @@ class PickleShareDB:
             self.cache.pop(it,None)
 
     #@-others
+#@+node:ekr.20141215061501.5: ** class SqlitePickleShareDB
+class SqlitePickleShareDB:
+
+    """
+    A PickleShareDB-like db that keeps all entries in a single sqlite file.
+
+    Values are pickled and compressed exactly as in PickleShareDB, but
+    they are decompressed only when they are first accessed.
+    """
+
+    #@+others
+    #@+node:ekr.20141215061501.6: *3*  Birth & special methods
+    #@+node:ekr.20141215061501.7: *4*  __init__ (SqlitePickleShareDB)
+    def __init__(self,fn,legacyRoot=None,maxSize=0):
+
+        """
+        Init the SqlitePickleShareDB class.
+        fn:         The sqlite file that contains the data.
+        legacyRoot: A PickleShareDB directory to import the first time.
+        maxSize:    The maximum total size of all entries, or 0.
+        """
+
+        trace = False and not g.unitTesting
+
+        if g.unitTesting:
+            # Like PickleShareDB, don't touch the file system.
+            self.fn = ':memory:'
+        else:
+            self.fn = abspath(expanduser(fn))
+            parent,junk = split(self.fn)
+            if parent and not isdir(parent):
+                os.makedirs(parent)
+
+        if trace: g.trace('SqlitePickleShareDB',self.fn)
+
+        self.batchLevel = 0
+            # > 0: defer commits until endBatch.
+        self.cache = {}
+            # Keys are keys, values are unpickled values.
+        self.maxSize = maxSize
+        self.totalSize = None
+            # The total size of all entries, or None if not yet known.
+        self.touched = set()
+            # Keys read since the last commit.
+        self.conn = sqlite3.connect(self.fn,timeout=10.0)
+        self.conn.text_factory = str
+        self.conn.execute('create table if not exists cachevalues '
+            '(key text primary key, data blob, size integer, atime real)')
+        self.conn.execute('create index if not exists cacheatimes '
+            'on cachevalues (atime)')
+        self.conn.execute('create table if not exists meta '
+            '(key text primary key, value text)')
+        self.conn.commit()
+        if legacyRoot and not g.unitTesting:
+            self.migrate(legacyRoot)
+    #@+node:ekr.20141215061501.8: *4* __contains__
+    def __contains__(self, key):
+
+        # Unlike PickleShareDB, this does not read the value.
+        if key in self.cache:
+            return True
+        row = self.conn.execute(
+            'select 1 from cachevalues where key=?',(key,)).fetchone()
+        return row is not None
+    #@+node:ekr.20141215061501.9: *4* __delitem__
+    def __delitem__(self,key):
+
+        """ del db["key"] """
+
+        self.cache.pop(key,None)
+        self.touched.discard(key)
+        if self.totalSize is not None:
+            self.totalSize -= self.entrySize(key)
+        self.conn.execute('delete from cachevalues where key=?',(key,))
+        self.commit()
+    #@+node:ekr.20141215061501.10: *4* __getitem__
+    def __getitem__(self,key):
+
+        """ db['key'] reading """
+
+        trace = False and not g.unitTesting
+
+        if key in self.cache:
+            if trace: g.trace('(SqlitePickleShareDB: in cache)',key)
+            self.touched.add(key)
+            return self.cache[key]
+        row = self.conn.execute(
+            'select data from cachevalues where key=?',(key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        try:
+            obj = self.loadz(row[0])
+        except Exception:
+            if trace: g.trace('***Exception',key)
+            raise KeyError(key)
+        self.cache[key] = obj
+        self.touched.add(key)
+        if trace: g.trace('(SqlitePickleShareDB: set cache)',key)
+        return obj
+    #@+node:ekr.20141215061501.11: *4* __iter__
+    def __iter__(self):
+
+        for k in list(self.keys()):
+            yield k
+    #@+node:ekr.20141215061501.12: *4* __repr__
+    def __repr__(self):
+
+        return "SqlitePickleShareDB('%s')" % self.fn
+    #@+node:ekr.20141215061501.13: *4* __setitem__
+    def __setitem__(self,key,value):
+
+        """ db['key'] = 5 """
+
+        trace = False and not g.unitTesting
+        if trace: g.trace('(SqlitePickleShareDB)',key)
+
+        data = self.dumpz(value)
+        if self.totalSize is not None:
+            self.totalSize += len(data) - self.entrySize(key)
+        self.conn.execute(
+            'replace into cachevalues (key,data,size,atime) values (?,?,?,?)',
+            (key,self.toBlob(data),len(data),time.time()))
+        self.cache[key] = value
+        self.touched.discard(key)
+        self.commit()
+    #@+node:ekr.20141215061501.14: *3* batches & commit
+    def beginBatch (self):
+        '''Defer commits until the matching endBatch.'''
+        self.batchLevel += 1
+
+    def endBatch (self):
+        '''End a batch, committing all changes if it is the outermost batch.'''
+        self.batchLevel = max(0,self.batchLevel-1)
+        self.commit()
+
+    def commit (self):
+        '''Commit all pending changes, unless a batch is in progress.'''
+        if self.batchLevel > 0:
+            return
+        if self.touched:
+            t = time.time()
+            self.conn.executemany(
+                'update cachevalues set atime=? where key=?',
+                [(t,key) for key in self.touched])
+            self.touched = set()
+        self.conn.commit()
+        if self.maxSize:
+            self.evict()
+    #@+node:ekr.20141215061501.15: *3* dumpz, loadz & toBlob
+    def dumpz (self,val):
+        '''Return the compressed pickle of val, as in PickleShareDB.'''
+        return zlib.compress(pickle.dumps(val,pickle.HIGHEST_PROTOCOL))
+
+    def loadz (self,data):
+        '''Return the value whose compressed pickle is data.'''
+        return pickle.loads(zlib.decompress(bytes(data)))
+
+    def toBlob (self,data):
+        '''Return data in a form that sqlite stores as a blob.'''
+        return data if isPython3 else buffer(data) # pylint: disable=undefined-variable
+    #@+node:ekr.20141215061501.16: *3* evict & entrySize
+    def evict (self):
+        '''Delete the least-recently used entries until the db fits in maxSize.'''
+        trace = False and not g.unitTesting
+        if self.totalSize is None:
+            # Sum the sizes once. __setitem__ and __delitem__ keep the total.
+            row = self.conn.execute('select sum(size) from cachevalues').fetchone()
+            self.totalSize = row and row[0] or 0
+        if self.totalSize <= self.maxSize:
+            return
+        # Another Leo may share the db: recompute the total before evicting.
+        row = self.conn.execute('select sum(size) from cachevalues').fetchone()
+        total = self.totalSize = row and row[0] or 0
+        if total <= self.maxSize:
+            return
+        # Evict down to 90% of the limit so we don't evict on every write.
+        limit = int(0.9 * self.maxSize)
+        doomed = []
+        for key,size in self.conn.execute(
+            'select key,size from cachevalues order by atime,rowid'
+        ):
+            if total <= limit:
+                break
+            doomed.append(key)
+            total -= size
+        if trace: g.trace('evicting %s entries' % len(doomed))
+        self.conn.executemany('delete from cachevalues where key=?',
+            [(key,) for key in doomed])
+        self.conn.commit()
+        self.totalSize = total
+        for key in doomed:
+            self.cache.pop(key,None)
+
+    def entrySize (self,key):
+        '''Return the size of the entry for key, or 0.'''
+        row = self.conn.execute(
+            'select size from cachevalues where key=?',(key,)).fetchone()
+        return row and row[0] or 0
+    #@+node:ekr.20141215061501.17: *3* migrate
+    def migrate (self,root):
+        '''
+        Import all entries from the PickleShareDB directory root, once.
+        The compressed pickles are copied without being decompressed.
+        '''
+        trace = False and not g.unitTesting
+        row = self.conn.execute(
+            "select value from meta where key='migrated'").fetchone()
+        if row:
+            return
+        n = 0
+        if isdir(root):
+            legacy = PickleShareDB(root)
+            for key in legacy.keys():
+                f = legacy._openFile(join(legacy.root,key),'rb')
+                if not f: continue
+                try:
+                    data = f.read()
+                finally:
+                    f.close()
+                self.conn.execute(
+                    'insert or ignore into cachevalues (key,data,size,atime) '
+                    'values (?,?,?,?)',
+                    (key,self.toBlob(data),len(data),time.time()))
+                n += 1
+        self.conn.execute(
+            "replace into meta (key,value) values ('migrated',?)",(root,))
+        self.conn.commit()
+        if trace: g.trace('imported %s entries from %s' % (n,root))
+    #@+node:ekr.20141215061501.18: *3* clear
+    def clear (self,verbose=False):
+
+        if verbose:
+            g.red('clearing cache at...\n')
+            g.es_print(self.fn)
+
+        self.cache = {}
+        self.touched = set()
+        self.conn.execute('delete from cachevalues')
+        self.totalSize = 0
+        self.commit()
+    #@+node:ekr.20141215061501.19: *3* get
+    def get(self, key, default=None):
+
+        try:
+            return self[key]
+        except KeyError:
+            return default
+    #@+node:ekr.20141215061501.20: *3* has_key
+    def has_key(self, key):
+
+        return key in self
+    #@+node:ekr.20141215061501.21: *3* items
+    def items(self):
+        return [z for z in self]
+    #@+node:ekr.20141215061501.22: *3* keys
+    def keys(self, globpat = None):
+
+        """Return all keys in DB, or all keys matching a glob"""
+
+        if globpat is None:
+            rows = self.conn.execute('select key from cachevalues')
+        else:
+            rows = self.conn.execute(
+                'select key from cachevalues where key glob ?',(globpat,))
+        return [row[0] for row in rows]
+    #@+node:ekr.20141215061501.23: *3* uncache
+    def uncache(self,*items):
+        """ Removes all, or specified items from cache
+
+        The values remain in the db, so later reads will decompress them again.
+        """
+
+        if not items:
+            self.cache = {}
+        for it in items:
+            self.cache.pop(it,None)
+    #@-others
 #@-others
 #@-leo
@@ -6,6 +6,9 @@
 python_qsh = True
     # True use PythonQSyntaxHighlighter
     # False use QSyntaxHighlighter
+compiled_colorizer = True
+    # True use CompiledColorizer (leoTokenizer.py)
+    # False use JEditColorizer
 # if python_qsh: print('===== python_qsh ===== ')
 #@@language python
 #@@tabwidth -4
@@ -13,7 +16,9 @@ python_qsh = True
 #@+<< imports >>
 #@+node:ekr.20140827092102.18575: ** << imports >>
 import leo.core.leoGlobals as g
-
+import leo.core.leoFrame as leoFrame
+    # QScintillaColorizer is a subclass of leoFrame.ColorizerMixin.
+import leo.core.leoTokenizer as leoTokenizer
 from leo.core.leoQt import isQt5,Qsci,QtCore,QtGui,QtWidgets
 
 import re
@@ -28,10 +33,14 @@ class PythonQSyntaxHighlighter:
     
     This allows incremental coloring of text at idle time, trading slower
     overall speed for much faster response time.
+
+    rehighlight colors the visible blocks first, then colors the rest of
+    the document at idle time. Coloring a block changes the following
+    blocks only until their states converge again.
     '''
     #@+others
     #@+node:ekr.20140825132752.18561: *3* pqsh.Birth & death
-    def __init__(self,parent,c=None,delay=10,limit=50):
+    def __init__(self,parent,c=None,delay=10,limit=50,margin=50):
         '''
         Ctor for QSyntaxHighlighter class.
         Parent is a QTextDocument or QTextEdit: it becomes the owner of the QSyntaxHighlighter.
@@ -51,6 +60,10 @@ class PythonQSyntaxHighlighter:
         self.r_delay = delay    # The waiting time, in msec. for self.timer.
         self.r_force = False    # True if the next block must be recolored.
         self.r_limit = limit    # The max number of lines to color at one time.
+        self.r_margin = margin  # The number of lines around the visible lines to color at once.
+        self.r_queue = []       # (start,end,force) tuples: ranges to color at idle time.
+        self.r_urgent = False   # True if the present range must be colored at once.
+        self.widget = parent    # The QTextEdit showing self.d.
         self.timer = g.IdleTime(handler=self.idle_handler,delay=self.r_delay)
         # Attach the parent's QTextDocument and set self.d.
         self.setDocument(parent)
@@ -64,13 +77,34 @@ class PythonQSyntaxHighlighter:
             self.idle_active = False
             if self.timer:
                 self.timer.stop()
+        self.r_queue = []
+        self.r_urgent = False
     #@+node:ekr.20140825132752.18566: *4* pqsh.rehighlight
     def rehighlight(self):
-        '''Color the whole document.'''
+        '''
+        Color the whole document.
+
+        Color the visible blocks, and self.r_margin blocks around them, at
+        once. Color the blocks that follow, then the blocks that precede,
+        at idle time. The visible blocks start in the default state: if
+        that is wrong, coloring the preceding blocks will fix them.
+        '''
         if self.d:
             # g.trace('*****',g.callers())
-            cursor = QtGui.QTextCursor(self.d)
-            self.rehighlight_helper(cursor,QtGui.QTextCursor.End)
+            self.kill()
+            first,last = self.visibleRange()
+            if first is None or not self.timer:
+                cursor = QtGui.QTextCursor(self.d)
+                self.rehighlight_helper(cursor,QtGui.QTextCursor.End)
+            else:
+                self.r_queue = [(last,self.d.characterCount(),False),(0,first,False)]
+                self.r_urgent = True
+                self.inReformatBlocks = True
+                try:
+                    self.setRange(first,last)
+                    self.reformat_blocks_helper()
+                finally:
+                    self.inReformatBlocks = False
     #@+node:ekr.20140825132752.18568: *4* pqsh.rehighlightBlock & helper
     def rehighlightBlock(self,block):
         '''Reapplies the highlighting to the given QTextBlock block.'''
@@ -187,8 +221,8 @@ class PythonQSyntaxHighlighter:
     #@+node:ekr.20140825132752.18557: *4* pqsh.applyFormatChanges
     def applyFormatChanges(self):
         '''Apply self.formats to the current layout.'''
-        if self.formats:
-            layout = self.cb.layout()
+        layout = self.cb.layout()
+        if self.formats or layout.additionalFormats():
             layout.setAdditionalFormats(self.formats)
             self.formats = []
             self.d.markContentsDirty(self.cb.position(),self.cb.length())
@@ -223,10 +257,11 @@ class PythonQSyntaxHighlighter:
         if c:
             if c.p == self.r_p:
                 self.reformat_blocks_helper()
-            elif trace:
-                self.idle_active = False
-                g.trace('node changed: old: %s new: %s' % (
+            else:
+                # Stop coloring: the text belongs to another node.
+                if trace: g.trace('node changed: old: %s new: %s' % (
                     self.r_p and self.r_p.h[:10],c.p and c.p.h[:10]))
+                self.kill()
     #@+node:ekr.20140826120657.18648: *4* pqsh.is_valid
     def is_valid(self,obj):
         return obj and obj.isValid()
@@ -240,16 +275,31 @@ class PythonQSyntaxHighlighter:
         '''The common code shared by reformatBlocks and idle_handler.'''
         block = self.r_block
         n,start = 0,False
-        while self.is_valid(block) and (block.position() < self.r_end or self.r_force):
-            n += 1
-            if n >= self.r_limit > 0 and self.timer:
-                start = True
+        while True:
+            # Stop urgent coloring at the end of its range, even if the state
+            # of the last block changed: the queue holds the following blocks.
+            while self.is_valid(block) and (block.position() < self.r_end or
+                (self.r_force and not self.r_urgent)
+            ):
+                n += 1
+                if n >= self.r_limit > 0 and self.timer and not self.r_urgent:
+                    start = True
+                    break
+                else:
+                    before_state = block.userState()
+                    self.reformatBlock(block)
+                    self.r_force = block.userState() != before_state
+                    block = self.r_block = block.next()
+            if start or not self.r_queue:
                 break
-            else:
-                before_state = block.userState()
-                self.reformatBlock(block)
-                self.r_force = block.userState() != before_state
-                block = self.r_block = block.next()
+            if self.r_urgent:
+                # The visible blocks are colored. Color the rest at idle time.
+                self.r_urgent = False
+                self.seeInsertPoint()
+            i,j,force = self.r_queue.pop(0)
+            self.setRange(i,j,force)
+            block = self.r_block
+        self.r_urgent = False
         self.formatChanges = []
         self.idle_active = start
         if self.timer and start:
@@ -257,12 +307,16 @@ class PythonQSyntaxHighlighter:
         elif self.timer:
             self.timer.stop()
             # g.trace('--end',g.app.allow_see,self.c.p and self.c.p.h or None)
-            # Fix bug 78: find-next match not always scrolled into view.
-            # https://github.com/leo-editor/leo-editor/issues/78
-            w = self.c.frame.body.wrapper
-            if g.app.allow_delayed_see and w:
-                w.seeInsertPoint()
-            g.app.allow_delayed_see = False
+            self.seeInsertPoint()
+    #@+node:ekr.20150101080001.1: *5* pqsh.seeInsertPoint
+    def seeInsertPoint(self):
+        '''Scroll the insert point into view if a find command has asked for that.'''
+        # Fix bug 78: find-next match not always scrolled into view.
+        # https://github.com/leo-editor/leo-editor/issues/78
+        w = self.c and self.c.frame.body.wrapper
+        if g.app.allow_delayed_see and w:
+            w.seeInsertPoint()
+        g.app.allow_delayed_see = False
     #@+node:ekr.20140825132752.18560: *4* pqsh.reformatBlock
     def reformatBlock(self,block):
         trace = False and not g.unitTesting
@@ -271,10 +325,7 @@ class PythonQSyntaxHighlighter:
         else:
             self.cb = block
             self.formats = []
-            for i in range(block.length()):
-                r = QtGui.QTextLayout.FormatRange()
-                r.start,r.length,r.format = i,1,QtGui.QTextCharFormat()
-                self.formats.append(r)
+                # applyFormatChanges clears the previous formats.
             if trace: g.trace(str(block.text()))
             self.highlightBlock(block.text())
             self.applyFormatChanges()
@@ -286,209 +337,79 @@ class PythonQSyntaxHighlighter:
         block = self.d.findBlock(from_)
         if not self.is_valid(block):
             return
+        self.shiftQueue(from_,charsRemoved,charsAdded)
+        if self.idle_active and self.is_valid(self.r_block):
+            # Finish the interrupted range later.
+            end = self.shiftPosition(self.r_end,from_,charsRemoved,charsAdded)
+            self.r_queue.insert(0,(self.r_block.position(),end,self.r_force))
         # Set the ivars for reformat_blocks_helper.
         adjust = 1 if charsRemoved > 0 else 0
         lastBlock = self.d.findBlock(from_ + charsAdded + adjust)
         if self.is_valid(lastBlock):
-            self.r_end = lastBlock.position() + lastBlock.length()
+            end = lastBlock.position() + lastBlock.length()
         else:
-            self.r_end = self.d.blockCount()
-        self.r_block = block
-        self.r_p = self.c.p.copy()
-        self.r_force = False
+            end = self.d.blockCount()
+        self.setRange(block.position(),end)
         # Delegate the colorizing to shared helper.
         self.reformat_blocks_helper()
-    #@-others
-#@-<< class PythonQSyntaxHighlighter >>
-#@+others
-#@+node:ekr.20140906081909.18690: ** class ColorizerMixin
-class ColorizerMixin:
-    '''A mixin class for all c.frame.body.colorizer classes.'''
-    
-    def __init__(self,c):
-        '''Ctor for ColorizerMixin class.'''
-        self.c = c
-        
-    def colorize(self,p,incremental=False,interruptable=True):
-        assert False,'colorize must be defined in sublcasses'
-        
-    def kill(self):
-        '''Kill colorizing.'''
-        pass
-        
-    def write_colorizer_cache (self,p):
-        '''Write colorizing data for p for later use by rehighlight_with_cache.'''
-        pass
-
-    #@+others
-    #@+node:ekr.20140906081909.18715: *3* cm.findColorDirectives
-    color_directives_pat = re.compile(
-        # Order is important: put longest matches first.
-        r'(^@color|^@killcolor|^@nocolor-node|^@nocolor)'
-        ,re.MULTILINE)
-
-    def findColorDirectives (self,p):
+    #@+node:ekr.20150101080001.2: *4* pqsh.setRange
+    def setRange(self,start,end,force=False):
+        '''Set the ivars for reformat_blocks_helper to color positions start to end.'''
+        self.r_block = self.d.findBlock(start)
+        self.r_end = end
+        self.r_p = self.c.p.copy()
+        self.r_force = force
+    #@+node:ekr.20150101080001.3: *4* pqsh.shiftQueue & shiftPosition
+    def shiftQueue(self,from_,charsRemoved,charsAdded):
+        '''Adjust the positions in self.r_queue after a change to the text.'''
+        args = from_,charsRemoved,charsAdded
+        self.r_queue = [
+            (self.shiftPosition(i,*args),self.shiftPosition(j,*args),force)
+                for i,j,force in self.r_queue]
+
+    def shiftPosition(self,i,from_,charsRemoved,charsAdded):
+        '''Return the position of i after a change to the text.'''
+        if i <= from_:
+            return i
+        elif i >= from_ + charsRemoved:
+            return i + charsAdded - charsRemoved
+        else:
+            return from_ + charsAdded
+    #@+node:ekr.20150101080001.4: *4* pqsh.visibleRange
+    def visibleRange(self):
         '''
-        Scan p for @color, @killcolor, @nocolor and @nocolor-node directives.
+        Return (start,end): the positions of the visible blocks, extended by
+        self.r_margin blocks on either side. Return (None,None) if the
+        widget can not tell.
 
-        Return a dict containing pointers to the start of each directive.
+        A find command may scroll the insert point into view after
+        coloring: in that case the blocks around the insert point become
+        visible.
         '''
-        trace = False and not g.unitTesting
-        d = {}
-        anIter = self.color_directives_pat.finditer(p.b)
-        for m in anIter:
-            # Remove leading '@' for compatibility with
-            # functions in leoGlobals.py.
-            word = m.group(0)[1:]
-            d[word] = word
-        if trace: g.trace(d)
-        return d
-    #@+node:ekr.20140906081909.18701: *3* cm.findLanguageDirectives
-    def findLanguageDirectives (self,p):
-
-        '''Scan p's body text for *valid* @language directives.
-
-        Return a list of languages.'''
-
-        # Speed not very important: called only for nodes containing @language directives.
-        trace = False and not g.unitTesting
-        aList = []
-        for s in g.splitLines(p.b):
-            if g.match_word(s,0,'@language'):
-                i = len('@language')
-                i = g.skip_ws(s,i)
-                j = g.skip_id(s,i)
-                if j > i:
-                    word = s[i:j]
-                    if self.isValidLanguage(word):
-                        aList.append(word)
-                    else:
-                        if trace:g.trace('invalid',word)
-
-        if trace: g.trace(aList)
-        return aList
-    #@+node:ekr.20140906081909.18702: *3* cm.isValidLanguage
-    def isValidLanguage (self,language):
-
-        fn = g.os_path_join(g.app.loadDir,'..','modes','%s.py' % (language))
-        return g.os_path_exists(fn)
-    #@+node:ekr.20140906081909.18711: *3* cm.scanColorByPosition
-    def scanColorByPosition(self,p):
-        '''Scan p for color-related directives.'''
-        c = self.c
-        wrapper = c.frame.body.wrapper
-        i = wrapper.getInsertPoint()
-        s = wrapper.getAllText()
-        i1,i2 = g.getLine(s,i)
-        tag = '@language'
-        language = self.language
-        for s in g.splitLines(s[:i1]):
-            if s.startswith(tag):
-                language = s[len(tag):].strip()
-        return language
-
-    #@+node:ekr.20140906081909.18697: *3* cm.scanColorDirectives
-    def scanColorDirectives(self,p):
-        '''Set self.language based on the directives in p's tree.'''
-        trace = False and not g.unitTesting
-        c = self.c
-        if not c:
-            return None # self.c may be None for testing.
-        root = p.copy()
-        self.colorCacheFlag = False
-        self.language = None
-        self.rootMode = None # None, "code" or "doc"
-        for p in root.self_and_parents():
-            theDict = g.get_directives_dict(p)
-            # if trace: g.trace(p.h,theDict)
-            if p == root:
-                # The @colorcache directive is a per-node directive.
-                self.colorCacheFlag = 'colorcache' in theDict
-                # g.trace('colorCacheFlag: %s' % self.colorCacheFlag)
-            if 'language' in theDict:
-                s = theDict["language"]
-                aList = self.findLanguageDirectives(p)
-                # In the root node, we use the first (valid) @language directive,
-                # no matter how many @language directives the root node contains.
-                # In ancestor nodes, only unambiguous @language directives
-                # set self.language.
-                if p == root or len(aList) == 1:
-                    self.languageList = list(set(aList))
-                    self.language = aList and aList[0] or []
-                    break
-            if 'root' in theDict and not self.rootMode:
-                s = theDict["root"]
-                if g.match_word(s,0,"@root-code"):
-                    self.rootMode = "code"
-                elif g.match_word(s,0,"@root-doc"):
-                    self.rootMode = "doc"
-                else:
-                    doc = c.config.at_root_bodies_start_in_doc_mode
-                    self.rootMode = "doc" if doc else "code"
-        # If no language, get the language from any @<file> node.
-        if self.language:
-            if trace: g.trace('found @language %s %s' % (self.language,self.languageList))
-            return self.language
-        #  Attempt to get the language from the nearest enclosing @<file> node.
-        self.language = g.getLanguageFromAncestorAtFileNode(root)
-        if not self.language:
-            if trace: g.trace('using default',c.target_language)
-            self.language = c.target_language
-        return self.language # For use by external routines.
-    #@+node:ekr.20140906081909.18704: *3* cm.updateSyntaxColorer
-    def updateSyntaxColorer (self,p):
-        '''Scan p.b for color directives.'''
-        trace = False and not g.unitTesting
-        # An important hack: shortcut everything if the first line is @killcolor.
-        if p.b.startswith('@killcolor'):
-            if trace: g.trace('@killcolor')
-            self.flag = False
-            return self.flag
-        else:
-            # self.flag is True unless an unambiguous @nocolor is seen.
-            p = p.copy()
-            self.flag = self.useSyntaxColoring(p)
-            self.scanColorDirectives(p) # Sets self.language
-        if trace: g.trace(self.flag,len(p.b),self.language,p.h,g.callers(5))
-        return self.flag
-    #@+node:ekr.20140906081909.18714: *3* cm.useSyntaxColoring
-    def useSyntaxColoring (self,p):
-        """Return True unless p is unambiguously under the control of @nocolor."""
-        trace = False and not g.unitTesting
-        if not p:
-            if trace: g.trace('no p',repr(p))
-            return False
-        p = p.copy()
-        first = True ; kind = None ; val = True
-        self.killColorFlag = False
-        for p in p.self_and_parents():
-            d = self.findColorDirectives(p)
-            color,no_color = 'color' in d,'nocolor' in d
-            # An @nocolor-node in the first node disabled coloring.
-            if first and 'nocolor-node' in d:
-                kind = '@nocolor-node'
-                self.killColorFlag = True
-                val = False ; break
-            # A killcolor anywhere disables coloring.
-            elif 'killcolor' in d:
-                kind = '@killcolor %s' % p.h
-                self.killColorFlag = True
-                val = False ; break
-            # A color anywhere in the target enables coloring.
-            elif color and first:
-                kind = 'color %s' % p.h
-                val = True ; break
-            # Otherwise, the @nocolor specification must be unambiguous.
-            elif no_color and not color:
-                kind = '@nocolor %s' % p.h
-                val = False ; break
-            elif color and not no_color:
-                kind = '@color %s' % p.h
-                val = True ; break
-            first = False
-        if trace: g.trace(val,kind)
-        return val
+        w = self.widget
+        if not w or not hasattr(w,'cursorForPosition') or not self.c:
+            return None,None
+        try:
+            if g.app.allow_delayed_see:
+                first = last = w.textCursor().block()
+                n = max(1,w.viewport().height() // max(1,w.fontMetrics().height()))
+            else:
+                viewport = w.viewport()
+                first = w.cursorForPosition(QtCore.QPoint(0,0)).block()
+                last = w.cursorForPosition(QtCore.QPoint(
+                    viewport.width()-1,viewport.height()-1)).block()
+                n = 0
+        except Exception:
+            return None,None
+        for i in range(n + self.r_margin):
+            if self.is_valid(first.previous()):
+                first = first.previous()
+            if self.is_valid(last.next()):
+                last = last.next()
+        return first.position(),last.position() + last.length()
     #@-others
+#@-<< class PythonQSyntaxHighlighter >>
+#@+others
 #@+node:ekr.20110605121601.18569: ** class JEditColorizer
 # This is c.frame.body.colorizer.highlighter.colorer
 
@@ -536,7 +457,8 @@ class JEditColorizer:
         assert(wrapper == self.c.frame.body.wrapper)
 
         # Used by recolor and helpers...
-        self.actualColorDict = {} # Used only by setTag.
+        self.actualColorDict = {} # Used only by getFormat.
+        self.formatDict = {} # Keys are (tag,colorName,underline,id(font)). Values are QTextCharFormats.
         self.defaultState = 'default-state:' # The name of the default state.
         self.hyperCount = 0
         self.lineCount = 0 # The number of lines recolored so far.
@@ -832,6 +754,7 @@ class JEditColorizer:
         wrapper = self.wrapper
         isQt = g.app.gui.guiName().startswith('qt')
         if trace: g.trace(self.colorizer.language)
+        self.formatDict = {} # The cached formats may be invalid.
         if wrapper and hasattr(wrapper,'start_tag_configure'):
             wrapper.start_tag_configure()
         # Get the default body font.
@@ -2306,20 +2229,42 @@ class JEditColorizer:
             self.mainLoop(n,s)
         else:
             self.setState(n) # Required
-    #@+node:ekr.20110605121601.18641: *3* setTag
+    #@+node:ekr.20110605121601.18641: *3* setTag & getFormat
     def setTag (self,tag,s,i,j):
         '''Set the tag in the highlighter.'''
         trace = False and not g.unitTesting
         if i == j:
             if trace: g.trace('empty range')
             return
+        format = self.getFormat(tag)
+        if format:
+            if trace:
+                self.tagCount += 1
+                g.trace('%3s %3s %3s' % (i,j,len(s)),
+                    '%-10s %-25s' % (tag,s[i:j]),g.callers(2))
+            self.highlighter.setFormat (i,j-i,format)
+    #@+node:ekr.20141231120001.59: *4* getFormat
+    def getFormat (self,tag):
+        '''
+        Return the QTextCharFormat for tag, or None.
+
+        Formats are cached: creating a new format for every token is slow.
+        configure_tags clears the cache.
+        '''
+        trace = False and not g.unitTesting
         wrapper = self.wrapper # A QTextEditWrapper
         tag = tag.lower() # 2011/10/28
         colorName = wrapper.configDict.get(tag)
-        # Munge the color name.
         if not colorName:
             if trace: g.trace('no color for %s' % tag)
-            return
+            return None
+        underline = wrapper.configUnderlineDict.get(tag)
+        font = self.fonts.get(tag)
+        key = tag,colorName,underline,id(font)
+        format = self.formatDict.get(key)
+        if format:
+            return format
+        # Munge the color name.
         if colorName[-1].isdigit() and colorName[0] != '#':
             colorName = colorName[:-1]
         # Get the actual color.
@@ -2329,17 +2274,11 @@ class JEditColorizer:
             if color.isValid():
                 self.actualColorDict[colorName] = color
             else:
-                return g.trace('unknown color name',colorName,g.callers())
-        underline = wrapper.configUnderlineDict.get(tag)
+                g.trace('unknown color name',colorName,g.callers())
+                return None
         format = QtGui.QTextCharFormat()
-        font = self.fonts.get(tag)
         if font:
             format.setFont(font)
-        if trace:
-            self.tagCount += 1
-            g.trace(
-                '%3s %3s %3s %9s %7s' % (i,j,len(s),font and id(font) or '<no font>',colorName),
-                '%-10s %-25s' % (tag,s[i:j]),g.callers(2))
         if tag in ('blank','tab'):
             if tag == 'tab' or colorName == 'black':
                 format.setFontUnderline(True)
@@ -2350,7 +2289,70 @@ class JEditColorizer:
             format.setFontUnderline(True)
         else:
             format.setForeground(color)
-        self.highlighter.setFormat (i,j-i,format)
+        self.formatDict[key] = format
+        return format
+    #@-others
+#@+node:ekr.20141231120001.60: ** class CompiledColorizer(JEditColorizer)
+# This is c.frame.body.colorizer.highlighter.colorer if compiled_colorizer is True.
+
+class CompiledColorizer(JEditColorizer):
+    '''
+    A JEditColorizer that colors lines using leoTokenizer.Tokenizer.
+
+    The tokenizer compiles the rules of each mode into tables once, and
+    knows nothing about Qt. This class maps tokenizer states to Qt block
+    states and tokenizer runs to (cached) Qt formats.
+    '''
+    #@+others
+    #@+node:ekr.20141231120001.61: *3* cc.__init__
+    def __init__(self,c,colorizer,highlighter,wrapper):
+        '''Ctor for CompiledColorizer class.'''
+        JEditColorizer.__init__(self,c,colorizer,highlighter,wrapper)
+        self.tokenizer = leoTokenizer.Tokenizer(c,showInvisibles=self.showInvisibles)
+        self.initialState = None # The tokenizer state of the first line.
+        self.tokenStateDict = {} # Keys are tokenizer states, values are state numbers.
+        self.tokenStates = [] # Tokenizer states, indexed by state number.
+    #@+node:ekr.20141231120001.62: *3* cc.init
+    def init (self,p,s):
+        '''Init the colorizer and the tokenizer.'''
+        language = self.colorizer.language
+            # JEditColorizer.init may change self.colorizer.language.
+        JEditColorizer.init(self,p,s)
+        tokenizer = self.tokenizer
+        tokenizer.p = self.p
+        tokenizer.showInvisibles = self.showInvisibles
+        self.initialState = tokenizer.initialState(language)
+        self.tokenStateDict = {}
+        self.tokenStates = []
+    #@+node:ekr.20141231120001.63: *3* cc.recolor
+    def recolor (self,s):
+        '''
+        Recolor a *single* line, s.
+        Qt calls this method repeatedly to colorizer all the text.
+        '''
+        self.recolorCount += 1
+        if self.colorizer.changingText or not self.colorizer.flag:
+            return
+        self.lineCount += 1
+        self.totalChars += len(s)
+        # Get the state at the end of the previous line.
+        n = self.prevState()
+        if 0 <= n < len(self.tokenStates):
+            state = self.tokenStates[n]
+        else:
+            state = self.initialState or self.tokenizer.initialState(self.colorizer.language)
+        runs,state = self.tokenizer.tokenizeLine(s,state)
+        for i,j,tag in runs:
+            format = self.getFormat(tag)
+            if format:
+                self.highlighter.setFormat(i,j-i,format)
+        # Set the state at the end of this line.
+        n = self.tokenStateDict.get(state)
+        if n is None:
+            n = self.tokenStateDict[state] = len(self.tokenStates)
+            self.tokenStates.append(state)
+        self.setState(n)
+        self.language_name = self.tokenizer.language_name
     #@-others
 #@+node:ekr.20110605121601.18551: ** class LeoQtColorizer
 # This is c.frame.body.colorizer
@@ -2730,7 +2732,8 @@ class LeoQtSyntaxHighlighter(base_highlighter):
         else:
             QtGui.QSyntaxHighlighter.__init__(self,widget)
         self.colorizer = colorizer
-        self.colorer = JEditColorizer(c,
+        colorer_class = CompiledColorizer if compiled_colorizer else JEditColorizer
+        self.colorer = colorer_class(c,
             colorizer=colorizer,
             highlighter=self,
             wrapper=c.frame.body.wrapper)
@@ -2848,14 +2851,14 @@ if Qsci:
 #@+node:ekr.20140906081909.18689: ** class QScintillaColorizer(ColorizerMixin)
 # This is c.frame.body.colorizer
 
-class QScintillaColorizer(ColorizerMixin):
+class QScintillaColorizer(leoFrame.ColorizerMixin):
     '''A colorizer for a QsciScintilla widget.'''
     #@+others
     #@+node:ekr.20140906081909.18709: *3* qsc.ctor
     def __init__(self,c,widget):
         '''Ctor for QScintillaColorizer. widget is a '''
         # g.trace('QScintillaColorizer)',widget)
-        ColorizerMixin.__init__(self,c)
+        leoFrame.ColorizerMixin.__init__(self,c)
             # init the base class.
         self.changingText = False
         self.count = 0 # For unit testing.
@@ -145,6 +145,10 @@ class Commands (object):
 
         '''Init per-document ivars.'''
 
+        self.directivesCache = {}
+            # Keys are tuples describing positions. Used by g.get_directives_dict_list.
+        self.directivesCacheStamp = None
+            # The values that were in effect when c.directivesCache was last cleared.
         self.expansionLevel = 0
             # The expansion level of this outline.
         self.expansionNode = None
@@ -258,6 +262,12 @@ class Commands (object):
         trace = (False or g.trace_startup) and not g.unitTesting
         c = self
         if trace: g.es_debug(c.shortFileName(),g.app.gui)
+        import leo.core.leoSearchIndex as leoSearchIndex
+        import leo.core.leoWordIndex as leoWordIndex
+        self.gnxIndex = leoNodes.GnxIndex(c)
+        self.searchIndex = leoSearchIndex.SearchIndex(c)
+        self.wordIndex = leoWordIndex.WordIndex(c)
+            # The indices must exist before any VNode is created.
         gnx = 'hidden-root-vnode-gnx'
         self.hiddenRootNode = leoNodes.VNode(context=c,gnx=gnx)
         self.hiddenRootNode.setHeadString('<hidden root VNode>')
@@ -307,8 +317,12 @@ class Commands (object):
         self.cacher = leoCache.Cacher(c)
         self.cacher.initFileDB(self.mFileName)
         self.undoer = leoUndo.Undoer(self)
-        import leo.plugins.free_layout as free_layout
-        self.free_layout = free_layout.FreeLayoutController(c)
+        if gui.isNullGui:
+            # free_layout imports Qt, which takes most of the bridge's startup time.
+            self.free_layout = None
+        else:
+            import leo.plugins.free_layout as free_layout
+            self.free_layout = free_layout.FreeLayoutController(c)
         if hasattr(g.app.gui,'styleSheetManagerClass'):
             self.styleSheetManager = g.app.gui.styleSheetManagerClass(c)
         else:
@@ -876,6 +890,7 @@ class Commands (object):
             # 2010/10/09: Fix an interface blunder. Show all files by default.
             ("All files","*"),
             ("Leo files","*.leo"),
+            ("Leo binary files","*.leob"),
             ("Python files","*.py"),]
 
         fileName = ''.join(c.k.givenArgs) or g.app.gui.runOpenFileDialog(
@@ -886,7 +901,7 @@ class Commands (object):
 
         ok = False
         if fileName:
-            if fileName.endswith('.leo'):
+            if fileName.endswith(('.leo','.leob')):
                 c2 = g.openWithFileName(fileName,old_c=c)
                 if c2:
                     g.chdir(fileName)
@@ -1315,12 +1330,14 @@ class Commands (object):
                 fileName = ''.join(c.k.givenArgs) or g.app.gui.runSaveFileDialog(
                     initialfile = c.mFileName,
                     title="Save",
-                    filetypes=[("Leo files", "*.leo")],
+                    filetypes=[("Leo files", "*.leo"),("Leo binary files", "*.leob")],
                     defaultextension=".leo")
             c.bringToFront()
             if fileName:
                 # Don't change mFileName until the dialog has suceeded.
-                c.mFileName = g.ensure_extension(fileName, ".leo")
+                if not fileName.endswith('.leob'):
+                    fileName = g.ensure_extension(fileName, ".leo")
+                c.mFileName = fileName
                 c.frame.title = c.computeWindowTitle(c.mFileName)
                 c.frame.setTitle(c.computeWindowTitle(c.mFileName))
                     # 2013/08/04: use c.computeWindowTitle.
@@ -1379,7 +1396,7 @@ class Commands (object):
             fileName = ''.join(c.k.givenArgs) or g.app.gui.runSaveFileDialog(
                 initialfile = c.mFileName,
                 title="Save As",
-                filetypes=[("Leo files", "*.leo")],
+                filetypes=[("Leo files", "*.leo"),("Leo binary files", "*.leob")],
                 defaultextension=".leo")
         c.bringToFront()
         if fileName:
@@ -1387,7 +1404,9 @@ class Commands (object):
             if c.mFileName:
                 g.app.forgetOpenFile(c.mFileName)
             # Don't change mFileName until the dialog has suceeded.
-            c.mFileName = g.ensure_extension(fileName, ".leo")
+            if not fileName.endswith('.leob'):
+                fileName = g.ensure_extension(fileName, ".leo")
+            c.mFileName = fileName
             # Part of the fix for https://bugs.launchpad.net/leo-editor/+bug/1194209
             c.frame.title = title = c.computeWindowTitle(c.mFileName)
             c.frame.setTitle(title)
@@ -1437,11 +1456,12 @@ class Commands (object):
             fileName = ''.join(c.k.givenArgs) or g.app.gui.runSaveFileDialog(
                 initialfile = c.mFileName,
                 title="Save To",
-                filetypes=[("Leo files", "*.leo")],
+                filetypes=[("Leo files", "*.leo"),("Leo binary files", "*.leob")],
                 defaultextension=".leo")
         c.bringToFront()
         if fileName:
-            fileName = g.ensure_extension(fileName, ".leo")
+            if not fileName.endswith('.leob'):
+                fileName = g.ensure_extension(fileName, ".leo")
             c.fileCommands.saveTo(fileName)
             g.app.recentFilesManager.updateRecentFiles(fileName)
             g.chdir(fileName)
@@ -2312,10 +2332,10 @@ class Commands (object):
             if delim and gnx:
                 assert g.isString(gnx)
                 gnx = g.toUnicode(gnx)
-                for p in root.self_and_subtree():
+                for p in root.v.context.gnxIndex.gnx2positions(gnx):
                     if p.matchHeadline(vnodeName):
-                        if p.v.fileIndex == gnx:
-                            return p.copy(),True
+                        if p == root or root.isAncestorOf(p):
+                            return p,True
                 if trace: g.trace('not found! %s, %s' % (gnx,repr(vnodeName)))
                 return None,False
             else:
@@ -4071,6 +4091,7 @@ class Commands (object):
 
         bunch = u.beforeSort(p,undoType,oldChildren,newChildren,sortChildren)
         parent_v.children = newChildren
+        c.gnxIndex.childrenChanged(parent_v)
         if parent:
             dirtyVnodeList = parent.setAllAncestorAtFileNodesDirty()
         else:
@@ -4187,15 +4208,15 @@ class Commands (object):
         c = self
         d = {} # Keys are gnx's; values are lists of vnodes with that gnx.
         errors = 0
-        for p in c.all_positions():
-            gnx = p.v.fileIndex
+        for v,level,childIndex in c.walk(unique=True):
+            gnx = v.fileIndex
             if gnx:
                 aSet = d.get(gnx,set())
-                aSet.add(p.v)
+                aSet.add(v)
                 d[gnx] = aSet
             else:
                 errors += 1
-                print('empty v.fileIndex',p.v)
+                print('empty v.fileIndex',v)
         for gnx in sorted(d.keys()):
             aList = sorted(d.get(gnx))
             if len(aList) != 1:
@@ -5774,6 +5795,8 @@ class Commands (object):
         parent_v.children = parent_v.children[:n+1]
         # Add the moved nodes to p's children
         p.v.children.extend(followingSibs)
+        c.gnxIndex.childrenChanged(parent_v)
+        c.gnxIndex.childrenChanged(p.v)
         # Adjust the parent links in the moved nodes.
         # There is no need to adjust descendant links.
         for child in followingSibs:
@@ -6017,6 +6040,8 @@ class Commands (object):
         parent_v.children.extend(z[n:])
         # Remove v's children.
         p.v.children = []
+        c.gnxIndex.childrenChanged(parent_v)
+        c.gnxIndex.childrenChanged(p.v)
         # Adjust the parent links in the moved children.
         # There is no need to adjust descendant links.
         for child in children:
@@ -6730,10 +6755,20 @@ class Commands (object):
 
         '''Scan p and ancestors for directives.
 
-        Returns a dict containing the results, including defaults.'''
+        Returns a dict containing the results, including defaults.
+
+        The results are cached until any headline or body changes.'''
 
         trace = False and not g.unitTesting
         c = self ; p = p or c.p
+        wrap = c.config.getBool("body_pane_wraps")
+        cache = g.get_directives_cache(c)
+        cacheKey = 'all',p.v,p._childIndex,tuple(p.stack)
+        stamp = (c.target_language,c.page_width,c.tab_width,wrap,
+            c.openDirectory,g.app.config.relative_path_base_directory)
+        data = cache.get(cacheKey)
+        if data and data[0] == stamp:
+            return dict(data[1])
 
         # Set defaults
         language = c.target_language and c.target_language.lower()
@@ -6741,7 +6776,6 @@ class Commands (object):
             'language':language,
             'delims':g.set_delims_from_language(language),
         }
-        wrap = c.config.getBool("body_pane_wraps")
 
         table = (
             ('encoding',    None,           g.scanAtEncodingDirectives),
@@ -6779,7 +6813,8 @@ class Commands (object):
 
         # g.trace(d.get('tabwidth'))
 
-        return d
+        cache[cacheKey] = stamp,d
+        return dict(d)
     #@+node:ekr.20080828103146.15: *4* c.scanAtPathDirectives
     def scanAtPathDirectives(self,aList):
 
@@ -6793,6 +6828,14 @@ class Commands (object):
         c.scanAtPathDirectivesCount += 1 # An important statistic.
         if trace and verbose: g.trace('**entry',g.callers(4))
 
+        # Return the cached result if the @path directives in aList have been seen before.
+        cache = g.get_directives_cache(c)
+        key = ('path',c.openDirectory,g.app.config.relative_path_base_directory,
+            tuple([(d.get('path'),d.get('@path_in_body')) for d in aList]))
+        path = cache.get(key)
+        if path:
+            return path
+
         # Step 1: Compute the starting path.
         # The correct fallback directory is the absolute path to the base.
         if c.openDirectory:  # Bug fix: 2008/9/18
@@ -6839,8 +6882,10 @@ class Commands (object):
         if trace and verbose: g.trace('joined path:',path)
         if trace: g.trace('returns',path)
 
-        return path or g.getBaseDirectory(c)
+        path = path or g.getBaseDirectory(c)
             # 2010/10/22: A useful default.
+        cache[key] = path
+        return path
     #@+node:ekr.20080828103146.12: *4* c.scanAtRootDirectives
     # Called only by scanColorDirectives.
 
@@ -7681,10 +7726,15 @@ class Commands (object):
         c = self
         pat = re.compile(regex, flags)
         res = leoNodes.PosList()
-        for p in c.all_positions():
-            m = re.match(pat, p.h)
+        # Search only the nodes that the search index can not rule out.
+        candidates = c.searchIndex.candidates(regex,regex=True,flags=flags)
+        stack = []
+        for v,level,childIndex in c.walk(stack=stack):
+            if candidates is not None and v not in candidates:
+                continue
+            m = re.match(pat, v.h)
             if m:
-                pc = p.copy()
+                pc = leoNodes.Position(v,childIndex,stack[:])
                 pc.mo = m
                 res.append(pc)
         return res
@@ -7699,8 +7749,13 @@ class Commands (object):
         c = self
         pat = re.compile(regex, flags)
         res = leoNodes.PosList()
-        for p in c.all_positions():
-            m = re.finditer(pat, p.b)
+        # Search only the nodes that the search index can not rule out.
+        candidates = c.searchIndex.candidates(regex,regex=True,flags=flags)
+        stack = []
+        for v,level,childIndex in c.walk(stack=stack):
+            if candidates is not None and v not in candidates:
+                continue
+            m = re.finditer(pat, v.b)
             t1,t2 = itertools.tee(m,2)
             try:
                 if g.isPython3:
@@ -7709,7 +7764,7 @@ class Commands (object):
                     t1.next()
             except StopIteration:
                 continue
-            pc = p.copy()
+            pc = leoNodes.Position(v,childIndex,stack[:])
             pc.matchiter = t2
             res.append(pc)
         return res
@@ -7806,14 +7861,14 @@ class Commands (object):
     #@+node:ekr.20091001141621.6043: *4* c.all_nodes & all_unique_nodes
     def all_nodes(self):
         c = self
-        for p in c.all_positions():
-            yield p.v
+        for v,level,childIndex in c.walk():
+            yield v
         # raise StopIteration
 
     def all_unique_nodes(self):
         c = self
-        for p in c.all_unique_positions():
-            yield p.v
+        for v,level,childIndex in c.walk(unique=True):
+            yield v
         # raise StopIteration
 
     # Compatibility with old code.
@@ -7850,6 +7905,28 @@ class Commands (object):
     # Compatibility with old code.
     all_positions_iter = all_positions
     allNodes_iter = all_positions
+    #@+node:ekr.20141224090001.3: *4* c.walk & walk_positions
+    def walk(self,unique=False,prune=None,stack=None):
+        '''
+        Yield (v,level,childIndex) for all nodes of the outline, in outline
+        order, without creating positions. With unique=True, skip clones
+        already seen, and their subtrees, like c.all_unique_positions.
+        See v.walk_descendants for the other arguments.
+        '''
+        c = self
+        seen = set() if unique else None
+        return c.hiddenRootNode.walk_descendants(0,seen,prune,stack)
+
+    def walk_positions(self,unique=False,prune=None):
+        '''
+        Yield all positions of the outline, in outline order. Unlike
+        c.all_positions, each yielded position is a new object, so callers
+        need not copy it.
+        '''
+        c = self
+        stack = []
+        for v,level,childIndex in c.walk(unique,prune,stack):
+            yield leoNodes.Position(v,childIndex,stack[:])
     #@+node:ekr.20031218072017.2982: *3* c.Getters & Setters
     #@+node:ekr.20060906211747: *4* Getters
     #@+node:ekr.20040803140033: *5* c.currentPosition (changed)
@@ -8109,23 +8186,7 @@ class Commands (object):
         c = self
         context = v.context # v's commander.
         assert (c == context)
-        stack = []
-        while v.parents:
-            parent = v.parents[0]
-            if v in parent.children:
-                n = parent.children.index(v)
-            else:
-                return None
-            stack.insert(0,(v,n),)
-            v = parent
-
-        # v.parents includes the hidden root node.
-        if not stack:
-            # a VNode not in the tree
-            return c.nullPosition()
-        v,n = stack.pop()
-        p = leoNodes.Position(v,n,stack)
-        return p
+        return c.gnxIndex.vnode2position(v)
 
     #@+node:ekr.20060906211747.1: *4* Setters
     #@+node:ekr.20040315032503: *5* c.appendStringToBody
@@ -8403,6 +8464,7 @@ class Commands (object):
             d[gnxString] = v
             if trace or g.trace_gnxDict: g.trace(c.shortFileName(),gnxString,v)
         c.fileCommands.gnxDict = d
+        c.gnxIndex.invalidate()
     #@+node:ekr.20130823083943.12559: *3* c.recursiveImport
     def recursiveImport(self,dir_,
         one_file=False,
@@ -0,0 +1,535 @@
+#! /usr/bin/env python
+#@+leo-ver=5-thin
+#@+node:ekr.20141231090001.3: * @file leoDaemon.py
+#@@first
+'''
+A long-lived headless Leo for batch tools.
+
+Scripts that use leoBridge.controller pay for Leo's startup every time
+they run. The daemon starts Leo once, with the null gui, and keeps a
+pool of open commanders. It answers JSON requests over a Unix socket,
+using the framing in leo/external/lproto.py. Start it with::
+
+    python leo/core/leoDaemon.py serve [--socket=path] [--max-commanders=n]
+        [--no-plugins] [--no-settings]
+
+Send requests from Python with the Client class::
+
+    import leo.core.leoDaemon as leoDaemon
+    client = leoDaemon.Client()
+    d = client.request('run-script',path='x.leo',script='result = c.p.h')
+
+or from the shell::
+
+    python leo/core/leoDaemon.py request [--socket=path] '{"command":"status"}'
+    python leo/core/leoDaemon.py stop [--socket=path]
+
+Requests are dicts with a command key. Replies are dicts with an ok key.
+When ok is False, the error key describes the error. Replies contain the
+id key of the request, if any. The commands:
+
+open:       path. Open the outline. Reply: path, gnx (of the root), nodes.
+close:      path. Close the outline, discarding unsaved changes.
+query:      path, gnx or unl, body (default True). Reply: node, a dict
+            with gnx, h, b, level, unl and children (a list of gnx's).
+run-script: script, path (optional), gnx or unl (optional). Execute the
+            script with c, g and p defined. p is the node given by gnx or
+            unl, or c.p. Reply: output (the script's stdout) and result
+            (the script's result variable).
+write:      path, save (default False). Write the dirty @<file> nodes,
+            and the outline itself if save is True. Reply: written, the
+            list of files whose modification time changed.
+status:     Reply: commanders, the pool's paths, and the pool statistics.
+stop:       Stop the daemon after replying.
+
+The pool reopens an outline when the modification time of its .leo file
+or of any of its external files changes. When the pool holds more than
+--max-commanders outlines, it closes the least recently used outline,
+discarding its unsaved changes.
+
+The daemon runs requests one at a time, in the order they arrive.
+
+run-script requests execute arbitrary code, so the daemon creates its
+socket with mode 0600: only the user running the daemon may connect.
+
+This module imports no Leo module at the outer level except lproto.
+'''
+#@+<< imports >>
+#@+node:ekr.20141231090001.4: ** << imports >> (leoDaemon)
+import json
+import optparse
+import os
+import select
+import socket
+import sys
+# Make sure Leo's root directory is on sys.path.
+leo_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if leo_root not in sys.path:
+    sys.path.append(leo_root)
+from leo.external import lproto
+#@-<< imports >>
+
+standard_daemon_socket_name = os.path.expanduser('~/.leo/leodaemon_sockname')
+
+#@+others
+#@+node:ekr.20141231090001.5: ** main & helpers (leoDaemon.py)
+def main():
+    '''Start the daemon or send it a request, as given on the command line.'''
+    options,args = scanOptions()
+    socketName = options.socket or standard_daemon_socket_name
+    command = args and args[0]
+    if command == 'serve':
+        daemon = Daemon(socketName,
+            loadPlugins=not options.noPlugins,
+            maxCommanders=options.maxCommanders,
+            readSettings=not options.noSettings)
+        daemon.serve()
+    elif command in ('request','stop'):
+        if command == 'stop':
+            d = {'command':'stop'}
+        elif len(args) == 2:
+            d = json.loads(args[1])
+        else:
+            sys.exit('usage: leoDaemon.py request JSON')
+        client = Client(socketName)
+        try:
+            reply = client.request(**d)
+        finally:
+            client.close()
+        print(json.dumps(reply,indent=1,sort_keys=True))
+        if not reply.get('ok'):
+            sys.exit(1)
+    else:
+        sys.exit('usage: leoDaemon.py serve|request|stop [options]')
+#@+node:ekr.20141231090001.6: *3* scanOptions
+def scanOptions():
+    '''Handle all options and remove them from sys.argv.'''
+    parser = optparse.OptionParser()
+    parser.add_option('--max-commanders',dest='maxCommanders',type='int',default=10)
+    parser.add_option('--no-plugins',dest='noPlugins',action='store_true')
+    parser.add_option('--no-settings',dest='noSettings',action='store_true')
+    parser.add_option('--socket',dest='socket')
+    options,args = parser.parse_args()
+    sys.argv = sys.argv[:1]
+    return options,args
+#@+node:ekr.20141231090001.7: ** class Client
+class Client(lproto.LProtoClient):
+    '''A client of the Leo daemon.'''
+    #@+others
+    #@+node:ekr.20141231090001.8: *3* client.connect
+    def connect(self,fname):
+        '''
+        Connect to the daemon listening on the socket fname.
+        Raise socket.error if no daemon is listening.
+        '''
+        self.socket = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+        self.socket.connect(fname)
+        return True
+    #@+node:ekr.20141231090001.9: *3* client.close
+    def close(self):
+        '''Close the connection to the daemon.'''
+        self.socket.close()
+    #@+node:ekr.20141231090001.10: *3* client.request
+    def request(self,command,**keys):
+        '''
+        Send a request to the daemon and return its reply, a dict.
+        Relative paths are relative to this process's directory.
+        '''
+        d = dict(keys)
+        d['command'] = command
+        if d.get('path'):
+            d['path'] = os.path.abspath(os.path.expanduser(d['path']))
+        self.send(json.dumps(d).encode('utf-8'))
+        msg = self.recv()
+        if msg is None:
+            return {'ok':False,'error':'the daemon closed the connection'}
+        return json.loads(msg.decode('utf-8'))
+    #@-others
+#@+node:ekr.20141231090001.11: ** class CommanderPool
+class CommanderPool:
+    '''
+    The open outlines of the daemon, in least-recently-used order.
+
+    Entries are invalidated when the modification time of the outline or
+    any of its external files changes.
+    '''
+    #@+others
+    #@+node:ekr.20141231090001.12: *3* pool.ctor
+    def __init__(self,bridge,maxCommanders=10):
+        '''Ctor for the CommanderPool class.'''
+        import collections
+        self.bridge = bridge
+        self.g = bridge.globals()
+        self.entries = collections.OrderedDict()
+            # Keys are absolute paths; values are PoolEntry's.
+            # The least recently used entry is first.
+        self.maxCommanders = max(1,maxCommanders)
+        # Statistics...
+        self.evictions = 0
+        self.hits = 0
+        self.invalidations = 0
+        self.misses = 0
+    #@+node:ekr.20141231090001.13: *3* pool.close
+    def close(self,path):
+        '''Close the outline at path. Return True if it was open.'''
+        entry = self.entries.pop(path,None)
+        if entry:
+            self.destroy(entry.c)
+        return bool(entry)
+
+    def closeAll(self):
+        '''Close all outlines.'''
+        for path in list(self.entries):
+            self.close(path)
+    #@+node:ekr.20141231090001.14: *3* pool.destroy
+    def destroy(self,c):
+        '''Destroy c, discarding unsaved changes.'''
+        g = self.g
+        if c.frame in g.app.windowList:
+            g.app.destroyWindow(c.frame)
+    #@+node:ekr.20141231090001.15: *3* pool.get
+    def get(self,path):
+        '''
+        Return the commander for the outline at path, opening it if needed.
+        Raise IOError if the outline does not exist or can not be opened.
+        '''
+        g = self.g
+        entry = self.entries.get(path)
+        if entry:
+            if entry.isValid():
+                self.hits += 1
+                self.entries[path] = self.entries.pop(path)
+                    # Make the entry the most recently used.
+                return entry.c
+            self.invalidations += 1
+            self.close(path)
+        if not g.os_path_exists(path):
+            raise IOError('file not found: %s' % path)
+        self.misses += 1
+        c = self.bridge.openLeoFile(path)
+        if not c or not c.fileName():
+            if c: self.destroy(c)
+            raise IOError('can not open: %s' % path)
+        try:
+            self.entries[path] = PoolEntry(c,path)
+        except Exception:
+            self.destroy(c)
+            raise
+        while len(self.entries) > self.maxCommanders:
+            oldPath = next(iter(self.entries))
+            self.close(oldPath)
+            self.evictions += 1
+        return c
+    #@+node:ekr.20141231090001.16: *3* pool.refresh
+    def refresh(self,path):
+        '''
+        Remember the modification times of path's outline and external files,
+        so that the changes made by a request do not invalidate the entry.
+        '''
+        entry = self.entries.get(path)
+        if entry:
+            entry.mtimes = entry.computeMtimes()
+            return entry.mtimes
+        else:
+            return {}
+    #@+node:ekr.20141231090001.17: *3* pool.status
+    def status(self):
+        '''Return a dict describing the pool.'''
+        return {
+            'commanders': list(self.entries),
+            'evictions': self.evictions,
+            'hits': self.hits,
+            'invalidations': self.invalidations,
+            'maxCommanders': self.maxCommanders,
+            'misses': self.misses,
+        }
+    #@-others
+#@+node:ekr.20141231090001.18: ** class PoolEntry
+class PoolEntry:
+    '''An open outline and the modification times of its files.'''
+    def __init__(self,c,path):
+        '''Ctor for the PoolEntry class.'''
+        self.c = c
+        self.path = path
+        self.mtimes = self.computeMtimes()
+            # Keys are paths; values are modification times or None.
+
+    #@+others
+    #@+node:ekr.20141231090001.19: *3* entry.computeMtimes
+    def computeMtimes(self):
+        '''Return a dict of the modification times of the outline's files.'''
+        c = self.c
+        at = c.atFileCommands
+        paths = [self.path]
+        for p in c.all_unique_positions():
+            if p.isAnyAtFileNode():
+                paths.append(at.fullPath(p))
+        return dict([(fn,self.mtime(fn)) for fn in paths])
+    #@+node:ekr.20141231090001.20: *3* entry.isValid
+    def isValid(self):
+        '''Return True if no file of the outline has changed.'''
+        for fn,mtime in self.mtimes.items():
+            if self.mtime(fn) != mtime:
+                return False
+        return True
+    #@+node:ekr.20141231090001.21: *3* entry.mtime
+    def mtime(self,fn):
+        '''Return the modification time of fn, or None if fn does not exist.'''
+        try:
+            return os.stat(fn).st_mtime
+        except OSError:
+            return None
+    #@-others
+#@+node:ekr.20141231090001.22: ** class Daemon
+class Daemon:
+    '''A headless Leo answering JSON requests over a Unix socket.'''
+    #@+others
+    #@+node:ekr.20141231090001.23: *3* daemon.ctor
+    def __init__(self,socketName=None,loadPlugins=True,maxCommanders=10,readSettings=True):
+        '''Ctor for the Daemon class. Opens Leo with leoBridge.'''
+        import leo.core.leoBridge as leoBridge
+        self.socketName = socketName or standard_daemon_socket_name
+        bridge = leoBridge.controller(
+            gui='nullGui',
+            loadPlugins=loadPlugins,
+            readSettings=readSettings,
+            silent=True,
+            verbose=False,
+        )
+        if not bridge.isOpen():
+            raise RuntimeError('leoBridge can not initialize Leo')
+        self.g = bridge.globals()
+        self.pool = CommanderPool(bridge,maxCommanders)
+        self.requests = 0
+        self.stopping = False
+        self.commandsDict = {
+            'close':        self.closeCommand,
+            'open':         self.openCommand,
+            'query':        self.queryCommand,
+            'run-script':   self.runScriptCommand,
+            'status':       self.statusCommand,
+            'stop':         self.stopCommand,
+            'write':        self.writeCommand,
+        }
+    #@+node:ekr.20141231090001.24: *3* daemon.Commands
+    # Each command takes a request dict and returns a dict,
+    # the reply without its ok key. Commands raise exceptions
+    # for errors.
+    #@+node:ekr.20141231090001.25: *4* daemon.closeCommand
+    def closeCommand(self,d):
+        '''Close the outline at d['path'].'''
+        return {'closed':self.pool.close(self.getPath(d))}
+    #@+node:ekr.20141231090001.26: *4* daemon.openCommand
+    def openCommand(self,d):
+        '''Open the outline at d['path'].'''
+        path = self.getPath(d)
+        c = self.pool.get(path)
+        return {
+            'gnx': c.rootPosition().gnx,
+            'nodes': len(list(c.all_unique_positions())),
+            'path': path,
+        }
+    #@+node:ekr.20141231090001.27: *4* daemon.queryCommand
+    def queryCommand(self,d):
+        '''Return the node of d['path'] given by d['gnx'] or d['unl'].'''
+        c = self.pool.get(self.getPath(d))
+        p = self.findNode(c,d)
+        if not p:
+            raise ValueError('gnx or unl required')
+        return {'node':self.nodeDict(p,body=d.get('body',True))}
+    #@+node:ekr.20141231090001.28: *4* daemon.runScriptCommand
+    def runScriptCommand(self,d):
+        '''
+        Execute d['script'] with c, g and p defined.
+        Return its output and its result variable.
+        '''
+        g = self.g
+        script = d.get('script')
+        if not script:
+            raise ValueError('no script')
+        path = d.get('path')
+        if path:
+            path = self.getPath(d)
+            c = self.pool.get(path)
+            p = self.findNode(c,d) or c.p
+            c.selectPosition(p)
+        else:
+            c = p = None
+        namespace = {'c':c,'g':g,'p':p,'result':None}
+        old_stdout = sys.stdout
+        sys.stdout = f = g.fileLikeObject()
+        try:
+            exec(compile(script,'<leoDaemon script>','exec'),namespace)
+        finally:
+            sys.stdout = old_stdout
+            if path:
+                self.pool.refresh(path)
+        result = namespace.get('result')
+        try:
+            json.dumps(result)
+        except (TypeError,ValueError):
+            result = repr(result)
+        return {'output':f.get(),'result':result}
+    #@+node:ekr.20141231090001.29: *4* daemon.statusCommand
+    def statusCommand(self,d):
+        '''Return the status of the daemon.'''
+        result = self.pool.status()
+        result['requests'] = self.requests
+        return result
+    #@+node:ekr.20141231090001.30: *4* daemon.stopCommand
+    def stopCommand(self,d):
+        '''Stop the daemon after replying.'''
+        self.stopping = True
+        return {}
+    #@+node:ekr.20141231090001.31: *4* daemon.writeCommand
+    def writeCommand(self,d):
+        '''
+        Write the dirty @<file> nodes of d['path'],
+        and the outline itself if d['save'] is True.
+        '''
+        path = self.getPath(d)
+        c = self.pool.get(path)
+        before = self.pool.refresh(path)
+        if d.get('save'):
+            c.save()
+        else:
+            c.fileCommands.writeDirtyAtFileNodes()
+        after = self.pool.refresh(path)
+        written = sorted([fn for fn in after if after.get(fn) != before.get(fn)])
+        return {'written':written}
+    #@+node:ekr.20141231090001.32: *3* daemon.dispatch
+    def dispatch(self,msg):
+        '''Execute the request in msg, a JSON string. Return the reply.'''
+        self.requests += 1
+        d = {}
+        try:
+            d = json.loads(msg.decode('utf-8'))
+            if not isinstance(d,dict):
+                raise ValueError('requests must be dicts')
+            command = d.get('command')
+            f = self.commandsDict.get(command)
+            if not f:
+                raise ValueError('unknown command: %s' % command)
+            reply = f(d)
+            reply['ok'] = True
+        except Exception:
+            typ,val,tb = sys.exc_info()
+            reply = {'ok':False,'error':'%s: %s' % (typ.__name__,val)}
+        if isinstance(d,dict) and 'id' in d:
+            reply['id'] = d.get('id')
+        return json.dumps(reply).encode('utf-8')
+    #@+node:ekr.20141231090001.33: *3* daemon.findNode
+    def findNode(self,c,d):
+        '''Return the position given by d['gnx'] or d['unl'], or None.'''
+        g = self.g
+        gnx,unl = d.get('gnx'),d.get('unl')
+        if gnx:
+            p = c.gnxIndex.gnx2position(gnx)
+            if not p:
+                raise ValueError('gnx not found: %s' % gnx)
+            return p
+        elif unl:
+            if '#' in unl:
+                unl = unl.split('#',1)[1]
+            found,depth,p = g.recursiveUNLFind(unl.split('-->'),c)
+            if not found:
+                raise ValueError('unl not found: %s' % unl)
+            return p
+        else:
+            return None
+    #@+node:ekr.20141231090001.34: *3* daemon.getPath
+    def getPath(self,d):
+        '''Return the absolute path given by d['path'].'''
+        g = self.g
+        path = d.get('path')
+        if not path:
+            raise ValueError('no path')
+        return g.os_path_finalize(path)
+    #@+node:ekr.20141231090001.35: *3* daemon.nodeDict
+    def nodeDict(self,p,body=True):
+        '''Return a dict describing p.'''
+        d = {
+            'children': [z.gnx for z in p.children()],
+            'gnx': p.gnx,
+            'h': p.h,
+            'level': p.level(),
+            'unl': p.get_UNL(with_file=False),
+        }
+        if body:
+            d['b'] = p.b
+        return d
+    #@+node:ekr.20141231090001.36: *3* daemon.serve & helpers
+    def serve(self):
+        '''Answer requests until a stop request arrives.'''
+        listener = self.listen()
+        clients = {}
+            # Keys are sockets; values are LProtoBufs.
+        try:
+            while not self.stopping:
+                readable = select.select([listener] + list(clients),[],[])[0]
+                for sock in readable:
+                    if sock is listener:
+                        conn = listener.accept()[0]
+                        buf = lproto.LProtoBuf()
+                        buf.set_recv_cb(self.replier(conn))
+                        clients[conn] = buf
+                        continue
+                    try:
+                        byts = sock.recv(65536)
+                    except socket.error:
+                        byts = None
+                    if byts:
+                        clients[sock].push_bytes(byts)
+                    else:
+                        del clients[sock]
+                        sock.close()
+        finally:
+            for sock in clients:
+                sock.close()
+            listener.close()
+            if os.path.exists(self.socketName):
+                os.remove(self.socketName)
+            self.pool.closeAll()
+    #@+node:ekr.20141231090001.37: *4* daemon.listen
+    def listen(self):
+        '''
+        Return a socket listening on self.socketName. Only the daemon's
+        user may read or write the socket.
+        '''
+        fn = self.socketName
+        if os.path.exists(fn):
+            # Remove the socket only if no daemon is listening to it.
+            try:
+                Client(fn).close()
+            except socket.error:
+                os.remove(fn)
+            else:
+                raise socket.error('a daemon is already listening on %s' % fn)
+        else:
+            theDir = os.path.dirname(fn)
+            if theDir and not os.path.exists(theDir):
+                os.makedirs(theDir)
+        listener = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+        # run-script executes arbitrary code: only our user may connect.
+        oldMask = os.umask(0o177)
+        try:
+            listener.bind(fn)
+        finally:
+            os.umask(oldMask)
+        listener.listen(5)
+        return listener
+    #@+node:ekr.20141231090001.38: *4* daemon.replier
+    def replier(self,conn):
+        '''Return the LProtoBuf callback answering each request from conn.'''
+        def reply(msg):
+            s = self.dispatch(msg)
+            try:
+                conn.sendall(lproto.mk_send_bytes(s))
+            except socket.error:
+                pass # The client has gone: serve notices at its next read.
+        return reply
+    #@-others
+#@-others
+if __name__ == '__main__':
+    main()
+#@-leo
@@ -12,6 +12,7 @@ Modelled after Emacs and Vim commands.
 #@+node:ekr.20050710151017: ** << imports >> (leoEditCommands)
 import leo.core.leoGlobals as g
 # import leo.core.LeoFind as LeoFind
+import leo.core.leoWordIndex as leoWordIndex
 import difflib   
 docutils = g.importExtension('docutils',pluginName='leoEditCommands.py')
 try:
@@ -23,7 +24,6 @@ import re
 if g.isPython3:
     from functools import reduce
 import shlex
-import string
 import subprocess # Always exists in Python 2.6 and above.
 import sys
 #@-<< imports >>
@@ -362,6 +362,16 @@ def pylint_command(event):
     c = event.get('c')
     if c:
         PylintCommand(c).run()
+#@+node:ekr.20141230140001.17: *3* show-startup-profile
+@g.command('show-startup-profile')
+def showStartupProfile(event):
+    '''Summarize the profile written by the --startup-profile option in the log.'''
+    sp = g.app.startupProfile
+    if sp and sp.finished:
+        for s in sp.summary():
+            g.es(s)
+    else:
+        g.es('no startup profile: start Leo with --startup-profile=FILE')
 #@+node:ekr.20120211121736.10817: ** class EditCommandsManager
 class EditCommandsManager:
 
@@ -453,9 +463,8 @@ class AbbrevCommandsClass (BaseEditCommandsClass):
         # Set local ivars.
         self.abbrevs = {} # Keys are names, values are (abbrev,tag).
         self.daRanges = []
-        self.dynaregex = re.compile( # For dynamic abbreviations
-            r'[%s%s\-_]+'%(string.ascii_letters,string.digits))
-            # Not a unicode problem.
+        self.dynaregex = leoWordIndex.word_pattern
+            # For dynamic abbreviations.
         self.event = None
         self.globalDynamicAbbrevs = c.config.getBool('globalDynamicAbbrevs')
         self.last_hit = None # Distinguish between text and tree abbreviations.
@@ -962,15 +971,12 @@ class AbbrevCommandsClass (BaseEditCommandsClass):
     def getDynamicList (self,w,s):
 
         if self.globalDynamicAbbrevs:
-            # Look in all nodes.h
-            items = []
-            for p in self.c.all_unique_positions():
-                items.extend(self.dynaregex.findall(p.b))
+            # Look in all nodes, using the word index.
+            items = self.c.wordIndex.completions(s)
         else:
             # Just look in this node.
             items = self.dynaregex.findall(w.getAllText())
-
-        items = sorted(set([z for z in items if z.startswith(s)]))
+            items = sorted(set([z for z in items if z.startswith(s)]))
 
         # g.trace(repr(s),repr(sorted(items)))
         return items
@@ -10152,8 +10158,11 @@ class SearchCommandsClass (BaseEditCommandsClass):
         'clone-find-all-flattened':       find.minibufferCloneFindAllFlattened,
         'clone-find-parents':             self.c.cloneFindParents,
         'find-all':                       find.minibufferFindAll,
+        'find-all-cancel':                find.cancelFindAllCommand,
         'find-clone-all':                 find.minibufferCloneFindAll,
         'find-clone-all-flattened':       find.minibufferCloneFindAllFlattened,
+        'find-in-outlines':               find.findInOutlinesCommand,
+        'find-in-outlines-cancel':        find.cancelFindInOutlinesCommand,
         'find-next':                      find.findNextCommand,
         'find-prev':                      find.findPrevCommand,
         'find-tab-hide':                  find.hideFindTab,
@@ -10215,6 +10224,7 @@ class SpellCommandsClass (BaseEditCommandsClass):
         return {
             'focus-to-spell':           self.focusToSpell,
             'open-spell-tab':           self.openSpellTab,
+            'spell-check-outline':      self.checkOutline,
             'spell-find':               self.find,
             'spell-change':             self.change,
             'spell-change-then-find':   self.changeThenFind,
@@ -10266,6 +10276,16 @@ class SpellCommandsClass (BaseEditCommandsClass):
         else:
             self.openSpellTab()
 
+    #@+node:ekr.20141230110001.1: *5* checkOutline
+    def checkOutline (self,event=None):
+        '''
+        Find the misspelled words in all bodies at once, so that the
+        spell-find command finds each of them without checking any words.
+        '''
+        self.openSpellTab()
+        if self.handler and self.handler.loaded:
+            n,nodes = self.handler.spellIndex.checkOutline()
+            g.es('%s misspelled words in %s nodes' % (n,nodes))
     #@+node:ekr.20141113094129.9: *5* change
     def change(self,event=None):
         '''Simulate pressing the 'Change' button in the Spell tab.'''
@@ -10463,12 +10483,14 @@ class SpellTabHandler:
         self.workCtrl = g.app.gui.plainTextWidget(c.frame.top)
             # A text widget for scanning.
             # Must have a parent frame even though it is not packed.
-        if enchant:
+        if enchant or c.config.getString('spell-word-list'):
             self.spellController = EnchantClass(c)
+            self.spellIndex = SpellIndex(c,self.spellController)
             self.tab = g.app.gui.createSpellTab(c,self,tabName)
             self.loaded = True
         else:
             self.spellController = None
+            self.spellIndex = None
             self.tab = None
             self.loaded = False
     #@+node:ekr.20051025071455.36: *4* Commands
@@ -10479,6 +10501,7 @@ class SpellTabHandler:
             w = self.currentWord
             if w:
                 self.spellController.add(w)
+                self.spellIndex.wordChanged(w)
                 self.tab.onFindButton()
     #@+node:ekr.20051025071455.38: *5* change (spellTab)
     def change(self,event=None):
@@ -10517,13 +10540,6 @@ class SpellTabHandler:
             return
         c = self.c
         w = c.frame.body.wrapper
-        # Reload the work pane from the present node.
-        s = w.getAllText().rstrip()
-        self.workCtrl.delete(0,"end")
-        self.workCtrl.insert("end",s)
-        # Reset the insertion point of the work widget.
-        ins = w.getInsertPoint()
-        self.workCtrl.setInsertPoint(ins)
         alts, word = self.findNextMisspelledWord()
         self.currentWord = word # Need to remember this for 'add' and 'ignore'
         if alts:
@@ -10545,15 +10561,16 @@ class SpellTabHandler:
     def findNextMisspelledWord(self):
         """Find the next unknown word."""
         trace = False and not g.unitTesting
-        c = self.c ; p = c.p
+        c = self.c
         w = c.frame.body.wrapper
         sc = self.spellController
         alts = None ; word = None
         try:
+            p,ins = c.p,w.getInsertPoint()
             while 1:
-                i,j,p,word = self.findNextWord(p)
+                p,i,j,word = self.spellIndex.nextMisspelling(p,ins)
                 # g.trace(i,j,p and p.h or '<no p>')
-                if not p or not word:
+                if not p:
                     alts = None
                     break
                 alts = sc.processWord(word)
@@ -10575,45 +10592,11 @@ class SpellTabHandler:
                         c.selectPosition(p)
                     w.setSelectionRange(i,j,insert=j)
                     break
+                # Skip misspellings without suggestions.
+                ins = j
         except Exception:
             g.es_exception()
         return alts, word
-    #@+node:ekr.20051025071455.47: *6* findNextWord (spellTab)
-    def findNextWord(self,p):
-        """Scan for the next word, leaving the result in the work widget"""
-        trace = False and not g.unitTesting
-        c = self.c ; p = p.copy()
-        while 1:
-            s = self.workCtrl.getAllText()
-            i = self.workCtrl.getInsertPoint()
-            while i < len(s) and not g.isWordChar1(s[i]):
-                i += 1
-            # g.trace('p',p and p.h,'i',i,'len(s)',len(s))
-            if i < len(s):
-                # A non-empty word has been found.
-                j = i
-                while j < len(s) and (g.isWordChar(s[j]) or s[j] == "'"):
-                    j += 1
-                word = s[i:j]
-                word = word.strip("'")
-                # This trace verifies that all words have been checked.
-                # g.trace(repr(word))
-                for w in (self.workCtrl,c.frame.body.wrapper):
-                    c.widgetWantsFocusNow(w)
-                    w.setSelectionRange(i,j,insert=j)
-                if trace: g.trace(i,j,word,p.h)
-                return i,j,p,word
-            else:
-                # End of the body text.
-                p.moveToThreadNext()
-                if not p: break
-                self.workCtrl.delete(0,'end')
-                self.workCtrl.insert(0,p.b)
-                for w in (self.workCtrl,c.frame.body.wrapper):
-                    c.widgetWantsFocusNow(w)
-                    w.setSelectionRange(0,0,insert=0)
-                if trace: g.trace(0,0,'-->',p.h)
-        return None,None,None,None
     #@+node:ekr.20051025121408: *5* hide
     def hide (self,event=None):
 
@@ -10625,8 +10608,82 @@ class SpellTabHandler:
             w = self.currentWord
             if w:
                 self.spellController.ignore(w)
+                self.spellIndex.wordChanged(w)
                 self.tab.onFindButton()
     #@-others
+#@+node:ekr.20141230110001.4: *3* class SpellIndex
+class SpellIndex:
+
+    """
+    The misspelled words in the bodies of all nodes, found in batches.
+    Each unique word is checked only once, and the misspellings of each
+    node are cached until its body changes.
+    """
+
+    word_pattern = re.compile(r"[^\W\d][\w']*",re.UNICODE)
+        # The words of the Spell tab.
+
+    #@+others
+    #@+node:ekr.20141230110001.5: *4*  __init__ (SpellIndex)
+    def __init__ (self,c,spellController):
+        """Ctor for the SpellIndex class."""
+        self.c = c
+        self.nodes = {}
+            # Keys are vnodes; values are (textRevision,aList),
+            # where aList contains (i,j,word) for each misspelled word.
+        self.spellController = spellController
+        self.words = {}
+            # Keys are words; values are True if the word is properly spelled.
+    #@+node:ekr.20141230110001.6: *4* checkOutline
+    def checkOutline (self):
+        """
+        Find the misspelled words in all bodies. Return (n,nodes): the
+        number of misspelled words and of the nodes containing them.
+        """
+        n = nodes = 0
+        for v,level,childIndex in self.c.walk(unique=True):
+            aList = self.misspellings(v)
+            if aList:
+                n += len(aList)
+                nodes += 1
+        return n,nodes
+    #@+node:ekr.20141230110001.7: *4* misspellings
+    def misspellings (self,v):
+        """Return the list of (i,j,word) tuples for v's misspelled words."""
+        data = self.nodes.get(v)
+        if data and data[0] == v.textRevision:
+            return data[1]
+        aList = []
+        d,sc = self.words,self.spellController
+        for m in self.word_pattern.finditer(v._bodyString):
+            word = m.group(0).rstrip("'")
+            ok = d.get(word)
+            if ok is None:
+                ok = d[word] = bool(sc.check(word))
+            if not ok:
+                aList.append((m.start(),m.end(),word))
+        self.nodes[v] = v.textRevision,aList
+        return aList
+    #@+node:ekr.20141230110001.8: *4* nextMisspelling
+    def nextMisspelling (self,p,ins=0):
+        """
+        Return (p,i,j,word) for the first misspelled word at or after
+        offset ins of p's body, or in the following nodes in outline order.
+        Return (None,None,None,None) if there are no more misspellings.
+        """
+        p = p.copy()
+        while p:
+            for i,j,word in self.misspellings(p.v):
+                if i >= ins and not self.words.get(word):
+                    return p,i,j,word
+            p.moveToThreadNext()
+            ins = 0
+        return None,None,None,None
+    #@+node:ekr.20141230110001.9: *4* wordChanged
+    def wordChanged (self,word):
+        """Called after word has been added to the dictionary or ignored."""
+        self.words[word] = True
+    #@-others
 #@+node:ekr.20100904095239.5914: *3* class EnchantClass
 class EnchantClass:
 
@@ -10634,15 +10691,17 @@ class EnchantClass:
 
     #@+others
     #@+node:ekr.20100904095239.5916: *4*  __init__ (EnchantClass)
-    def __init__ (self,c):
-        """Ctor for the EnchantClass class."""
+    def __init__ (self,c,d=None):
+        """
+        Ctor for the EnchantClass class.
+
+        d: None, or the dictionary to use: an object with the API of
+           enchant.Dict, such as a WordListDict.
+        """
         self.c = c
-        language = g.toUnicode(c.config.getString('enchant_language'))
-        # Set the base language
-        if language and not enchant.dict_exists(language):
-            g.warning('Invalid language code for Enchant',repr(language))
-            g.es_print('Using "en_US" instead')
-            language = 'en_US'
+        self.d = d
+        if d:
+            return
         # Compute fn, the full path to the local dictionary.
         fn = c.config.getString('enchant_local_dictionary')
         if not fn:
@@ -10650,6 +10709,17 @@ class EnchantClass:
         # Fix bug https://github.com/leo-editor/leo-editor/issues/108
         if not g.os_path_exists(fn):
             fn = g.os_path_finalize_join(g.app.homeDir,'.leo','spellpyx.txt')
+        word_list = c.config.getString('spell-word-list')
+        if word_list:
+            # Use a plain word list instead of enchant.
+            self.open_word_list(g.os_path_finalize(word_list),fn)
+            return
+        language = g.toUnicode(c.config.getString('enchant_language'))
+        # Set the base language
+        if language and not enchant.dict_exists(language):
+            g.warning('Invalid language code for Enchant',repr(language))
+            g.es_print('Using "en_US" instead')
+            language = 'en_US'
         self.open_dict(fn,language)
     #@+node:ekr.20100904095239.5927: *4* add
     def add (self,word):
@@ -10657,6 +10727,12 @@ class EnchantClass:
         '''Add a word to the user dictionary.'''
 
         self.d.add(word)
+    #@+node:ekr.20141230110001.2: *4* check
+    def check (self,word):
+
+        """Return True if the word is properly spelled."""
+
+        return not self.d or self.d.check(word)
     #@+node:ekr.20130116142831.10185: *4* clean_dict
     def clean_dict (self,fn):
         
@@ -10720,6 +10796,27 @@ class EnchantClass:
             self.d = enchant.Dict(language)
         # Use only a single copy of the dict.
         g.app.spellDict = self.d
+    #@+node:ekr.20141230110001.3: *4* open_word_list
+    def open_word_list(self,path,fn):
+        """
+        Open a WordListDict containing the words in the file path and in
+        the local dictionary fn, creating fn if necessary.
+        """
+        d = g.app.spellDict
+        if d:
+            self.d = d
+            return
+        if not g.os_path_exists(path):
+            g.error('spell-word-list not found:',path)
+            return
+        if not g.os_path_exists(fn):
+            self.create(fn)
+        if g.os_path_exists(fn):
+            self.clean_dict(fn)
+        else:
+            fn = None
+        self.d = WordListDict(path,pwl=fn)
+        g.app.spellDict = self.d
     #@+node:ekr.20100904095239.5920: *4* processWord
     def processWord(self, word):
 
@@ -10735,6 +10832,74 @@ class EnchantClass:
         else:
             return d.suggest(word)
     #@-others
+#@+node:ekr.20141230110001.10: *3* class WordListDict
+class WordListDict:
+
+    """
+    A dictionary for EnchantClass containing the words of a plain text
+    file, one word per line. It has the parts of the API of enchant.Dict
+    that Leo uses.
+    """
+
+    #@+others
+    #@+node:ekr.20141230110001.11: *4*  __init__ (WordListDict)
+    def __init__ (self,fn=None,pwl=None,words=None):
+        """
+        Ctor for the WordListDict class.
+
+        fn:     None, or the file containing the words.
+        pwl:    None, or the local dictionary. add appends words to it.
+        words:  None, or a list of more words.
+        """
+        self.pwl = pwl
+        self.session = set()
+        self.words = set(words or [])
+        for path in (fn,pwl):
+            if path:
+                self.read(path)
+    #@+node:ekr.20141230110001.12: *4* add & add_to_session
+    def add (self,word):
+        """Add word to the dictionary and to the local dictionary file."""
+        self.words.add(word)
+        if self.pwl:
+            f = open(self.pwl,'ab')
+            try:
+                f.write(g.toEncodedString(word + '\n',reportErrors=True))
+            finally:
+                f.close()
+
+    def add_to_session (self,word):
+        """Accept word until Leo exits."""
+        self.session.add(word)
+    #@+node:ekr.20141230110001.13: *4* check
+    def check (self,word):
+        """Return True if word is in the dictionary, ignoring an initial capital."""
+        return (word in self.words or word in self.session or
+            word[:1].lower() + word[1:] in self.words)
+    #@+node:ekr.20141230110001.14: *4* read
+    def read (self,fn):
+        """Add all words in the file fn."""
+        f = open(fn,'rb')
+        try:
+            s = g.toUnicode(f.read())
+        finally:
+            f.close()
+        self.words.update([z.strip() for z in s.splitlines() if z.strip()])
+    #@+node:ekr.20141230110001.15: *4* suggest
+    def suggest (self,word):
+        """Return a list of the words closest to word."""
+        lower = word.lower()
+        ch,n = lower[:1],len(word)
+        candidates = [z for z in self.words
+            if z[:1].lower() == ch and abs(len(z)-n) < 3]
+        aList = difflib.get_close_matches(lower,
+            [z.lower() for z in candidates],n=10)
+        d = dict([(z.lower(),z) for z in candidates])
+        aList = [d[z] for z in aList]
+        if word[:1].isupper():
+            aList = [z[:1].upper() + z[1:] for z in aList]
+        return aList
+    #@-others
 #@-others
 #@-others
 #@-leo
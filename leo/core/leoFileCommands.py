@@ -11,6 +11,7 @@ import leo.core.leoGlobals as g
     # try: from psyco.classes import *
     # except ImportError: pass
 
+import leo.core.leoBinaryOutline as leoBinaryOutline
 import leo.core.leoNodes as leoNodes
 import binascii
 import difflib
@@ -52,6 +53,10 @@ class BadLeoFile(Exception):
 
 class InvalidPaste(Exception):
     pass
+
+class StopSettingsScan(Exception):
+    '''Raised by SettingsSaxContentHandler to end a parse early.'''
+    pass
 #@-<< define exception classes >>
 
 if sys.platform != 'cli':
@@ -489,6 +494,266 @@ if sys.platform != 'cli':
                 else:
                     node.attributes[name] = val
         #@-others
+    #@+node:ekr.20141218090101.1: *3* class StreamingSaxContentHandler (SaxContentHandler)
+    class StreamingSaxContentHandler (SaxContentHandler):
+
+        '''
+        A sax content handler that creates vnodes while reading a .leo file.
+
+        Unlike SaxContentHandler, this class creates no intermediate tree.
+        Each <v> element becomes a VNode as soon as it is seen, and each <t>
+        element sets the body text of the vnodes that refer to it.
+        '''
+
+        #@+others
+        #@+node:ekr.20141218090101.2: *4*  __init__ (StreamingSaxContentHandler)
+        def __init__ (self,c,fileName,silent,inClipboard):
+            '''Ctor for StreamingSaxContentHandler class.'''
+            SaxContentHandler.__init__(self,c,fileName,silent,inClipboard)
+            self.fc = c.fileCommands
+            self.newGnxs = []
+                # Gnxs added to fc.gnxDict by this read.
+            self.newVnodes = set()
+                # Vnodes created by this read.
+            self.oldVnodeBodies = {}
+                # Keys are vnodes that existed before this read.
+                # Values are their new body texts.
+            self.pendingLinks = []
+                # (child,parent) links to vnodes that existed before this read.
+            self.skipLevel = 0
+                # > 0: within the duplicate subtree of a clone.
+            self.tnxToListDict = {}
+                # Keys are tnx's (strings), values are *lists* of vnodes.
+            self.vnodeList = []
+                # The vnodes whose bodies the present <t> element sets.
+            self.vnodeStack = []
+                # Entries are (v,children), where children are v's new children.
+        #@+node:ekr.20141218090101.3: *4* abort & finish
+        def abort (self):
+            '''Undo the changes this read has made to fc.gnxDict.'''
+            for gnx in self.newGnxs:
+                self.fc.gnxDict.pop(gnx,None)
+            self.newGnxs = []
+
+        def finish (self):
+            '''
+            Link the top-level vnodes to the hidden root node and update the
+            vnodes that existed before this read.
+
+            Return the first top-level VNode, or None if there are no vnodes.
+            '''
+            if not self.vnodeStack:
+                return None
+            root_v,children = self.vnodeStack.pop()
+            assert root_v == self.c.hiddenRootNode and not self.vnodeStack
+            self.linkChildren(root_v,children)
+            for child,parent_v in self.pendingLinks:
+                child.parents.append(parent_v)
+            for v in self.oldVnodeBodies:
+                # The body of the later node overrides the earlier.
+                b = self.oldVnodeBodies.get(v)
+                if v.b != b:
+                    v.b = b
+            return children and children[0] or None
+        #@+node:ekr.20141218090101.4: *4* linkChildren
+        def linkChildren (self,parent_v,children):
+            '''Make children the children of parent_v.'''
+            parent_v.children = children
+            self.c.gnxIndex.childrenChanged(parent_v)
+            for child in children:
+                if child in self.newVnodes:
+                    child.parents.append(parent_v)
+                else:
+                    self.pendingLinks.append((child,parent_v),)
+        #@+node:ekr.20141218090101.5: *4* endTnode
+        def endTnode (self):
+
+            b = ''.join(self.content)
+            for v in self.vnodeList:
+                if v in self.newVnodes:
+                    v.setBodyString(b)
+                else:
+                    self.oldVnodeBodies[v] = b
+            self.content = []
+        #@+node:ekr.20141218090101.6: *4* endVnode
+        def endVnode (self):
+
+            self.node = None
+            if self.skipLevel:
+                self.skipLevel -= 1
+            else:
+                v,children = self.vnodeStack.pop()
+                self.linkChildren(v,children)
+        #@+node:ekr.20141218090101.7: *4* endVH
+        def endVH (self):
+
+            if self.node:
+                self.node.setHeadString(''.join(self.content))
+            self.content = []
+        #@+node:ekr.20141218090101.8: *4* tnodeAttributes (StreamingSaxContentHandler)
+        def tnodeAttributes (self,attrs):
+
+            self.vnodeList = []
+            tx = None
+            d = {}
+            for name in attrs.getNames():
+                if name == 'tx':
+                    tx = attrs.getValue(name)
+                    self.vnodeList = self.tnxToListDict.get(tx,[])
+                else:
+                    d[name] = attrs.getValue(name)
+            if not self.vnodeList:
+                self.error('Bad leo file: no node for <t tx=%s>' % (tx))
+            elif d:
+                for v in self.vnodeList:
+                    self.fc.handleTnodeSaxAttributes(g.Bunch(tnodeAttributes=d),v)
+        #@+node:ekr.20141218090101.9: *4* startVnode (StreamingSaxContentHandler)
+        def startVnode (self,attrs):
+
+            c,fc = self.c,self.fc
+            if not self.inElement('vnodes'):
+                self.error('<v> outside <vnodes>')
+            self.node = None
+            if self.skipLevel:
+                # Ignore the duplicate subtree of a clone.
+                self.skipLevel += 1
+                return
+            if not self.vnodeStack:
+                self.vnodeStack.append((c.hiddenRootNode,[]),)
+            d = dict([(name,attrs.getValue(name)) for name in attrs.getNames()])
+            tnx = d.get('t')
+            v = fc.gnxDict.get(tnx)
+            if v:
+                # A clone. Its children are already known.
+                self.skipLevel = 1
+                if v not in self.newVnodes and v not in self.oldVnodeBodies:
+                    self.oldVnodeBodies[v] = ''
+            else:
+                if tnx:
+                    # Important: this should retain compatibility with old .leo files.
+                    gnx = g.toUnicode(fc.canonicalTnodeIndex(str(tnx)))
+                else:
+                    gnx = g.app.nodeIndices.getNewIndex(None)
+                    g.trace('no txn! allocated new gnx',gnx)
+                v = leoNodes.VNode(context=c,gnx=gnx)
+                fc.gnxDict[gnx] = v
+                if g.trace_gnxDict: g.trace(c.shortFileName(),gnx,v)
+                self.newGnxs.append(gnx)
+                self.newVnodes.add(v)
+                self.node = v
+            self.vnodeStack[-1][1].append(v)
+            if not self.skipLevel:
+                self.vnodeStack.append((v,[]),)
+            if tnx:
+                aList = self.tnxToListDict.get(tnx,[])
+                if v not in aList:
+                    aList.append(v)
+                self.tnxToListDict[tnx] = aList
+            fc.handleVnodeSaxAttributes(g.Bunch(attributes=d),v)
+        #@-others
+    #@+node:ekr.20141230120001.1: *3* class SettingsSaxContentHandler (StreamingSaxContentHandler)
+    class SettingsSaxContentHandler (StreamingSaxContentHandler):
+
+        '''
+        A sax content handler that creates vnodes only for the @settings tree
+        of a .leo file: the first node whose headline is @settings, and all
+        its descendants.
+
+        The handler raises StopSettingsScan as soon as it has seen the body
+        text of all nodes in the tree, so the rest of the file is never
+        read. Most <t> elements follow those of the @settings tree.
+        '''
+
+        #@+others
+        #@+node:ekr.20141230120001.2: *4*  __init__ (SettingsSaxContentHandler)
+        def __init__ (self,c,fileName):
+            '''Ctor for SettingsSaxContentHandler class.'''
+            StreamingSaxContentHandler.__init__(self,c,fileName,
+                silent=True,inClipboard=True)
+                    # inClipboard: don't change c.frame.
+            self.dispatchDict['vnodes'] = (self.startVnodes,self.endVnodes)
+            self.complete = True
+                # False: the tree contains a clone whose headline and children
+                # precede the tree in the file. Only a full read can create it.
+            self.depth = 0
+                # The number of enclosing <v> elements.
+            self.found = False
+                # True: the @settings node has been seen.
+            self.pendingAttrs = None
+                # The attributes of the last <v> element outside the tree.
+            self.pendingTnx = set()
+                # The tnx's of the tree's <t> elements that remain to be read.
+            self.settingsDepth = None
+                # The depth of the @settings node while within its tree.
+            self.tnx = None
+                # The tx attribute of the present <t> element.
+            self.unnamedVnode = None
+                # A new vnode whose <vh> element has not been seen.
+        #@+node:ekr.20141230120001.3: *4* characters (SettingsSaxContentHandler)
+        def characters (self,content):
+
+            # Don't accumulate the body text of nodes outside the tree.
+            name = self.elementStack and self.elementStack[-1]
+            if name == 'vh' or (name == 't' and self.vnodeList):
+                StreamingSaxContentHandler.characters(self,content)
+        #@+node:ekr.20141230120001.4: *4* endTnode (SettingsSaxContentHandler)
+        def endTnode (self):
+
+            if self.vnodeList:
+                StreamingSaxContentHandler.endTnode(self)
+                self.pendingTnx.discard(self.tnx)
+                if not self.pendingTnx:
+                    raise StopSettingsScan
+            self.content = []
+        #@+node:ekr.20141230120001.5: *4* endVH (SettingsSaxContentHandler)
+        def endVH (self):
+
+            if self.pendingAttrs is not None:
+                attrs,self.pendingAttrs = self.pendingAttrs,None
+                if ''.join(self.content).rstrip() == '@settings':
+                    self.found = True
+                    self.settingsDepth = self.depth
+                    StreamingSaxContentHandler.startVnode(self,attrs)
+            self.unnamedVnode = None
+            StreamingSaxContentHandler.endVH(self)
+        #@+node:ekr.20141230120001.6: *4* endVnode (SettingsSaxContentHandler)
+        def endVnode (self):
+
+            if self.settingsDepth is not None:
+                if self.unnamedVnode:
+                    # A clone written before the @settings tree.
+                    self.complete = False
+                    raise StopSettingsScan
+                StreamingSaxContentHandler.endVnode(self)
+                if self.depth == self.settingsDepth:
+                    self.settingsDepth = None
+                    self.pendingTnx = set(self.tnxToListDict)
+            self.depth -= 1
+        #@+node:ekr.20141230120001.7: *4* endVnodes
+        def endVnodes (self):
+
+            # Stop if there is no @settings tree.
+            if not self.pendingTnx:
+                raise StopSettingsScan
+        #@+node:ekr.20141230120001.8: *4* startVnode (SettingsSaxContentHandler)
+        def startVnode (self,attrs):
+
+            self.depth += 1
+            if self.settingsDepth is not None:
+                StreamingSaxContentHandler.startVnode(self,attrs)
+                self.unnamedVnode = self.node
+            elif not self.found:
+                # Create the vnode in endVH if it is the @settings node.
+                self.pendingAttrs = attrs
+        #@+node:ekr.20141230120001.9: *4* tnodeAttributes (SettingsSaxContentHandler)
+        def tnodeAttributes (self,attrs):
+
+            self.tnx = attrs.get('tx')
+            if self.tnx in self.pendingTnx:
+                StreamingSaxContentHandler.tnodeAttributes(self,attrs)
+            else:
+                self.vnodeList = []
+        #@-others
     #@+node:ekr.20060919110638.15: *3* class SaxNodeClass
     class SaxNodeClass:
 
@@ -526,6 +791,8 @@ if sys.platform != 'cli':
 
 class FileCommands:
     """A class creating the FileCommands subcommander."""
+    # leo_namespace = 'http://www.leo-editor.org/2011/leo'
+    leo_namespace = 'http://leoeditor.com/namespaces/leo-python-editor/1.1'
     #@+others
     #@+node:ekr.20090218115025.4: ** fc.Birth
     #@+node:ekr.20031218072017.3019: *3* fc.ctor
@@ -662,6 +929,7 @@ class FileCommands:
         c.hiddenRootNode.children = children
         # Unlink v from the hidden root.
         v.parents.remove(c.hiddenRootNode)
+        c.gnxIndex.childrenChanged(c.hiddenRootNode)
         p = leoNodes.Position(v)
         # Important: we must not adjust links when linking v
         # into the outline.  The read code has already done that.
@@ -1367,9 +1635,105 @@ class FileCommands:
             sax_node = None
 
         return sax_node
-    #@+node:ekr.20060919110638.3: *4* fc.readSaxFile
+    #@+node:ekr.20141218090101.10: *4* fc.readSaxFile & helper
     def readSaxFile (self,theFile,fileName,silent,inClipboard,reassignIndices,s=None):
+        '''
+        Read a .leo file, or string s in clipboard format, in a single pass,
+        creating vnodes as the parser sees their elements.
+
+        theFile may also be a .leob file. See leoBinaryOutline.py.
+
+        Return the first top-level VNode, or None.
+        '''
+        fc = self ; c = fc.c
+        handler = StreamingSaxContentHandler(c,fileName,silent,inClipboard)
+        try:
+            if theFile and fc.isLeobFile(theFile):
+                leoBinaryOutline.LeobFile(theFile).replay(handler)
+            else:
+                parser = xml.sax.make_parser()
+                parser.setFeature(xml.sax.handler.feature_external_ges,1)
+                    # Include external general entities, esp. xml-stylesheet lines.
+                parser.setContentHandler(handler)
+                for chunk in fc.readSaxChunks(theFile,s):
+                    parser.feed(chunk)
+                parser.close()
+            v = handler.finish()
+        except Exception:
+            handler.abort()
+            g.error('error parsing',fileName)
+            g.es_exception()
+            v = None
+        c.gnxIndex.invalidate()
+        return v
+    #@+node:ekr.20141219100001.33: *5* fc.isLeobFile
+    def isLeobFile (self,theFile):
+        '''Return True if theFile, an open file, is a .leob file.'''
+        s = theFile.read(len(leoBinaryOutline.magic))
+        theFile.seek(0)
+        return leoBinaryOutline.isLeobData(s)
+    #@+node:ekr.20141218090101.11: *5* fc.readSaxChunks
+    saxChunkSize = 256 * 1024
+
+    def readSaxChunks (self,theFile,s):
+        '''
+        Yield the cleaned contents of theFile, or of string s if theFile is
+        None, in pieces of at most fc.saxChunkSize bytes.
+        '''
+        n = self.saxChunkSize
+        if theFile:
+            while True:
+                chunk = theFile.read(n)
+                if not chunk:
+                    break
+                yield self.cleanSaxInputString(chunk)
+        elif s:
+            for i in range(0,len(s),n):
+                yield self.cleanSaxInputString(s[i:i+n])
+    #@+node:ekr.20141230120001.10: *4* fc.readSettingsTree
+    def readSettingsTree (self,theFile,fileName):
+        '''
+        Read only the @settings tree of a .leo or .leob file, making it the
+        only top-level node of c's outline. Closes theFile.
 
+        Return False if only a full read can create the @settings tree.
+        c's outline is then unchanged.
+        '''
+        fc = self ; c = fc.c
+        handler = SettingsSaxContentHandler(c,fileName)
+        try:
+            try:
+                if fc.isLeobFile(theFile):
+                    leoBinaryOutline.LeobFile(theFile).replay(handler)
+                else:
+                    parser = xml.sax.make_parser()
+                    parser.setFeature(xml.sax.handler.feature_external_ges,1)
+                    parser.setContentHandler(handler)
+                    for chunk in fc.readSaxChunks(theFile,None):
+                        parser.feed(chunk)
+                    parser.close()
+            except StopSettingsScan:
+                pass
+            ok = handler.complete
+        except Exception:
+            # The full read will report the error.
+            ok = False
+        finally:
+            theFile.close()
+        if ok:
+            handler.finish()
+        else:
+            handler.abort()
+        c.gnxIndex.invalidate()
+        return ok
+    #@+node:ekr.20060919110638.3: *4* fc.readSaxFileInTwoPasses
+    def readSaxFileInTwoPasses (self,theFile,fileName,silent,inClipboard,reassignIndices,s=None):
+        '''
+        The former .leo file reader: parse the entire file into a tree of
+        SaxNodeClass objects, then create vnodes from that tree.
+
+        Retained for comparison by leoBenchmark.py.
+        '''
         dump = False and not g.unitTesting
         fc = self ; c = fc.c
 
@@ -1511,6 +1875,7 @@ class FileCommands:
             if ok:
                 ok = self.write_Leo_file(fileName,False) # outlineOnlyFlag
             if ok:
+                c.searchIndex.writeCache()
                 if not silent:
                     self.putSavedMessage(fileName)
                 c.setChanged(False) # Clears all dirty bits.
@@ -1535,6 +1900,7 @@ class FileCommands:
             try:
                 if self.write_Leo_file(fileName,outlineOnlyFlag=False):
                     c.setChanged(False) # Clears all dirty bits.
+                    c.searchIndex.writeCache()
                     self.putSavedMessage(fileName)
             finally:
                 c.ignoreChangedPaths = True
@@ -1590,6 +1956,13 @@ class FileCommands:
             if not g.isPython3:
                 s = g.toEncodedString(s,self.leo_file_encoding,reportErrors=True)
             self.outputFile.write(s)
+    #@+node:ekr.20150102090001.8: *4* attributesToString
+    def attributesToString (self,attrs):
+        '''Return the xml form of attrs, a list of (name,value) tuples.'''
+        # putDescendentAttributes puts marks and expanded attributes on separate lines.
+        return ''.join(['%s%s="%s"' % (
+            '\n' if name in ('marks','expanded') else ' ',name,val)
+                for name,val in attrs])
     #@+node:ekr.20141020112451.18329: *4* put_dquote
     def put_dquote (self):
         self.put('"')
@@ -1650,11 +2023,27 @@ class FileCommands:
         # New in 4.3:  These settings never get written to the .leo file.
         self.put("<find_panel_settings/>")
         self.put_nl()
-    #@+node:ekr.20031218072017.3037: *4* fc.putGlobals
+    #@+node:ekr.20031218072017.3037: *4* fc.putGlobals & globalsAttributes
     # Changed for Leo 4.0.
 
     def putGlobals (self):
 
+        globalsAttrs,windowAttrs,logAttrs = self.globalsAttributes()
+        self.put("<globals%s>" % self.attributesToString(globalsAttrs))
+        self.put_nl()
+        self.put_tab()
+        self.put("<global_window_position%s/>" % self.attributesToString(windowAttrs))
+        self.put_nl()
+        self.put_tab()
+        self.put("<global_log_window_position%s/>" % self.attributesToString(logAttrs))
+        self.put_nl()
+        self.put("</globals>") ; self.put_nl()
+
+    def globalsAttributes (self):
+        '''
+        Return the lists of (name,value) attributes of the <globals>,
+        <global_window_position> and <global_log_window_position> elements.
+        '''
         trace = False and not g.unitTesting
         c = self.c
 
@@ -1664,23 +2053,20 @@ class FileCommands:
             c.cacher.setCachedGlobalsElement(c.mFileName)
 
         # Always put positions, to trigger sax methods.
-        self.put("<globals")
-        #@+<< put the body/outline ratios >>
-        #@+node:ekr.20031218072017.3038: *5* << put the body/outline ratios >>
-        self.put(" body_outline_ratio=")
-        self.put_in_dquotes("0.5" if c.fixed or use_db else "%1.2f" % (
-            c.frame.ratio))
-
-        self.put(" body_secondary_ratio=")
-        self.put_in_dquotes("0.5" if c.fixed or use_db else "%1.2f" % (
-            c.frame.secondary_ratio))
+        #@+<< compute the body/outline ratios >>
+        #@+node:ekr.20031218072017.3038: *5* << compute the body/outline ratios >>
+        globalsAttrs = [
+            ('body_outline_ratio',"0.5" if c.fixed or use_db else "%1.2f" % (
+                c.frame.ratio)),
+            ('body_secondary_ratio',"0.5" if c.fixed or use_db else "%1.2f" % (
+                c.frame.secondary_ratio)),
+        ]
 
         if trace: g.trace('fixed or use_db',c.fixed or use_db,
             '%1.2f %1.2f' % (c.frame.ratio,c.frame.secondary_ratio))
-        #@-<< put the body/outline ratios >>
-        self.put(">") ; self.put_nl()
-        #@+<< put the position of this frame >>
-        #@+node:ekr.20031218072017.3039: *5* << put the position of this frame >>
+        #@-<< compute the body/outline ratios >>
+        #@+<< compute the position of this frame >>
+        #@+node:ekr.20031218072017.3039: *5* << compute the position of this frame >>
         # New in Leo 4.5: support fixed .leo files.
 
         if c.fixed or use_db:
@@ -1695,42 +2081,33 @@ class FileCommands:
 
         # g.trace(width,height,left,top)
 
-        self.put_tab()
-        self.put("<global_window_position")
-        self.put(" top=") ; self.put_in_dquotes(str(top))
-        self.put(" left=") ; self.put_in_dquotes(str(left))
-        self.put(" height=") ; self.put_in_dquotes(str(height))
-        self.put(" width=") ; self.put_in_dquotes(str(width))
-        self.put("/>") ; self.put_nl()
-        #@-<< put the position of this frame >>
-        #@+<< put the position of the log window >>
-        #@+node:ekr.20031218072017.3040: *5* << put the position of the log window >>
+        windowAttrs = [(name,str(val)) for name,val in (
+            ('top',top),('left',left),('height',height),('width',width))]
+        #@-<< compute the position of this frame >>
+        #@+<< compute the position of the log window >>
+        #@+node:ekr.20031218072017.3040: *5* << compute the position of the log window >>
         top = left = height = width = 0 # no longer used
 
-        self.put_tab()
-        self.put("<global_log_window_position")
-        self.put(" top=") ; self.put_in_dquotes(str(top))
-        self.put(" left=") ; self.put_in_dquotes(str(left))
-        self.put(" height=") ; self.put_in_dquotes(str(height))
-        self.put(" width=") ; self.put_in_dquotes(str(width))
-        self.put("/>") ; self.put_nl()
-        #@-<< put the position of the log window >>
-        self.put("</globals>") ; self.put_nl()
-    #@+node:ekr.20031218072017.3041: *4* fc.putHeader
+        logAttrs = [(name,str(val)) for name,val in (
+            ('top',top),('left',left),('height',height),('width',width))]
+        #@-<< compute the position of the log window >>
+        return globalsAttrs,windowAttrs,logAttrs
+    #@+node:ekr.20031218072017.3041: *4* fc.putHeader & headerAttributes
     def putHeader (self):
 
-        tnodes = 0 ; clone_windows = 0 # Always zero in Leo2.
-
-        if 1: # For compatibility with versions before Leo 4.5.
-            self.put("<leo_header")
-            self.put(" file_format=") ; self.put_in_dquotes("2")
-            self.put(" tnodes=") ; self.put_in_dquotes(str(tnodes))
-            self.put(" max_tnode_index=") ; self.put_in_dquotes(str(0))
-            self.put(" clone_windows=") ; self.put_in_dquotes(str(clone_windows))
-            self.put("/>") ; self.put_nl()
+        self.put("<leo_header%s/>" % self.attributesToString(self.headerAttributes()))
+        self.put_nl()
 
-        else:
-            self.put('<leo_header file_format="2"/>\n')
+    def headerAttributes (self):
+        '''Return the list of (name,value) attributes of the <leo_header> element.'''
+        tnodes = 0 ; clone_windows = 0 # Always zero in Leo2.
+        # For compatibility with versions before Leo 4.5.
+        return [
+            ('file_format',"2"),
+            ('tnodes',str(tnodes)),
+            ('max_tnode_index',str(0)),
+            ('clone_windows',str(clone_windows)),
+        ]
     #@+node:ekr.20031218072017.3042: *4* fc.putPostlog
     def putPostlog (self):
 
@@ -1745,8 +2122,7 @@ class FileCommands:
     def putProlog (self):
         '''Put the prolog of the xml file.'''
         c = self.c
-        # tag = 'http://www.leo-editor.org/2011/leo'
-        tag = 'http://leoeditor.com/namespaces/leo-python-editor/1.1'
+        tag = self.leo_namespace
         self.putXMLLine()
         # Put "created by Leo" line.
         self.put('<!-- Created by Leo: http://leoeditor.com/leo_toc.html -->')
@@ -1775,28 +2151,31 @@ class FileCommands:
         b = v.b
         body = xml.sax.saxutils.escape(b) if b else ''
         self.put('<t tx="%s"%s>%s</t>\n' % (gnx,ua,body))
-    #@+node:ekr.20031218072017.1575: *4* fc.putTnodes
+    #@+node:ekr.20031218072017.1575: *4* fc.putTnodes & tnodeList
     def putTnodes (self):
 
         """Puts all tnodes as required for copy or save commands"""
 
-        c = self.c
-
         self.put("<tnodes>\n")
-        #@+<< write only those tnodes that were referenced >>
-        #@+node:ekr.20031218072017.1576: *5* << write only those tnodes that were referenced >>
+        for v in self.tnodeList():
+            self.putTnode(v)
+        self.put("</tnodes>\n")
+
+    def tnodeList (self):
+        '''Return the list of vnodes whose <t> elements must be written.'''
+        c = self.c
+        result = []
+        #@+<< compute only those tnodes that were referenced >>
+        #@+node:ekr.20031218072017.1576: *5* << compute only those tnodes that were referenced >>
         if self.usingClipboard: # write the current tree.
-            theIter = c.p.self_and_subtree()
+            theIter = c.p.walk(unique=True)
         else: # write everything
-            theIter = c.all_unique_positions()
+            theIter = c.walk(unique=True)
 
         # Populate tnodes
         tnodes = {}
-        for p in theIter:
-            # Make *sure* the file index has the proper form.
-            # pylint: disable=unbalanced-tuple-unpacking
-            index = p.v.fileIndex
-            tnodes[index] = p.v
+        for v,level,childIndex in theIter:
+            tnodes[v.fileIndex] = v
 
         # Put all tnodes in index order.
         for index in sorted(tnodes):
@@ -1805,18 +2184,48 @@ class FileCommands:
             if v:
                 # Write only those tnodes whose vnodes were written.
                 if v.isWriteBit():
-                    self.putTnode(v)
+                    result.append(v)
             else:
                 g.trace('can not happen: no VNode for',repr(index))
                 # This prevents the file from being written.
                 raise BadLeoFile('no VNode for %s' % repr(index))
-        #@-<< write only those tnodes that were referenced >>
-        self.put("</tnodes>\n")
-    #@+node:ekr.20031218072017.1863: *4* fc.putVnode
+        #@-<< compute only those tnodes that were referenced >>
+        return result
+    #@+node:ekr.20031218072017.1863: *4* fc.putVnode & vnodeAttributes
     def putVnode (self,p,isIgnore=False):
 
         """Write a <v> element corresponding to a VNode."""
 
+        fc = self ; v = p.v
+        attrs,forceWrite,isIgnore = fc.vnodeAttributes(p,isIgnore)
+        gnx = v.fileIndex
+        v_head = '<v t="%s"%s>' % (gnx,fc.attributesToString(attrs))
+        if gnx in fc.vnodesDict:
+            fc.put(v_head+'</v>\n')
+        else:
+            fc.vnodesDict[gnx]=True
+            v_head += '<vh>%s</vh>' % (xml.sax.saxutils.escape(p.v.headString()or''))
+            # The string catentation is faster than repeated calls to fc.put.
+            # New in 4.2: don't write child nodes of @file-thin trees (except when writing to clipboard)
+            if p.hasChildren() and (forceWrite or self.usingClipboard):
+                fc.put('%s\n' % v_head)
+                # This optimization eliminates all "recursive" copies.
+                p.moveToFirstChild()
+                while 1:
+                    fc.putVnode(p,isIgnore)
+                    if p.hasNext(): p.moveToNext()
+                    else:           break
+                p.moveToParent() # Restore p in the caller.
+                fc.put('</v>\n')
+            else:
+                fc.put('%s</v>\n' % v_head) # Call put only once.
+
+    def vnodeAttributes (self,p,isIgnore=False):
+        '''
+        Return (attrs,forceWrite,isIgnore) for p's <v> element. attrs is a
+        list of (name,value) tuples, not including the t attribute.
+        forceWrite is True if the element must include p's children.
+        '''
         fc = self ; c = fc.c ; v = p.v
         isAuto = p.isAtAutoNode() and p.atAutoNodeName().strip()
         isEdit = p.isAtEditNode() and p.atEditNodeName().strip() and not p.hasChildren()
@@ -1845,6 +2254,14 @@ class FileCommands:
         if forceWrite or self.usingClipboard:
             v.setWriteBit() # 4.2: Indicate we wrote the body text.
         #@-<< Set gnx = VNode index >>
+        if not self.usingClipboard:
+            #@+<< issue informational messages >>
+            #@+node:ekr.20040702085529: *5* << issue informational messages >> (changed)
+            if 0: # It's strange to clear the orphan bit.
+                if isOrphan and (isFile or isThin):
+                    g.warning("writing erroneous:",p.h)
+                    p.clearOrphan()
+            #@-<< issue informational messages >>
         attrs = []
         #@+<< Append attribute bits to attrs >>
         #@+node:ekr.20031218072017.1865: *5* << Append attribute bits to attrs >>
@@ -1857,7 +2274,7 @@ class FileCommands:
             if v.isMarked():   attr += "M"
             if v.isOrphan():   attr += "O"
             if attr:
-                attrs.append(' a="%s"' % attr)
+                attrs.append(('a',attr),)
 
         # Put the archived *current* position in the *root* positions <v> element.
         if p == self.rootPosition:
@@ -1888,38 +2305,10 @@ class FileCommands:
         if p.hasChildren() and not forceWrite and not self.usingClipboard:
             # We put the entire tree when using the clipboard, so no need for this.
             if not isAuto: # Bug fix: 2008/8/7.
-                attrs.append(self.putDescendentVnodeUas(p)) # New in Leo 4.5.
-                attrs.append(self.putDescendentAttributes(p))
+                attrs.extend(self.descendentVnodeUas(p)) # New in Leo 4.5.
+                attrs.extend(self.descendentAttributes(p))
         #@-<< Append unKnownAttributes to attrs >>
-        attrs = ''.join(attrs)
-        v_head = '<v t="%s"%s>' % (gnx,attrs)
-        if gnx in fc.vnodesDict:
-            fc.put(v_head+'</v>\n')
-        else:
-            fc.vnodesDict[gnx]=True
-            v_head += '<vh>%s</vh>' % (xml.sax.saxutils.escape(p.v.headString()or''))
-            # The string catentation is faster than repeated calls to fc.put.
-            if not self.usingClipboard:
-                #@+<< issue informational messages >>
-                #@+node:ekr.20040702085529: *5* << issue informational messages >> (changed)
-                if 0: # It's strange to clear the orphan bit.
-                    if isOrphan and (isFile or isThin):
-                        g.warning("writing erroneous:",p.h)
-                        p.clearOrphan()
-                #@-<< issue informational messages >>
-            # New in 4.2: don't write child nodes of @file-thin trees (except when writing to clipboard)
-            if p.hasChildren() and (forceWrite or self.usingClipboard):
-                fc.put('%s\n' % v_head)
-                # This optimization eliminates all "recursive" copies.
-                p.moveToFirstChild()
-                while 1:
-                    fc.putVnode(p,isIgnore)
-                    if p.hasNext(): p.moveToNext()
-                    else:           break
-                p.moveToParent() # Restore p in the caller.
-                fc.put('</v>\n')
-            else:
-                fc.put('%s</v>\n' % v_head) # Call put only once.
+        return attrs,forceWrite,isIgnore
     #@+node:ekr.20031218072017.1579: *4* fc.putVnodes
     def putVnodes (self):
 
@@ -1954,6 +2343,71 @@ class FileCommands:
             g.app.prolog_prefix_string,
             self.leo_file_encoding,
             g.app.prolog_postfix_string))
+    #@+node:ekr.20150102090001.9: *3* fc.putLeobFile & helper
+    def putLeobFile (self):
+        '''
+        Return the contents of a .leob file for c's outline.
+
+        Like putLeoFile, but this sends the elements of the .leo file
+        directly to a LeobEncoder, without creating or parsing any xml.
+        '''
+        fc = self ; c = fc.c
+        encoder = leoBinaryOutline.LeobEncoder()
+        start,end = encoder.start,encoder.endElement
+        fc.updateFixedStatus()
+        if c.config.stylesheet or c.frame.stylesheet:
+            encoder.processingInstruction('xml-stylesheet',
+                c.frame.stylesheet or c.config.stylesheet)
+        start('leo_file',[('xmlns:leo',fc.leo_namespace)])
+        start('leo_header',fc.headerAttributes())
+        end('leo_header')
+        globalsAttrs,windowAttrs,logAttrs = fc.globalsAttributes()
+        start('globals',globalsAttrs)
+        start('global_window_position',windowAttrs)
+        end('global_window_position')
+        start('global_log_window_position',logAttrs)
+        end('global_log_window_position')
+        end('globals')
+        for name in ('preferences','find_panel_settings'):
+            start(name,[])
+            end(name)
+        # Like putVnodes.
+        c.clearAllVisited()
+        fc.currentPosition = c.p
+        fc.rootPosition = c.rootPosition()
+        fc.vnodesDict = {}
+        start('vnodes',[])
+        for p in c.rootPosition().self_and_siblings():
+            fc.putLeobVnode(encoder,p,isIgnore=p.isAtIgnoreNode())
+        end('vnodes')
+        start('tnodes',[])
+        for v in fc.tnodeList():
+            attrs = [('tx',v.fileIndex)]
+            if hasattr(v,'unknownAttributes'):
+                attrs.extend([(key,leoBinaryOutline.cleanAttribute(val))
+                    for key,val in fc.unknownAttributesList(v)])
+            start('t',attrs)
+            encoder.characters(leoBinaryOutline.cleanText(v.b))
+            end('t')
+        end('tnodes')
+        end('leo_file')
+        return encoder.getData()
+    #@+node:ekr.20150102090001.10: *4* fc.putLeobVnode
+    def putLeobVnode (self,encoder,p,isIgnore=False):
+        '''Send p's <v> element to encoder. See putVnode.'''
+        fc = self ; v = p.v
+        attrs,forceWrite,isIgnore = fc.vnodeAttributes(p,isIgnore)
+        gnx = v.fileIndex
+        encoder.start('v',[('t',gnx)] + attrs)
+        if gnx not in fc.vnodesDict:
+            fc.vnodesDict[gnx] = True
+            encoder.start('vh',[])
+            encoder.characters(leoBinaryOutline.cleanText(v.headString() or ''))
+            encoder.endElement('vh')
+            if p.hasChildren() and (forceWrite or fc.usingClipboard):
+                for child in p.children():
+                    fc.putLeobVnode(encoder,child,isIgnore)
+        encoder.endElement('v')
     #@+node:ekr.20031218072017.1573: *3* fc.putLeoOutline (to clipboard)
     def putLeoOutline (self):
 
@@ -2055,6 +2509,7 @@ class FileCommands:
         if not theActualFile: return False
         self.mFileName = fileName
         self.outputFile = StringIO() # Always write to a string.
+        toLeob = fileName.endswith('.leob') and not toOPML and not toZip
         try:
             if toOPML:
                 if hasattr(c,'opmlController'):
@@ -2062,14 +2517,18 @@ class FileCommands:
                 else:
                     # This is not likely ever to be called.
                     g.trace('leoOPML plugin not active.')
-            else:
+            elif not toLeob:
                 self.putLeoFile()
-            s = self.outputFile.getvalue()
+            if toLeob:
+                # Create the .leob file directly from the outline.
+                s = self.putLeobFile()
+            else:
+                s = self.outputFile.getvalue()
             g.app.write_Leo_file_string = s # 2010/01/19: always set this.
             if toZip:
                 self.writeZipFile(s)
             else:
-                if g.isPython3:
+                if g.isPython3 and not toLeob:
                     s = bytes(s,self.leo_file_encoding,'replace')
                 theActualFile.write(s)
                 theActualFile.close()
@@ -2269,10 +2728,17 @@ class FileCommands:
                     result.append((torv,d),)
 
         return result
-    #@+node:ekr.20080805085257.2: *3* fc.pickle
+    #@+node:ekr.20080805085257.2: *3* fc.pickle & pickleValue
     def pickle (self,torv,val,tag):
 
-        '''Pickle val and return the hexlified result.'''
+        '''Pickle val and return the hexlified result as an xml attribute.'''
+
+        s = self.pickleValue(torv,val,tag)
+        return ' %s="%s"' % (tag,s) if s else ''
+
+    def pickleValue (self,torv,val,tag):
+
+        '''Pickle val and return the hexlified result, or None.'''
 
         trace = False and g.unitTesting
         try:
@@ -2282,22 +2748,25 @@ class FileCommands:
             if trace: g.trace('\n',
                 type(val),val,'\n',type(s),repr(s),'\n',
                 type(s2),s2,'\n',type(s3),s3)
-            field = ' %s="%s"' % (tag,s3)
-            return field
+            return s3
 
         except pickle.PicklingError:
             if tag: # The caller will print the error if tag is None.
                 g.warning("ignoring non-pickleable value",val,"in",torv)
-            return ''
+            return None
 
         except Exception:
             g.error("fc.pickle: unexpected exception in",torv)
             g.es_exception()
-            return ''
-    #@+node:ekr.20040701065235.2: *3* fc.putDescendentAttributes
+            return None
+    #@+node:ekr.20040701065235.2: *3* fc.putDescendentAttributes & descendentAttributes
     def putDescendentAttributes (self,p):
 
-        nodeIndices = g.app.nodeIndices
+        return ''.join(['\n%s="%s"' % z for z in self.descendentAttributes(p)])
+
+    def descendentAttributes (self,p):
+
+        '''Return the list of (name,value) marks and expanded attributes for p.'''
 
         # Create lists of all tnodes whose vnodes are marked or expanded.
         marks = [] ; expanded = []
@@ -2316,15 +2785,22 @@ class FileCommands:
                     sList.append("%s," % v.fileIndex)
                 s = ''.join(sList)
                 # g.trace(tag,[str(p.h) for p in theList])
-                result.append('\n%s="%s"' % (tag,s))
+                result.append((tag,s),)
 
-        return ''.join(result)
-    #@+node:ekr.20080805071954.2: *3* fc.putDescendentVnodeUas
+        return result
+    #@+node:ekr.20080805071954.2: *3* fc.putDescendentVnodeUas & descendentVnodeUas
     def putDescendentVnodeUas (self,p):
 
         '''Return the a uA field for descendent VNode attributes,
         suitable for reconstituting uA's for anonymous vnodes.'''
 
+        return ''.join([' %s="%s"' % z for z in self.descendentVnodeUas(p)])
+
+    def descendentVnodeUas (self,p):
+
+        '''Return a list containing the (name,value) attribute for
+        descendent VNode attributes, or an empty list.'''
+
         trace = False
         if trace: g.trace(p.h)
 
@@ -2338,7 +2814,7 @@ class FileCommands:
 
         # Create aList of pairs (v,d) where d contains only pickleable entries.
         if aList: aList = self.createUaList(aList)
-        if not aList: return ''
+        if not aList: return []
 
         # Create d, an enclosing dict to hold all the inner dicts.
         d = {}
@@ -2351,38 +2827,53 @@ class FileCommands:
         if trace: g.trace(p.h,g.dictToString(d))
 
         # Pickle and hexlify d
-        return d and self.pickle(
-            torv=p.v,val=d,tag='descendentVnodeUnknownAttributes') or ''
-    #@+node:ekr.20050418161620.2: *3* fc.putUaHelper
+        tag = 'descendentVnodeUnknownAttributes'
+        s = d and self.pickleValue(torv=p.v,val=d,tag=tag)
+        return [(tag,s)] if s else []
+    #@+node:ekr.20050418161620.2: *3* fc.putUaHelper & uaAttribute
     def putUaHelper (self,torv,key,val):
 
         '''Put attribute whose name is key and value is val to the output stream.'''
 
+        attr = self.uaAttribute(torv,key,val)
+        return ' %s="%s"' % (key,xml.sax.saxutils.escape(attr[1])) if attr else ''
+
+    def uaAttribute (self,torv,key,val):
+
+        '''Return the (name,value) attribute for key and val, or None.'''
+
         # g.trace(key,repr(val),g.callers())
 
         # New in 4.3: leave string attributes starting with 'str_' alone.
         if key.startswith('str_'):
             if type(val) == type(''):
-                attr = ' %s="%s"' % (key,xml.sax.saxutils.escape(val))
-                return attr
+                return key,val
             else:
                 g.warning("ignoring non-string attribute",key,"in",torv)
-                return ''
+                return None
         else:
-            return self.pickle(torv=torv,val=val,tag=key)
-    #@+node:EKR.20040526202501: *3* fc.putUnknownAttributes
+            s = self.pickleValue(torv=torv,val=val,tag=key)
+            return (key,s) if s else None
+    #@+node:EKR.20040526202501: *3* fc.putUnknownAttributes & unknownAttributesList
     def putUnknownAttributes (self,torv):
 
         """Put pickleable values for all keys in torv.unknownAttributes dictionary."""
 
+        return ''.join([' %s="%s"' % (key,xml.sax.saxutils.escape(val))
+            for key,val in self.unknownAttributesList(torv)])
+
+    def unknownAttributesList (self,torv):
+
+        """Return (name,value) attributes for all keys in torv.unknownAttributes."""
+
         attrDict = torv.unknownAttributes
         if type(attrDict) != type({}):
             g.warning("ignoring non-dictionary unknownAttributes for",torv)
-            return ''
+            return []
         else:
-            val = ''.join([self.putUaHelper(torv,key,val) for key,val in attrDict.items()])
             # g.trace(torv,attrDict)
-            return val
+            return [z for z in [self.uaAttribute(torv,key,val)
+                for key,val in attrDict.items()] if z]
     #@+node:ekr.20031218072017.3045: *3* fc.setDefaultDirectoryForNewFiles
     def setDefaultDirectoryForNewFiles (self,fileName):
 
@@ -3,8 +3,10 @@
 '''Leo's gui-independent find classes.'''
 
 import leo.core.leoGlobals as g
+import os
 import re
 import sys
+import time
 
 #@+<< Theory of operation of find/change >>
 #@+node:ekr.20031218072017.2414: ** << Theory of operation of find/change >>
@@ -111,6 +113,99 @@ class SearchWidget:
 
         return g.toPythonIndex(self.s,i)
     #@-others
+#@+node:ekr.20141226090001.1: ** class SearchMatcher
+class SearchMatcher:
+    '''
+    A plain (not regex) search pattern, normalized once per search.
+
+    The matcher caches the lower-case text of each pane it searches, so
+    searching unchanged nodes again does not convert their text again.
+    The cache holds at most maxCacheSize characters.
+    '''
+    maxCacheSize = 10 * 1000 * 1000
+
+    def __init__ (self,key,pattern,nocase,word):
+        self.key = key # The pattern and options before normalization.
+        self.cache = {}
+            # Keys are (v.gnx,in_headline);
+            # values are (v.textRevision,hash(s),len(s),s.lower()).
+        self.cacheSize = 0 # The total length of the lower-case texts in the cache.
+        self.nocase = nocase
+        self.pattern = pattern.lower() if nocase else pattern
+            # The pattern with backslashes replaced, in lower case if nocase.
+        self.word = word
+        # Whole-word searches use this regex, as do searches of text whose
+        # length changes when converted to lower case. Compile the original
+        # pattern: converting it to lower case may change its length too.
+        s = re.escape(pattern)
+        if word and g.isWordChar(pattern[:1]): s = r'(?<!\w)' + s
+        if word and g.isWordChar(pattern[-1:]): s = s + r'(?!\w)'
+        flags = re.UNICODE
+        if nocase: flags |= re.IGNORECASE
+        self.re_obj = re.compile(s,flags)
+    def __repr__(self):
+        return 'SearchMatcher: %s' % repr(self.key)
+
+    #@+others
+    #@+node:ekr.20141226090001.2: *3* matcher.find & rfind
+    def find (self,s,i,j,key=None):
+        '''
+        Return (k,k+n), the first match in s[i:j], or (-1,-1).
+        key is None or (v,in_headline), the pane containing s.
+        '''
+        n = len(self.pattern)
+        s2 = self.lower(s,key)
+        if self.word or len(s2) != len(s):
+            mo = self.re_obj.search(s,i)
+            if mo and mo.end() <= j:
+                return mo.start(),mo.end()
+            return -1,-1
+        k = s2.find(self.pattern,i,j)
+        return (-1,-1) if k == -1 else (k,k+n)
+
+    def rfind (self,s,i,j,key=None):
+        '''
+        Return (k,k+n), the last match in s[i:j], or (-1,-1).
+        key is None or (v,in_headline), the pane containing s.
+        '''
+        n = len(self.pattern)
+        s2 = self.lower(s,key)
+        if self.word or len(s2) != len(s):
+            last,mo = None,self.re_obj.search(s,i)
+            while mo and mo.end() <= j:
+                last = mo
+                mo = self.re_obj.search(s,mo.start()+1)
+            return (last.start(),last.end()) if last else (-1,-1)
+        k = s2.rfind(self.pattern,i,j)
+        return (-1,-1) if k == -1 else (k,k+n)
+    #@+node:ekr.20141226090001.3: *3* matcher.lower
+    def lower (self,s,key):
+        '''
+        Return s, in lower case if the search ignores case.
+        key is None or (v,in_headline), the pane containing s.
+        '''
+        if not self.nocase:
+            return s
+        if key is None:
+            return s.lower()
+        v,in_headline = key
+        key = v.fileIndex,in_headline
+        h = hash(s) # Python strings remember their hash.
+        data = self.cache.get(key)
+        if data and data[0] == v.textRevision and data[1] == h and data[2] == len(s):
+            return data[3]
+        s2 = s.lower()
+        if data:
+            self.cacheSize -= len(data[3])
+            del self.cache[key]
+        if self.cacheSize + len(s2) > self.maxCacheSize:
+            self.cache = {}
+            self.cacheSize = 0
+        if len(s2) <= self.maxCacheSize:
+            self.cache[key] = v.textRevision,h,len(s),s2
+            self.cacheSize += len(s2)
+        return s2
+    #@-others
 #@+node:ekr.20061212084717: ** class LeoFind (LeoFind.py)
 class LeoFind:
 
@@ -157,9 +252,19 @@ class LeoFind:
         self.radioButtonsChanged = False # Set by ftm.radio_button_callback
         # Ivars containing internal state...
         self.buttonFlag = False
+        self.candidates = None
+            # None or a set of vnodes returned by c.searchIndex.candidates.
+            # Batch searches skip all other nodes.
         self.changeAllFlag = False
         self.findAllFlag = False
+        self.findAllState = None
+            # A g.Bunch describing a running find-all or clone-find-all command.
+        self.fio = None
+            # The FindInOutlines object of a running find-in-outlines command.
+        self.fioIterator = None # The generator returned by self.fio.find.
+        self.fioResults = [] # The matches it has found so far.
         self.in_headline = False # True: searching headline text.
+        self.matcher = None # The SearchMatcher for the last plain search.
         self.p = None # The position being searched.  Never saved between searches!
         self.was_in_headline = None
             # Fix bug: https://groups.google.com/d/msg/leo-editor/RAzVPihqmkI/-tgTQw0-LtwJ
@@ -249,11 +354,29 @@ class LeoFind:
         
         self.setup_command()
         self.findAll(clone_find_all=True,clone_find_all_flattened=True)
-    #@+node:ekr.20131122231705.16465: *4* find.findAllCommand
+    #@+node:ekr.20131122231705.16465: *4* find.findAllCommand & cancel
     def findAllCommand(self,event=None):
         
         self.setup_command()
         self.findAll()
+
+    def cancelFindAllCommand(self,event=None):
+        '''Stop a running find-all or clone-find-all command.'''
+        if self.findAllState:
+            self.finishFindAll(cancelled=True)
+    #@+node:ekr.20141229100001.15: *4* find.findInOutlinesCommand & cancel
+    def findInOutlinesCommand(self,event=None):
+        '''
+        Find the find text in all .leo files given by
+        @string find-in-outlines-path, without opening them.
+        '''
+        self.setup_command()
+        self.findInOutlines()
+
+    def cancelFindInOutlinesCommand(self,event=None):
+        '''Stop the find-in-outlines command.'''
+        if self.fio:
+            self.fio.cancel()
     #@+node:ekr.20031218072017.3063: *4* find.findNextCommand
     def findNextCommand(self,event=None):
         '''The find-next command.'''
@@ -984,65 +1107,35 @@ class LeoFind:
 
         self.ftm.setFindText(pattern)
     #@+node:ekr.20031218072017.3067: *3* LeoFind.Utils
-    #@+node:ekr.20031218072017.2293: *4* find.batchChange (sets start of replace-all group)
-    #@+at This routine performs a single batch change operation, updating the
-    # head or body string of p and leaving the result in s_ctrl. We update
-    # the body if we are changing the body text of c.currentVnode().
-    # 
-    # s_ctrl contains the found text on entry and contains the changed text
-    # on exit. pos and pos2 indicate the selection. The selection will never
-    # be empty. NB: we can not assume that self.p is visible.
-    #@@c
-
-    def batchChange (self,pos1,pos2):
-
-        c = self.c ; u = c.undoer
-        p = self.p
-        w = self.s_ctrl
-        # Replace the selection with self.change_text
-        if pos1 > pos2: pos1,pos2=pos2,pos1
-        s = w.getAllText()
-        if pos1 != pos2: w.delete(pos1,pos2)
-        w.insert(pos1,self.change_text)
-        # Update the selection.
-        insert=pos1 if self.reverse else pos1+len(self.change_text)
-        w.setSelectionRange(insert,insert)
-        w.setInsertPoint(insert)
-        # Update the node
-        s = w.getAllText() # Used below.
-        if self.in_headline:
-            #@+<< change headline >>
-            #@+node:ekr.20031218072017.2294: *5* << change headline >>
-            if len(s) > 0 and s[-1]=='\n':
-                s = s[:-1]
-            if s != p.h:
-                undoData = u.beforeChangeNodeContents(p)
-                p.initHeadString(s)
-                if self.mark_changes:
-                    p.setMarked()
-                p.setDirty()
-                if not c.isChanged():
-                    c.setChanged(True)
-                u.afterChangeNodeContents(p,'Change Headline',undoData)
-            #@-<< change headline >>
+    #@+node:ekr.20031218072017.2293: *4* find.batchChange
+    def batchChange (self,s):
+        '''
+        Replace all matches in s with self.change_text, without using any
+        widget. Return (s2,n): the new text and the number of replacements.
+        '''
+        if not s:
+            return s,0
+        change_text = self.change_text
+        if self.pattern_match:
+            re_obj = self.re_obj
         else:
-            #@+<< change body >>
-            #@+node:ekr.20031218072017.2295: *5* << change body >>
-            if len(s) > 0 and s[-1]=='\n': s = s[:-1]
-
-            if s != p.b:
-
-                undoData = u.beforeChangeNodeContents(p)
-
-                c.setBodyString(p,s)
-                if self.mark_changes:
-                    p.setMarked()
-                p.setDirty()
-                if not c.isChanged():
-                    c.setChanged(True)
-
-                u.afterChangeNodeContents(p,'Change Body',undoData)
-            #@-<< change body >>
+            matcher = self.getMatcher(self.find_text,self.ignore_case,self.whole_word)
+            if not matcher.nocase and not matcher.word:
+                n = s.count(matcher.pattern)
+                return (s.replace(matcher.pattern,change_text),n) if n else (s,0)
+            re_obj = matcher.re_obj
+        counts = []
+        def replace(mo):
+            if mo.start() == mo.end():
+                return '' # Like find.search, ignore empty matches.
+            counts.append(1)
+            if self.pattern_match:
+                groups = mo.groups('')
+                if groups:
+                    return self.makeRegexSubs(change_text,groups)
+            return change_text
+        s2 = re_obj.sub(replace,s)
+        return s2,len(counts)
     #@+node:ekr.20031218072017.3068: *4* find.change
     def change(self,event=None):
         if self.checkArgs():
@@ -1050,8 +1143,12 @@ class LeoFind:
             self.changeSelection()
 
     replace = change
-    #@+node:ekr.20031218072017.3069: *4* find.changeAll
+    #@+node:ekr.20031218072017.3069: *4* find.changeAll & helper
     def changeAll(self):
+        '''
+        Replace all matches in the search range, one node at a time. Each
+        changed node gets one undo bead in the 'Replace All' undo group.
+        '''
         trace = False and not g.unitTesting
         c = self.c ; u = c.undoer ; undoType = 'Replace All'
         current = c.p
@@ -1060,24 +1157,57 @@ class LeoFind:
             return
         self.initInHeadline()
         saveData = self.save()
-        self.initBatchCommands()
-        count = 0
-        u.beforeChangeGroup(current,undoType)
+        self.errors = 0
+        if not self.find_text or (self.pattern_match and not self.precompilePattern()):
+            self.restore(saveData)
+            return
         # Fix bug 338172: ReplaceAll will not replace newlines indicated as \n in target string.
         self.change_text = self.replaceBackSlashes(self.change_text)
-        while 1:
-            pos1, pos2 = self.findNextMatch()
-            if pos1 is None:
-                if trace: g.trace('findNextMatch failed')
-                break
-            if trace: g.trace(pos1,pos2,self.p and self.p.h)
-            count += 1
-            self.batchChange(pos1,pos2)
+        # Search only the nodes that the search index can not rule out.
+        candidates = self.indexCandidates()
+        count = 0
+        u.beforeChangeGroup(current,undoType)
+        for p in self.changeAllPositions():
+            if candidates is not None and p.v not in candidates:
+                continue
+            h,n1 = self.batchChange(p.h) if self.search_headline else (p.h,0)
+            b,n2 = self.batchChange(p.b) if self.search_body else (p.b,0)
+            if not n1 and not n2:
+                continue
+            if trace: g.trace(n1,n2,p.h)
+            count += n1 + n2
+            undoData = u.beforeChangeNodeContents(p)
+            if n1:
+                p.initHeadString(h)
+            if n2:
+                if p.v == current.v:
+                    c.setBodyString(p,b) # Update the body pane.
+                else:
+                    p.v.setBodyString(b)
+            if self.mark_changes:
+                p.setMarked()
+            p.setDirty()
+            u.afterChangeNodeContents(p,undoType,undoData)
+            g.es('','%s: %s' % (n1 + n2,p.h))
+        if count and not c.isChanged():
+            c.setChanged(True)
         p = c.p
         u.afterChangeGroup(p,undoType,reportFlag=True)
         g.es("changed:",count,"instances of",self.find_text,"to",self.change_text)
         c.redraw(p)
         self.restore(saveData)
+    #@+node:ekr.20141227090001.1: *5* find.changeAllPositions
+    def changeAllPositions(self):
+        '''Return an iterator yielding one position of each node that changeAll searches.'''
+        c = self.c
+        if self.node_only:
+            return iter([c.p])
+        elif self.suboutline_only:
+            return c.p.walk_positions(unique=True)
+        elif c.hoistStack:
+            return c.hoistStack[-1].p.walk_positions(includeSelf=False,unique=True)
+        else:
+            return c.walk_positions(unique=True)
     #@+node:ekr.20031218072017.3070: *4* find.changeSelection
     # Replace selection with self.change_text.
     # If no selection, insert self.change_text at the cursor.
@@ -1163,10 +1293,19 @@ class LeoFind:
         self.initInHeadline()
         if self.changeSelection():
             self.findNext(False) # don't reinitialize
-    #@+node:ekr.20031218072017.3073: *4* find.findAll & helper
+    #@+node:ekr.20031218072017.3073: *4* find.findAll & helpers
     def findAll(self,clone_find_all=False,clone_find_all_flattened=False):
+        '''
+        Find all matches of the find text. Print the matching lines, or
+        clone the matching nodes as the children of a new "Found" node.
+
+        With a gui, the search runs at idle time, showing its progress in
+        the status line, and find-all-cancel stops it.
+        '''
         trace = False and not g.unitTesting
-        c,w = self.c,self.s_ctrl
+        c = self.c
+        if self.findAllState:
+            self.finishFindAll(cancelled=True)
         if clone_find_all_flattened:
             undoType = 'Clone Find All Flattened'
         elif clone_find_all:
@@ -1180,51 +1319,37 @@ class LeoFind:
             self.p = None # Restore will select the root position.
         data = self.save()
         self.initBatchCommands()
-        skip = set() # vnodes that should be skipped.
-        count = 0
         if trace: g.trace(self.find_text)
         # 2014/04/24: Init suboutline-only for clone-find-all commands
         if clone_find_all or clone_find_all_flattened:
             self.p = c.p.copy()
             if self.suboutline_only:
                 self.onlyPosition = self.p.copy()
-        clones = set()
-        while 1:
-            pos, newpos = self.findNextMatch() # sets self.p.
-            if not self.p: self.p = c.p.copy()
-            if pos is None: break
-            if clone_find_all and self.p.v in skip:
-                continue
-            count += 1
-            s = w.getAllText()
-            i,j = g.getLine(s,pos)
-            line = s[i:j]
-            if clone_find_all or clone_find_all_flattened:
-                if clone_find_all_flattened:
-                    skip.add(self.p.v)
-                else:
-                    # Don't look at the node or it's descendants.
-                    for p2 in self.p.self_and_subtree():
-                        skip.add(p2.v)
-                clones.add(self.p.copy())
-            else:
-                self.printLine(line,allFlag=True)
-        if clones and (clone_find_all or clone_find_all_flattened):
-            u = c.undoer
-            undoData = u.beforeInsertNode(c.p)
-            found = self.createCloneFindAllNodes(clones,clone_find_all_flattened)
-            u.afterInsertNode(found,undoType,undoData,dirtyVnodeList=[])
-            c.selectPosition(found)
-            c.setChanged(True)
+        self.findAllState = state = g.Bunch(
+            clone_find_all=clone_find_all or clone_find_all_flattened,
+            clones=[], # The matching positions, in outline order.
+            count=0, # The number of matches.
+            data=data, # For self.restore.
+            flattened=clone_find_all_flattened,
+            matches=self.findAllMatches(
+                clone_find_all or clone_find_all_flattened,clone_find_all_flattened),
+            nodes=0, # The number of nodes searched.
+            timer=None,
+            undoType=undoType)
+        # Unit tests expect the results at once.
+        timer = not g.unitTesting and g.IdleTime(
+            self.findAllIdleHandler,delay=0,tag='find-all')
+        if timer:
+            state.timer = timer
+            timer.start()
         else:
-            self.restore(data)
-        c.redraw()
-        g.es("found",count,"matches for",self.find_text)
+            self.findAllSlice(state)
+            self.finishFindAll()
     #@+node:ekr.20141023110422.1: *5* find.createCloneFindAllNodes
     def createCloneFindAllNodes(self,clones,flattened):
         '''
         Create a "Found" node as the last node of the outline.
-        Clone all positions in the clones set a children of found.
+        Clone all positions in the clones list as children of found.
         '''
         c = self.c
         # Create the found node.
@@ -1233,11 +1358,256 @@ class LeoFind:
             last.moveToNext()
         found = last.insertAfter()
         found.h = 'Found:%s %s' % (' (flattened)' if flattened else '',self.find_text)
-        # Clone nodes as children of the found node.
+        # Link all clones at once: cloning and moving
+        # each position would adjust the links twice per clone.
+        parent_v = found.v
+        parent_v.childrenModified()
+        seen = set()
         for p in clones:
-            p2 = p.clone()
-            p2.moveToLastChildOf(found)
+            v = p.v
+            if v not in seen:
+                seen.add(v)
+                parent_v.children.append(v)
+                v.parents.append(parent_v)
+                v._p_changed = 1
+        parent_v._p_changed = 1
+        c.gnxIndex.childrenChanged(parent_v)
         return found
+    #@+node:ekr.20141230090001.1: *5* find.findAllIdleHandler
+    def findAllIdleHandler(self,timer):
+        '''Search until the time slice ends. Finish when the search ends.'''
+        c,state = self.c,self.findAllState
+        if not state or state.timer is not timer:
+            timer.stop() # Can not happen.
+            return
+        if not c.exists:
+            timer.stop()
+            state.matches.close()
+            self.findAllState = None
+        elif self.p and not c.positionExists(self.p):
+            # The outline changed under the search.
+            self.finishFindAll(cancelled=True)
+        elif self.findAllSlice(state,budget=0.05):
+            c.frame.putStatusLine('%s: %s matches in %s nodes...' % (
+                state.undoType.lower(),state.count,state.nodes))
+        else:
+            self.finishFindAll()
+    #@+node:ekr.20141230090001.2: *5* find.findAllMatches
+    def findAllMatches(self,clone_find_all,flattened):
+        '''
+        A generator yielding the line containing each match of the find
+        text, and None each time the search moves to another node. self.p
+        and self.in_headline describe each match when it is yielded.
+
+        For clone-find-all commands, yield at most one match per node, and
+        no matches in the descendants of matching nodes unless flattened.
+        '''
+        c,w = self.c,self.s_ctrl
+        skip = set() # vnodes that should be skipped.
+        # Search only the nodes that the search index can not rule out.
+        self.candidates = self.indexCandidates()
+        try:
+            for pos,newpos in self.iterMatches(): # sets self.p.
+                if not self.p: self.p = c.p.copy()
+                if pos is None:
+                    yield None
+                    continue
+                if clone_find_all and self.p.v in skip:
+                    continue
+                s = w.getAllText()
+                i,j = g.getLine(s,pos)
+                if clone_find_all:
+                    if flattened:
+                        skip.add(self.p.v)
+                    else:
+                        # Don't look at the node or it's descendants.
+                        for v,level,childIndex in self.p.walk(unique=True):
+                            skip.add(v)
+                yield s[i:j]
+        finally:
+            self.candidates = None
+    #@+node:ekr.20150102090001.1: *5* find.indexCandidates
+    def indexCandidates(self):
+        '''
+        Return the set of vnodes that may match the find text, or None if
+        the search index can not rule out any node.
+        '''
+        pattern = self.find_text
+        if not self.pattern_match:
+            # Plain searches match \n, \t and \\ as newlines, tabs and backslashes.
+            pattern = self.replaceBackSlashes(pattern)
+        return self.c.searchIndex.candidates(pattern,
+            regex=self.pattern_match,word=self.whole_word)
+    #@+node:ekr.20141230090001.3: *5* find.findAllSlice
+    def findAllSlice(self,state,budget=None):
+        '''
+        Handle the matches of a find-all or clone-find-all command for at
+        most budget seconds, or until the search ends if budget is None.
+        Return True if the search has not ended.
+        '''
+        t1 = time.time()
+        for line in state.matches:
+            if line is None:
+                state.nodes += 1
+            else:
+                state.count += 1
+                if state.clone_find_all:
+                    state.clones.append(self.p.copy())
+                else:
+                    self.printLine(line,allFlag=True)
+            if budget is not None and time.time() - t1 > budget:
+                return True
+        return False
+    #@+node:ekr.20141230090001.4: *5* find.finishFindAll
+    def finishFindAll(self,cancelled=False):
+        '''
+        End a find-all or clone-find-all command: create the "Found" node
+        or restore the screen, and report the number of matches.
+        '''
+        c,state = self.c,self.findAllState
+        self.findAllState = None
+        state.matches.close()
+        clones = state.clones
+        if state.timer:
+            state.timer.stop()
+            c.frame.clearStatusLine()
+            # The user may have changed the outline.
+            clones = [p for p in clones if c.positionExists(p)]
+        if clones:
+            u = c.undoer
+            undoData = u.beforeInsertNode(c.p)
+            found = self.createCloneFindAllNodes(clones,state.flattened)
+            u.afterInsertNode(found,state.undoType,undoData,dirtyVnodeList=[])
+            c.selectPosition(found)
+            c.setChanged(True)
+        elif not state.timer or c.p == state.data[2]:
+            # Don't move the user away from nodes selected during the search.
+            self.restore(state.data)
+        c.redraw()
+        if cancelled:
+            g.es('%s cancelled' % state.undoType.lower())
+        g.es("found",state.count,"matches for",self.find_text)
+    #@+node:ekr.20141229100001.16: *4* find.findInOutlines & helpers
+    def findInOutlines(self):
+        '''
+        Find the find text in .leo files without opening them, in worker
+        processes. Create a "Found in outlines" node containing links to the
+        matching nodes when the search ends.
+
+        With a gui, the search runs at idle time and
+        find-in-outlines-cancel stops it.
+        '''
+        import leo.core.leoFindInOutlines as leoFindInOutlines
+        c = self.c
+        if self.fio:
+            g.es('find-in-outlines is already running')
+            return
+        if not self.checkArgs():
+            return
+        if self.pattern_match:
+            pattern = self.find_text
+        else:
+            pattern = self.replaceBackSlashes(self.find_text)
+        try:
+            fio = leoFindInOutlines.FindInOutlines(pattern,
+                ignore_case=self.ignore_case,
+                regex=self.pattern_match,
+                whole_word=self.whole_word,
+                search_headline=self.search_headline,
+                search_body=self.search_body,
+                external_files=c.config.getBool('find-in-outlines-external-files'),
+                workers=c.config.getInt('find-in-outlines-workers') or None)
+        except re.error:
+            g.warning('invalid regular expression:',self.find_text)
+            return
+        self.fio,self.fioResults = fio,[]
+        timer = g.IdleTime(self.findInOutlinesIdleHandler,
+            delay=100,tag='find-in-outlines')
+        if timer:
+            self.fioIterator = fio.find(self.findInOutlinesPaths(),timeout=0)
+            g.es('searching outlines...')
+            timer.start()
+        else:
+            try:
+                self.fioResults = list(fio.find(self.findInOutlinesPaths()))
+            except Exception:
+                g.error('find-in-outlines failed')
+                g.es_exception()
+                self.fio,self.fioResults = None,[]
+                return
+            self.finishFindInOutlines()
+    #@+node:ekr.20141229100001.17: *5* find.findInOutlinesIdleHandler
+    def findInOutlinesIdleHandler(self,timer):
+        '''Add the results that are ready. Finish when the search ends.'''
+        c = self.c
+        if not c.exists:
+            self.fio.cancel()
+        t1 = time.time()
+        try:
+            for data in self.fioIterator:
+                if data is None:
+                    return # No worker has finished.
+                self.fioResults.append(data)
+                if time.time() - t1 > 0.1:
+                    return # Keep Leo responsive.
+            ok = True
+        except Exception:
+            ok = False
+            g.error('find-in-outlines failed')
+            g.es_exception()
+        timer.stop()
+        timer.destroy_self()
+        self.fioIterator = None
+        if ok and c.exists:
+            self.finishFindInOutlines()
+        else:
+            self.fio,self.fioResults = None,[]
+    #@+node:ekr.20141229100001.18: *5* find.findInOutlinesPaths
+    def findInOutlinesPaths(self):
+        '''
+        Return the list of .leo files and directories that find-in-outlines
+        searches: those in @string find-in-outlines-path, or the directory
+        containing this outline.
+        '''
+        c = self.c
+        s = c.config.getString('find-in-outlines-path')
+        if s:
+            return [z.strip() for z in s.split(os.pathsep) if z.strip()]
+        fn = c.fileName()
+        return [g.os_path_dirname(g.os_path_finalize(fn)) if fn else os.getcwd()]
+    #@+node:ekr.20141229100001.19: *5* find.finishFindInOutlines
+    def finishFindInOutlines(self):
+        '''
+        Report the results of find-in-outlines in a new "Found in outlines"
+        node, the last top-level node of the outline.
+        '''
+        c,fio,results = self.c,self.fio,self.fioResults
+        self.fio,self.fioResults = None,[]
+        for fileName,message in fio.errors:
+            g.es_print('find-in-outlines: %s: %s' % (fileName,message),color='red')
+        if results:
+            # Group the matches by node.
+            lines,last = [],None
+            for fileName,unl,n,s in results:
+                if (fileName,unl) != last:
+                    last = fileName,unl
+                    lines.append('file://%s#%s\n' % (fileName,unl))
+                lines.append('    %s: %s\n' % (n,s.strip()))
+            u = c.undoer
+            undoData = u.beforeInsertNode(c.p)
+            last = c.rootPosition()
+            while last.hasNext():
+                last.moveToNext()
+            found = last.insertAfter()
+            found.h = 'Found in outlines: %s' % self.find_text
+            found.b = ''.join(lines)
+            u.afterInsertNode(found,'Find In Outlines',undoData,dirtyVnodeList=[])
+            c.selectPosition(found)
+            c.setChanged(True)
+            c.redraw()
+        g.es('found %s matches in %s outlines%s' % (
+            len(results),len(set([z[0] for z in results])),
+            ' (cancelled)' if fio.cancelled else ''))
     #@+node:ekr.20031218072017.3074: *4* find.findNext
     def findNext(self,initFlag=True):
         '''Find the next instance of the pattern.'''
@@ -1268,6 +1638,17 @@ class LeoFind:
         The caller must call set_first_incremental_search or
         set_first_batch_search.
         '''
+        for pos,newpos in self.iterMatches():
+            if pos is not None:
+                return pos,newpos
+        return None,None
+    #@+node:ekr.20141230090001.5: *5* find.iterMatches
+    def iterMatches(self):
+        '''
+        A generator that resumes the search where it left off. Yield
+        (pos,newpos) for each match, and (None,None) each time the search
+        moves to another node, so that callers may stop between nodes.
+        '''
         trace = False and not g.unitTesting
         verbose = True
         c = self.c ; p = self.p
@@ -1279,15 +1660,15 @@ class LeoFind:
                 print(parent)
         if not self.search_headline and not self.search_body:
             if trace: g.trace('nothing to search')
-            return None, None
+            return
         if len(self.find_text) == 0:
             if trace: g.trace('no find text')
-            return None, None
+            return
         self.errors = 0
         attempts = 0
         if self.pattern_match:
             ok = self.precompilePattern()
-            if not ok: return None,None
+            if not ok: return
         while p:
             pos, newpos = self.search()
             if self.errors:
@@ -1301,7 +1682,8 @@ class LeoFind:
                     p.setMarked()
                     c.frame.tree.drawIcon(p) # redraw only the icon.
                 if trace: g.trace('success',pos,newpos,p.h)
-                return pos, newpos
+                yield pos, newpos
+                continue
             # Searching the pane failed: switch to another pane or node.
             if self.shouldStayInNode(p):
                 # Switching panes is possible.  Do so.
@@ -1314,8 +1696,8 @@ class LeoFind:
                 if p: # Found another node: select the proper pane.
                     self.in_headline = self.firstSearchPane()
                     self.initNextText()
+                yield None, None
         if trace: g.trace('failed after %s attempts' % attempts)
-        return None, None
     #@+node:ekr.20131123071505.16468: *5* find.doWrap
     def doWrap(self):
         '''Return the position resulting from a wrap.'''
@@ -1385,23 +1767,25 @@ class LeoFind:
         if wrap and not self.wrapPosition:
             self.wrapPosition = p.copy()
             self.wrapPos = 0 if self.reverse else len(p.b)
-        # Move to the next position.
-        p = p.threadBack() if self.reverse else p.threadNext()
-        # Check it.
-        if p and self.outsideSearchRange(p):
-            if trace: g.trace('outside search range',p and p.h)
-            return None
-        if not p and wrap:
-            p = self.doWrap()
-        if not p:
-            if trace: g.trace('end of search')
-            return None
-        if wrap and p == self.wrapPosition:
-            if trace: g.trace('end of wrapped search',p and p.h)
-            return None
-        else:
-            if trace: g.trace('found',p and p.h)
-            return p
+        while True:
+            # Move to the next position.
+            p = p.threadBack() if self.reverse else p.threadNext()
+            # Check it.
+            if p and self.outsideSearchRange(p):
+                if trace: g.trace('outside search range',p and p.h)
+                return None
+            if not p and wrap:
+                p = self.doWrap()
+            if not p:
+                if trace: g.trace('end of search')
+                return None
+            if wrap and p == self.wrapPosition:
+                if trace: g.trace('end of wrapped search',p and p.h)
+                return None
+            if self.candidates is None or p.v in self.candidates:
+                if trace: g.trace('found',p and p.h)
+                return p
+            # The search index shows that p can not match.
     #@+node:ekr.20131123071505.16465: *6* find.outsideSearchRange
     def outsideSearchRange(self,p):
         '''
@@ -1583,104 +1967,39 @@ class LeoFind:
         self.match_obj = None
         return -1,-1
     #@+node:ekr.20060526140744: *6* backwardsHelper
-    debugIndices = []
-
-    #@+at
-    # rfind(sub [,start [,end]])
-    # 
-    # Return the highest index in the string where substring sub is found, such that
-    # sub is contained within s[start,end]. Optional arguments start and end are
-    # interpreted as in slice notation. Return -1 on failure.
-    #@@c
     def backwardsHelper (self,s,i,j,pattern,nocase,word):
-
+        '''Do a plain search backwards.'''
         trace = False and not g.unitTesting
-        if nocase:
-            s = s.lower()
-            pattern = pattern.lower()
-                # Bug fix: 10/5/06: At last the bug is found!
-        pattern = self.replaceBackSlashes(pattern)
-        n = len(pattern)
         # 2014/09/18: Put the indices in range.  Indices can get out of range
         # because the search code strips '\r' characters when searching @edit nodes.
         i = max(0,i)
         j = min(len(s),j)
-        # Old code:
-            # if i < 0 or i > len(s) or j < 0 or j > len(s):
-                # g.trace('bad index: i = %s, j = %s' % (i,j))
-                # i = 0 ; j = len(s)
-        if trace and (s and i == 0 and j == 0):
-            g.trace('two zero indices')
-        # short circuit the search: helps debugging.
-        if s.find(pattern) == -1:
-            return -1,-1
-        if word:
-            while 1:
-                k = s.rfind(pattern,i,j)
-                if trace: g.trace('**word** %3s %3s %5s -> %s %s' % (
-                    i,j,'(end)' if j==len(s) else '',k,self.p.h))
-                if k == -1: return -1, -1
-                if self.matchWord(s,k,pattern):
-                    return k,k+n
-                else:
-                    j = max(0,k-1)
-        else:
-            k = s.rfind(pattern,i,j)
-            if trace: g.trace('%3s %3s %5s -> %s %s' % (
-                i,j,'(end)' if j==len(s) else '',k,self.p.h))
-            if k == -1:
-                return -1, -1
-            else:
-                return k,k+n
+        matcher = self.getMatcher(pattern,nocase,word)
+        k,k2 = matcher.rfind(s,i,j,self.matcherKey())
+        if trace: g.trace('%3s %3s %5s -> %s %s' % (
+            i,j,'(end)' if j==len(s) else '',k,self.p.h))
+        return k,k2
+    #@+node:ekr.20141226090001.4: *6* getMatcher & matcherKey
+    def getMatcher (self,pattern,nocase,word):
+        '''Return the SearchMatcher for pattern, reusing the previous one if possible.'''
+        key = pattern,bool(nocase),bool(word)
+        if not self.matcher or self.matcher.key != key:
+            pattern = self.replaceBackSlashes(pattern)
+            self.matcher = SearchMatcher(key,pattern,bool(nocase),bool(word))
+        return self.matcher
+
+    def matcherKey (self):
+        '''Return the key of the pane being searched in matcher.cache.'''
+        return (self.p.v,self.in_headline) if self.p else None
     #@+node:ekr.20060526093531: *6* plainHelper
     def plainHelper (self,s,i,j,pattern,nocase,word):
         '''Do a plain search.'''
         trace = False and not g.unitTesting
         if trace: g.trace(i,j,repr(s[i:i+20]))
-        if nocase:
-            s = s.lower() ; pattern = pattern.lower()
-        pattern = self.replaceBackSlashes(pattern)
-        n = len(pattern)
-        if word:
-            while 1:
-                k = s.find(pattern,i,j)
-                # g.trace(k,n)
-                if k == -1:
-                    if trace: g.trace('no match word',i)
-                    return -1, -1
-                elif self.matchWord(s,k,pattern):
-                    if trace: g.trace('match word',k)
-                    return k, k + n
-                else: i = k + n
-        else:
-            k = s.find(pattern,i,j)
-            if k == -1:
-                if trace: g.trace('no match word',i)
-                return -1, -1
-            else:
-                if trace: g.trace('match', k)
-                return k, k + n
-    #@+node:ekr.20060526140744.1: *6* matchWord
-    def matchWord(self,s,i,pattern):
-        '''Do a whole-word search.'''
-        trace = False and not g.unitTesting
-        pattern = self.replaceBackSlashes(pattern)
-        if not s or not pattern or not g.match(s,i,pattern):
-            if trace: g.trace('empty')
-            return False
-        pat1,pat2 = pattern[0],pattern[-1]
-        n = len(pattern)
-        ch1 = 0 <= i-1 < len(s) and s[i-1] or '.'
-        ch2 = 0 <= i+n < len(s) and s[i+n] or '.'
-        isWordPat1 = g.isWordChar(pat1)
-        isWordPat2 = g.isWordChar(pat2)
-        isWordCh1 = g.isWordChar(ch1)
-        isWordCh2 = g.isWordChar(ch2)
-        # g.trace('i',i,'ch1,ch2,pat',repr(ch1),repr(ch2),repr(pattern))
-        inWord = isWordPat1 and isWordCh1 or isWordPat2 and isWordCh2
-        if trace: g.trace('returns',not inWord)
-        return not inWord
-
+        matcher = self.getMatcher(pattern,nocase,word)
+        k,k2 = matcher.find(s,i,j,self.matcherKey())
+        if trace: g.trace('match' if k > -1 else 'no match',k)
+        return k,k2
     #@+node:ekr.20070105165924: *6* replaceBackSlashes
     def replaceBackSlashes (self,s):
         '''Carefully replace backslashes in a search pattern.'''
@@ -1720,7 +2039,8 @@ class LeoFind:
         if not self.search_headline and not self.search_body:
             g.es("not searching headline or body")
             val = False
-        s = self.ftm.getFindText()
+        # Headless commanders have no find tab.
+        s = self.ftm.getFindText() if self.ftm else self.find_text
         if len(s) == 0:
             g.es("empty find patttern")
             val = False
@@ -1957,6 +2277,9 @@ class LeoFind:
         """Update ivars from the find panel."""
         trace = False and not g.unitTesting
         c = self.c
+        # A running find-all command must not share the search state.
+        if self.findAllState:
+            self.finishFindAll(cancelled=True)
         self.p = c.p.copy()
         ftm = self.ftm
         # The caller is responsible for removing most trailing cruft.
@@ -0,0 +1,301 @@
+#@+leo-ver=5-thin
+#@+node:ekr.20141229100001.1: * @file leoFindInOutlines.py
+'''
+Find a pattern in .leo files without opening them.
+
+Worker processes parse each .leo file with leosax, and optionally read
+the external files of its @file, @thin, @auto and @edit nodes. The
+results stream back as (fileName,unl,line,s) tuples:
+
+fileName: the .leo file.
+unl:      the UNL of the node containing the match.
+line:     the line number of the match in the node's body text,
+          starting at 1, or 0 for a match in the headline.
+s:        the line containing the match.
+
+g.recursiveUNLSearch(unl.split('-->'),c) selects the node in the
+outline fileName.
+'''
+#@+<< imports >>
+#@+node:ekr.20141229100001.2: ** << imports >> (leoFindInOutlines)
+import leo.core.leoGlobals as g
+from leo.external import leosax
+import os
+import re
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+#@-<< imports >>
+
+external_kinds = ('@auto','@edit','@file','@thin')
+    # Nodes whose trees are not in the .leo file. Also @auto-x nodes.
+leo_sentinel_pattern = re.compile(r'^\s*(.*?)@\+leo(-ver=\d+)?(-thin)?(.*)$')
+node_sentinel_pattern = re.compile(r'^\+node:[^:]*:\s*(\*+|\*\d+\*)\s(.*)$')
+
+#@+others
+#@+node:ekr.20141229100001.3: ** class FindInOutlines
+class FindInOutlines:
+    '''Find a pattern in unopened .leo files.'''
+    def __init__ (self,pattern,
+        ignore_case=False,regex=False,whole_word=False,
+        search_headline=True,search_body=True,
+        external_files=False,workers=None
+    ):
+        # Raise re.error now, not in the workers.
+        compileMatcher(pattern,ignore_case,regex,whole_word)
+        self.cancelled = False
+        self.errors = [] # (fileName,message) for all files that could not be read.
+        self.external_files = external_files
+        self.options = (pattern,ignore_case,regex,whole_word,search_headline,search_body)
+        self.workers = workers
+    def __repr__ (self):
+        return 'FindInOutlines: %s' % repr(self.options[0])
+
+    #@+others
+    #@+node:ekr.20141229100001.4: *3* fio.cancel
+    def cancel (self):
+        '''Stop the search. The find generator returns soon afterwards.'''
+        self.cancelled = True
+    #@+node:ekr.20141229100001.5: *3* fio.find
+    def find (self,paths,timeout=None):
+        '''
+        A generator yielding (fileName,unl,line,s) for all matches in the
+        .leo files given by paths, a list of .leo files and directories.
+        find searches all .leo files in the directories and their
+        subdirectories.
+
+        find searches in worker processes only if g.spawnContext() can
+        start them safely, and searches serially otherwise.
+
+        With a timeout, the generator yields None when no worker has
+        finished within timeout seconds, so idle-time code can poll it.
+        '''
+        tasks = [(fn,self.options,self.external_files) for fn in self.leoFiles(paths)]
+        n = self.workers
+        if n is None:
+            n = multiprocessing.cpu_count() if multiprocessing else 1
+        n = min(n,len(tasks))
+        # Don't fork: the children must not share the gui.
+        ctx = g.spawnContext() if n > 1 else None
+        if ctx:
+            pool = ctx.Pool(processes=n)
+            it = pool.imap_unordered(searchFile,tasks,chunksize=1)
+            results = self.poll(it,len(tasks),timeout)
+        else:
+            results = (searchFile(task) for task in tasks)
+            pool = None
+        try:
+            for data in results:
+                if self.cancelled:
+                    break
+                if data is None:
+                    yield None
+                    continue
+                fileName,hits,error = data
+                if error:
+                    self.errors.append((fileName,error))
+                for unl,line,s in hits:
+                    if self.cancelled:
+                        break
+                    yield fileName,unl,line,s
+        finally:
+            if pool:
+                pool.terminate()
+    #@+node:ekr.20141229100001.6: *3* fio.leoFiles
+    def leoFiles (self,paths):
+        '''Return the sorted list of all .leo files given by paths.'''
+        result = set()
+        for path in paths:
+            path = os.path.abspath(os.path.expanduser(path))
+            if os.path.isdir(path):
+                for root,dirs,files in os.walk(path):
+                    for fn in files:
+                        if fn.endswith('.leo'):
+                            result.add(os.path.join(root,fn))
+            elif os.path.isfile(path):
+                result.add(path)
+            else:
+                self.errors.append((path,'not found'))
+        return sorted(result)
+    #@+node:ekr.20141229100001.7: *3* fio.poll
+    def poll (self,it,n,timeout):
+        '''
+        Yield the next n results of the multiprocessing iterator it,
+        or None whenever no result is ready within timeout seconds.
+        '''
+        while n > 0:
+            try:
+                data = it.next(timeout)
+            except multiprocessing.TimeoutError:
+                yield None
+                continue
+            n -= 1
+            yield data
+    #@-others
+#@+node:ekr.20141229100001.8: ** Worker functions
+# These functions run in worker processes. They must not use g.app.
+#@+node:ekr.20141229100001.9: *3* compileMatcher
+def compileMatcher (pattern,ignore_case,regex,whole_word):
+    '''
+    Return a compiled regex for the given search options,
+    exactly as Leo's find commands interpret them.
+    '''
+    flags = re.UNICODE
+    if ignore_case:
+        flags |= re.IGNORECASE
+    if regex:
+        flags |= re.MULTILINE
+        if whole_word:
+            if not pattern.startswith('\\b'): pattern = '\\b' + pattern
+            if not pattern.endswith('\\b'): pattern = pattern + '\\b'
+        return re.compile(pattern,flags)
+    else:
+        s = re.escape(pattern)
+        if whole_word and g.isWordChar(pattern[:1]): s = r'(?<!\w)' + s
+        if whole_word and g.isWordChar(pattern[-1:]): s = s + r'(?!\w)'
+        return re.compile(s,flags)
+#@+node:ekr.20141229100001.10: *3* externalPath
+def externalPath (fileName,nd):
+    '''Return the full path of the external file of leosax node nd.'''
+    path = os.path.dirname(fileName)
+    for nd2 in nd.path[:-1]:
+        for s in [nd2.h] + ''.join(nd2.b).splitlines():
+            if s.startswith('@path '):
+                path = os.path.join(path,s[6:].strip())
+                break
+    aList = nd.h.split(None,1)
+    if len(aList) < 2:
+        return None
+    name = os.path.expanduser(aList[1].strip())
+    return os.path.normpath(os.path.join(path,name))
+#@+node:ekr.20141229100001.11: *3* findLines
+def findLines (matcher,s):
+    '''
+    Yield (n,line) for each line of s containing the start of a non-empty
+    match. n is the line number, starting at 1.
+    '''
+    n,i,prev = 1,0,None
+    for m in matcher.finditer(s):
+        j = m.start()
+        if j == m.end():
+            continue
+        n += s.count('\n',i,j)
+        i = j
+        if n != prev:
+            prev = n
+            k = s.find('\n',j)
+            yield n,s[s.rfind('\n',0,j)+1:len(s) if k == -1 else k]
+#@+node:ekr.20141229100001.12: *3* searchExternalFile
+def searchExternalFile (path,nd,matcher,search_headline,search_body):
+    '''
+    Search the external file of leosax node nd. Return a list of
+    (unl,line,s) tuples.
+    '''
+    f = open(path,'rb')
+    try:
+        s = f.read().decode('utf-8','replace')
+    finally:
+        f.close()
+    if not matcher.search(s):
+        return []
+    prefix = [z.h for z in nd.path[:-1]]
+    i = s.find('\n')
+    m = leo_sentinel_pattern.match(s[:i if i > -1 else len(s)])
+    if nd.h.startswith(('@file ','@thin ')) and m:
+        nodes = splitSentinelFile(s,m.group(1),m.group(4).strip())
+    else:
+        nodes = [([nd.h],s)]
+    result = []
+    for headlines,body in nodes:
+        unl = '-->'.join(prefix + headlines)
+        if search_headline and matcher.search(headlines[-1]):
+            result.append((unl,0,headlines[-1]))
+        if search_body:
+            result.extend([(unl,n,line) for n,line in findLines(matcher,body)])
+    return result
+#@+node:ekr.20141229100001.13: *3* searchFile
+def searchFile (task):
+    '''
+    Search one .leo file. Return (fileName,hits,error), where hits is a
+    list of (unl,line,s) tuples.
+    '''
+    fileName,options,external_files = task
+    pattern,ignore_case,regex,whole_word,search_headline,search_body = options
+    hits = []
+    try:
+        matcher = compileMatcher(pattern,ignore_case,regex,whole_word)
+        root = leosax.get_leo_data(fileName)
+    except Exception as e:
+        return fileName,hits,'%s: %s' % (e.__class__.__name__,e)
+    errors = []
+    for nd in root.flat():
+        unl = nd.UNL()
+        if search_headline and matcher.search(nd.h):
+            hits.append((unl,0,nd.h))
+        if search_body and nd.b:
+            body = ''.join(nd.b)
+            hits.extend([(unl,n,line) for n,line in findLines(matcher,body)])
+        kind = nd.h.split(' ',1)[0]
+        if external_files and (kind in external_kinds or kind.startswith('@auto-')):
+            path = externalPath(fileName,nd)
+            if path and os.path.isfile(path):
+                try:
+                    hits.extend(searchExternalFile(path,nd,matcher,
+                        search_headline,search_body))
+                except Exception as e:
+                    errors.append('%s: %s' % (path,e))
+    return fileName,hits,'\n'.join(errors) or None
+#@+node:ekr.20141229100001.14: *3* splitSentinelFile
+def splitSentinelFile (s,delim1,delim2):
+    '''
+    Split the text of an external file with sentinels into nodes.
+    Return a list of (headlines,body) tuples, one for each node.
+    headlines is the list of headlines from the root to the node.
+    '''
+    tag = delim1 + '@'
+    nodes = [] # [headlines,lines] for all nodes.
+    stack = [] # The nodes enclosing the present line.
+    others = [] # len(stack) for each @others or section reference.
+    verbatim = False
+    for line in s.splitlines(True)[1:]:
+        stripped = line.lstrip()
+        if verbatim or not stripped.startswith(tag):
+            verbatim = False
+            if stack:
+                stack[-1][1].append(line)
+            continue
+        indent = line[:len(line)-len(stripped)]
+        s2 = stripped[len(tag):].rstrip()
+        if delim2 and s2.endswith(delim2):
+            s2 = s2[:-len(delim2)].rstrip()
+        m = node_sentinel_pattern.match(s2)
+        if m:
+            stars,h = m.group(1),m.group(2)
+            level = int(stars[1:-1]) if len(stars) > 2 else len(stars)
+            del stack[max(0,level-1):]
+            headlines = [z[0][-1] for z in stack] + [h]
+            node = [headlines,[]]
+            nodes.append(node)
+            stack.append(node)
+        elif not stack:
+            pass
+        elif s2.startswith('+others') or s2.startswith('+<<'):
+            body = '@others' if s2.startswith('+others') else s2[1:]
+            stack[-1][1].append(indent + body + '\n')
+            others.append(len(stack))
+        elif s2.startswith('-others') or s2.startswith('-<<'):
+            if others:
+                del stack[others.pop():]
+        elif s2.startswith('@'):
+            # A directive.
+            stack[-1][1].append(indent + s2 + '\n')
+        elif s2.startswith('+at'):
+            stack[-1][1].append(indent + '@' + s2[3:] + '\n')
+        elif s2.startswith('+doc'):
+            stack[-1][1].append(indent + '@doc' + s2[4:] + '\n')
+        elif s2 == 'verbatim':
+            verbatim = True
+    return [(headlines,''.join(lines)) for headlines,lines in nodes]
+#@-others
+#@-leo
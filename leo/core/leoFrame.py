@@ -12,11 +12,10 @@ big_text_buttons = True # Show buttons instead of immediately loading big text.
 #@+<< imports >>
 #@+node:ekr.20120219194520.10464: ** << imports >> (leoFrame)
 import leo.core.leoGlobals as g
-import leo.core.leoColorizer as leoColorizer
-    # NullColorizer is a subclass of ColorizerMixin
 import leo.core.leoMenu as LeoMenu
 import leo.core.leoNodes as leoNodes
 
+import re
 import time
 #@-<< imports >>
 #@+<< About handling events >>
@@ -1844,8 +1843,196 @@ class NullBody (LeoBody):
     # Low-level gui...
     def setFocus (self):                        pass
     #@-others
+#@+node:ekr.20140906081909.18690: ** class ColorizerMixin
+class ColorizerMixin:
+    '''A mixin class for all c.frame.body.colorizer classes.'''
+    
+    def __init__(self,c):
+        '''Ctor for ColorizerMixin class.'''
+        self.c = c
+        
+    def colorize(self,p,incremental=False,interruptable=True):
+        assert False,'colorize must be defined in sublcasses'
+        
+    def kill(self):
+        '''Kill colorizing.'''
+        pass
+        
+    def write_colorizer_cache (self,p):
+        '''Write colorizing data for p for later use by rehighlight_with_cache.'''
+        pass
+
+    #@+others
+    #@+node:ekr.20140906081909.18715: *3* cm.findColorDirectives
+    color_directives_pat = re.compile(
+        # Order is important: put longest matches first.
+        r'(^@color|^@killcolor|^@nocolor-node|^@nocolor)'
+        ,re.MULTILINE)
+
+    def findColorDirectives (self,p):
+        '''
+        Scan p for @color, @killcolor, @nocolor and @nocolor-node directives.
+
+        Return a dict containing pointers to the start of each directive.
+        '''
+        trace = False and not g.unitTesting
+        d = {}
+        anIter = self.color_directives_pat.finditer(p.b)
+        for m in anIter:
+            # Remove leading '@' for compatibility with
+            # functions in leoGlobals.py.
+            word = m.group(0)[1:]
+            d[word] = word
+        if trace: g.trace(d)
+        return d
+    #@+node:ekr.20140906081909.18701: *3* cm.findLanguageDirectives
+    def findLanguageDirectives (self,p):
+
+        '''Scan p's body text for *valid* @language directives.
+
+        Return a list of languages.'''
+
+        # Speed not very important: called only for nodes containing @language directives.
+        trace = False and not g.unitTesting
+        aList = []
+        for s in g.splitLines(p.b):
+            if g.match_word(s,0,'@language'):
+                i = len('@language')
+                i = g.skip_ws(s,i)
+                j = g.skip_id(s,i)
+                if j > i:
+                    word = s[i:j]
+                    if self.isValidLanguage(word):
+                        aList.append(word)
+                    else:
+                        if trace:g.trace('invalid',word)
+
+        if trace: g.trace(aList)
+        return aList
+    #@+node:ekr.20140906081909.18702: *3* cm.isValidLanguage
+    def isValidLanguage (self,language):
+
+        fn = g.os_path_join(g.app.loadDir,'..','modes','%s.py' % (language))
+        return g.os_path_exists(fn)
+    #@+node:ekr.20140906081909.18711: *3* cm.scanColorByPosition
+    def scanColorByPosition(self,p):
+        '''Scan p for color-related directives.'''
+        c = self.c
+        wrapper = c.frame.body.wrapper
+        i = wrapper.getInsertPoint()
+        s = wrapper.getAllText()
+        i1,i2 = g.getLine(s,i)
+        tag = '@language'
+        language = self.language
+        for s in g.splitLines(s[:i1]):
+            if s.startswith(tag):
+                language = s[len(tag):].strip()
+        return language
+
+    #@+node:ekr.20140906081909.18697: *3* cm.scanColorDirectives
+    def scanColorDirectives(self,p):
+        '''Set self.language based on the directives in p's tree.'''
+        trace = False and not g.unitTesting
+        c = self.c
+        if not c:
+            return None # self.c may be None for testing.
+        root = p.copy()
+        self.colorCacheFlag = False
+        self.language = None
+        self.rootMode = None # None, "code" or "doc"
+        for p in root.self_and_parents():
+            theDict = g.get_directives_dict(p)
+            # if trace: g.trace(p.h,theDict)
+            if p == root:
+                # The @colorcache directive is a per-node directive.
+                self.colorCacheFlag = 'colorcache' in theDict
+                # g.trace('colorCacheFlag: %s' % self.colorCacheFlag)
+            if 'language' in theDict:
+                s = theDict["language"]
+                aList = self.findLanguageDirectives(p)
+                # In the root node, we use the first (valid) @language directive,
+                # no matter how many @language directives the root node contains.
+                # In ancestor nodes, only unambiguous @language directives
+                # set self.language.
+                if p == root or len(aList) == 1:
+                    self.languageList = list(set(aList))
+                    self.language = aList and aList[0] or []
+                    break
+            if 'root' in theDict and not self.rootMode:
+                s = theDict["root"]
+                if g.match_word(s,0,"@root-code"):
+                    self.rootMode = "code"
+                elif g.match_word(s,0,"@root-doc"):
+                    self.rootMode = "doc"
+                else:
+                    doc = c.config.at_root_bodies_start_in_doc_mode
+                    self.rootMode = "doc" if doc else "code"
+        # If no language, get the language from any @<file> node.
+        if self.language:
+            if trace: g.trace('found @language %s %s' % (self.language,self.languageList))
+            return self.language
+        #  Attempt to get the language from the nearest enclosing @<file> node.
+        self.language = g.getLanguageFromAncestorAtFileNode(root)
+        if not self.language:
+            if trace: g.trace('using default',c.target_language)
+            self.language = c.target_language
+        return self.language # For use by external routines.
+    #@+node:ekr.20140906081909.18704: *3* cm.updateSyntaxColorer
+    def updateSyntaxColorer (self,p):
+        '''Scan p.b for color directives.'''
+        trace = False and not g.unitTesting
+        # An important hack: shortcut everything if the first line is @killcolor.
+        if p.b.startswith('@killcolor'):
+            if trace: g.trace('@killcolor')
+            self.flag = False
+            return self.flag
+        else:
+            # self.flag is True unless an unambiguous @nocolor is seen.
+            p = p.copy()
+            self.flag = self.useSyntaxColoring(p)
+            self.scanColorDirectives(p) # Sets self.language
+        if trace: g.trace(self.flag,len(p.b),self.language,p.h,g.callers(5))
+        return self.flag
+    #@+node:ekr.20140906081909.18714: *3* cm.useSyntaxColoring
+    def useSyntaxColoring (self,p):
+        """Return True unless p is unambiguously under the control of @nocolor."""
+        trace = False and not g.unitTesting
+        if not p:
+            if trace: g.trace('no p',repr(p))
+            return False
+        p = p.copy()
+        first = True ; kind = None ; val = True
+        self.killColorFlag = False
+        for p in p.self_and_parents():
+            d = self.findColorDirectives(p)
+            color,no_color = 'color' in d,'nocolor' in d
+            # An @nocolor-node in the first node disabled coloring.
+            if first and 'nocolor-node' in d:
+                kind = '@nocolor-node'
+                self.killColorFlag = True
+                val = False ; break
+            # A killcolor anywhere disables coloring.
+            elif 'killcolor' in d:
+                kind = '@killcolor %s' % p.h
+                self.killColorFlag = True
+                val = False ; break
+            # A color anywhere in the target enables coloring.
+            elif color and first:
+                kind = 'color %s' % p.h
+                val = True ; break
+            # Otherwise, the @nocolor specification must be unambiguous.
+            elif no_color and not color:
+                kind = '@nocolor %s' % p.h
+                val = False ; break
+            elif color and not no_color:
+                kind = '@color %s' % p.h
+                val = True ; break
+            first = False
+        if trace: g.trace(val,kind)
+        return val
+    #@-others
 #@+node:ekr.20031218072017.2218: ** class NullColorizer
-class NullColorizer(leoColorizer.ColorizerMixin):
+class NullColorizer(ColorizerMixin):
     '''
     A colorizer class that doesn't color,
     but does support methods 
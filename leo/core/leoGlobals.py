@@ -1599,7 +1599,17 @@ def clearAllIvars (o):
     """Clear all ivars of o, a member of some class."""
 
     if o:
-        o.__dict__.clear()
+        d = getattr(o,'__dict__',None)
+        if d is not None:
+            d.clear()
+        # Clear the ivars of classes that define __slots__.
+        for cls in o.__class__.__mro__:
+            slots = cls.__dict__.get('__slots__',())
+            if g.isString(slots):
+                slots = [slots]
+            for ivar in slots:
+                if ivar not in ('__dict__','__weakref__') and hasattr(o,ivar):
+                    delattr(o,ivar)
 #@+node:ekr.20031218072017.1590: *4* g.collectGarbage
 def collectGarbage():
 
@@ -2023,14 +2033,38 @@ def get_directives_dict(p,root=None):
     Returns a dict containing the stripped remainder of the line
     following the first occurrence of each recognized directive
     """
+    if root: root_node = root[0]
+    d,warning,has_noweb_root = g.scan_directives_dict(p)
+    d = dict(d)
+    if warning:
+        g.app.atPathInBodyWarning = warning
+    if root and has_noweb_root:
+        if root_node:
+            d["root"]=0 # value not immportant
+        else:
+            g.es('%s= may only occur in a topmost node (i.e., without a parent)' % (
+                g.angleBrackets('*')))
+    return d
+#@+node:ekr.20141221090001.2: *4* g.scan_directives_dict
+def scan_directives_dict(p):
+    """
+    Return (d,warning,has_noweb_root) for p.v.
+
+    d is the dict returned by g.get_directives_dict, without the "root" entry.
+    warning is p.h if p contains an @path directive that must be ignored.
+    has_noweb_root is True if p.b contains a noweb root.
+
+    The result is cached in p.v.directivesCache until p.h, p.b or
+    g.globalDirectiveList changes. Callers must not change d.
+    """
     trace = False and not g.unitTesting
-    verbose = False
+    v = p.v
+    directives_pat = g.get_directives_re()
+    data = v.directivesCache
+    if data and data[0] == v.textRevision and data[1] is directives_pat:
+        return data[2:]
     if trace: g.trace('*'*20,p.h)
-    if root: root_node = root[0]
-    d = {}
-    # Do this every time so plugins can add directives.
-    pat = g.compute_directives_re()
-    directives_pat = re.compile(pat,re.MULTILINE)
+    d,warning = {},None
     # The headline has higher precedence because it is more visible.
     for kind,s in (('head',p.h),('body',p.b)):
         anIter = directives_pat.finditer(s)
@@ -2058,22 +2092,12 @@ def get_directives_dict(p,root=None):
                     # A special case for @path in the body text of @<file> nodes.
                     # Don't give an actual warning: just set some flags.
                     if kind == 'body' and word.strip() == 'path' and p.isAnyAtFileNode():
-                        g.app.atPathInBodyWarning = p.h
+                        warning = p.h
                         d['@path_in_body'] = p.h
                         if trace: g.trace('@path in body',p.h)
-
-    if root:
-        anIter = g_noweb_root.finditer(p.b)
-        for m in anIter:
-            if root_node:
-                d["root"]=0 # value not immportant
-            else:
-                g.es('%s= may only occur in a topmost node (i.e., without a parent)' % (
-                    g.angleBrackets('*')))
-            break
-    if trace and verbose:
-        g.trace('%4d' % (len(p.h) + len(p.b)))
-    return d
+    has_noweb_root = bool(g_noweb_root.search(p.b))
+    v.directivesCache = v.textRevision,directives_pat,d,warning,has_noweb_root
+    return d,warning,has_noweb_root
 #@+node:ekr.20090214075058.10: *4* compute_directives_re
 def compute_directives_re ():
     '''Return an re pattern which will match all Leo directives.'''
@@ -2095,23 +2119,64 @@ def compute_directives_re ():
             # @others can have leading whitespace.
             aList.append(r'^\s@others\s')
         return '|'.join(aList)
+#@+node:ekr.20141221090001.3: *4* get_directives_re
+directives_re = None
+directives_re_key = None
+
+def get_directives_re():
+    '''
+    Return the compiled form of compute_directives_re().
+    Recompile the pattern only if plugins have changed globalDirectiveList.
+    '''
+    global directives_re,directives_re_key
+    key = tuple(globalDirectiveList)
+    if key != directives_re_key:
+        directives_re = re.compile(g.compute_directives_re(),re.MULTILINE)
+        directives_re_key = key
+    return directives_re
 #@+node:ekr.20080827175609.1: *3* g.get_directives_dict_list (must be fast)
 def get_directives_dict_list(p):
 
     """Scans p and all its ancestors for directives.
 
     Returns a list of dicts containing pointers to
-    the start of each directive"""
+    the start of each directive.
 
-    result = []
-    p1 = p.copy()
-    for p in p1.self_and_parents():
-        root = None if p.hasParent() else [p.copy()]
-        result.append(g.get_directives_dict(p,root=root))
-    # if trace:
-        # n = len(p1.h) + len(p1.b)
-        # g.trace('%4d %s' % (n,g.timeSince(time1)))
+    The result is cached until any headline or body changes.
+    Callers must not change the list or its dicts."""
+
+    c = p.v.context
+    cache = g.get_directives_cache(c)
+    key = 'list',p.v,p._childIndex,tuple(p.stack)
+    data = cache.get(key)
+    if data:
+        result,warning = data
+        if warning:
+            g.app.atPathInBodyWarning = warning
+        return result
+    result,warning = [],None
+    for p2 in p.self_and_parents():
+        d,warning2,has_noweb_root = g.scan_directives_dict(p2)
+        if has_noweb_root and not p2.hasParent():
+            d = dict(d)
+            d["root"] = 0 # value not important.
+        result.append(d)
+        warning = warning2 or warning
+    if warning:
+        g.app.atPathInBodyWarning = warning
+    cache[key] = result,warning
     return result
+#@+node:ekr.20141221090001.4: *3* g.get_directives_cache
+def get_directives_cache(c):
+    '''
+    Return c.directivesCache, first clearing it if any headline or body
+    has changed since the last call.
+    '''
+    stamp = g.app.textRevision,g.get_directives_re()
+    if stamp != c.directivesCacheStamp:
+        c.directivesCache = {}
+        c.directivesCacheStamp = stamp
+    return c.directivesCache
 #@+node:ekr.20111010082822.15545: *3* g.getLanguageFromAncestorAtFileNode (New)
 def getLanguageFromAncestorAtFileNode(p):
 
@@ -3952,7 +4017,7 @@ def enableIdleTimeHook(idleTimeDelay=500,idleTimeHandler=None):
 #@+node:ekr.20140825042850.18410: *4* g.IdleTime
 def IdleTime(handler,delay=500,tag=None):
     '''A proxy for the g.app.gui.IdleTime class.'''
-    if g.app and g.app.gui and hasattr(g.app.gui,'idleTimeClass'):
+    if g.app and g.app.gui and getattr(g.app.gui,'idleTimeClass',None):
         return g.app.gui.idleTimeClass(handler,delay,tag)
     else:
         return None
@@ -6025,6 +6090,44 @@ if 0: # Testing:
     )  
     for s in aList:
         print(pep8_class_name(s))
+#@+node:ekr.20150102090001.18: *3* g.spawnContext & hasMainGuard
+def spawnContext():
+    '''
+    Return a multiprocessing context that spawns worker processes, or None
+    if Leo can not start worker processes safely. Callers should then do
+    their work in Leo's process.
+
+    Forking would share the gui with the children, so Python 2, whose
+    multiprocessing module can only fork on Linux, gets None.
+
+    Each spawned worker imports the main script again, so the main
+    script must guard its top-level code with if __name__ == '__main__'.
+    '''
+    try:
+        import multiprocessing
+    except ImportError:
+        return None
+    if not hasattr(multiprocessing,'get_context'):
+        return None
+    main = sys.modules.get('__main__')
+    fn = getattr(main,'__file__',None)
+    if fn and not hasMainGuard(fn):
+        return None
+    return multiprocessing.get_context('spawn')
+
+main_guard_pattern = re.compile(
+    r'''^if\s+(__name__\s*==\s*['"]__main__['"]|['"]__main__['"]\s*==\s*__name__)\s*:''',
+    re.MULTILINE)
+
+def hasMainGuard(fn):
+    '''
+    Return True if the script fn contains an if __name__ == '__main__'
+    statement, so that spawned workers can import it safely.
+    '''
+    s,e = readFileIntoString(fn,raw=True,silent=True)
+    if s is None:
+        return False
+    return bool(main_guard_pattern.search(toUnicode(s)))
 #@+node:ekr.20031218072017.3150: *3* g.windows
 def windows():
     return app and app.windowList
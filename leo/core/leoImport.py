@@ -11,13 +11,6 @@
 #@+node:ekr.20091224155043.6539: ** << imports >> (leoImport)
 # Required so the unit test that simulates an @auto leoImport.py will work!
 import leo.core.leoGlobals as g
-try:
-    import docutils
-    import docutils.core
-    # print('leoImport.py:',docutils)
-except ImportError:
-    docutils = None
-    # print('leoImport.py: can not import docutils')
 import glob
 import importlib
 import os
@@ -1398,7 +1391,8 @@ class LeoImportCommands:
         return self.scannerUnitTest(p,atAuto=atAuto,fileName=fileName,s=s,showTree=showTree,ext='.py')
 
     def rstUnitTest(self,p,fileName=None,s=None,showTree=False):
-        if docutils:
+        import leo.core.leoRst as leoRst
+        if leoRst.importDocutils():
             return self.scannerUnitTest(p,atAuto=False,fileName=fileName,s=s,showTree=showTree,ext='.rst')
         else:
             return None
@@ -626,22 +626,28 @@ class AutoCompleterClass:
         aList = d.get(prefix)
         if aList:
             if trace and verbose: g.trace('**cache hit: %s' % (prefix))
-            return aList
-
-        # elif self.use_codewise:
-            # aList = self.get_codewise_completions(prefix)
-        # else:
-            # aList = self.get_leo_completions(prefix)
-
-        # Always try the Leo completions first.
-        # Fall back to the codewise completions.
-        aList = (
-            self.get_leo_completions(prefix) or
-            self.get_codewise_completions(prefix)
-        )
-
-        if trace: g.trace('**cash miss: %s' % (prefix))
-        d [prefix] = aList
+        else:
+            # elif self.use_codewise:
+                # aList = self.get_codewise_completions(prefix)
+            # else:
+                # aList = self.get_leo_completions(prefix)
+
+            # Always try the Leo completions first.
+            # Fall back to the codewise completions.
+            aList = (
+                self.get_leo_completions(prefix) or
+                self.get_codewise_completions(prefix)
+            )
+            if trace: g.trace('**cash miss: %s' % (prefix))
+            d [prefix] = aList
+
+        # Add plain words from the words of the outline.
+        # Don't cache them: c.wordIndex changes as the user types.
+        if prefix and '.' not in prefix:
+            known = set(aList)
+            words = [z for z in self.get_word_completions(prefix) if z not in known]
+            if words:
+                aList = aList + words # Never change the cached list.
         return aList
     #@+node:ekr.20110510120621.14539: *5* ac.get_codewise_completions & helpers
     def get_codewise_completions(self,prefix):
@@ -788,6 +794,11 @@ class AutoCompleterClass:
                 g.trace('len(aList): %3s, prefix: %s' % (len(aList),repr(prefix)))
 
         return aList
+    #@+node:ekr.20141230100001.13: *5* ac.get_word_completions
+    def get_word_completions(self,prefix):
+        '''Return the words of the outline that complete prefix.'''
+        return [z for z in self.c.wordIndex.completions(prefix)
+            if z != prefix and '-' not in z]
     #@+node:ekr.20110512090917.14466: *4* ac.get_leo_namespace
     def get_leo_namespace (self,prefix):
         '''
@@ -94,6 +94,7 @@ class NodeIndices (object):
                 if index:
                     if trace: g.trace('new gnx',index,v.h)
                     fc.gnxDict[index] = v
+                    v.context.gnxIndex.valid = False
                 else:
                     g.trace('can not happen: no v.fileIndex',v)
         self.hold_set = set()
@@ -201,6 +202,9 @@ class NodeIndices (object):
 
 # Positions should *never* be saved by the ZOBD.
 class Position (object):
+    # Iterators create many positions, so they have no __dict__ until
+    # scripts or plugins set an ivar not listed here.
+    __slots__ = ('__dict__','_childIndex','stack','txtOffset','v')
     #@+others
     #@+node:ekr.20040228094013: *3*  p.ctor & other special methods...
     #@+node:ekr.20080416161551.190: *4*  p.__init__
@@ -216,7 +220,7 @@ class Position (object):
         else:
             self.stack = []
         g.app.positions += 1
-        self.txtOffset = None # see self.textOffset()
+        # self.txtOffset is set only by p.textOffset().
     #@+node:ekr.20080920052058.3: *4* p.__eq__ & __ne__
     def __eq__(self,p2):
         """Return True if two positions are equivalent."""
@@ -746,7 +750,7 @@ class Position (object):
         p = self
 
         # caching of p.textOffset, we need to calculate it only once
-        if p.txtOffset is not None:
+        if getattr(p,'txtOffset',None) is not None:
             return p.txtOffset
 
         p.txtOffset = 0
@@ -800,7 +804,7 @@ class Position (object):
             if p == p2:
                 break
         else:
-            v.expandedPositions.append(p.copy())
+            v.expandedPositions = list(v.expandedPositions) + [p.copy()]
         if trace: g.trace(len(v.expandedPositions),p.h,p._childIndex,v.expandedPositions)
         v.expand()
         
@@ -913,21 +917,21 @@ class Position (object):
         p = self
         dirtyVnodeList = []
 
-        # Calculate all nodes that are joined to p or parents of such nodes.
-        nodes = p.findAllPotentiallyDirtyNodes()
+        # All @<file> nodes joined to p or parents of such nodes.
+        # The GnxIndex caches this set until the outline changes.
+        nodes = p.v.context.gnxIndex.atFileRoots(p.v)
         if setDescendentsDirty:
             # **Important**: only mark _direct_ descendents of nodes.
             # Using the findAllPotentiallyDirtyNodes algorithm would mark way too many nodes.
+            nodes = set(nodes)
             for p2 in p.subtree():
-                # Only @thin nodes need to be marked.
-                if p2.v not in nodes and p2.isAnyAtFileNode():
+                if p2.isAnyAtFileNode():
                         # Bug fix: 2011/07/05: was p2.isAtThinFileNode():
-                    nodes.append(p2.v)
+                    nodes.add(p2.v)
         if trace and verbose:
             for v in nodes:
                 print (v.isDirty(),v.isAnyAtFileNode(),v)
-        dirtyVnodeList = [v for v in nodes
-            if not v.isDirty() and v.isAnyAtFileNode()]
+        dirtyVnodeList = [v for v in nodes if not v.isDirty()]
         for v in dirtyVnodeList:
             v.setDirty()
         if trace: g.trace("position",dirtyVnodeList,g.callers(5))
@@ -1034,11 +1038,8 @@ class Position (object):
     def nodes (self):
         '''Yield p.v and all vnodes in p's subtree.'''
         p = self
-        p = p.copy()
-        after = p.nodeAfterTree()
-        while p and p != after: # bug fix: 2013/10/12
-            yield p.v
-            p.moveToThreadNext()
+        for v,level,childIndex in p.walk():
+            yield v
 
     # Compatibility with old code.
     tnodes_iter = nodes
@@ -1112,11 +1113,8 @@ class Position (object):
     def unique_nodes (self):
         '''Yield p.v and all unique vnodes in p's subtree.'''
         p = self
-        seen = set()
-        for p in p.self_and_subtree():
-            if p.v not in seen:
-                seen.add(p.v)
-                yield p.v
+        for v,level,childIndex in p.walk(unique=True):
+            yield v
 
     # Compatibility with old code.
     unique_tnodes_iter = unique_nodes
@@ -1136,6 +1134,43 @@ class Position (object):
     # Compatibility with old code.
     subtree_with_unique_tnodes_iter = unique_subtree
     subtree_with_unique_vnodes_iter = unique_subtree
+    #@+node:ekr.20141224090001.1: *4* p.walk & walk_positions
+    def walk(self,includeSelf=True,unique=False,prune=None,stack=None):
+        '''
+        Yield (v,level,childIndex) for p (if includeSelf is True) and for
+        all nodes in p's subtree, in outline order.
+
+        This is much faster than p.self_and_subtree because it creates no
+        positions. See v.walk_descendants for the other arguments.
+        '''
+        p = self
+        if not p:
+            return
+        if stack is None:
+            stack = []
+        stack[:] = p.stack
+        seen = set() if unique else None
+        level = len(p.stack)
+        if includeSelf:
+            if seen is not None:
+                seen.add(p.v)
+            yield p.v,level,p._childIndex
+            if prune and p.v in prune:
+                return
+        stack.append((p.v,p._childIndex))
+        for data in p.v.walk_descendants(level+1,seen,prune,stack):
+            yield data
+
+    def walk_positions(self,includeSelf=True,unique=False,prune=None):
+        '''
+        Yield p (if includeSelf is True) and all positions in p's subtree.
+        Unlike p.self_and_subtree, each yielded position is a new object,
+        so callers need not copy it.
+        '''
+        p = self
+        stack = []
+        for v,level,childIndex in p.walk(includeSelf,unique,prune,stack):
+            yield Position(v,childIndex,stack[:])
     #@+node:ekr.20040303175026: *3* p.Moving, Inserting, Deleting, Cloning, Sorting
     #@+node:ekr.20040303175026.8: *4* p.clone
     def clone (self):
@@ -1162,6 +1197,8 @@ class Position (object):
         p = self
         p2.v._headString = p.h
         p2.v._bodyString = p.b
+        p2.v.bumpTextRevision()
+        p2.v.context.gnxIndex.headlineChanged(p2.v)
         # 2013/09/08: Fix bug 1019794: p.copyTreeFromSelfTo, should deepcopy p.v.u.
         p2.v.u = copy.deepcopy(p.v.u)
         # 2009/10/02: no need to copy arg to iter
@@ -1765,6 +1802,7 @@ class Position (object):
         if parent_v.children[p._childIndex] == v:
             parent_v.children[p._childIndex] = v2
             v2.parents.append(parent_v)
+            v2.context.gnxIndex.linked(parent_v,v2)
             # p.v no longer truly exists.
             # p.v = p2.v
         else:
@@ -1813,6 +1851,298 @@ class Position (object):
             if g.app.unitTesting: assert False, 'bad child index: %s' % (n)
     #@-others
 position = Position # compatibility.
+#@+node:ekr.20141220080001.1: ** class GnxIndex
+class GnxIndex(object):
+    '''
+    A map from gnx's to vnodes, from vnodes to all their positions,
+    including every clone instance, and from vnodes to the @<file> nodes
+    that contain them.
+
+    Low-level code in leoNodes.py, leoUndo.py and leoCommands.py keeps
+    the index up to date. Code that changes v.children or v.parents
+    directly must call childrenChanged or invalidate, which change
+    self.revision: atFileRoots never uses data from an older revision.
+    Both methods also tell c.wordIndex which parts of the outline to
+    index again.
+    Cached child indices are checked on use and recomputed on any miss
+    or mismatch, so changes made by other code can not produce stale
+    positions.
+
+    In debug mode (--debug) every result is also checked against a full
+    traversal of the outline.
+    '''
+    #@+others
+    #@+node:ekr.20141220080001.2: *3* gi.ctor
+    def __init__(self,c):
+        '''Ctor for the GnxIndex class.'''
+        self.c = c
+        self.atFileRootsDict = {}
+            # Keys are vnodes; values are frozensets of @<file> vnodes:
+            # the key itself and all its ancestors via any clone.
+        self.atFileRootsRevision = 0
+            # The revision for which atFileRootsDict is valid.
+        self.childIndicesDict = {}
+            # Keys are parent vnodes; values are tuples (n,d), where
+            # n is len(parent.children) and d maps children to lists of
+            # their indices in parent.children.
+        self.debug = g.app.debug
+            # True: check all results using a full traversal.
+        self.gnxDict = {}
+            # Keys are gnx's; values are vnodes.
+        self.revision = 0
+            # Changes whenever the structure of the outline may have changed.
+        self.valid = False
+            # True: gnxDict contains all vnodes of the outline.
+    #@+node:ekr.20141220080001.3: *3* gi.Public API
+    #@+node:ekr.20141220080001.4: *4* gi.gnx2vnode
+    def gnx2vnode(self,gnx):
+        '''Return the VNode in c's outline with the given gnx, or None.'''
+        v = self.gnxDict.get(gnx)
+        if v and (v.fileIndex != gnx or not self.isAttached(v)):
+            del self.gnxDict[gnx]
+            v = None
+        if not v and not self.valid:
+            self.rebuild()
+            v = self.gnxDict.get(gnx)
+        if self.debug:
+            self.checkVnode(gnx,v)
+        return v
+    #@+node:ekr.20141220080001.5: *4* gi.gnx2position & gnx2positions
+    def gnx2position(self,gnx):
+        '''Return the first position whose VNode has the given gnx, or None.'''
+        v = self.gnx2vnode(gnx)
+        return v and self.vnode2position(v) or None
+
+    def gnx2positions(self,gnx):
+        '''Return all positions whose VNode has the given gnx.'''
+        v = self.gnx2vnode(gnx)
+        return self.vnode2positions(v) if v else []
+    #@+node:ekr.20141220080001.6: *4* gi.vnode2position
+    def vnode2position(self,v):
+        '''
+        Return the position of v found by following v.parents[0] links.
+        This is c.vnode2position, without calls to list.index.
+        '''
+        c = self.c
+        stack = []
+        while v.parents:
+            parent = v.parents[0]
+            indices = self.childIndices(parent,v)
+            if not indices:
+                return None
+            stack.insert(0,(v,indices[0]),)
+            v = parent
+        # v.parents includes the hidden root node.
+        if not stack:
+            # a VNode not in the tree
+            return c.nullPosition()
+        v,n = stack.pop()
+        return Position(v,n,stack)
+    #@+node:ekr.20141220080001.7: *4* gi.vnode2positions
+    def vnode2positions(self,v):
+        '''
+        Return all positions p such that p.v == v, in outline order.
+        This takes O(depth) time for each position.
+        '''
+        stacks = self.stacks(v,{})
+        result = [Position(v,n,stack) for stack,n in stacks]
+        if self.debug:
+            self.checkPositions(v,result)
+        return result
+    #@+node:ekr.20141223090001.1: *4* gi.atFileRoots
+    def atFileRoots(self,v):
+        '''
+        Return a frozenset containing all @<file> nodes that are v itself
+        or ancestors of any clone of v.
+        '''
+        if self.atFileRootsRevision != self.revision:
+            self.atFileRootsDict = {}
+            self.atFileRootsRevision = self.revision
+        d = self.atFileRootsDict
+        roots = d.get(v)
+        if roots is None:
+            roots = frozenset()
+            for parent_v in v.parents:
+                roots2 = self.atFileRoots(parent_v)
+                if roots2:
+                    # Share the parent's set when possible.
+                    roots = roots | roots2 if roots else roots2
+            if v.isAnyAtFileNode():
+                roots = roots | frozenset([v])
+            d[v] = roots
+            if self.debug:
+                expected = frozenset([z for z in v.findAllPotentiallyDirtyNodes()
+                    if z.isAnyAtFileNode()])
+                if roots != expected:
+                    g.error('atFileRoots(%s): expected %s, got %s' % (
+                        v,len(expected),len(roots)))
+        return roots
+    #@+node:ekr.20141220080001.8: *4* gi.check
+    def check(self):
+        '''
+        Check the index against a full traversal of the outline.
+        Return the number of errors.
+        '''
+        c = self.c
+        d,expected = {},{}
+        for p in c.all_positions():
+            d[p.v.fileIndex] = p.v
+            expected.setdefault(p.v,[]).append(p.copy())
+        errors = 0
+        for gnx,v in d.items():
+            v2 = self.gnx2vnode(gnx)
+            if v2 is not v:
+                g.error('gnx2vnode(%s): expected %s, got %s' % (gnx,v,v2))
+                errors += 1
+        for v,aList in expected.items():
+            aList2 = self.vnode2positions(v)
+            if [p.key() for p in aList] != [p.key() for p in aList2]:
+                g.error('vnode2positions(%s): expected %s positions, got %s' % (
+                    v,len(aList),len(aList2)))
+                errors += 1
+        return errors
+    #@+node:ekr.20141220080001.9: *3* gi.Updating
+    # These methods are only for the use of low-level code.
+    #@+node:ekr.20141220080001.10: *4* gi.childrenChanged
+    def childrenChanged(self,parent_v):
+        '''Called when code changes parent_v.children.'''
+        self.childIndicesDict.pop(parent_v,None)
+        self.revision += 1
+        if self.atFileRootsDict:
+            self.atFileRootsDict = {}
+        self.c.wordIndex.childrenChanged(parent_v)
+    #@+node:ekr.20141223090001.2: *4* gi.headlineChanged
+    def headlineChanged(self,v):
+        '''
+        Called when code changes v's headline,
+        which may make v an @<file> node or not.
+        '''
+        if self.atFileRootsDict:
+            self.atFileRootsDict = {}
+            self.atFileRootsRevision = self.revision
+    #@+node:ekr.20141220080001.11: *4* gi.invalidate
+    def invalidate(self):
+        '''
+        Called after code creates or changes many vnodes without using the
+        low-level methods of the Position and VNode classes.
+        '''
+        self.atFileRootsDict = {}
+        self.childIndicesDict = {}
+        self.revision += 1
+        self.valid = False
+        self.c.wordIndex.invalidate()
+    #@+node:ekr.20141220080001.12: *4* gi.linked
+    def linked(self,parent_v,v):
+        '''Called after v._addLink links v as a child of parent_v.'''
+        self.childrenChanged(parent_v)
+        if not self.isAttached(parent_v):
+            return
+        # Add v and its descendants, stopping at known vnodes.
+        d = self.gnxDict
+        todo = [v]
+        while todo:
+            v = todo.pop()
+            if v.fileIndex and d.get(v.fileIndex) is not v:
+                d[v.fileIndex] = v
+                todo.extend(v.children)
+    #@+node:ekr.20141220080001.13: *4* gi.rebuild
+    def rebuild(self):
+        '''Recreate the gnxDict from the outline.'''
+        c = self.c
+        self.childIndicesDict = {}
+        self.gnxDict = dict([(v.fileIndex,v) for v in c.all_unique_nodes()])
+        self.valid = True
+    #@+node:ekr.20141220080001.14: *3* gi.Utils
+    #@+node:ekr.20141220080001.15: *4* gi.checkPositions & checkVnode
+    def checkPositions(self,v,aList):
+        '''Check the result of vnode2positions(v).'''
+        c = self.c
+        expected = [p.key() for p in c.all_positions() if p.v == v]
+        if expected != [p.key() for p in aList]:
+            g.internalError('vnode2positions(%s): expected %s positions, got %s' % (
+                v,len(expected),len(aList)))
+
+    def checkVnode(self,gnx,v):
+        '''Check the result of gnx2vnode(gnx).'''
+        c = self.c
+        for v2 in c.all_unique_nodes():
+            if v2.fileIndex == gnx:
+                if v2 is not v:
+                    g.internalError('gnx2vnode(%s): expected %s, got %s' % (gnx,v2,v))
+                return
+        if v:
+            g.internalError('gnx2vnode(%s): expected None, got %s' % (gnx,v))
+    #@+node:ekr.20141220080001.16: *4* gi.childIndices
+    def childIndices(self,parent_v,v):
+        '''
+        Return the list of all indices i such that parent_v.children[i] is v.
+        Recompute the data for parent_v on any miss or mismatch:
+        parent_v.children may have changed without notice.
+        '''
+        children = parent_v.children
+        data = self.childIndicesDict.get(parent_v)
+        if data:
+            n,d = data
+            indices = d.get(v)
+            if indices and n == len(children) and all([children[i] is v for i in indices]):
+                return indices
+        d = {}
+        for i,child in enumerate(children):
+            aList = d.get(child)
+            if aList:
+                aList.append(i)
+            else:
+                d[child] = [i]
+        self.childIndicesDict[parent_v] = len(children),d
+        return d.get(v,[])
+    #@+node:ekr.20141220080001.17: *4* gi.isAttached
+    def isAttached(self,v):
+        '''Return True if v is c.hiddenRootNode or one of its descendants.'''
+        root = self.c.hiddenRootNode
+        # Try the first parents first: this takes O(depth) time.
+        v2 = v
+        while v2 is not root and v2.parents:
+            v2 = v2.parents[0]
+        if v2 is root:
+            return True
+        seen = set()
+        todo = [v]
+        while todo:
+            v = todo.pop()
+            if v is root:
+                return True
+            for parent in v.parents:
+                if parent not in seen:
+                    seen.add(parent)
+                    todo.append(parent)
+        return False
+    #@+node:ekr.20141220080001.18: *4* gi.stacks
+    def stacks(self,v,memo):
+        '''
+        Return a list of tuples (stack,n), one for each position of v,
+        sorted in outline order. memo caches the results for ancestors.
+        '''
+        if v in memo:
+            return memo[v]
+        root = self.c.hiddenRootNode
+        result,seen = [],set()
+        for parent in v.parents:
+            if parent in seen:
+                continue # v.parents contains parent once for each link.
+            seen.add(parent)
+            indices = self.childIndices(parent,v)
+            if parent is root:
+                for n in indices:
+                    result.append(([],n),)
+            elif indices:
+                for stack,n2 in self.stacks(parent,memo):
+                    stack = stack + [(parent,n2)]
+                    for n in indices:
+                        result.append((stack,n),)
+        result.sort(key=lambda data: [z[1] for z in data[0]] + [data[1]])
+        memo[v] = result
+        return result
+    #@-others
 #@+node:ville.20090311190405.68: ** class PosList (leoNodes.py)
 class PosList(list):
     #@+others
@@ -1869,6 +2199,71 @@ class PosList(list):
 
     #@-others
 Poslist = PosList # compatibility.
+#@+node:ekr.20141222100001.7: ** class VNodeUiState
+class VNodeUiState (object):
+    '''
+    Ivars of a VNode that record the state of Leo's body pane.
+    Few vnodes ever set these ivars.
+    '''
+    __slots__ = (
+        'expandedPositions','insertSpot','scrollBarSpot',
+        'selectionLength','selectionStart',
+    )
+    defaults = {
+        'expandedPositions': (), # Immutable: see uiStateProperty.
+        'insertSpot': None,
+        'scrollBarSpot': None,
+        'selectionLength': 0,
+        'selectionStart': 0,
+    }
+    #@+others
+    #@+node:ekr.20141222100001.8: *3* ui.ctor
+    def __init__ (self):
+        '''Ctor for the VNodeUiState class.'''
+        self.expandedPositions = [] # Positions that should be expanded.
+        self.insertSpot = None # Location of previous insert point.
+        self.scrollBarSpot = None # Previous value of scrollbar position.
+        self.selectionLength = 0 # The length of the selected body text.
+        self.selectionStart = 0 # The start of the selected body text.
+    #@+node:ekr.20141222100001.9: *3* ui.isDefault
+    def isDefault (self):
+        '''Return True if all ivars have their default values.'''
+        return (
+            not self.expandedPositions and
+            self.insertSpot is None and
+            self.scrollBarSpot is None and
+            not self.selectionLength and
+            not self.selectionStart)
+    #@-others
+#@+node:ekr.20141222100001.10: ** uiStateProperty
+def uiStateProperty (name,doc):
+    '''
+    Return a property for v.<name>, an ivar of v._uiState.
+
+    Getting the property never allocates v._uiState. Setting it allocates
+    v._uiState only for a non-default value, and frees v._uiState when
+    all its ivars once again have default values.
+
+    Without v._uiState, v.expandedPositions is an empty tuple. Callers must
+    assign a new list to v.expandedPositions instead of changing it in place.
+    '''
+    default = VNodeUiState.defaults[name]
+
+    def getter(v):
+        state = v._uiState
+        return getattr(state,name) if state else default
+
+    def setter(v,val):
+        state = v._uiState
+        if not state:
+            if val == default or (name == 'expandedPositions' and not val):
+                return
+            v._uiState = state = VNodeUiState()
+        setattr(state,name,val)
+        if state.isDefault():
+            v._uiState = None
+
+    return property(getter,setter,doc=doc)
 #@+node:ekr.20031218072017.3341: ** class VNode
 class VNodeBase (object):
     #@+<< VNode constants >>
@@ -1890,6 +2285,22 @@ class VNodeBase (object):
     dirtyBit    = 0x200
     writeBit    = 0x400
     #@-<< VNode constants >>
+    #@+<< VNode slots >>
+    #@+node:ekr.20141222100001.5: *3* << VNode slots >>
+    # Outlines may contain millions of vnodes, so vnodes have no __dict__
+    # until code sets an ivar not listed here, such as v.unknownAttributes.
+    # Rarely used ivars live in v._uiState. See class VNodeUiState.
+
+    if not use_zodb:
+        __slots__ = (
+            '__dict__','__weakref__',
+            '_bodyString','_headString','_uiState',
+            'children','context','directivesCache','fileIndex',
+            'iconVal','parents','statusBits','textRevision',
+        )
+        # Without ZODB, setting v._p_changed does nothing.
+        _p_changed = property(lambda v: False,lambda v,val: None)
+    #@-<< VNode slots >>
     #@+others
     #@+node:ekr.20031218072017.3342: *3* v.Birth & death
     #@+node:ekr.20031218072017.3344: *4* v.__init
@@ -1916,15 +2327,15 @@ class VNodeBase (object):
                 # New in Leo 5.0: This may be '': it will be allocated later.
         self.iconVal = 0 # The present value of the node's icon.
         self.statusBits = 0 # status bits
+        self.textRevision = 0 # Changes whenever the headline or body changes.
         # Information that is never written to any file...
         self.context = context # The context containing context.hiddenRootNode.
             # Required so we can compute top-level siblings.
             # It is named .context rather than .c to emphasize its limited usage.
-        self.expandedPositions = [] # Positions that should be expanded.
-        self.insertSpot = None # Location of previous insert point.
-        self.scrollBarSpot = None # Previous value of scrollbar position.
-        self.selectionLength = 0 # The length of the selected body text.
-        self.selectionStart = 0 # The start of the selected body text.
+        self.directivesCache = None # Used only by g.get_directives_dict.
+        self._uiState = None # A VNodeUiState, allocated when needed.
+        context.searchIndex.changed(self)
+        context.wordIndex.changed(self)
     #@+node:ekr.20031218072017.3345: *4* v.__repr__ & v.__str__
     def __repr__ (self):
 
@@ -2241,21 +2652,19 @@ class VNodeBase (object):
         v = self ; c = v.context
 
         # Set the starting nodes.
-        nodes = []
-        newNodes = [v]
+        nodes = [v]
+        seen = set(nodes)
 
         # Add nodes until no more are added.
-        while newNodes:
-            addedNodes = []
-            nodes.extend(newNodes)
-            for v in newNodes:
-                for v2 in v.parents:
-                    if v2 not in nodes and v2 not in addedNodes:
-                        addedNodes.append(v2)
-            newNodes = addedNodes[:]
+        # nodes grows while we iterate over it.
+        for v in nodes:
+            for v2 in v.parents:
+                if v2 not in seen:
+                    seen.add(v2)
+                    nodes.append(v2)
 
         # Remove the hidden VNode.
-        if c.hiddenRootNode in nodes:
+        if c.hiddenRootNode in seen:
             if trace: g.trace('removing hidden root',c.hiddenRootNode)
             nodes.remove(c.hiddenRootNode)
 
@@ -2272,13 +2681,13 @@ class VNodeBase (object):
         v = self
         dirtyVnodeList = []
 
-        # Calculate all nodes that are joined to p or parents of such nodes.
-        nodes = v.findAllPotentiallyDirtyNodes()
+        # All @<file> nodes joined to v or parents of such nodes.
+        # The GnxIndex caches this set until the outline changes.
+        nodes = v.context.gnxIndex.atFileRoots(v)
         if trace and verbose:
             for v in nodes:
                 print (v.isDirty(),v.isAnyAtFileNode(),v)
-        dirtyVnodeList = [v for v in nodes
-            if not v.isDirty() and v.isAnyAtFileNode()]
+        dirtyVnodeList = [v for v in nodes if not v.isDirty()]
         for v in dirtyVnodeList:
             v.setDirty() # Do not call p.setDirty here!
         if trace: g.trace(dirtyVnodeList)
@@ -2439,6 +2848,7 @@ class VNodeBase (object):
             # v.h, len(v._bodyString),len(s),g.callers(5),
             # v._bodyString,s))
         v._bodyString = g.toUnicode(s,reportErrors=True)
+        v.bumpTextRevision()
 
     def setHeadString (self,s):
         
@@ -2448,6 +2858,8 @@ class VNodeBase (object):
         # Fix bug: https://bugs.launchpad.net/leo-editor/+bug/1245535
         # API allows headlines to contain newlines.
         v._headString = g.toUnicode(s,reportErrors=True).replace('\n','')
+        v.bumpTextRevision()
+        v.context.gnxIndex.headlineChanged(v)
 
     initBodyString = setBodyString
     initHeadString = setHeadString
@@ -2460,6 +2872,7 @@ class VNodeBase (object):
         if g.isString(index):
             v.fileIndex = index
             g.app.nodeIndices.updateLastIndex(index)
+            v.context.gnxIndex.valid = False
         else:
             g.trace('can not happen',repr(index))
     #@+node:ekr.20031218072017.3402: *4* v.setSelection
@@ -2468,12 +2881,69 @@ class VNodeBase (object):
         v = self
         v.selectionStart = start
         v.selectionLength = length
+    #@+node:ekr.20141221090001.1: *4* v.bumpTextRevision
+    def bumpTextRevision(self):
+        '''
+        Give v a new text revision.
+        Code that sets v._headString or v._bodyString must call this.
+        '''
+        g.app.textRevision += 1
+        self.textRevision = g.app.textRevision
+        self.context.searchIndex.changed(self)
+        self.context.wordIndex.changed(self)
     #@+node:ville.20120502221057.7498: *4* v.contentModified
     def contentModified(self):
         g.contentModifiedSet.add(self)
     #@+node:ville.20120502221057.7499: *4* v.childrenModified
     def childrenModified(self):
         g.childrenModifiedSet.add(self)
+    #@+node:ekr.20141224090001.2: *3* v.walk_descendants
+    def walk_descendants(self,level=0,seen=None,prune=None,stack=None):
+        '''
+        Yield (v,level,childIndex) for all descendants of self, in outline
+        order, using an explicit stack instead of positions.
+
+        level:  the level of self's children.
+        seen:   None or a set of vnodes. If given, skip all vnodes in the
+                set, and their subtrees, and add all yielded vnodes to it.
+        prune:  None or a set of vnodes. Do not visit the descendants of
+                any vnode in the set. Callers may add the vnode just
+                yielded to prune before resuming the walk.
+        stack:  None or a list in the format of Position.stack. The walk
+                appends entries to it, so that when a vnode is yielded
+                Position(v,childIndex,stack[:]) is the position of the
+                yielded node.
+
+        The caller must not change the outline during the walk, except
+        for the subtrees of pruned nodes.
+        '''
+        if stack is None:
+            stack = []
+        base = len(stack)
+        parent_v,i = self,0
+        while True:
+            children = parent_v.children
+            if i < len(children):
+                v = children[i]
+                if seen is not None:
+                    if v in seen:
+                        i += 1
+                        continue
+                    seen.add(v)
+                yield v,level,i
+                if v.children and not (prune and v in prune):
+                    stack.append((v,i))
+                    parent_v,i = v,0
+                    level += 1
+                else:
+                    i += 1
+            elif len(stack) > base:
+                v,i = stack.pop()
+                parent_v = stack[-1][0] if len(stack) > base else self
+                i += 1
+                level -= 1
+            else:
+                break
     #@+node:ekr.20130524063409.10700: *3* v.Inserting & cloning
     def cloneAsNthChild(self,parent_v,n):
         # Does not check for illegal clones!
@@ -2521,6 +2991,7 @@ class VNodeBase (object):
             if len(v.parents) == 1:
                 for child in v.children:
                     child._addParentLinks(parent=v)
+        v.context.gnxIndex.linked(parent_v,v)
     #@+node:ekr.20090804184658.6129: *5* v._addParentLinks
     def _addParentLinks(self,parent): 
 
@@ -2542,6 +3013,7 @@ class VNodeBase (object):
         assert parent_v.children[childIndex]==v
         del parent_v.children[childIndex]
         v.parents.remove(parent_v)
+        v.context.gnxIndex.childrenChanged(parent_v)
         v._p_changed = 1
         parent_v._p_changed = 1
         # If v has no more parents, we adjust all
@@ -2626,6 +3098,17 @@ class VNodeBase (object):
     gnx = property(
         __get_gnx, # __set_gnx,
         doc = "VNode gnx property")
+    #@+node:ekr.20141222100001.6: *4* v.UI state properties
+    expandedPositions = uiStateProperty('expandedPositions',
+        doc = "Positions that should be expanded.")
+    insertSpot = uiStateProperty('insertSpot',
+        doc = "Location of previous insert point.")
+    scrollBarSpot = uiStateProperty('scrollBarSpot',
+        doc = "Previous value of scrollbar position.")
+    selectionLength = uiStateProperty('selectionLength',
+        doc = "The length of the selected body text.")
+    selectionStart = uiStateProperty('selectionStart',
+        doc = "The start of the selected body text.")
     #@-others
     
 if use_zodb and ZODB:
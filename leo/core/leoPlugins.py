@@ -531,6 +531,8 @@ class LeoPluginsController:
             return module
         assert g.app.loadDir
         moduleName = g.toUnicode(moduleName)
+        sp = g.app.startupProfile
+        if sp: sp.begin('plugins',moduleName)
         # This import will typically result in calls to registerHandler.
         # if the plugin does _not_ use the init top-level function.
         self.loadingModuleNameStack.append(moduleName)
@@ -589,6 +591,7 @@ class LeoPluginsController:
                     if trace: report('fyi: no top-level init() function in %s' % moduleName)
                     self.loadedModules[moduleName] = result
             self.loadingModuleNameStack.pop()
+        if sp: sp.end('plugins',moduleName,loaded=bool(result))
         if g.app.batchMode or g.app.inBridge or g.unitTesting:
             pass
         elif result:
@@ -21,39 +21,14 @@ if 0:
 #@+node:ekr.20100908120927.5971: ** << imports >> (leoRst)
 import leo.core.leoGlobals as g
 verbose = g.app.trace_plugins
-try:
-    import docutils
-    import docutils.core
-except ImportError:
-    docutils = None
-if verbose:
-    print('leoRst3.py: docutils: %s' % docutils)
-if docutils:
-    try:
-        from docutils import parsers
-        if verbose or not parsers: print('leoRst.py',parsers)
-        from docutils.parsers import rst
-        if verbose or not rst: print('leoRst.py',rst)
-        if not parsers or not rst:
-            docutils = None
-    except ImportError:
-        docutils = None
-    except Exception:
-        g.es_exception()
-        docutils = None
+docutils = None
+    # importDocutils imports docutils when it is first needed.
 if g.isPython3:
     import html.parser as HTMLParser
 else:
     import HTMLParser
-try:
-    import leo.plugins.mod_http as mod_http
-except ImportError:
-    mod_http = None
-except Exception:
-    # Don't let a problem with a plugin crash Leo's core!
-    # g.es_print('leoRst: can not import leo.plugins.mod_http')
-    # g.es_exception()
-    mod_http = None
+mod_http = None
+    # importModHttp imports the mod_http plugin when it is first needed.
 # import os
 import pprint
 import re
@@ -102,19 +77,61 @@ code_block.arguments = (
     0, # Number of optional arguments.
     0) # True if final argument may contain whitespace.
 
-# A mapping from option name to conversion function.
-if docutils:
-    code_block.options = {
-        'language':
-        docutils.parsers.rst.directives.unchanged
-            # Return the text argument, unchanged.
-    }
-    code_block.content = 1 # True if content is allowed.
-
-    # Register the directive with docutils.
-    docutils.parsers.rst.directives.register_directive('code-block',code_block)
-else:
-    code_block.options = {}
+code_block.options = {}
+#@+node:ekr.20141230140001.1: ** importDocutils
+def importDocutils ():
+    '''
+    Import docutils and register the code-block directive with it.
+    Return the docutils module, or None if docutils is not present.
+
+    leoRst imports docutils only when it is first needed: the import
+    takes a significant part of Leo's startup time.
+    '''
+    global docutils
+    if docutils is None:
+        docutils = False # Import docutils at most once.
+        try:
+            import docutils
+            import docutils.core
+            from docutils import parsers
+            if verbose or not parsers: print('leoRst.py',parsers)
+            from docutils.parsers import rst
+            if verbose or not rst: print('leoRst.py',rst)
+            if not parsers or not rst:
+                docutils = False
+        except ImportError:
+            docutils = False
+        except Exception:
+            g.es_exception()
+            docutils = False
+        if verbose:
+            print('leoRst.py: docutils: %s' % docutils)
+        if docutils:
+            # A mapping from option name to conversion function.
+            code_block.options = {
+                'language':
+                docutils.parsers.rst.directives.unchanged
+                    # Return the text argument, unchanged.
+            }
+            code_block.content = 1 # True if content is allowed.
+            # Register the directive with docutils.
+            docutils.parsers.rst.directives.register_directive('code-block',code_block)
+    return docutils or None
+#@+node:ekr.20141230140001.2: ** importModHttp
+def importModHttp ():
+    '''Import the mod_http plugin. Return the module, or None.'''
+    global mod_http
+    if mod_http is None:
+        try:
+            import leo.plugins.mod_http as mod_http
+        except ImportError:
+            mod_http = False
+        except Exception:
+            # Don't let a problem with a plugin crash Leo's core!
+            # g.es_print('leoRst: can not import leo.plugins.mod_http')
+            # g.es_exception()
+            mod_http = False
+    return mod_http or None
 #@+node:ekr.20090502071837.33: ** class RstCommands
 #@+at This plugin optionally stores information for the http plugin. Each node can
 # have one additional attribute, with the name rst_http_attributename, which is a
@@ -1553,7 +1570,7 @@ class RstCommands:
             self.setOption(key,val,'initOptionsFromSettings')
 
         # Special case.
-        if self.getOption('http_server_support') and not mod_http:
+        if self.getOption('http_server_support') and not importModHttp():
             g.error('No http_server_support: can not import mod_http plugin')
             self.setOption('http_server_support',False)
     #@+node:ekr.20090502071837.56: *5* handleSingleNodeOptions
@@ -1823,7 +1840,7 @@ class RstCommands:
         '''Send s to docutils using the writer implied by ext and return the result.'''
 
         trace = False and not g.unitTesting
-        if not docutils:
+        if not importDocutils():
             g.error('writeToDocutils: docutils not present')
             return None
         openDirectory = self.c.frame.openDirectory
@@ -0,0 +1,415 @@
+#@+leo-ver=5-thin
+#@+node:ekr.20141225080001.1: * @file leoSearchIndex.py
+'''
+An inverted index of the words in each commander's outline.
+
+c.searchIndex.candidates returns the set of vnodes that may contain a match
+of a search pattern. Searches use it to skip all other nodes before
+running the exact search.
+
+The index maps words to the nodes containing them, and trigrams to the
+words containing them, so patterns may match parts of words. The index is
+built when first needed and updated lazily: v.bumpTextRevision marks
+changed nodes and the next query indexes them again. The Cacher saves
+the index with the outline.
+'''
+#@+<< imports >>
+#@+node:ekr.20141225080001.2: ** << imports >> (leoSearchIndex)
+import leo.core.leoGlobals as g
+import array
+import hashlib
+import re
+#@-<< imports >>
+
+version = 1
+    # The version of the cached data.
+word_pattern = re.compile(r'\w+',re.UNICODE)
+non_ascii_pattern = re.compile(g.u(r'[^\x00-\x7f]'))
+fold_table = {
+    # Characters that re.IGNORECASE matches with characters that are not
+    # their lower-case equivalents. Keys and values are code points.
+    0x0131: 0x0069, 0x017f: 0x0073, 0x00b5: 0x03bc, 0x0345: 0x03b9,
+    0x1fbe: 0x03b9, 0x1fd3: 0x0390, 0x1fe3: 0x03b0, 0x03c2: 0x03c3,
+    0x03d0: 0x03b2, 0x03d1: 0x03b8, 0x03d5: 0x03c6, 0x03d6: 0x03c0,
+    0x03f0: 0x03ba, 0x03f1: 0x03c1, 0x03f5: 0x03b5, 0x1e9b: 0x1e61,
+    0xfb05: 0xfb06, 0x1c80: 0x0432, 0x1c81: 0x0434, 0x1c82: 0x043e,
+    0x1c83: 0x0441, 0x1c84: 0x0442, 0x1c85: 0x0442, 0x1c86: 0x044a,
+    0x1c87: 0x0463, 0x1c88: 0xa64b,
+    # u'\u0130'.lower() is u'i\u0307', but re.IGNORECASE matches u'\u0130' with u'i'.
+    0x0307: None,
+}
+
+#@+others
+#@+node:ekr.20141225080001.3: ** fold
+def fold(s):
+    '''
+    Return s in lower case, with the characters that re.IGNORECASE
+    considers equal mapped to the same character.
+    '''
+    s = s.lower()
+    if non_ascii_pattern.search(s):
+        s = s.translate(fold_table)
+    return s
+#@+node:ekr.20141225080001.4: ** class SearchIndex
+class SearchIndex(object):
+    '''
+    An inverted index of the words in the headlines and bodies of all
+    nodes of c's outline.
+
+    Postings are arrays of node ids. A node gets a new id whenever it is
+    indexed again, leaving its old ids unused. The index is rebuilt when
+    there are too many unused ids.
+    '''
+    #@+others
+    #@+node:ekr.20141225080001.5: *3* si.ctor & reset
+    def __init__(self,c):
+        '''Ctor for the SearchIndex class.'''
+        self.c = c
+        self.enabled = None
+            # None: use the @bool search-index setting.
+        self.useCache = True
+            # True: read the cached index when first building the index.
+        self.reset()
+
+    def reset(self):
+        '''Clear the index.'''
+        self.built = False
+            # True: the index covers all nodes except those in self.stale.
+        self.digests = []
+            # Keys are ids; values are digests of the indexed text, or None.
+        self.dirty = False
+            # True: the index has changed since it was cached.
+        self.ids = {}
+            # Keys are vnodes; values are ids.
+        self.postings = {}
+            # Keys are words; values are arrays of ids.
+        self.reindexed = 0
+            # The number of nodes indexed again since the last build.
+        self.stale = set()
+            # Vnodes changed since they were last indexed.
+        self.trigrams = None
+            # Keys are trigrams; values are sets of words.
+            # None until a query needs it.
+        self.vnodes = []
+            # Keys are ids; values are vnodes, or None for unused ids.
+    #@+node:ekr.20141225080001.6: *3* si.Public API
+    #@+node:ekr.20141225080001.7: *4* si.candidates
+    def candidates(self,pattern,regex=False,word=False,flags=0):
+        '''
+        Return a set containing all vnodes whose headline or body may match
+        the pattern, or None if the index can not narrow the search.
+
+        regex:  True: pattern is a regular expression.
+        word:   True: pattern must match whole words.
+        flags:  The flags used to compile the regular expression.
+
+        The result may contain vnodes that are not in the outline, and
+        vnodes that do not match. Case is always ignored.
+        '''
+        if not pattern or not self.isEnabled():
+            return None
+        if regex:
+            if flags & re.VERBOSE:
+                return None
+            literals = self.requiredLiterals(pattern)
+        else:
+            literals = [pattern]
+        constraints = []
+        for s in literals or []:
+            constraints.extend(self.wordConstraints(s,word and not regex))
+        if not constraints:
+            return None
+        self.update()
+        # Look up whole words first: it's fast and usually most selective.
+        constraints.sort(key=lambda z: (z[0] != 'exact',-len(z[1])))
+        result = None
+        for kind,s in constraints:
+            ids = self.findIds(kind,s)
+            if ids is not None:
+                result = ids if result is None else result & ids
+                if not result:
+                    break
+        if result is None:
+            return None
+        vnodes = self.vnodes
+        return set([vnodes[i] for i in result if vnodes[i] is not None])
+    #@+node:ekr.20141225080001.8: *4* si.changed
+    def changed(self,v):
+        '''Called whenever v's headline or body changes.'''
+        if self.built:
+            self.stale.add(v)
+    #@+node:ekr.20141225080001.9: *4* si.isEnabled
+    def isEnabled(self):
+        '''Return True if searches should use the index.'''
+        if self.enabled is None:
+            return self.c.config.getBool('search-index',default=True)
+        else:
+            return self.enabled
+    #@+node:ekr.20141225080001.10: *4* si.update
+    def update(self):
+        '''Index all nodes changed since the last query.'''
+        if not self.built or self.reindexed > max(1000,len(self.ids)):
+            self.build()
+        elif self.stale:
+            for v in self.stale:
+                self.indexNode(v)
+            self.stale = set()
+            self.dirty = True
+    #@+node:ekr.20141225080001.11: *4* si.writeCache
+    def writeCache(self):
+        '''Save the index in the cache, if it has changed.'''
+        c = self.c
+        if not (self.built and self.dirty and g.enableDB and c.mFileName):
+            return
+        gnxs = [v and v.fileIndex for v in self.vnodes]
+        postings = dict([(word,toBytes(a)) for word,a in self.postings.items()])
+        c.cacher.setCachedSearchIndex((version,gnxs,self.digests,postings))
+        self.dirty = False
+    #@+node:ekr.20141225080001.12: *3* si.Indexing
+    #@+node:ekr.20141225080001.13: *4* si.build
+    def build(self):
+        '''Index all nodes, using the cached index if possible.'''
+        c = self.c
+        self.reset()
+        if self.useCache:
+            self.useCache = False
+            self.readCache()
+        for v,level,childIndex in c.walk(unique=True):
+            if v not in self.ids:
+                self.indexNode(v)
+        self.built = True
+    #@+node:ekr.20141225080001.14: *4* si.indexNode
+    def indexNode(self,v):
+        '''
+        Add v's words to the index. A changed node gets a new id, so its
+        old postings no longer refer to it.
+        '''
+        n = self.ids.get(v)
+        if n is not None:
+            self.vnodes[n] = self.digests[n] = None
+            self.reindexed += 1
+        n = self.ids[v] = len(self.vnodes)
+        self.vnodes.append(v)
+        s = v._headString + '\n' + v._bodyString
+        self.digests.append(digest(s))
+        postings = self.postings
+        for word in set(word_pattern.findall(fold(s))):
+            a = postings.get(word)
+            if a is None:
+                a = postings[word] = array.array('i')
+                if self.trigrams is not None:
+                    self.addTrigrams(word)
+            a.append(n)
+        self.dirty = True
+    #@+node:ekr.20141225080001.15: *4* si.readCache
+    def readCache(self):
+        '''
+        Init the index from the cache. Nodes whose text has changed since
+        the index was cached remain unindexed.
+        '''
+        c = self.c
+        if not (g.enableDB and c.mFileName):
+            return
+        try:
+            data = c.cacher.getCachedSearchIndex()
+            if not data or data[0] != version:
+                return
+            gnxs,digests,postings = data[1:]
+            d = dict([(gnx,i) for i,gnx in enumerate(gnxs) if gnx])
+            self.vnodes = [None] * len(gnxs)
+            self.digests = list(digests)
+            for v,level,childIndex in c.walk(unique=True):
+                i = d.get(v.fileIndex)
+                if (i is not None and self.vnodes[i] is None and
+                    digests[i] == digest(v._headString + '\n' + v._bodyString)
+                ):
+                    self.vnodes[i] = v
+                    self.ids[v] = i
+            self.postings = dict([(word,fromBytes(s)) for word,s in postings.items()])
+        except Exception:
+            g.es_exception()
+            self.reset()
+    #@+node:ekr.20141225080001.16: *3* si.Queries
+    #@+node:ekr.20141225080001.17: *4* si.addTrigrams
+    def addTrigrams(self,word):
+        '''Add word to the trigram index.'''
+        d = self.trigrams
+        for i in range(len(word)-2):
+            aSet = d.get(word[i:i+3])
+            if aSet is None:
+                d[word[i:i+3]] = set([word])
+            else:
+                aSet.add(word)
+    #@+node:ekr.20141225080001.18: *4* si.findIds
+    def findIds(self,kind,s):
+        '''
+        Return the set of ids of all nodes that contain a word matching s,
+        or None if the index can not narrow the search.
+
+        kind is 'exact', 'prefix', 'suffix' or 'substring': how the words
+        must match s.
+        '''
+        # Searching more than half the nodes is faster without the index.
+        limit = len(self.ids) // 2
+        if kind == 'exact':
+            a = self.postings.get(s,[])
+            return None if len(a) > limit else set(a)
+        if len(s) < 3:
+            return None
+        if self.trigrams is None:
+            self.trigrams = {}
+            for word in self.postings:
+                self.addTrigrams(word)
+        # Find the words containing all trigrams of s.
+        sets = [self.trigrams.get(s[i:i+3],set()) for i in range(len(s)-2)]
+        sets.sort(key=len)
+        if len(sets[0]) > limit:
+            return None # Each word appears in at least one node.
+        words = set(sets[0])
+        for aSet in sets[1:]:
+            words &= aSet
+            if not words:
+                break
+        if kind == 'prefix':
+            words = [z for z in words if z.startswith(s)]
+        elif kind == 'suffix':
+            words = [z for z in words if z.endswith(s)]
+        else:
+            words = [z for z in words if s in z]
+        if sum([len(self.postings[z]) for z in words]) > limit:
+            return None
+        result = set()
+        for word in words:
+            result.update(self.postings[word])
+        return result
+    #@+node:ekr.20141225080001.19: *4* si.requiredLiterals
+    def requiredLiterals(self,pattern):
+        '''
+        Return a list of strings that every match of the regular expression
+        pattern must contain, or None if the pattern is too complex.
+        '''
+        if '|' in pattern or re.search(r'\(\?[a-zA-Z]*x',pattern):
+            return None
+        result,run = [],[]
+        i,n = 0,len(pattern)
+
+        def endRun():
+            if run:
+                result.append(''.join(run))
+                del run[:]
+
+        def skipQuantifier(i):
+            if i < n and pattern[i] == '{':
+                j = pattern.find('}',i)
+                i = n if j == -1 else j + 1
+            elif i < n and pattern[i] in '*+?':
+                i += 1
+            if i < n and pattern[i] in '?+':
+                i += 1 # A lazy or possessive quantifier.
+            return i
+
+        def isOptional(i):
+            return i < n and pattern[i] in '*?{'
+
+        while i < n:
+            ch = pattern[i]
+            if ch == '\\':
+                if i + 1 < n and not pattern[i+1].isalnum():
+                    # An escaped literal.
+                    ch = pattern[i+1]
+                    i += 2
+                else:
+                    # A character class, an anchor, a backreference, etc.
+                    endRun()
+                    i = skipQuantifier(i + 2)
+                    continue
+            elif ch == '[':
+                endRun()
+                j = i + 1
+                if j < n and pattern[j] == '^':
+                    j += 1
+                if j < n and pattern[j] == ']':
+                    j += 1
+                while j < n and pattern[j] != ']':
+                    j += 2 if pattern[j] == '\\' else 1
+                i = skipQuantifier(j + 1)
+                continue
+            elif ch == '(':
+                endRun()
+                j,level = i + 1,1
+                while j < n and level > 0:
+                    if pattern[j] == '\\':
+                        j += 1
+                    elif pattern[j] == '(':
+                        level += 1
+                    elif pattern[j] == ')':
+                        level -= 1
+                    j += 1
+                inner = pattern[i+1:j-1]
+                if not isOptional(j):
+                    # The group must match: look inside it.
+                    m = re.match(r'\?(P<\w+>|[a-zA-Z-]*:)',inner)
+                    if m:
+                        inner = inner[m.end():]
+                    if not inner.startswith('?'):
+                        result.extend(self.requiredLiterals(inner) or [])
+                i = skipQuantifier(j)
+                continue
+            elif ch in '.^$*+?{)':
+                endRun()
+                i = skipQuantifier(i + 1) if ch in '.)' else i + 1
+                continue
+            else:
+                i += 1
+            # ch is a literal character.
+            if isOptional(i):
+                endRun()
+                i = skipQuantifier(i)
+            else:
+                run.append(ch)
+                if i < n and pattern[i] == '+':
+                    endRun()
+                    i = skipQuantifier(i)
+        endRun()
+        return result
+    #@+node:ekr.20141225080001.20: *4* si.wordConstraints
+    def wordConstraints(self,s,word):
+        '''
+        Return a list of (kind,w) tuples describing the words that must
+        appear in any text containing s. See si.findIds.
+        '''
+        s = fold(s)
+        result = []
+        for m in word_pattern.finditer(s):
+            left = word or m.start() > 0
+            right = word or m.end() < len(s)
+            if left and right:
+                kind = 'exact'
+            elif left:
+                kind = 'prefix'
+            elif right:
+                kind = 'suffix'
+            else:
+                kind = 'substring'
+            result.append((kind,m.group(0)))
+        return result
+    #@-others
+#@+node:ekr.20141225080001.21: ** digest, fromBytes & toBytes
+def digest(s):
+    '''Return the md5 digest of s.'''
+    return hashlib.md5(g.toEncodedString(s,reportErrors=False)).digest()
+
+def fromBytes(s):
+    '''Return an array of ids from s, the result of toBytes.'''
+    a = array.array('i')
+    if hasattr(a,'frombytes'):
+        a.frombytes(s)
+    else:
+        a.fromstring(s) # Python 2.
+    return a
+
+def toBytes(a):
+    '''Return the contents of a, an array of ids, as bytes.'''
+    return a.tobytes() if hasattr(a,'tobytes') else a.tostring()
+#@-others
+#@-leo
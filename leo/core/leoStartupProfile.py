@@ -0,0 +1,229 @@
+#@+leo-ver=5-thin
+#@+node:ekr.20141230140001.3: * @file leoStartupProfile.py
+'''
+Structured timings of Leo's startup, enabled by the --startup-profile=FILE
+command-line option.
+
+runLeo.py creates g.app.startupProfile before importing any other Leo
+module, so the profile includes the import time of every module. The
+LoadManager, the plugins controller and the settings code time their
+work with sp.begin and sp.end. When startup is complete, lm.load calls
+sp.finish and writes the profile to FILE as a JSON dict with these keys:
+
+phases:   the phases of startup, in the order they started.
+imports:  one entry for each import that loaded at least one module.
+plugins:  one entry for each plugin loaded during startup.
+settings: one entry for each settings file read or parsed.
+total:    the wall and cpu time from the creation of the profile.
+
+Entries contain name, start, wall and cpu keys. Times are in seconds;
+start is relative to the creation of the profile. Phases have a depth
+key: nested phases have larger depths. Imports have self and cumulative
+keys instead: self excludes the time taken by nested imports.
+
+The show-startup-profile command shows a summary in the log.
+
+This module must not import other Leo modules.
+'''
+#@+<< imports >>
+#@+node:ekr.20141230140001.4: ** << imports >> (leoStartupProfile)
+import importlib
+import os
+import sys
+import time
+try:
+    import builtins # Python 3.
+except ImportError:
+    import __builtin__ as builtins # Python 2.
+# json and threading are imported when needed.
+#@-<< imports >>
+
+cpu_clock = getattr(time,'process_time',None) or time.clock
+wall_clock = getattr(time,'perf_counter',None) or time.time
+
+#@+others
+#@+node:ekr.20141230140001.5: ** getProfileFileName
+def getProfileFileName (argv):
+    '''Return the FILE of the --startup-profile=FILE option in argv, or None.'''
+    tag = '--startup-profile'
+    for i,arg in enumerate(argv):
+        if arg.startswith(tag + '='):
+            return arg[len(tag)+1:] or None
+        elif arg == tag and i + 1 < len(argv):
+            return argv[i+1]
+    return None
+#@+node:ekr.20141230140001.6: ** class StartupProfile
+class StartupProfile(object):
+    '''Per-phase, per-import, per-plugin and per-settings-file timings.'''
+    #@+others
+    #@+node:ekr.20141230140001.7: *3* sp.ctor
+    def __init__(self,fileName=None):
+        '''Ctor for the StartupProfile class.'''
+        self.cpu0 = cpu_clock()
+        self.wall0 = wall_clock()
+        self.entries = {'phases':[],'plugins':[],'settings':[]}
+            # Keys are kinds; values are lists of entries.
+        self.fileName = fileName and os.path.abspath(fileName)
+        self.finished = False
+        self.imports = {}
+            # Keys are module names; values are [self,cumulative].
+        self.importStack = []
+            # One [childTime] list for each import in progress.
+        self.oldImport = None
+        self.oldImportModule = None
+        self.stack = []
+            # (kind,name,entry) for all unfinished entries.
+        self.currentThread = None
+            # threading.current_thread, set by installImportHook.
+        self.thread = None
+        self.total = None
+    #@+node:ekr.20141230140001.8: *3* sp.begin & end
+    def begin(self,kind,name):
+        '''Start timing name. kind is 'phases', 'plugins' or 'settings'.'''
+        if self.finished:
+            return
+        t = wall_clock()
+        entry = {'name':name,'start':t-self.wall0,'wall':t,'cpu':cpu_clock()}
+        if kind == 'phases':
+            entry['depth'] = len([z for z in self.stack if z[0] == 'phases'])
+        self.entries[kind].append(entry)
+        self.stack.append((kind,name,entry))
+
+    def end(self,kind,name,**keys):
+        '''
+        Stop timing name. Add keys to its entry. Entries started after
+        name and not yet ended are discarded.
+        '''
+        t,cpu = wall_clock(),cpu_clock()
+        for i in range(len(self.stack)-1,-1,-1):
+            kind2,name2,entry = self.stack[i]
+            if kind2 == kind and name2 == name:
+                for kind3,name3,entry3 in self.stack[i+1:]:
+                    self.entries[kind3].remove(entry3)
+                del self.stack[i:]
+                entry['wall'] = t - entry['wall']
+                entry['cpu'] = cpu - entry['cpu']
+                entry.update(keys)
+                return
+    #@+node:ekr.20141230140001.9: *3* sp.finish
+    def finish(self):
+        '''
+        Stop profiling and return the profile as a dict.
+        Write the dict as JSON if the profile has a file name.
+        Raise IOError if the file can not be written.
+        '''
+        if not self.finished:
+            for kind,name,entry in reversed(list(self.stack)):
+                self.end(kind,name)
+            self.removeImportHook()
+            self.total = {
+                'cpu': cpu_clock() - self.cpu0,
+                'wall': wall_clock() - self.wall0,
+            }
+            self.finished = True
+            if self.fileName:
+                import json
+                f = open(self.fileName,'w')
+                try:
+                    json.dump(self.toDict(),f,indent=1,sort_keys=True)
+                finally:
+                    f.close()
+        return self.toDict()
+    #@+node:ekr.20141230140001.10: *3* sp.Import hook
+    #@+node:ekr.20141230140001.11: *4* sp.installImportHook & removeImportHook
+    def installImportHook(self):
+        '''Time all imports in this thread until self.removeImportHook.'''
+        import threading
+        if self.oldImport:
+            return
+        self.currentThread = threading.current_thread
+        self.thread = self.currentThread()
+        self.oldImport = builtins.__import__
+        self.oldImportModule = importlib.import_module
+        builtins.__import__ = self.importHook
+        importlib.import_module = self.importModuleHook
+
+    def removeImportHook(self):
+        '''Restore the import functions replaced by installImportHook.'''
+        if self.oldImport:
+            builtins.__import__ = self.oldImport
+            importlib.import_module = self.oldImportModule
+            self.oldImport = self.oldImportModule = None
+    #@+node:ekr.20141230140001.12: *4* sp.importHook & importModuleHook
+    def importHook(self,name,globals=None,locals=None,fromlist=(),level=0):
+        '''Replaces __import__.'''
+        f = self.oldImport
+        if level > 0 and globals:
+            # A relative import: compute the module's full name.
+            package = globals.get('__package__') or globals.get('__name__','')
+            package = package.rsplit('.',level-1)[0]
+            fullName = package + '.' + name if name else package
+        else:
+            fullName = name
+        return self.timeImport(fullName,f,name,globals,locals,fromlist,level)
+
+    def importModuleHook(self,name,package=None):
+        '''Replaces importlib.import_module.'''
+        return self.timeImport(name,self.oldImportModule,name,package)
+    #@+node:ekr.20141230140001.13: *4* sp.timeImport
+    def timeImport(self,fullName,f,*args):
+        '''Call f(*args), timing the import of fullName.'''
+        # Imports here would call this method recursively.
+        if self.currentThread() is not self.thread:
+            return f(*args)
+        n = len(sys.modules)
+        data = [0.0] # The time taken by nested imports.
+        self.importStack.append(data)
+        t1 = wall_clock()
+        try:
+            return f(*args)
+        finally:
+            t = wall_clock() - t1
+            self.importStack.pop()
+            if self.importStack:
+                self.importStack[-1][0] += t
+            if len(sys.modules) > n:
+                # The import loaded at least one module.
+                aList = self.imports.setdefault(fullName,[0.0,0.0])
+                aList[0] += t - data[0]
+                aList[1] += t
+    #@+node:ekr.20141230140001.14: *3* sp.summary
+    def summary(self,n=10):
+        '''Return a list of lines summarizing the profile, showing the n slowest items.'''
+        d = self.toDict()
+        result = []
+        put = result.append
+        total = d.get('total')
+        if total:
+            put('startup: %7.3fs wall %7.3fs cpu' % (total['wall'],total['cpu']))
+        if self.fileName:
+            put('startup profile: %s' % self.fileName)
+        put('phases: wall, cpu')
+        for entry in d['phases']:
+            put('%7.3fs %7.3fs %s%s' % (
+                entry['wall'],entry['cpu'],' '*2*entry['depth'],entry['name']))
+        imports = d['imports']
+        put('imports: %7.3fs, %s modules. Slowest: self, cumulative' % (
+            sum([z['self'] for z in imports]),len(imports)))
+        for entry in sorted(imports,key=lambda z:-z['self'])[:n]:
+            put('%7.3fs %7.3fs %s' % (entry['self'],entry['cumulative'],entry['name']))
+        for kind in ('plugins','settings'):
+            aList = d[kind]
+            put('%s: %7.3fs, %s entries. Slowest: wall, cpu' % (
+                kind,sum([z['wall'] for z in aList]),len(aList)))
+            for entry in sorted(aList,key=lambda z:-z['wall'])[:n]:
+                put('%7.3fs %7.3fs %s' % (entry['wall'],entry['cpu'],entry['name']))
+        return result
+    #@+node:ekr.20141230140001.15: *3* sp.toDict
+    def toDict(self):
+        '''Return the profile as a dict that can be written as JSON.'''
+        d = {'total': self.total}
+        unfinished = set([id(z[2]) for z in self.stack])
+        for kind in self.entries:
+            d[kind] = [dict(z) for z in self.entries[kind] if id(z) not in unfinished]
+        d['imports'] = [{'name':name,'self':aList[0],'cumulative':aList[1]}
+            for name,aList in sorted(self.imports.items())]
+        return d
+    #@-others
+#@-others
+#@-leo
@@ -13,15 +13,13 @@ import leo.core.leoGlobals as g
 
 import leo.core.leoGui as leoGui # For UnitTestGui.
 
-import doctest
+# doctest, cProfile and timeit are imported when needed.
 import gc
 import glob
 import os
-import cProfile as profile
 # import pstats # A Python distro bug: can fail on Ubuntu.
 # import re
 import sys
-import timeit
 import tokenize
 import unittest
 
@@ -916,6 +914,7 @@ class TestManager:
             g.es_print('https://bugs.launchpad.net/ubuntu/+source/python-defaults/+bug/123755')
             g.es_print('try installing pstats yourself')
             return
+        import cProfile as profile
 
         s = p.b.rstrip() + '\n'
 
@@ -934,6 +933,7 @@ class TestManager:
 
     def runTimerOnNode (self,p,count):
 
+        import timeit
         c = self.c
         s = p.b.rstrip() + '\n'
 
@@ -959,6 +959,7 @@ class TestManager:
     #@+node:ekr.20051104075904.99: *4* TM.createUnitTestsFromDoctests
     def createUnitTestsFromDoctests(self,modules,verbose=True):
 
+        import doctest
         created = False # True if suite is non-empty.
 
         suite = unittest.makeSuite(unittest.TestCase)
@@ -0,0 +1,1187 @@
+# -*- coding: utf-8 -*-
+#@+leo-ver=5-thin
+#@+node:ekr.20141231120001.1: * @file leoTokenizer.py
+#@@first
+'''
+A gui-independent tokenizer for the colorizer modes in leo/modes.
+
+The Tokenizer class colors text as leoColorizer.JEditColorizer does,
+but it returns (start,end,tag) runs instead of setting Qt formats::
+
+    import leo.core.leoTokenizer as leoTokenizer
+    runs,states = leoTokenizer.tokenize('python',s)
+
+runs is a list of (start,end,tag) tuples, in the order in which the
+jEdit colorizer would color them. Runs may overlap: later runs override
+earlier runs, as with QSyntaxHighlighter.setFormat. states is a list
+containing the state at the end of each line of s. Pass a state as the
+start_state argument to tokenize the text following that line.
+
+When the tokenizer first uses a ruleset, it calls each rule function of
+the ruleset with a RuleRecorder, which records the matcher the function
+calls and the matcher's arguments. From these records, the Ruleset class
+compiles a master regex that matches wherever any rule of the ruleset
+could succeed. The main loop jumps from one such position to the next
+and calls rule functions only there. Regular expressions in rules are
+compiled once, not once per call.
+
+This module must not import Qt.
+'''
+#@@language python
+#@@tabwidth -4
+#@@pagewidth 80
+#@+<< imports >>
+#@+node:ekr.20141231120001.2: ** << imports >> (leoTokenizer)
+import leo.core.leoGlobals as g
+import re
+import string
+#@-<< imports >>
+
+defaultTokenizer = None
+    # The Tokenizer used by tokenize when no commander is given.
+regexCache = {}
+    # Keys are (pattern,flags). Values are compiled regexes, or None.
+url_scan_regex = re.compile(r"""(?:file|ftp|http|https)://[^\s'"]+[\w=/]""")
+    # The urls that colorRangeWithTag finds within colored text.
+
+#@+others
+#@+node:ekr.20141231120001.3: ** tokenize
+def tokenize(language,text,start_state=None,c=None,p=None,showInvisibles=False):
+    '''
+    Tokenize text as the given language, starting in start_state.
+    Return (runs,states), as described in the module's docstring.
+
+    c and p are used only to find the definitions of section references.
+    Callers that tokenize many texts for the same commander should
+    create a Tokenizer themselves.
+    '''
+    global defaultTokenizer
+    if c:
+        tokenizer = Tokenizer(c,p=p,showInvisibles=showInvisibles)
+    else:
+        if not defaultTokenizer:
+            defaultTokenizer = Tokenizer()
+        tokenizer = defaultTokenizer
+        tokenizer.showInvisibles = showInvisibles
+    return tokenizer.tokenize(language,text,start_state)
+#@+node:ekr.20141231120001.4: ** compileRegex
+def compileRegex(pattern,flags=0):
+    '''Return the compiled regex for pattern, or None if pattern is invalid.'''
+    key = pattern,flags
+    try:
+        return regexCache[key]
+    except KeyError:
+        pass
+    try:
+        regex = re.compile(pattern,flags)
+    except Exception:
+        # Do not call g.es here!
+        g.trace('Invalid regular expression: %s' % (pattern))
+        regex = None
+    regexCache[key] = regex
+    return regex
+#@+node:ekr.20141231120001.5: ** class RuleRecorder
+class RuleRecorder:
+    '''
+    A stand-in for a colorer, passed to the rule functions of a mode.
+    It records the matcher a rule function calls.
+    '''
+    def __init__(self):
+        '''Ctor for the RuleRecorder class.'''
+        self.calls = []
+
+    def __getattr__(self,name):
+        if not name.startswith('match_'):
+            raise AttributeError(name)
+        def recorder(s,i,*args,**keys):
+            self.calls.append((name,args,keys))
+            return 0
+        return recorder
+#@+node:ekr.20141231120001.6: ** class Ruleset
+class Ruleset:
+    '''The compiled form of one ruleset of a colorizer mode.'''
+    #@+others
+    #@+node:ekr.20141231120001.7: *3* ruleset.ctor & helpers
+    def __init__(self,tokenizer,language,rulesetName,mode):
+        '''Ctor for the Ruleset class. mode is None for unknown languages.'''
+        self.language = language
+        self.mode = mode
+        self.rulesetName = rulesetName
+        self.tokenizer = tokenizer
+        if mode:
+            self.properties = hasattr(mode,'properties') and mode.properties or {}
+            self.keywordsDict = self.setKeywords(
+                hasattr(mode,'keywordsDictDict') and mode.keywordsDictDict.get(rulesetName,{}) or {})
+            self.attributesDict = hasattr(mode,'attributesDictDict') and mode.attributesDictDict.get(rulesetName) or {}
+            self.rulesDict = hasattr(mode,'rulesDictDict') and mode.rulesDictDict.get(rulesetName) or {}
+        else:
+            # Unknown languages have no rules, not even Leo's rules.
+            self.properties,self.attributesDict,self.rulesDict = {},{},{}
+            self.keywordsDict = self.setKeywords({})
+        self.hasLeoRules = bool(mode)
+        if mode and language == 'haskell':
+            # JEditColorizer.match_keywords adds "'" to word_chars for Haskell.
+            self.word_chars["'"] = "'"
+        self.setModeAttributes()
+        self.wordClass = '[%s]' % ''.join([re.escape(ch) for ch in sorted(self.word_chars)])
+        self.wordRegex = re.compile('%s*' % self.wordClass)
+        self.masters = {}
+            # Keys are showInvisibles, values are compiled master regexes.
+        self.rules = {}
+            # Keys are characters, values are lists of (function,keys).
+    #@+node:ekr.20141231120001.8: *4* ruleset.setKeywords
+    def setKeywords(self,d):
+        '''
+        Return a copy of the keywords dict d, including all Leo directives.
+
+        Set self.word_chars to string.letters + string.digits plus any other
+        character appearing in any keyword.
+        '''
+        d = dict(d)
+        for s in g.globalDirectiveList:
+            key = '@' + s
+            if key not in d:
+                d [key] = 'leokeyword'
+        chars = [g.toUnicode(ch) for ch in (string.ascii_letters + string.digits)]
+        for key in list(d.keys()):
+            for ch in key:
+                if ch not in chars:
+                    chars.append(g.toUnicode(ch))
+        for ch in (' ', '\t'):
+            if ch in chars:
+                chars.remove(ch)
+        self.word_chars = dict([(z,z) for z in chars])
+        return d
+    #@+node:ekr.20141231120001.9: *4* ruleset.setModeAttributes
+    def setModeAttributes(self):
+        '''Set the ivars from self.attributesDict,
+        converting 'true'/'false' to True and False.'''
+        d = self.attributesDict
+        aList = (
+            ('default',         'null'),
+            ('digit_re',        ''),
+            ('escape',          ''),
+            ('highlight_digits',True),
+            ('ignore_case',     True),
+            ('no_word_sep',     ''),
+        )
+        for key, default in aList:
+            val = d.get(key,default)
+            if val in ('true','True'): val = True
+            if val in ('false','False'): val = False
+            setattr(self,key,val)
+    #@+node:ekr.20141231120001.10: *3* ruleset.compileRules & helpers
+    def compileRules(self,ch):
+        '''
+        Return the list of (function,keys) tuples for character ch, in the
+        order in which JEditColorizer.mainLoop calls the rules for ch.
+        '''
+        tokenizer = self.tokenizer
+        cls = tokenizer.__class__
+        # Ignore Leo rules that JEditColorizer.addLeoRules inserts into the mode's lists.
+        aList = [f for f in self.rulesDict.get(ch,[])
+            if getattr(f,'__module__',None) != 'leo.core.leoColorizer']
+        result = []
+        for f in aList:
+            data = self.recordRule(f)
+            if data:
+                name,keys = data
+                result.append((getattr(cls,name),keys))
+            else:
+                result.append((f,{}))
+        if self.hasLeoRules:
+            for ch2,name,atFront in tokenizer.leoRulesTable:
+                if ch2 == ch:
+                    data = getattr(cls,name),{}
+                    if atFront:
+                        result.insert(0,data)
+                    else:
+                        result.append(data)
+        return result
+    #@+node:ekr.20141231120001.11: *4* ruleset.recordRule
+    def recordRule(self,f):
+        '''
+        Return (name,keys) if rule function f just calls the matcher called
+        name, with keyword arguments keys. Otherwise, return None.
+        '''
+        recorder = RuleRecorder()
+        try:
+            f(recorder,'',0)
+        except Exception:
+            return None
+        if len(recorder.calls) == 1:
+            name,args,keys = recorder.calls[0]
+            if not args and name in self.tokenizer.matchers:
+                return name,keys
+        return None
+    #@+node:ekr.20141231120001.12: *4* ruleset.rulesFor
+    def rulesFor(self,ch):
+        '''Return the list of (function,keys) tuples for ch.'''
+        aList = self.rules.get(ch)
+        if aList is None:
+            aList = self.rules[ch] = self.compileRules(ch)
+        return aList
+    #@+node:ekr.20141231120001.13: *3* ruleset.getMaster & helpers
+    def getMaster(self,showInvisibles):
+        '''
+        Return a regex matching at all positions at which any rule could
+        return a non-zero value. Return None if the rules dict is not a
+        dict: in that case, any character may have rules.
+
+        Each alternative of the regex starts with a literal character, so
+        that the re module can skip quickly to the next candidate.
+        '''
+        showInvisibles = bool(showInvisibles)
+        if showInvisibles in self.masters:
+            return self.masters.get(showInvisibles)
+        if isinstance(self.rulesDict,dict):
+            chars = set(self.rulesDict.keys())
+            if self.hasLeoRules:
+                chars.update([z[0] for z in self.tokenizer.leoRulesTable])
+            aList = []
+            for ch in sorted(chars):
+                tails = []
+                for f,keys in self.rulesFor(ch):
+                    tail = self.fragment(ch,f,keys,showInvisibles)
+                    if tail == '':
+                        tails = [''] # This rule may match wherever s[i] == ch.
+                        break
+                    elif tail is not None:
+                        tails.append(tail)
+                if tails == ['']:
+                    aList.append(re.escape(ch))
+                elif tails:
+                    aList.append('%s(?:%s)' % (re.escape(ch),'|'.join(tails)))
+            master = re.compile('|'.join(aList) if aList else '(?!)')
+        else:
+            master = None
+        self.masters[showInvisibles] = master
+        return master
+    #@+node:ekr.20141231120001.14: *4* ruleset.fragment
+    def fragment(self,ch,f,keys,showInvisibles):
+        '''
+        Return a regex that matches just after s[i] == ch if rule f could
+        return a non-zero value at i. Return None if f never can. The regex
+        may match more often than the rule succeeds.
+        '''
+        name = f.__name__
+        leoPattern = self.tokenizer.leoFragments.get(name)
+        if leoPattern is not None:
+            return leoPattern
+        if name in ('match_blanks','match_tabs'):
+            return '' if showInvisibles else None
+        if name == 'match_mark_previous':
+            return None # Always fails.
+        if name not in self.tokenizer.matchers or not keys:
+            # Keywords, unknown rule functions, or functions with unusual arguments.
+            if name == 'match_keywords':
+                if ch not in self.word_chars:
+                    return None
+                return r'(?<!%s[\s\S])' % self.wordClass
+            return ''
+        if name in ('match_seq_regexp','match_eol_span_regexp','match_span_regexp'):
+            flags = re.MULTILINE | (re.IGNORECASE if self.ignore_case else 0)
+            pattern = keys.get('begin') if name == 'match_span_regexp' else keys.get('regexp')
+            if not pattern or not compileRegex(pattern,flags):
+                return None
+            return self.before(1,keys)
+        if name in ('match_line','match_compiled_regexp'):
+            return ''
+        seq = keys.get({
+            'match_eol_span':'seq',
+            'match_mark_following':'pattern',
+            'match_seq':'seq',
+            'match_span':'begin',
+            'match_word_and_regexp':'word',
+        }.get(name),'')
+        if not seq or not seq.startswith(ch):
+            return None # g.match fails for empty patterns.
+        wc = self.wordClass
+        after = r'(?!%s[\s\S])' % wc if keys.get('at_word_start') else ''
+        if name == 'match_seq':
+            # match_seq ignores at_line_start and at_whitespace_end!
+            return re.escape(seq[1:]) + after
+        if name == 'match_mark_following':
+            after += '(?=%s)' % wc # getNextToken must find a word.
+        elif name == 'match_word_and_regexp':
+            after = '' # match_word_and_regexp ignores the following character.
+        return re.escape(seq[1:]) + self.before(len(seq),keys) + after
+    #@+node:ekr.20141231120001.15: *4* ruleset.before
+    def before(self,n,keys):
+        '''
+        Return lookbehind assertions, placed n characters after the start
+        of the match, for the at_line_start and at_word_start arguments.
+        '''
+        result = []
+        tail = r'[\s\S]{%s}' % n if n else ''
+        if keys.get('at_line_start'):
+            result.append('(?<![^\n]%s)' % tail)
+        if keys.get('at_word_start'):
+            result.append('(?<!%s%s)' % (self.wordClass,tail))
+        return ''.join(result)
+    #@-others
+#@+node:ekr.20141231120001.16: ** class Tokenizer
+class Tokenizer:
+    '''
+    Color text using the rules in leo/modes, without a gui.
+
+    The matchers are those of leoColorizer.JEditColorizer. Instead of
+    setting Qt formats, they append (start,end,tag) runs to self.runs.
+    '''
+    #@+<< Tokenizer tables >>
+    #@+node:ekr.20141231120001.17: *3* << Tokenizer tables >>
+    leoRulesTable = (
+        # Rules added at front are added in **reverse** order.
+        ('@',  'match_leo_keywords',    True), # Called after all other Leo matchers.
+        ('@',  'match_at_color',        True),
+        ('@',  'match_at_killcolor',    True),
+        ('@',  'match_at_language',     True),
+        ('@',  'match_at_nocolor',      True),
+        ('@',  'match_at_nocolor_node', True),
+        ('@',  'match_doc_part',        True),
+        ('f',  'match_url_f',           True),
+        ('g',  'match_url_g',           True),
+        ('h',  'match_url_h',           True),
+        ('m',  'match_url_m',           True),
+        ('n',  'match_url_n',           True),
+        ('p',  'match_url_p',           True),
+        ('t',  'match_url_t',           True),
+        ('w',  'match_url_w',           True),
+        ('<',  'match_section_ref',     True), # Called **first**.
+        # Rules added at back are added in normal order.
+        (' ',  'match_blanks',          False),
+        ('\t', 'match_tabs',            False),
+    )
+        # The same table as in JEditColorizer.addLeoRules.
+
+    matchers = (
+        'match_compiled_regexp',
+        'match_eol_span','match_eol_span_regexp',
+        'match_keywords','match_line',
+        'match_mark_following','match_mark_previous',
+        'match_seq','match_seq_regexp',
+        'match_span','match_span_regexp',
+        'match_word_and_regexp',
+    )
+        # The matchers that mode files may call.
+
+    url_kinds = r"""://[^\s'"]+[\w=/]"""
+    url_regex_f = re.compile(r'(?:file|ftp)' + url_kinds)
+    url_regex_g = re.compile(r'gopher' + url_kinds)
+    url_regex_h = re.compile(r'(?:http|https)' + url_kinds)
+    url_regex_m = re.compile(r'mailto' + url_kinds)
+    url_regex_n = re.compile(r'(?:news|nntp)' + url_kinds)
+    url_regex_p = re.compile(r'prospero' + url_kinds)
+    url_regex_t = re.compile(r'telnet' + url_kinds)
+    url_regex_w = re.compile(r'wais' + url_kinds)
+
+    leoFragments = {
+        'match_at_color':           r'(?<![\s\S]{2})',
+        'match_at_killcolor':       r'(?<![^\n][\s\S])',
+        'match_at_language':        r'(?<![\s\S]{2})',
+        'match_at_nocolor':         r'(?<![\s\S]{2})',
+        'match_at_nocolor_node':    r'(?<![^\n][\s\S])',
+        'match_doc_part':           r'(?<![\s\S]{2})',
+        'match_leo_keywords':       r'(?<![^ \t\n][\s\S])',
+        'match_section_ref':        r'<',
+        'match_url_f':              r'(?:ile|tp)' + url_kinds,
+        'match_url_g':              r'opher' + url_kinds,
+        'match_url_h':              r'(?:ttp|ttps)' + url_kinds,
+        'match_url_m':              r'ailto' + url_kinds,
+        'match_url_n':              r'(?:ews|ntp)' + url_kinds,
+        'match_url_p':              r'rospero' + url_kinds,
+        'match_url_t':              r'elnet' + url_kinds,
+        'match_url_w':              r'ais' + url_kinds,
+    }
+        # Regex fragments for Leo's rules, matching just after the rule's character.
+    #@-<< Tokenizer tables >>
+    #@+others
+    #@+node:ekr.20141231120001.18: *3*  tok.Birth & modes
+    #@+node:ekr.20141231120001.19: *4* tok.__init__
+    def __init__(self,c=None,p=None,showInvisibles=False):
+        '''Ctor for the Tokenizer class.'''
+        self.c = c
+        self.p = p
+            # The root for g.findReference. None means c.p.
+        self.showInvisibles = showInvisibles
+        self.use_hyperlinks = bool(c and c.config.getBool('use_hyperlinks'))
+        self.leoKeywordsDict = dict([(key,'leokeyword') for key in g.globalDirectiveList])
+        self.emptyRuleset = Ruleset(self,'unknown-language','',None)
+        # Mode data.
+        self.language_name = None
+        self.modeName = None # The language given by the state.
+        self.modeStack = []
+        self.rulesets = {} # Keys are ruleset names, values are Rulesets.
+        self.setRuleset(self.emptyRuleset)
+        # Per-line data.
+        self.prev = None # The previous token.
+        self.restartState = None
+        self.runs = []
+        self.searchCache = {} # Keys are id(regex), values are (s,i,m).
+        self.hasUrls = False # True if the line contains any url.
+    #@+node:ekr.20141231120001.20: *4* tok.init_mode & helpers
+    def init_mode(self,name):
+        '''Name may be a language name or a delegate name.'''
+        if not name: return False
+        language,rulesetName = self.nameToRulesetName(name)
+        ruleset = self.rulesets.get(rulesetName)
+        if ruleset:
+            if ruleset.language == 'unknown-language':
+                return False
+            self.setRuleset(ruleset)
+            self.language_name = language
+            return True
+        path = g.os_path_join(g.app.loadDir,'..','modes')
+        fn = g.os_path_join(path,'%s.py' % (language))
+        if g.os_path_exists(fn):
+            mode = g.importFromPath(moduleName=language,path=path)
+        else:
+            mode = None
+        return self.init_mode_from_module(name,mode)
+    #@+node:ekr.20141231120001.21: *5* tok.init_mode_from_module
+    def init_mode_from_module(self,name,mode):
+        '''Name may be a language name or a delegate name.
+           Mode is a python module or class containing all
+           coloring rule attributes for the mode.
+        '''
+        language,rulesetName = self.nameToRulesetName(name)
+        if not mode:
+            # Create a dummy ruleset to limit recursion.
+            self.rulesets[rulesetName] = Ruleset(self,'unknown-language',rulesetName,None)
+            self.language_name = 'unknown-language'
+            return False
+        if hasattr(mode,'pre_init_mode') and self.c:
+            # A hack to give modes/forth.py access to c.
+            mode.pre_init_mode(self.c)
+        ruleset = Ruleset(self,language,rulesetName,mode)
+        self.rulesets[rulesetName] = ruleset
+        self.setRuleset(ruleset)
+        initialDelegate = ruleset.properties.get('initialModeDelegate')
+        if initialDelegate:
+            # Replace the original mode by the delegate mode.
+            self.init_mode(initialDelegate)
+            language2,rulesetName2 = self.nameToRulesetName(initialDelegate)
+            self.rulesets[rulesetName] = self.rulesets.get(rulesetName2)
+            self.language_name = language2
+        else:
+            self.language_name = language
+        return True
+    #@+node:ekr.20141231120001.22: *5* tok.nameToRulesetName & munge
+    def nameToRulesetName(self,name):
+        '''
+        Compute language and rulesetName from name, which is either a language
+        name or a delegate name.
+        '''
+        i = name.find('::')
+        if i == -1:
+            language = g.app.delegate_language_dict.get(name,name)
+            rulesetName = '%s_main' % (language)
+        else:
+            language = name[:i]
+            delegate = name[i+2:]
+            rulesetName = self.munge('%s_%s' % (language,delegate))
+        return language,rulesetName
+
+    def munge(self,s):
+        '''Munge a mode name so that it is a valid python id.'''
+        valid = string.ascii_letters + string.digits + '_'
+        return ''.join([ch.lower() if ch in valid else '_' for ch in s])
+    #@+node:ekr.20141231120001.23: *5* tok.setRuleset
+    def setRuleset(self,ruleset):
+        '''Make ruleset the present ruleset.'''
+        self.ruleset = ruleset
+        self.attributesDict = ruleset.attributesDict
+        self.escape = ruleset.escape
+        self.ignore_case = ruleset.ignore_case
+        self.keywordsDict = ruleset.keywordsDict
+        self.rulesetName = ruleset.rulesetName
+        self.word_chars = ruleset.word_chars
+    #@+node:ekr.20141231120001.24: *3* tok.Entry points
+    #@+node:ekr.20141231120001.25: *4* tok.initialState
+    def initialState(self,language):
+        '''Return the state at the start of text in the given language.'''
+        return language,None
+    #@+node:ekr.20141231120001.26: *4* tok.tokenize
+    def tokenize(self,language,text,state=None):
+        '''
+        Tokenize text, starting in state or in the initial state for language.
+        Return (runs,states), as described in the module's docstring.
+        '''
+        if state is None:
+            state = self.initialState(language)
+        runs,states = [],[]
+        offset = 0
+        for s in text.split('\n'):
+            lineRuns,state = self.tokenizeLine(s,state)
+            if offset:
+                runs.extend([(offset+i,offset+j,tag) for i,j,tag in lineRuns])
+            else:
+                runs.extend(lineRuns)
+            states.append(state)
+            offset += len(s) + 1
+        return runs,states
+    #@+node:ekr.20141231120001.27: *4* tok.tokenizeLine
+    def tokenizeLine(self,s,state):
+        '''
+        Tokenize a single line s, starting in the given state.
+        Return (runs,state), state being the state at the end of the line.
+        '''
+        modeName,restart = state
+        if modeName != self.modeName:
+            self.modeName = modeName
+            if not self.init_mode(modeName):
+                self.setRuleset(self.emptyRuleset)
+        self.runs = []
+        self.restartState = restart
+        self.searchCache = {}
+        self.hasUrls = url_scan_regex.search(s) is not None
+        if s.strip() or self.showInvisibles:
+            self.mainLoop(restart,s)
+        return self.runs,(self.modeName,self.restartState)
+    #@+node:ekr.20141231120001.28: *3* tok.Main loop
+    #@+node:ekr.20141231120001.29: *4* tok.colorRangeWithTag
+    def colorRangeWithTag(self,s,i,j,tag,delegate='',exclude_match=False):
+        '''Color s[i:j] with tag, or with the rules of the delegate.'''
+        if delegate:
+            self.modeStack.append((self.ruleset,self.modeName))
+            self.init_mode(delegate)
+            while 0 <= i < j and i < len(s):
+                ruleset = self.ruleset
+                master = ruleset.getMaster(self.showInvisibles)
+                if master:
+                    # Use the default tag up to the next possible match.
+                    m = self.search(master,s,i)
+                    k = min(j,len(s),m.start() if m else len(s))
+                    if k > i:
+                        default_tag = self.attributesDict.get('default')
+                        self.setTag(default_tag or tag,s,i,k)
+                        i = k
+                        continue
+                progress = i
+                for f,keys in ruleset.rulesFor(s[i]):
+                    n = f(self,s,i,**keys)
+                    if n is None:
+                        g.trace('Can not happen: delegate matcher returns None')
+                    elif n > 0:
+                        i += n ; break
+                else:
+                    # Use the *delegate's* default characters if possible.
+                    default_tag = self.attributesDict.get('default')
+                    self.setTag(default_tag or tag,s,i,i+1)
+                    i += 1
+                assert i > progress
+            ruleset,self.modeName = self.modeStack.pop()
+            self.setRuleset(ruleset)
+        elif not exclude_match:
+            self.setTag(tag,s,i,j)
+        if tag != 'url' and self.hasUrls:
+            # Allow URL's *everywhere*.
+            j = min(j,len(s))
+            while i < j:
+                m = self.search(url_scan_regex,s,i)
+                if not m or m.start() >= j:
+                    break
+                self.colorRangeWithTag(s,m.start(),m.end(),'url')
+                self.prev = (m.start(),m.end(),'url')
+                i = m.end()
+    #@+node:ekr.20141231120001.30: *4* tok.mainLoop & restart
+    def mainLoop(self,restart,s):
+        '''Colorize a *single* line s, starting in the given restart state.'''
+        i = 0
+        if restart:
+            i = self.restart(restart,s)
+        if i == 0:
+            self.restartState = restart
+        ruleset,master = None,None
+        while i < len(s):
+            if ruleset is not self.ruleset:
+                # A delegate or @language has changed the ruleset.
+                ruleset = self.ruleset
+                master = ruleset.getMaster(self.showInvisibles)
+            if master:
+                m = self.search(master,s,i)
+                if not m:
+                    break
+                i = m.start()
+            rules = ruleset.rules.get(s[i])
+            if rules is None:
+                rules = ruleset.rulesFor(s[i])
+            for f,keys in rules:
+                n = f(self,s,i,**keys)
+                if n is None:
+                    g.trace('Can not happen: n is None',repr(f))
+                    i += 1
+                    break
+                elif n > 0: # Success.
+                    i += n
+                    break
+                elif n < 0: # Fail and skip n chars.
+                    i += -n
+                    break
+            else:
+                i += 1
+
+    def search(self,regex,s,i):
+        '''
+        Return regex.search(s,i), reusing the previous search of s if possible.
+
+        Delegates and URL scans search the same line repeatedly. Without the
+        cache, long lines would take quadratic time.
+        '''
+        data = self.searchCache.get(id(regex))
+        if data:
+            s2,i2,m = data
+            if s2 is s and i2 <= i and (not m or m.start() >= i):
+                return m
+        m = regex.search(s,i)
+        self.searchCache[id(regex)] = s,i,m
+        return m
+
+    def restart(self,restart,s):
+        '''Call the restarter given by restart. Return the new i.'''
+        kind = restart[0]
+        if kind == 'span':
+            return self.restart_match_span(s,*restart[1:])
+        else:
+            f = {
+                'docpart':      self.restartDocPart,
+                'killcolor':    self.restartKillColor,
+                'nocolor':      self.restartNoColor,
+                'nocolor-node': self.restartNoColorNode,
+            }.get(kind)
+            return f(s) if f else 0
+    #@+node:ekr.20141231120001.31: *4* tok.setTag & state
+    def setTag(self,tag,s,i,j):
+        '''Append a (start,end,tag) run to self.runs.'''
+        j = min(j,len(s))
+        if i < j and tag:
+            self.runs.append((i,j,tag.lower()))
+
+    def clearState(self):
+        self.restartState = None
+
+    def setRestart(self,*args):
+        self.restartState = args
+    #@+node:ekr.20141231120001.32: *3* tok.Leo rule functions
+    #@+node:ekr.20141231120001.33: *4* tok.match_at_color
+    def match_at_color(self,s,i):
+        seq = '@color'
+        # Only matches at start of line.
+        if i != 0: return 0
+        if g.match_word(s,i,seq):
+            j = i + len(seq)
+            self.colorRangeWithTag(s,i,j,'leokeyword')
+            self.clearState()
+            return j - i
+        else:
+            return 0
+    #@+node:ekr.20141231120001.34: *4* tok.match_at_language
+    def match_at_language(self,s,i):
+        seq = '@language'
+        # Only matches at start of line.
+        if i != 0: return 0
+        if g.match_word(s,i,seq):
+            j = i + len(seq)
+            j = g.skip_ws(s,j)
+            k = g.skip_c_id(s,j)
+            name = s[j:k]
+            ok = self.init_mode(name)
+            if ok:
+                self.modeName = name
+                self.colorRangeWithTag(s,i,k,'leokeyword')
+            self.clearState()
+            return k - i
+        else:
+            return 0
+    #@+node:ekr.20141231120001.35: *4* tok.match_at_nocolor & restarter
+    def match_at_nocolor(self,s,i):
+        # Only matches at start of line.
+        if i == 0 and not g.match(s,i,'@nocolor-') and g.match_word(s,i,'@nocolor'):
+            self.setRestart('nocolor')
+            return len(s) # Match everything.
+        else:
+            return 0
+
+    def restartNoColor(self,s):
+        if g.match_word(s,0,'@color'):
+            self.clearState()
+        else:
+            self.setRestart('nocolor')
+        return len(s) # Always match everything.
+    #@+node:ekr.20141231120001.36: *4* tok.match_at_killcolor & restarter
+    def match_at_killcolor(self,s,i):
+        # Only matches at start of line.
+        if i != 0 and s[i-1] != '\n':
+            return 0
+        if g.match_word(s,i,'@killcolor'):
+            self.setRestart('killcolor')
+            return len(s) # Match everything.
+        else:
+            return 0
+
+    def restartKillColor(self,s):
+        self.setRestart('killcolor')
+        return len(s)+1
+    #@+node:ekr.20141231120001.37: *4* tok.match_at_nocolor_node & restarter
+    def match_at_nocolor_node(self,s,i):
+        # Only matches at start of line.
+        if i != 0 and s[i-1] != '\n':
+            return 0
+        if g.match_word(s,i,'@nocolor-node'):
+            self.setRestart('nocolor-node')
+            return len(s) # Match everything.
+        else:
+            return 0
+
+    def restartNoColorNode(self,s):
+        self.setRestart('nocolor-node')
+        return len(s)+1
+    #@+node:ekr.20141231120001.38: *4* tok.match_blanks & match_tabs
+    def match_blanks(self,s,i):
+        if not self.showInvisibles:
+            return 0
+        j = i ; n = len(s)
+        while j < n and s[j] == ' ':
+            j += 1
+        if j > i:
+            self.colorRangeWithTag(s,i,j,'blank')
+            return j - i
+        else:
+            return 0
+
+    def match_tabs(self,s,i):
+        if not self.showInvisibles:
+            return 0
+        j = i ; n = len(s)
+        while j < n and s[j] == '\t':
+            j += 1
+        if j > i:
+            self.colorRangeWithTag(s,i,j,'tab')
+            return j - i
+        else:
+            return 0
+    #@+node:ekr.20141231120001.39: *4* tok.match_doc_part & restarter
+    def match_doc_part(self,s,i):
+        # Only matches at start of line.
+        if i != 0:
+            return 0
+        elif g.match_word(s,i,'@doc'):
+            j = i + 4
+        elif g.match(s,i,'@') and (i+1 >= len(s) or s[i+1] in (' ','\t','\n')):
+            j = i + 1
+        else:
+            return 0
+        self.colorRangeWithTag(s,i,j,'leokeyword')
+        self.colorRangeWithTag(s,j,len(s),'docpart')
+        self.setRestart('docpart')
+        return len(s)
+
+    def restartDocPart(self,s):
+        for tag in ('@c','@code'):
+            if g.match_word(s,0,tag):
+                j = len(tag)
+                self.colorRangeWithTag(s,0,j,'leokeyword')
+                self.clearState()
+                return j
+        self.setRestart('docpart')
+        self.colorRangeWithTag(s,0,len(s),'docpart')
+        return len(s)
+    #@+node:ekr.20141231120001.40: *4* tok.match_leo_keywords
+    def match_leo_keywords(self,s,i):
+        '''Succeed if s[i:] is a Leo keyword.'''
+        if s[i] != '@':
+            return 0
+        # fail if something besides whitespace precedes the word on the line.
+        i2 = i-1
+        while i2 >= 0:
+            ch = s[i2]
+            if ch == '\n':
+                break
+            elif ch in (' ','\t'):
+                i2 -= 1
+            else:
+                return 0
+        # Get the word as quickly as possible.
+        j = self.ruleset.wordRegex.match(s,i+1).end()
+        word = s[i+1:j] # entries in leoKeywordsDict do not start with '@'.
+        if j < len(s) and s[j] not in (' ','\t','\n'):
+            return 0 # Fail, but allow a rescan, as in objective_c.
+        if self.leoKeywordsDict.get(word):
+            kind = 'leokeyword'
+            self.colorRangeWithTag(s,i,j,kind)
+            self.prev = (i,j,kind)
+            return j-i+1 # Bug fix: skip the last character.
+        else:
+            # Allow objective_c keywords starting with '@'.
+            kind = self.keywordsDict.get('@' + word)
+            if kind:
+                self.colorRangeWithTag(s,i,j,kind)
+                self.prev = (i,j,kind)
+                return j-i
+            else:
+                return -(j-i+1) # An important optimization.
+    #@+node:ekr.20141231120001.41: *4* tok.match_section_ref
+    def match_section_ref(self,s,i):
+        if not g.match(s,i,'<<'):
+            return 0
+        k = g.find_on_line(s,i+2,'>>')
+        if k == -1:
+            return 0
+        else:
+            c = self.c
+            j = k + 2
+            self.colorRangeWithTag(s,i,i+2,'namebrackets')
+            ref = c and g.findReference(c,s[i:j],self.p or c.p)
+            if ref:
+                if not self.use_hyperlinks:
+                    self.colorRangeWithTag(s,i+2,k,'link')
+            else:
+                self.colorRangeWithTag(s,i+2,k,'name')
+            self.colorRangeWithTag(s,k,j,'namebrackets')
+            return j - i
+    #@+node:ekr.20141231120001.42: *4* tok.match_url_any/f/g/h/m/n/p/t/w
+    def match_url_f(self,s,i):
+        return self.match_compiled_regexp(s,i,kind='url',regexp=self.url_regex_f)
+
+    def match_url_g(self,s,i):
+        return self.match_compiled_regexp(s,i,kind='url',regexp=self.url_regex_g)
+
+    def match_url_h(self,s,i):
+        return self.match_compiled_regexp(s,i,kind='url',regexp=self.url_regex_h)
+
+    def match_url_m(self,s,i):
+        return self.match_compiled_regexp(s,i,kind='url',regexp=self.url_regex_m)
+
+    def match_url_n(self,s,i):
+        return self.match_compiled_regexp(s,i,kind='url',regexp=self.url_regex_n)
+
+    def match_url_p(self,s,i):
+        return self.match_compiled_regexp(s,i,kind='url',regexp=self.url_regex_p)
+
+    def match_url_t(self,s,i):
+        return self.match_compiled_regexp(s,i,kind='url',regexp=self.url_regex_t)
+
+    def match_url_w(self,s,i):
+        return self.match_compiled_regexp(s,i,kind='url',regexp=self.url_regex_w)
+    #@+node:ekr.20141231120001.43: *3* tok.Pattern matchers
+    #@+node:ekr.20141231120001.44: *4* tok.match_compiled_regexp
+    def match_compiled_regexp(self,s,i,kind,regexp,delegate=''):
+        '''Succeed if the compiled regular expression regexp matches at s[i:].'''
+        m = regexp.match(s,i)
+        n = m.end() - i if m else 0
+        if n > 0:
+            j = i + n
+            self.colorRangeWithTag(s,i,j,kind,delegate=delegate)
+            self.prev = (i,j,kind)
+            return j - i
+        else:
+            return 0
+    #@+node:ekr.20141231120001.45: *4* tok.match_eol_span
+    def match_eol_span(self,s,i,
+        kind=None,seq='',
+        at_line_start=False,at_whitespace_end=False,at_word_start=False,
+        delegate='',exclude_match=False):
+        '''Succeed if seq matches s[i:]'''
+        if at_line_start and i != 0 and s[i-1] != '\n': return 0
+        if at_whitespace_end and i != g.skip_ws(s,0): return 0
+        if at_word_start and i > 0 and s[i-1] in self.word_chars: return 0
+        if at_word_start and i + len(seq) + 1 < len(s) and s[i+len(seq)] in self.word_chars:
+            return 0
+        if g.match(s,i,seq):
+            j = len(s)
+            self.colorRangeWithTag(s,i,j,kind,delegate=delegate,exclude_match=exclude_match)
+            self.prev = (i,j,kind)
+            return j # With a delegate, this could clear state.
+        else:
+            return 0
+    #@+node:ekr.20141231120001.46: *4* tok.match_eol_span_regexp
+    def match_eol_span_regexp(self,s,i,
+        kind='',regexp='',
+        at_line_start=False,at_whitespace_end=False,at_word_start=False,
+        delegate='',exclude_match=False
+    ):
+        '''Succeed if the regular expression regex matches s[i:].'''
+        if at_line_start and i != 0 and s[i-1] != '\n': return 0
+        if at_whitespace_end and i != g.skip_ws(s,0): return 0
+        if at_word_start and i > 0 and s[i-1] in self.word_chars: return 0
+        n = self.match_regexp_helper(s,i,regexp)
+        if n > 0:
+            j = len(s)
+            self.colorRangeWithTag(s,i,j,kind,delegate=delegate,exclude_match=exclude_match)
+            self.prev = (i,j,kind)
+            return j - i
+        else:
+            return 0
+    #@+node:ekr.20141231120001.47: *4* tok.match_keywords
+    # This is a time-critical method.
+    def match_keywords(self,s,i):
+        '''
+        Succeed if s[i:] is a keyword.
+        Returning -len(word) for failure greatly reduces the number of times this
+        method is called.
+        '''
+        # We must be at the start of a word.
+        if i > 0 and s[i-1] in self.word_chars:
+            return 0
+        j = self.ruleset.wordRegex.match(s,i).end()
+        word = s[i:j]
+        if not word:
+            return 0
+        if self.ignore_case: word = word.lower()
+        kind = self.keywordsDict.get(word)
+        if kind:
+            self.colorRangeWithTag(s,i,j,kind)
+            self.prev = (i,j,kind)
+            return j - i
+        else:
+            return -len(word) # An important optimization.
+    #@+node:ekr.20141231120001.48: *4* tok.match_line
+    def match_line(self,s,i,kind=None,delegate='',exclude_match=False):
+        '''Match the rest of the line.'''
+        j = g.skip_to_end_of_line(s,i)
+        self.colorRangeWithTag(s,i,j,kind,delegate=delegate)
+        return j-i
+    #@+node:ekr.20141231120001.49: *4* tok.match_mark_following & getNextToken
+    def match_mark_following(self,s,i,
+        kind='',pattern='',
+        at_line_start=False,at_whitespace_end=False,at_word_start=False,
+        exclude_match=False):
+        '''Succeed if s[i:] matches pattern.'''
+        if at_line_start and i != 0 and s[i-1] != '\n': return 0
+        if at_whitespace_end and i != g.skip_ws(s,0): return 0
+        if at_word_start and i > 0 and s[i-1] in self.word_chars: return 0
+        if at_word_start and i + len(pattern) + 1 < len(s) and s[i+len(pattern)] in self.word_chars:
+            return 0
+        if g.match(s,i,pattern):
+            j = i + len(pattern)
+            k = self.getNextToken(s,j)
+            # Do not match *anything* unless there is a token following.
+            if k > j:
+                self.colorRangeWithTag(s,i,j,kind,exclude_match=exclude_match)
+                self.colorRangeWithTag(s,j,k,kind,exclude_match=False)
+                j = k
+                self.prev = (i,j,kind)
+                return j - i
+            else:
+                return 0
+        else:
+            return 0
+
+    def getNextToken(self,s,i):
+        '''Return the index of the end of the next token for match_mark_following.'''
+        return min(len(s),self.ruleset.wordRegex.match(s,i).end())
+    #@+node:ekr.20141231120001.50: *4* tok.match_mark_previous
+    def match_mark_previous(self,s,i,
+        kind='',pattern='',
+        at_line_start=False,at_whitespace_end=False,at_word_start=False,
+        exclude_match=False):
+        '''JEditColorizer.match_mark_previous always fails.'''
+        return 0
+    #@+node:ekr.20141231120001.51: *4* tok.match_regexp_helper
+    def match_regexp_helper(self,s,i,pattern):
+        '''Return the length of the matching text if seq (a regular expression) matches the present position.'''
+        flags = re.MULTILINE
+        if self.ignore_case: flags |= re.IGNORECASE
+        regex = compileRegex(pattern,flags)
+        if not regex:
+            return 0
+        self.match_obj = mo = regex.match(s,i)
+        if mo is None:
+            return 0
+        else:
+            return mo.end() - mo.start()
+    #@+node:ekr.20141231120001.52: *4* tok.match_seq
+    def match_seq(self,s,i,
+        kind='',seq='',
+        at_line_start=False,
+        at_whitespace_end=False,
+        at_word_start=False,
+        delegate=''
+    ):
+        '''Succeed if s[:] mathces seq.'''
+        # Like JEditColorizer.match_seq, ignore at_line_start and at_whitespace_end.
+        if at_word_start and i + len(seq) + 1 < len(s) and s[i+len(seq)] in self.word_chars:
+            j = i
+        elif g.match(s,i,seq):
+            j = i + len(seq)
+            self.colorRangeWithTag(s,i,j,kind,delegate=delegate)
+            self.prev = (i,j,kind)
+        else:
+            j = i
+        return j - i
+    #@+node:ekr.20141231120001.53: *4* tok.match_seq_regexp
+    def match_seq_regexp(self,s,i,
+        kind='',regexp='',
+        at_line_start=False,at_whitespace_end=False,at_word_start=False,
+        delegate=''
+    ):
+        '''Succeed if the regular expression regexp matches at s[i:].'''
+        if at_line_start and i != 0 and s[i-1] != '\n': return 0
+        if at_whitespace_end and i != g.skip_ws(s,0): return 0
+        if at_word_start and i > 0 and s[i-1] in self.word_chars: return 0
+        n = self.match_regexp_helper(s,i,regexp)
+        j = i + n
+        self.colorRangeWithTag(s,i,j,kind,delegate=delegate)
+        self.prev = (i,j,kind)
+        return j - i
+    #@+node:ekr.20141231120001.54: *4* tok.match_span & helper & restarter
+    def match_span(self,s,i,
+        kind='',begin='',end='',
+        at_line_start=False,at_whitespace_end=False,at_word_start=False,
+        delegate='',exclude_match=False,
+        no_escape=False,no_line_break=False,no_word_break=False
+    ):
+        '''Succeed if s[i:] starts with 'begin' and contains a following 'end'.'''
+        if i >= len(s): return 0
+        if at_line_start and i != 0 and s[i-1] != '\n':
+            j = i
+        elif at_whitespace_end and i != g.skip_ws(s,0):
+            j = i
+        elif at_word_start and i > 0 and s[i-1] in self.word_chars:
+            j = i
+        elif at_word_start and i + len(begin) + 1 < len(s) and s[i+len(begin)] in self.word_chars:
+            j = i
+        elif not g.match(s,i,begin):
+            j = i
+        else:
+            # We have matched the start of the span.
+            j = self.match_span_helper(s,i+len(begin),end,
+                no_escape,no_line_break,no_word_break=no_word_break)
+            if j == -1:
+                j = i # A real failure.
+            else:
+                # A match
+                i2 = i + len(begin) ; j2 = j + len(end)
+                if delegate:
+                    self.colorRangeWithTag(s,i,i2,kind,delegate=None,    exclude_match=exclude_match)
+                    self.colorRangeWithTag(s,i2,j,kind,delegate=delegate,exclude_match=exclude_match)
+                    self.colorRangeWithTag(s,j,j2,kind,delegate=None,    exclude_match=exclude_match)
+                else:
+                    self.colorRangeWithTag(s,i,j2,kind,delegate=None,exclude_match=exclude_match)
+                j = j2
+                self.prev = (i,j,kind)
+        if j > len(s):
+            j = len(s) + 1
+            self.setRestart('span',delegate,end,exclude_match,kind,
+                no_escape,no_line_break,no_word_break)
+        elif j != i:
+            self.clearState()
+        return j - i # Correct, whatever j is.
+    #@+node:ekr.20141231120001.55: *5* tok.match_span_helper
+    def match_span_helper(self,s,i,pattern,no_escape,no_line_break,no_word_break):
+        '''
+        Return n >= 0 if s[i] ends with a non-escaped 'end' string.
+        '''
+        esc = self.escape
+        while 1:
+            j = s.find(pattern,i)
+            if j == -1:
+                # Match to end of text if not found and no_line_break is False
+                if no_line_break:
+                    return -1
+                else:
+                    return len(s)+1
+            elif no_word_break and j > 0 and s[j-1] in self.word_chars:
+                return -1
+            elif no_line_break and '\n' in s[i:j]:
+                return -1
+            elif esc and not no_escape:
+                # Only an odd number of escapes is a 'real' escape.
+                escapes = 0 ; k = 1
+                while j-k >=0 and s[j-k] == esc:
+                    escapes += 1 ; k += 1
+                if (escapes % 2) == 1:
+                    i += 1 # Just advance past the *one* escaped character.
+                else:
+                    return j
+            else:
+                return j
+    #@+node:ekr.20141231120001.56: *5* tok.restart_match_span
+    def restart_match_span(self,s,
+        delegate,end,exclude_match,kind,
+        no_escape,no_line_break,no_word_break
+    ):
+        '''Remain in this state until 'end' is seen.'''
+        i = 0
+        j = self.match_span_helper(s,i,end,no_escape,no_line_break,no_word_break)
+        if j == -1:
+            j2 = len(s)+1
+        elif j > len(s):
+            j2 = j
+        else:
+            j2 = j + len(end)
+        if delegate:
+            self.colorRangeWithTag(s,i,j,kind,delegate=delegate,exclude_match=exclude_match)
+            self.colorRangeWithTag(s,j,j2,kind,delegate=None,exclude_match=exclude_match)
+        else:
+            self.colorRangeWithTag(s,i,j2,kind,delegate=None,exclude_match=exclude_match)
+        j = j2
+        if j > len(s):
+            self.setRestart('span',delegate,end,exclude_match,kind,
+                no_escape,no_line_break,no_word_break)
+        else:
+            self.clearState()
+        return j # Return the new i, *not* the length of the match.
+    #@+node:ekr.20141231120001.57: *4* tok.match_span_regexp
+    def match_span_regexp(self,s,i,
+        kind='',begin='',end='',
+        at_line_start=False,at_whitespace_end=False,at_word_start=False,
+        delegate='',exclude_match=False,
+        no_escape=False,no_line_break=False, no_word_break=False,
+    ):
+        '''Succeed if s[i:] starts with 'begin' (a regular expression) and
+        contains a following 'end'.
+        '''
+        if at_line_start and i != 0 and s[i-1] != '\n': return 0
+        if at_whitespace_end and i != g.skip_ws(s,0): return 0
+        if at_word_start and i > 0 and s[i-1] in self.word_chars: return 0
+        if at_word_start and i + len(begin) + 1 < len(s) and s[i+len(begin)] in self.word_chars:
+            return 0
+        n = self.match_regexp_helper(s,i,begin)
+        if n > 0:
+            j = i + n
+            j2 = s.find(end,j)
+            if j2 == -1: return 0
+            if self.escape and not no_escape:
+                # Only an odd number of escapes is a 'real' escape.
+                escapes = 0 ; k = 1
+                while j-k >=0 and s[j-k] == self.escape:
+                    escapes += 1 ; k += 1
+                if (escapes % 2) == 1:
+                    # An escaped end **aborts the entire match**.
+                    return 0
+            i2 = j2 - len(end)
+            if delegate:
+                self.colorRangeWithTag(s,i,j,kind, delegate=None,     exclude_match=exclude_match)
+                self.colorRangeWithTag(s,j,i2,kind, delegate=delegate,exclude_match=False)
+                self.colorRangeWithTag(s,i2,j2,kind,delegate=None,    exclude_match=exclude_match)
+            else:
+                self.colorRangeWithTag(s,i,j2,kind,delegate=None,exclude_match=exclude_match)
+            self.prev = (i,j,kind)
+            return j2 - i
+        else: return 0
+    #@+node:ekr.20141231120001.58: *4* tok.match_word_and_regexp
+    def match_word_and_regexp(self,s,i,
+        kind1='',word='',
+        kind2='',pattern='',
+        at_line_start=False,at_whitespace_end=False,at_word_start=False,
+        exclude_match=False
+    ):
+        '''Succeed if s[i:] matches pattern.'''
+        if at_line_start and i != 0 and s[i-1] != '\n': return 0
+        if at_whitespace_end and i != g.skip_ws(s,0): return 0
+        if at_word_start and i > 0 and s[i-1] in self.word_chars: return 0
+        if not g.match(s,i,word):
+            return 0
+        j = i + len(word)
+        n = self.match_regexp_helper(s,j,pattern)
+        if n == 0:
+            return 0
+        self.colorRangeWithTag(s,i,j,kind1,exclude_match=exclude_match)
+        k = j + n
+        self.colorRangeWithTag(s,j,k,kind2,exclude_match=False)
+        self.prev = (j,k,kind2)
+        return k - i
+    #@-others
+#@-others
+#@-leo
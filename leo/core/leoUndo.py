@@ -50,6 +50,8 @@
 #@-<< How Leo implements unlimited undo >>
 
 import leo.core.leoGlobals as g
+import tempfile
+import zlib
 
 # pylint: disable=unpacking-non-sequence
 
@@ -72,6 +74,11 @@ class Undoer:
         # g.trace('Undoer',self.granularity)
 
         self.max_undo_stack_size = c.config.getInt('max_undo_stack_size') or 0
+        n = c.config.getInt('max_undo_stack_bytes')
+        self.max_undo_stack_bytes = 50000000 if n is None else n
+            # Zero: keep the text of all beads in memory.
+        self.journal = None # An UndoJournal, created when first needed.
+        self.stackBytes = 0 # The approximate size of the text in all beads.
 
         # Statistics comparing old and new ways (only if self.debug_Undoer is on).
         self.new_mem = 0
@@ -156,21 +163,27 @@ class Undoer:
 
         u = self ; n = u.max_undo_stack_size
 
-        if n > 0 and u.bead >= n and not g.app.unitTesting:
+        cut = n > 0 and u.bead >= n and not g.app.unitTesting
+        spill = 0 < u.max_undo_stack_bytes < u.stackBytes
+        if not cut and not spill:
+            return
 
-            # Do nothing if we are in the middle of creating a group.
-            i = len(u.beads)-1
-            while i >= 0:
-                bunch = u.beads[i]
-                if hasattr(bunch,'kind') and bunch.kind == 'beforeGroup':
-                    return
-                i -= 1
+        # Do nothing if we are in the middle of creating a group.
+        i = len(u.beads)-1
+        while i >= 0:
+            bunch = u.beads[i]
+            if hasattr(bunch,'kind') and bunch.kind == 'beforeGroup':
+                return
+            i -= 1
 
+        if cut:
             # This work regardless of how many items appear after bead n.
             # g.trace('Cutting undo stack to %d entries' % (n))
             u.beads = u.beads[-n:]
             u.bead = n-1
             # g.trace('bead:',u.bead,'len(u.beads)',len(u.beads),g.callers())
+        if spill:
+            u.spillBeads()
     #@+node:ekr.20080623083646.10: *4* dumpBead
     def dumpBead (self,n):
 
@@ -194,6 +207,18 @@ class Undoer:
             return self.dumpBead(n-1)
         else:
             return '<no top bead>'
+    #@+node:ekr.20141228090001.1: *4* continuesBead
+    def continuesBead (self,bunch,oldText):
+        '''
+        Return True if the change described by bunch, a typing bead, ends
+        with oldText, so that the next change can be added to bunch.
+        '''
+        oldMiddle = bunch.get('oldMiddle')
+        newMiddle = bunch.get('newMiddle')
+        return (
+            # The journal may contain the bead's text.
+            g.isString(oldMiddle) and g.isString(newMiddle) and
+            bunch.get('leading',0) + len(newMiddle) + bunch.get('trailing',0) == len(oldText))
     #@+node:EKR.20040526150818: *4* getBead
     def getBead (self,n):
 
@@ -227,6 +252,8 @@ class Undoer:
         # New in 4.4b2:  Add this to the group if it is being accumulated.
         bunch2 = u.bead >= 0 and u.bead < len(u.beads) and u.beads[u.bead]
 
+        u.stackBytes += u.textSize(bunch)
+
         if bunch2 and hasattr(bunch2,'kind') and bunch2.kind == 'beforeGroup':
             # Just append the new bunch the group's items.
             bunch2.items.append(bunch)
@@ -238,6 +265,51 @@ class Undoer:
 
             # Recalculate the menu labels.
             u.setUndoTypes()
+    #@+node:ekr.20141228090001.2: *4* matchingPrefix & matchingSuffix
+    def guessPrefix (self,oldSel,newSel):
+        '''Return the index at which a typing change probably starts.'''
+        try:
+            aList = [int(z) for sel in (oldSel,newSel) if sel for z in sel]
+        except (TypeError,ValueError):
+            aList = []
+        return max(0,min(aList)) if aList else 0
+
+    def matchingPrefix (self,s1,s2,guess=0):
+        '''
+        Return the length of the longest common prefix of s1 and s2.
+        The search starts at guess, the probable result.
+        '''
+        i = max(0,min(guess,len(s1),len(s2)))
+        hi = min(len(s1),len(s2))
+        if not s1.startswith(s2[:i]):
+            i,hi = 0,i-1
+        # Look at ever larger slices until one does not match, then start again.
+        step = 1
+        while i < hi:
+            j = min(hi,i+step)
+            if s1[i:j] == s2[i:j]:
+                i = j ; step *= 2
+            else:
+                hi = j-1 ; step = 1
+        return i
+
+    def matchingSuffix (self,s1,s2,limit):
+        '''
+        Return the length of the longest common suffix of s1 and s2, at most
+        limit. The search starts at limit, the usual result when typing.
+        '''
+        n1,n2 = len(s1),len(s2)
+        k = hi = max(0,min(limit,n1,n2))
+        if not s1.endswith(s2[n2-k:]):
+            k,hi = 0,k-1
+        step = 1
+        while k < hi:
+            j = min(hi,k+step)
+            if s1[n1-j:n1-k] == s2[n2-j:n2-k]:
+                k = j ; step *= 2
+            else:
+                hi = j-1 ; step = 1
+        return k
     #@+node:ekr.20050126081529: *4* recognizeStartOfTypingWord
     def recognizeStartOfTypingWord (self,
         old_lines,old_row,old_col,old_ch, 
@@ -295,9 +367,54 @@ class Undoer:
         # bunch is not a dict, so bunch.keys() is required.
         for key in list(bunch.keys()): 
             val = bunch.get(key)
+            if isinstance(val,JournalEntry):
+                val = u.journal.read(val)
             setattr(u,key,val)
             if key not in u.optionalIvars:
                 u.optionalIvars.append(key)
+    #@+node:ekr.20141228090001.3: *4* spillBeads & helpers
+    def spillBeads (self):
+        '''
+        Move the text of the oldest beads to the undo journal until the text
+        of all beads uses at most half of @int max_undo_stack_bytes.
+        '''
+        trace = False and not g.unitTesting
+        u = self
+        limit = u.max_undo_stack_bytes // 2
+        sizes = [u.textSize(z) for z in u.beads]
+        total = sum(sizes)
+        for i,bunch in enumerate(u.beads):
+            if total <= limit:
+                break
+            if i != u.bead and sizes[i]:
+                for z in [bunch] + list(bunch.get('items') or []):
+                    u.spillBunch(z)
+                total -= sizes[i] - u.textSize(bunch)
+        if trace: g.trace('%s bytes in memory' % total)
+        # Don't try again until the beads grow, even if beads such as
+        # tree beads keep more than limit bytes in memory.
+        u.stackBytes = min(total,limit)
+
+    def spillBunch (self,bunch):
+        '''Move the long strings in bunch to the undo journal.'''
+        u = self
+        d = bunch.__dict__
+        for key,val in list(d.items()):
+            if g.isString(val) and len(val) >= 64 and key not in ('kind','undoType'):
+                if not u.journal:
+                    u.journal = UndoJournal()
+                d[key] = u.journal.write(val)
+
+    def textSize (self,val):
+        '''Return the approximate number of characters of text in val.'''
+        if g.isString(val):
+            return len(val)
+        elif isinstance(val,g.Bunch):
+            return sum([self.textSize(z) for z in val.__dict__.values()])
+        elif isinstance(val,(list,tuple)):
+            return sum([self.textSize(z) for z in val])
+        else:
+            return 0
     #@+node:ekr.20031218072017.3614: *4* setRedoType
     # These routines update both the ivar and the menu label.
     def setRedoType (self,theType):
@@ -373,50 +490,62 @@ class Undoer:
         u.cutStack()
 
         if trace: g.trace(u.bead,u.undoMenuLabel,u.redoMenuLabel)
-    #@+node:EKR.20040530121329: *4* u.restoreTree & helpers
+    #@+node:ekr.20141229090001.1: *4* u.diffTree
+    def diffTree (self,oldTree):
+        '''
+        Compare the tree info created by u.saveTree with the present vnodes.
+        Return (oldTree,newTree): the tree info for just the changed and new
+        vnodes, before and after the change.
+        '''
+        u = self
+        known = set()
+        changed = []
+        for data in oldTree:
+            v = data[0]
+            known.add(v)
+            if (v._headString != data[1] or v._bodyString != data[2] or
+                v.statusBits != data[3] or v.parents != data[4] or
+                v.children != data[5] or
+                getattr(v,'unknownAttributes',None) is not data[6]
+            ):
+                changed.append(data)
+        newTree = [u.saveVnode(data[0]) for data in changed]
+        # New vnodes can only be children of changed or new vnodes.
+        todo = [child for data in newTree for child in data[5]]
+        while todo:
+            v = todo.pop()
+            if v not in known:
+                known.add(v)
+                newTree.append(u.saveVnode(v))
+                todo.extend(v.children)
+        return changed,newTree
+    #@+node:EKR.20040530121329: *4* u.restoreTree
     def restoreTree (self,treeInfo):
-
-        """Use the tree info to restore all VNode data,
-        including all links."""
-
+        '''
+        Use the tree info created by u.saveTree to restore all VNode data,
+        including all links.
+        '''
         u = self
-
         # This effectively relinks all vnodes.
-        for v,vInfo,tInfo in treeInfo:
-            u.restoreVnodeUndoInfo(vInfo)
-            u.restoreTnodeUndoInfo(tInfo)
-    #@+node:ekr.20050415170737.2: *5* restoreVnodeUndoInfo
-    def restoreVnodeUndoInfo (self,bunch):
-
-        """Restore all ivars saved in the bunch."""
-
-        v = bunch.v
-
-        v.statusBits = bunch.statusBits
-        v.children   = bunch.children
-        v.parents    = bunch.parents
-
-        uA = bunch.get('unknownAttributes')
-        if uA is not None:
-            v.unknownAttributes = uA
-            v._p_changed = 1
-    #@+node:ekr.20050415170812.2: *5* restoreTnodeUndoInfo
-    def restoreTnodeUndoInfo (self,bunch):
-
-        v = bunch.v
-        v.h  = bunch.headString
-        v.b  = bunch.bodyString
-        v.statusBits  = bunch.statusBits
-
-        uA = bunch.get('unknownAttributes')
-        if uA is not None:
-            v.unknownAttributes = uA
-            v._p_changed = 1
+        for v,h,b,statusBits,parents,children,uA in treeInfo:
+            if v._headString != h:
+                v.h = h
+            if v._bodyString != b:
+                v.b = b
+            v.statusBits = statusBits
+            # Copy the lists: the tree info must never change.
+            v.parents = parents[:]
+            v.children = children[:]
+            if uA is not None:
+                v.unknownAttributes = uA
+                v._p_changed = 1
+        u.c.gnxIndex.invalidate()
     #@+node:EKR.20040528075307: *4* u.saveTree & helpers
-    def saveTree (self,p,treeInfo=None):
-
-        """Return a list of tuples with all info needed to handle a general undo operation."""
-
+    def saveTree (self,p):
+        '''
+        Return a list of tuples containing all info needed to restore p's
+        tree during undo or redo.
+        '''
         # WARNING: read this before doing anything "clever"
         #@+<< about u.saveTree >>
         #@+node:EKR.20040530114124: *5* << about u.saveTree >>
@@ -427,66 +556,35 @@ class Undoer:
         # adjustments to t.vnodeLists.
         # 
         # Instead of creating new nodes, the new code creates all information
-        # needed to properly restore the vnodes and tnodes. It creates a list of
-        # tuples, on tuple for each VNode in the tree. Each tuple has the form,
+        # needed to properly restore the vnodes. It creates a list of tuples,
+        # one tuple for each VNode in the tree. Each tuple has the form:
         # 
-        # (vnodeInfo, tnodeInfo)
+        # (v,h,b,statusBits,parents,children,unknownAttributes)
         # 
-        # where vnodeInfo and tnodeInfo are dicts contain all info needed to
-        # recreate the nodes. The v.createUndoInfoDict and t.createUndoInfoDict
-        # methods correspond to the old v.copy and t.copy methods.
+        # The tuples share the headline and body strings with the vnodes, so
+        # only the parents and children lists are copied. Clones appear only
+        # once.
         # 
-        # Aside: Prior to 4.2 Leo used a scheme that was equivalent to the
-        # createUndoInfoDict info, but quite a bit uglier.
+        # u.afterChangeTree uses u.diffTree to keep only the tuples of the
+        # vnodes that the command changed. Unchanged vnodes are the same before
+        # and after the command, so undo and redo need not restore them.
         #@-<< about u.saveTree >>
-
-        u = self ; topLevel = (treeInfo == None)
-        if topLevel: treeInfo = []
-
-        # Add info for p.v.  Duplicate tnode info is harmless.
-        data = (p.v,u.createVnodeUndoInfo(p.v),u.createTnodeUndoInfo(p.v))
-        treeInfo.append(data)
-
-        # Recursively add info for the subtree.
-        child = p.firstChild()
-        while child:
-            self.saveTree(child,treeInfo)
-            child = child.next()
-
-        # if topLevel: g.trace(treeInfo)
+        u = self
+        treeInfo,seen = [],set()
+        todo = [p.v]
+        while todo:
+            v = todo.pop()
+            if v not in seen:
+                seen.add(v)
+                treeInfo.append(u.saveVnode(v))
+                todo.extend(v.children)
         return treeInfo
-    #@+node:ekr.20050415170737.1: *5* createVnodeUndoInfo
-    def createVnodeUndoInfo (self,v):
-
-        """Create a bunch containing all info needed to recreate a VNode for undo."""
-
-        bunch = g.Bunch(
-            v = v,
-            statusBits = v.statusBits,
-            parents    = v.parents[:],
-            children   = v.children[:],
-        )
-
-        if hasattr(v,'unknownAttributes'):
-            bunch.unknownAttributes = v.unknownAttributes
-
-        return bunch
-    #@+node:ekr.20050415170812.1: *5* createTnodeUndoInfo
-    def createTnodeUndoInfo (self,v):
-
-        """Create a bunch containing all info needed to recreate a VNode."""
-
-        bunch = g.Bunch(
-            v = v,
-            headString = v.h,
-            bodyString = v.b,
-            statusBits = v.statusBits,
-        )
-
-        if hasattr(v,'unknownAttributes'):
-            bunch.unknownAttributes = v.unknownAttributes
-
-        return bunch
+    #@+node:ekr.20141229090001.2: *5* u.saveVnode
+    def saveVnode (self,v):
+        '''Return the tuple describing v in the tree info created by u.saveTree.'''
+        return (v,v._headString,v._bodyString,v.statusBits,
+            v.parents[:],v.children[:],
+            getattr(v,'unknownAttributes',None))
     #@+node:ekr.20050525151449: *4* u.trace
     def trace (self):
 
@@ -587,7 +685,7 @@ class Undoer:
         # Set by beforeChangeTree: changed, oldSel, oldText, oldTree, p
         bunch.newSel = w.getSelectionRange()
         bunch.newText = w.getAllText()
-        bunch.newTree = u.saveTree(p)
+        bunch.oldTree,bunch.newTree = u.diffTree(bunch.oldTree)
         u.pushBead(bunch)
     #@+node:ekr.20050424161505: *5* afterClearRecentFiles
     def afterClearRecentFiles (self,bunch):
@@ -1072,7 +1170,11 @@ class Undoer:
         u.setUndoType("Can't Undo")
         u.beads = [] # List of undo nodes.
         u.bead = -1 # Index of the present bead: -1:len(beads)
-
+        u.stackBytes = 0
+        if u.journal and not u.per_node_undo:
+            # Per-node beads may still refer to the journal.
+            u.journal.close()
+            u.journal = None
     #@+node:ekr.20031218072017.3611: *4* enableMenuItems
     def enableMenuItems (self):
 
@@ -1169,66 +1271,31 @@ class Undoer:
         u.undoType = undo_type
         u.p = p.copy()
         #@-<< init the undo params >>
-        #@+<< compute leading, middle & trailing  lines >>
-        #@+node:ekr.20031218072017.1491: *5* << compute leading, middle & trailing  lines >>
+        #@+<< compute leading, middle & trailing text >>
+        #@+node:ekr.20031218072017.1491: *5* << compute leading, middle & trailing text >>
         #@+at Incremental undo typing is similar to incremental syntax coloring. We compute
-        # the number of leading and trailing lines that match, and save both the old and
-        # new middle lines. NB: the number of old and new middle lines may be different.
+        # the number of leading and trailing characters that match, and save both the old
+        # and new middle text. The selections tell where to start looking, so typing in a
+        # large body does not scan the whole text.
         #@@c
 
-        old_lines = oldText.split('\n')
-        new_lines = newText.split('\n')
-        new_len = len(new_lines)
-        old_len = len(old_lines)
-        min_len = min(old_len,new_len)
-
-        i = 0
-        while i < min_len:
-            if old_lines[i] != new_lines[i]:
-                break
-            i += 1
-        leading = i
-
-        if leading == new_len:
-            # This happens when we remove lines from the end.
-            # The new text is simply the leading lines from the old text.
-            trailing = 0
-        else:
-            i = 0
-            while i < min_len - leading:
-                if old_lines[old_len-i-1] != new_lines[new_len-i-1]:
-                    break
-                i += 1
-            trailing = i
-
-        # NB: the number of old and new middle lines may be different.
-        if trailing == 0:
-            old_middle_lines = old_lines[leading:]
-            new_middle_lines = new_lines[leading:]
-        else:
-            old_middle_lines = old_lines[leading:-trailing]
-            new_middle_lines = new_lines[leading:-trailing]
-
-        # Remember how many trailing newlines in the old and new text.
-        i = len(oldText) - 1 ; old_newlines = 0
-        while i >= 0 and oldText[i] == '\n':
-            old_newlines += 1
-            i -= 1
-
-        i = len(newText) - 1 ; new_newlines = 0
-        while i >= 0 and newText[i] == '\n':
-            new_newlines += 1
-            i -= 1
+        leading = u.matchingPrefix(oldText,newText,u.guessPrefix(oldSel,newSel))
+        limit = min(len(oldText),len(newText)) - leading
+        trailing = u.matchingSuffix(oldText,newText,limit)
+        old_middle = oldText[leading:len(oldText)-trailing]
+        new_middle = newText[leading:len(newText)-trailing]
+        # For line granularity: the start of the first changed line and the
+        # number of characters after the last changed line.
+        line_start = oldText.rfind('\n',0,leading) + 1
+        i = newText.find('\n',len(newText)-trailing)
+        line_end = 0 if i == -1 else len(newText) - i
 
         if trace and verbose:
             g.pr("lead,trail",leading,trailing)
-            g.pr("old mid,nls:",len(old_middle_lines),old_newlines,oldText)
-            g.pr("new mid,nls:",len(new_middle_lines),new_newlines,newText)
-            #g.pr("lead,trail:",leading,trailing)
-            #g.pr("old mid:",old_middle_lines)
-            #g.pr("new mid:",new_middle_lines)
+            g.pr("old mid:",repr(old_middle))
+            g.pr("new mid:",repr(new_middle))
             g.pr("---------------------")
-        #@-<< compute leading, middle & trailing  lines >>
+        #@-<< compute leading, middle & trailing text >>
         #@+<< save undo text info >>
         #@+node:ekr.20031218072017.1492: *5* << save undo text info >>
         #@+at This is the start of the incremental undo algorithm.
@@ -1248,19 +1315,17 @@ class Undoer:
             # Compute statistics comparing old and new ways...
             # The old doesn't often store the old text, so don't count it here.
             u.old_mem += len(newText)
-            s1 = '\n'.join(old_middle_lines)
-            s2 = '\n'.join(new_middle_lines)
-            u.new_mem += len(s1) + len(s2)
+            u.new_mem += len(old_middle) + len(new_middle)
         else:
             u.oldText = None
             u.newText = None
 
         u.leading = leading
         u.trailing = trailing
-        u.oldMiddleLines = old_middle_lines
-        u.newMiddleLines = new_middle_lines
-        u.oldNewlines = old_newlines
-        u.newNewlines = new_newlines
+        u.lineStart = line_start
+        u.lineEnd = line_end
+        u.oldMiddle = old_middle
+        u.newMiddle = new_middle
         #@-<< save undo text info >>
         #@+<< save the selection and scrolling position >>
         #@+node:ekr.20040324061854.2: *5* << save the selection and scrolling position >>
@@ -1301,7 +1366,8 @@ class Undoer:
             old_p.v != p.v or
             old_d.get('kind') != 'typing' or
             old_d.get('undoType') != 'Typing' or
-            undo_type != 'Typing'
+            undo_type != 'Typing' or
+            not u.continuesBead(old_d,oldText)
         ):
             newBead = True # We can't share the previous node.
         elif granularity == 'char':
@@ -1312,8 +1378,8 @@ class Undoer:
             assert granularity in ('line','word')
             # Replace the previous bead if only the middle lines have changed.
             newBead = (
-                old_d.get('leading',0)  != u.leading or 
-                old_d.get('trailing',0) != u.trailing
+                old_d.get('lineStart',0) != u.lineStart or 
+                old_d.get('lineEnd',0)   != u.lineEnd
             )
             if granularity == 'word' and not newBead:
                 # Protect the method that may be changed by the user
@@ -1385,12 +1451,24 @@ class Undoer:
                 redoHelper=u.redoTyping,
                 oldText=u.oldText,
                 oldSel=u.oldSel,
-                oldNewlines=u.oldNewlines,
-                oldMiddleLines=u.oldMiddleLines,
+                oldMiddle=u.oldMiddle,
             )
             u.pushBead(bunch)
         else:
+            # Combine the previous change with this one.
             bunch = old_d
+            u.stackBytes -= len(bunch.oldMiddle) + len(bunch.newMiddle)
+            leading = min(bunch.leading,u.leading)
+            trailing = min(bunch.trailing,u.trailing)
+            n = len(oldText)
+            bunch.oldMiddle = ''.join([
+                oldText[leading:bunch.leading],
+                bunch.oldMiddle,
+                oldText[n-bunch.trailing:n-trailing],
+            ])
+            u.leading,u.trailing = leading,trailing
+            u.newMiddle = newText[leading:len(newText)-trailing]
+            u.stackBytes += len(bunch.oldMiddle) + len(u.newMiddle)
 
         bunch.dirtyVnodeList = p.setAllAncestorAtFileNodesDirty()
 
@@ -1398,13 +1476,17 @@ class Undoer:
         bunch.dirtyVnodeList.append(p.copy())
         bunch.leading=u.leading
         bunch.trailing= u.trailing
-        bunch.newNewlines=u.newNewlines
-        bunch.newMiddleLines=u.newMiddleLines
+        bunch.lineStart=u.lineStart
+        bunch.lineEnd=u.lineEnd
+        bunch.newMiddle=u.newMiddle
         bunch.newSel=u.newSel
         bunch.newText=u.newText
         bunch.yview=u.yview
         #@-<< adjust the undo stack, clearing all forward entries >>
 
+        if newBead:
+            u.stackBytes += len(u.newMiddle)
+
         if u.per_node_undo:
             u.putIvarsToVnode(p)
 
@@ -1531,6 +1613,8 @@ class Undoer:
         # Move the demoted nodes from the old parent to the new parent.
         parent_v.children = parent_v.children[:n+1]
         u.p.v.children.extend(u.followingSibs)
+        c.gnxIndex.childrenChanged(parent_v)
+        c.gnxIndex.childrenChanged(u.p.v)
 
         # Adjust the parent links of the moved nodes.
         # There is no need to adjust descendant links.
@@ -1657,6 +1741,8 @@ class Undoer:
         parent_v.children.insert(u.newN,v)
         v.parents.append(u.newParent_v)
         v.parents.remove(u.oldParent_v)
+        c.gnxIndex.childrenChanged(u.oldParent_v)
+        c.gnxIndex.childrenChanged(u.newParent_v)
 
         u.updateMarks('new')
 
@@ -1713,6 +1799,8 @@ class Undoer:
 
         # Remove the old children.
         u.p.v.children = []
+        c.gnxIndex.childrenChanged(parent_v)
+        c.gnxIndex.childrenChanged(u.p.v)
 
         # Adjust the parent links in the moved children.
         # There is no need to adjust descendant links.
@@ -1728,6 +1816,7 @@ class Undoer:
 
         parent_v = u.p._parentVnode()
         parent_v.children = u.newChildren
+        c.gnxIndex.childrenChanged(parent_v)
         p = c.setPositionAfterSort(u.sortChildren)
         c.setCurrentPosition(p)
     #@+node:ekr.20050318085432.8: *4* redoTree
@@ -1754,8 +1843,7 @@ class Undoer:
             c.frame.body.forceFullRecolor()
         self.undoRedoText(
             u.p,u.leading,u.trailing,
-            u.newMiddleLines,u.oldMiddleLines,
-            u.newNewlines,u.oldNewlines,
+            u.newMiddle,u.oldMiddle,
             tag="redo",undoType=u.undoType)
         u.updateMarks('new')
         for v in u.dirtyVnodeList:
@@ -1907,6 +1995,8 @@ class Undoer:
 
         # Add the demoted nodes to the parent's children.
         parent_v.children.extend(u.followingSibs)
+        c.gnxIndex.childrenChanged(parent_v)
+        c.gnxIndex.childrenChanged(u.p.v)
 
         # Adjust the parent links.
         # There is no need to adjust descendant links.
@@ -2022,6 +2112,8 @@ class Undoer:
         assert u.newParent_v.children[u.newN] == v
         del u.newParent_v.children[u.newN]
         u.oldParent_v.children.insert(u.oldN,v)
+        c.gnxIndex.childrenChanged(u.oldParent_v)
+        c.gnxIndex.childrenChanged(u.newParent_v)
 
         # Recompute the parent links.
         v.parents.append(u.oldParent_v)
@@ -2099,6 +2191,8 @@ class Undoer:
 
         # Add the demoted nodes to v's children.
         u.p.v.children = u.children[:]
+        c.gnxIndex.childrenChanged(parent_v)
+        c.gnxIndex.childrenChanged(u.p.v)
 
         # Adjust the parent links.
         # There is no need to adjust descendant links.
@@ -2109,42 +2203,21 @@ class Undoer:
         c.setCurrentPosition(u.p)
     #@+node:ekr.20031218072017.1493: *4* undoRedoText
     def undoRedoText (self,p,
-        leading,trailing, # Number of matching leading & trailing lines.
-        oldMidLines,newMidLines, # Lists of unmatched lines.
-        oldNewlines,newNewlines, # Number of trailing newlines.
+        leading,trailing, # Number of matching leading & trailing characters.
+        oldMiddle,newMiddle, # The unmatched text.
         tag="undo", # "undo" or "redo"
         undoType=None
     ):
         '''Handle text undo and redo: converts _new_ text into _old_ text.'''
-        # newNewlines is unused, but it has symmetry.
+        # newMiddle is unused, but it has symmetry.
         trace = False and not g.unitTesting
         u = self ; c = u.c ; w = c.frame.body.wrapper
-        #@+<< Compute the result using p's body text >>
-        #@+node:ekr.20061106105812.1: *5* << Compute the result using p's body text >>
         # Recreate the text using the present body text.
-        body = p.b
-        body = g.toUnicode(body)
-        body_lines = body.split('\n')
-        s = []
-        if leading > 0:
-            s.extend(body_lines[:leading])
-        if len(oldMidLines) > 0:
-            s.extend(oldMidLines)
-        if trailing > 0:
-            s.extend(body_lines[-trailing:])
-        s = '\n'.join(s)
-        # Remove trailing newlines in s.
-        while len(s) > 0 and s[-1] == '\n':
-            s = s[:-1]
-        # Add oldNewlines newlines.
-        if oldNewlines > 0:
-            s = s + '\n' * oldNewlines
-        result = s
-
+        body = g.toUnicode(p.b)
+        result = body[:leading] + oldMiddle + body[len(body)-trailing:]
         if u.debug_print:
             g.pr("body:  ",body)
             g.pr("result:",result)
-        #@-<< Compute the result using p's body text >>
         p.setBodyString(result)
         w.setAllText(result)
         sel = u.oldSel if tag == 'undo' else u.newSel
@@ -2182,6 +2255,7 @@ class Undoer:
 
         parent_v = u.p._parentVnode()
         parent_v.children = u.oldChildren
+        c.gnxIndex.childrenChanged(parent_v)
         p = c.setPositionAfterSort(u.sortChildren)
         c.setCurrentPosition(p)
     #@+node:ekr.20050318085713.2: *4* undoTree
@@ -2205,8 +2279,7 @@ class Undoer:
             c.frame.body.forceFullRecolor()
         self.undoRedoText(
             u.p,u.leading,u.trailing,
-            u.oldMiddleLines,u.newMiddleLines,
-            u.oldNewlines,u.newNewlines,
+            u.oldMiddle,u.newMiddle,
             tag="undo",undoType=u.undoType)
         u.updateMarks('old')
         for v in u.dirtyVnodeList:
@@ -2219,5 +2292,47 @@ class Undoer:
             c.bodyWantsFocus()
             w.setYScrollPosition(u.yview)
     #@-others
+#@+node:ekr.20141228090001.4: ** class UndoJournal
+class UndoJournal:
+    '''
+    A temporary file containing the compressed text of old undo beads.
+    u.spillBeads replaces the text in beads by JournalEntry objects and
+    u.setIvarsFromBunch reads the text again.
+    '''
+    def __init__ (self):
+        self.f = tempfile.TemporaryFile()
+        self.size = 0 # The size of the file.
+    def __repr__(self):
+        return 'UndoJournal: %s bytes' % self.size
+
+    #@+others
+    #@+node:ekr.20141228090001.5: *3* journal.close, read & write
+    def close (self):
+        '''Close and delete the journal.'''
+        self.f.close()
+
+    def read (self,entry):
+        '''Return the string described by entry.'''
+        self.f.seek(entry.offset)
+        data = zlib.decompress(self.f.read(entry.length))
+        return g.toUnicode(data,'utf-8')
+
+    def write (self,s):
+        '''Append s to the journal and return a JournalEntry describing it.'''
+        data = zlib.compress(g.toEncodedString(s,'utf-8'))
+        self.f.seek(self.size)
+        self.f.write(data)
+        entry = JournalEntry(self.size,len(data))
+        self.size += len(data)
+        return entry
+    #@-others
+#@+node:ekr.20141228090001.6: ** class JournalEntry
+class JournalEntry:
+    '''The location of a string in an UndoJournal.'''
+    def __init__ (self,offset,length):
+        self.offset = offset
+        self.length = length
+    def __repr__(self):
+        return 'JournalEntry: %s %s' % (self.offset,self.length)
 #@-others
 #@-leo
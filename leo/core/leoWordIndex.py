@@ -0,0 +1,195 @@
+#@+leo-ver=5-thin
+#@+node:ekr.20141230100001.1: * @file leoWordIndex.py
+'''
+A sorted index of the words in the body text of each commander's outline.
+
+c.wordIndex.completions(prefix) returns all words starting with prefix in
+O(log n) time, plus the time to copy the result. Dynamic abbreviations
+and the autocompleter use it instead of scanning all bodies.
+
+The index is built when first needed and updated lazily: v.bumpTextRevision
+marks changed nodes and the next query indexes them again. c.gnxIndex
+reports the parents whose children have changed. The next query compares
+their children with the children they had when last indexed, indexes the
+added subtrees and removes the subtrees no longer in the outline. Only
+c.gnxIndex.invalidate forces a traversal of the whole outline.
+'''
+#@+<< imports >>
+#@+node:ekr.20141230100001.2: ** << imports >> (leoWordIndex)
+import bisect
+import re
+import string
+#@-<< imports >>
+
+word_pattern = re.compile(r'[%s%s\-_]+' % (string.ascii_letters,string.digits))
+    # The words of dynamic abbreviations. Not a unicode problem.
+last_char = '\x7f'
+    # Greater than all characters in words.
+
+#@+others
+#@+node:ekr.20141230100001.3: ** class WordIndex
+class WordIndex(object):
+    '''
+    A sorted list of all words in the bodies of c's outline, with the
+    number of nodes containing each word.
+    '''
+    #@+others
+    #@+node:ekr.20141230100001.4: *3* wi.ctor & reset
+    def __init__(self,c):
+        '''Ctor for the WordIndex class.'''
+        self.c = c
+        self.reset()
+
+    def reset(self):
+        '''Clear the index.'''
+        self.built = False
+            # True: the index covers all nodes except those in self.stale.
+        self.changedParents = set()
+            # Indexed vnodes whose children have changed since the last update.
+            # None: the next update must traverse the whole outline.
+        self.counts = {}
+            # Keys are words; values are the number of indexed nodes containing them.
+        self.nodeChildren = {}
+            # Keys are indexed vnodes and the hidden root node;
+            # values are tuples of their children when last indexed.
+        self.nodeWords = {}
+            # Keys are indexed vnodes; values are frozensets of their words.
+        self.stale = set()
+            # Vnodes changed since they were last indexed.
+        self.words = []
+            # The keys of self.counts, sorted.
+    #@+node:ekr.20141230100001.5: *3* wi.Public API
+    #@+node:ekr.20141230100001.6: *4* wi.changed
+    def changed(self,v):
+        '''Called whenever v's headline or body changes.'''
+        if self.built:
+            self.stale.add(v)
+    #@+node:ekr.20150102090001.13: *4* wi.childrenChanged & invalidate
+    def childrenChanged(self,parent_v):
+        '''Called by c.gnxIndex whenever parent_v.children changes.'''
+        if self.built and self.changedParents is not None:
+            self.changedParents.add(parent_v)
+
+    def invalidate(self):
+        '''Called by c.gnxIndex.invalidate: the next update rescans the outline.'''
+        if self.built:
+            self.changedParents = None
+    #@+node:ekr.20141230100001.7: *4* wi.completions
+    def completions(self,prefix):
+        '''Return a new sorted list of all words starting with prefix.'''
+        self.update()
+        words = self.words
+        i = bisect.bisect_left(words,prefix)
+        j = bisect.bisect_left(words,prefix + last_char,i)
+        return words[i:j]
+    #@+node:ekr.20141230100001.8: *4* wi.update
+    def update(self):
+        '''Index all nodes changed since the last query.'''
+        if not self.built:
+            self.build()
+            return
+        if self.changedParents is None:
+            self.rescan()
+        elif self.changedParents:
+            self.updateStructure()
+        if self.stale:
+            for v in self.stale:
+                # Nodes that are not indexed are not in the outline.
+                if v in self.nodeWords:
+                    self.indexNode(v)
+            self.stale = set()
+    #@+node:ekr.20141230100001.9: *3* wi.Indexing
+    #@+node:ekr.20141230100001.10: *4* wi.build
+    def build(self):
+        '''Index all nodes.'''
+        c = self.c
+        self.reset()
+        counts,d = self.counts,self.nodeWords
+        children = self.nodeChildren
+        children[c.hiddenRootNode] = tuple(c.hiddenRootNode.children)
+        for v,level,childIndex in c.walk(unique=True):
+            words = d[v] = frozenset(word_pattern.findall(v._bodyString))
+            for word in words:
+                counts[word] = counts.get(word,0) + 1
+            children[v] = tuple(v.children)
+        self.words = sorted(counts)
+        self.built = True
+    #@+node:ekr.20141230100001.11: *4* wi.indexNode & removeNode
+    def indexNode(self,v):
+        '''Add v's words to the index, removing the words v no longer contains.'''
+        old = self.nodeWords.get(v,frozenset())
+        new = self.nodeWords[v] = frozenset(word_pattern.findall(v._bodyString))
+        self.updateWords(old,new)
+
+    def removeNode(self,v):
+        '''Remove v's words from the index.'''
+        old = self.nodeWords.pop(v)
+        self.nodeChildren.pop(v,None)
+        self.updateWords(old,frozenset())
+    #@+node:ekr.20150102090001.14: *4* wi.rescan
+    def rescan(self):
+        '''Index added nodes and remove deleted nodes using a full traversal.'''
+        c = self.c
+        children = self.nodeChildren
+        children[c.hiddenRootNode] = tuple(c.hiddenRootNode.children)
+        nodes = set([v for v,level,childIndex in c.walk(unique=True)])
+        for v in [z for z in self.nodeWords if z not in nodes]:
+            self.removeNode(v)
+        for v in nodes:
+            if v not in self.nodeWords:
+                self.indexNode(v)
+            children[v] = tuple(v.children)
+        self.changedParents = set()
+    #@+node:ekr.20150102090001.15: *4* wi.updateStructure
+    def updateStructure(self):
+        '''
+        Index the subtrees added to self.changedParents and remove
+        the subtrees that are no longer in the outline.
+        '''
+        gi = self.c.gnxIndex
+        children,d = self.nodeChildren,self.nodeWords
+        parents,self.changedParents = self.changedParents,set()
+        added,removed = [],[]
+        for parent_v in parents:
+            old = children.get(parent_v)
+            if old is None:
+                continue # Not indexed: parent_v is not in the outline.
+            new = children[parent_v] = tuple(parent_v.children)
+            newSet = set(new)
+            added.extend([(parent_v,v) for v in new if v not in d])
+            removed.extend([v for v in old if v not in newSet])
+        # Remove deleted subtrees first: their children are not in the outline.
+        todo = removed
+        while todo:
+            v = todo.pop()
+            if v in d and not gi.isAttached(v):
+                todo.extend(children.get(v,()))
+                self.removeNode(v)
+        for parent_v,v in added:
+            if parent_v in children:
+                todo = [v]
+                while todo:
+                    v = todo.pop()
+                    if v not in d:
+                        self.indexNode(v)
+                        children[v] = tuple(v.children)
+                        todo.extend(v.children)
+    #@+node:ekr.20141230100001.12: *4* wi.updateWords
+    def updateWords(self,old,new):
+        '''Update the counts of the words of a node that changed from old to new.'''
+        counts,words = self.counts,self.words
+        for word in new - old:
+            n = counts.get(word,0)
+            if n == 0:
+                bisect.insort(words,word)
+            counts[word] = n + 1
+        for word in old - new:
+            n = counts[word] - 1
+            if n:
+                counts[word] = n
+            else:
+                del counts[word]
+                del words[bisect.bisect_left(words,word)]
+    #@-others
+#@-others
+#@-leo
@@ -20,12 +20,23 @@ if path not in sys.path:
     # print('appending %s to sys.path' % path)
     sys.path.append(path)
 
+# Start the --startup-profile profiler before importing any other Leo module.
+import leo.core.leoStartupProfile as leoStartupProfile
+fn = leoStartupProfile.getProfileFileName(sys.argv)
+startupProfile = fn and leoStartupProfile.StartupProfile(fn)
+if startupProfile:
+    startupProfile.installImportHook()
+    startupProfile.begin('phases','import core modules')
+
 # Import leoGlobals, but do NOT set g.
 import leo.core.leoGlobals as leoGlobals
 
 # Create g.app.
 import leo.core.leoApp as leoApp
 leoGlobals.app = leoApp.LeoApp()
+if startupProfile:
+    leoGlobals.app.startupProfile = startupProfile
+    startupProfile.end('phases','import core modules')
 
 # **Now** we can set g.
 g = leoGlobals
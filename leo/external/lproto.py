@@ -12,13 +12,9 @@ Author: Ville M. Vainio <vivainio@gmail.com>
 #@-<< docstring >>
 #@+<< imports >>
 #@+node:ville.20091009234538.1373: ** << imports >>
-# todo remove dependency on Qt.
-import leo.core.leoGlobals as g
-from leo.core.leoQt import isQt5,QtCore
-if isQt5:
-    from PyQt5 import QtNetwork
-else:
-    from PyQt4 import QtNetwork
+# LProtoClient.connect imports leoGlobals.
+# Only LProtoServer uses Qt: see importQt.
+QtCore = QtNetwork = None
 import os   
 import socket
 import struct
@@ -50,6 +46,21 @@ def lprint(*args):
     # print(args)
     
     return
+#@+node:ekr.20141231090001.1: ** importQt
+def importQt():
+    '''
+    Import QtCore and QtNetwork.
+
+    Only LProtoServer needs Qt: clients and servers that use only
+    mk_send_bytes and LProtoBuf need not import it.
+    '''
+    global QtCore,QtNetwork
+    if not QtNetwork:
+        from leo.core.leoQt import isQt5,QtCore
+        if isQt5:
+            from PyQt5 import QtNetwork
+        else:
+            from PyQt4 import QtNetwork
 #@+node:ville.20091010205847.1363: ** sending
 def mk_send_bytes(msg):
 
@@ -61,7 +72,7 @@ class LProtoBuf:
     def __init__(self):
 
         self.plen = -1
-        self.buf = ""
+        self.buf = b""
 
     def set_recv_cb(self, cb):
         """ set func to call with received messages """
@@ -69,7 +80,7 @@ class LProtoBuf:
     def get_rlen(self):
         # read pkg length
         if self.plen == -1:
-            return 4
+            return 4 - len(self.buf)
         return self.plen - len(self.buf)
 
     def push_bytes(self, allbytes):
@@ -80,20 +91,22 @@ class LProtoBuf:
             allbytes = allbytes[rlen:]
 
     def push_bytes_one(self, byts):
+        self.buf = self.buf + byts
         if self.plen == -1:
-            lendesc = byts[0:4]
-            intlen = struct.unpack('I', lendesc)[0]
+            if len(self.buf) < 4:
+                # The length descriptor is split between reads.
+                return
+            intlen = struct.unpack('I', self.buf)[0]
             lprint("have", intlen, "bytes")
             self.plen = intlen
-            self.buf = byts[4:]
-        else:
-            self.buf = self.buf + byts
+            self.buf = b""
 
         if len(self.buf) == self.plen:
             lprint("dispatch msg", self.buf)
-            self.recv_cb(self.buf)
-            self.buf = ""
+            msg = self.buf
+            self.buf = b""
             self.plen = -1
+            self.recv_cb(msg)
             return
 
         lprint("in buf",self.buf)
@@ -104,6 +117,7 @@ class LProtoServer:
     #@+node:ekr.20111012070545.7254: *3* __init__ (LProtoServer)
     def __init__(self):
 
+        importQt()
         self.srv = QtNetwork.QLocalServer()
         self.receiver = None
         self.ses = {}
@@ -150,7 +164,7 @@ class LProtoServer:
 
         def readyread_cb():
             lprint("read ready")
-            allbytes = lsock.readAll()
+            allbytes = bytes(lsock.readAll())
             buf = ses_ent['_buf']
             buf.push_bytes(allbytes)
 
@@ -194,6 +208,7 @@ class LProtoClient:
 
         '''Connect to the server.  Return True if the connection was established.'''
 
+        import leo.core.leoGlobals as g
         trace = False and not g.unitTesting
 
         if trace: g.trace(fname,socket)
@@ -227,6 +242,20 @@ class LProtoClient:
 
         byts = mk_send_bytes(msg)
         self.socket.sendall(byts)
+    #@+node:ekr.20141231090001.2: *3* recv
+    def recv(self):
+        '''
+        Wait for the next message from the server and return it.
+        Return None if the server closes the connection first.
+        '''
+        result = []
+        self.recvbuf.set_recv_cb(result.append)
+        while not result:
+            byts = self.socket.recv(65536)
+            if not byts:
+                return None
+            self.recvbuf.push_bytes(byts)
+        return result[0]
     #@-others
 
 
@@ -176,6 +176,7 @@ class OpmlController:
         parent_v.children = []
         children = self.createChildren(c,dummyRoot,parent_v)
         assert c.hiddenRootNode.children == children
+        c.gnxIndex.invalidate()
         return children
     #@+node:ekr.20060914171659.2: *4* oc.createChildren
     # node is a NodeClass object, parent_v is a VNode.
@@ -55,9 +55,9 @@ class GnxCache:
         r = self.get(gnx)
         if r:
             c,v = r
-            for p in c.all_unique_positions():
-                if p.v is v:
-                    return c,p.copy()
+            p = c.gnxIndex.vnode2position(v)
+            if p:
+                return c,p
         
         print("Not in gnx cache, slow!")
         
@@ -620,17 +620,17 @@ class ScriptingController:
         # Look at the open commanders only if we aren't looking in unopened settings files.
         if not findFlag:
             # First, look in selected commander.
-            for p in c.all_positions():
-                if p.gnx == gnx:
-                    if trace: g.trace('found',p.h,'in',c.shortFileName())
-                    return c,p,p.b
+            p = c.gnxIndex.gnx2position(gnx)
+            if p:
+                if trace: g.trace('found',p.h,'in',c.shortFileName())
+                return c,p,p.b
             # Next look in all other open commanders.
             for c2 in g.app.commanders():
                 if c2 != c:
-                    for p in c2.all_positions():
-                        if p.gnx == gnx:
-                            if trace: g.trace('found',p.h,'in',c2.shortFileName())
-                            return c2,p,p.b
+                    p = c2.gnxIndex.gnx2position(gnx)
+                    if p:
+                        if trace: g.trace('found',p.h,'in',c2.shortFileName())
+                        return c2,p,p.b
         # Fix bug 74: problems with @button if defined in myLeoSettings.leo.
         c0 = g.app.log and g.app.log.c if g.app.qt_use_tabs else None
         c2,p2,script = None,None,None
@@ -122,9 +122,8 @@ class TagController:
         ''' return a list of positions of nodes containing the tag '''
         nodelist = []
         for node in self.c.all_unique_nodes():
-            p = self.c.vnode2position(node)
-            if tag in self.get_tags(p):
-                nodelist.append(p)
+            if tag in node.u.get(self.TAG_LIST_KEY, []):
+                nodelist.append(self.c.vnode2position(node))
         return nodelist
     #@+node:peckj.20140804103733.9265: *3* individual nodes
     #@+node:peckj.20140804103733.9259: *4* get_tags
@@ -98,12 +98,7 @@ def show_unittest_failures(event):
     nav.scon.clear()
     if fails:
         for gnx, stack in fails:
-            pos = None
-            # sucks
-            for p in c.all_positions():
-                if p.gnx == gnx:
-                    pos = p.copy()
-                    break
+            pos = c.gnxIndex.gnx2position(gnx)
     
             def mkcb(pos, stack):
                 def focus():            
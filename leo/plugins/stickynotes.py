@@ -700,7 +700,7 @@ class Tabula(QMainWindow):
             return None,None
         tgt = active[0]
 
-        p = next(p for p in self.c.all_unique_positions() if p.gnx == tgt)
+        p = self.c.gnxIndex.gnx2position(tgt)
         return p, cur
 
     #@+node:ekr.20101114061906.5441: *4* save_states